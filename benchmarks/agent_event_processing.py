@@ -0,0 +1,89 @@
+"""Measure the CPU cost per event of the event processing of AgentsForAmazonBedrock.
+
+Replays a synthetic multi-agent completion, followed by a streamed answer, through the
+``AgentEventProcessor`` of ``src.utils`` that ``AgentsForAmazonBedrock.invoke``,
+``invoke_inline_agent`` and the Streamlit demo share, with only a ``ResultSink`` and with
+the ``ConsoleSink`` of each trace level, printing to ``os.devnull``. Run from the root of the repository, with the InlineAgent
+package installed::
+
+    python -m benchmarks.agent_event_processing
+    python -m benchmarks.agent_event_processing --collaborators 8 --chunks 2000 --json
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import time
+from typing import Callable, Dict, List
+
+from InlineAgent.testing import multi_agent_events
+
+from src.utils.agent_events import AgentEventProcessor, ConsoleSink, ResultSink
+
+
+def make_events(collaborators: int, tool_calls: int, chunks: int) -> List[Dict]:
+    events = multi_agent_events(
+        "benchmark-session", collaborators=collaborators, tool_calls=tool_calls
+    )
+    events += [{"chunk": {"bytes": f"token {idx} ".encode("utf-8")}} for idx in range(chunks)]
+    return events
+
+
+def cpu_per_event(replay: Callable[[], None], events: int, iterations: int) -> Dict:
+    replay()  # warm up
+    start = time.process_time()
+    for _ in range(iterations):
+        replay()
+    elapsed = time.process_time() - start
+    return {
+        "events": events * iterations,
+        "cpu_seconds": round(elapsed, 3),
+        "cpu_us_per_event": round(elapsed / (events * iterations) * 1e6, 2),
+    }
+
+
+def run(collaborators: int, tool_calls: int, chunks: int, iterations: int) -> Dict:
+    events = make_events(collaborators, tool_calls, chunks)
+    sinks = {
+        "result only": lambda: [ResultSink()],
+        "console outline": lambda: [ConsoleSink(trace_level="outline"), ResultSink()],
+        "console core": lambda: [ConsoleSink(trace_level="core"), ResultSink()],
+    }
+
+    report = dict()
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        for name, make_sinks in sinks.items():
+
+            def replay():
+                state = AgentEventProcessor(make_sinks()).run(events)
+                if len(state.answer) == 0:
+                    raise RuntimeError("No answer was assembled")
+
+            report[name] = cpu_per_event(replay, len(events), iterations)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--collaborators", type=int, default=4)
+    parser.add_argument("--tool-calls", type=int, default=3)
+    parser.add_argument("--chunks", type=int, default=500)
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    args = parser.parse_args()
+
+    report = run(args.collaborators, args.tool_calls, args.chunks, args.iterations)
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+
+    for name, result in report.items():
+        print(
+            f"{name:>16}: {result['cpu_us_per_event']:8.2f} us/event "
+            f"({result['events']:,} events, {result['cpu_seconds']:.3f}s CPU)"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,331 @@
+"""Benchmark DynamoDB loading, querying and scanning of AgentsForAmazonBedrock locally.
+
+Runs ``load_dynamodb``, ``query_dynamodb`` and ``scan_dynamodb`` of the helper in
+``src.utils`` against an in-process DynamoDB stand-in with a fixed latency per request,
+next to the item by item ``put_item`` loading and single page ``query`` they replace, and
+reports items per second. Run from the root of the repository, with the InlineAgent
+package installed::
+
+    python -m benchmarks.dynamodb_load --items 2000 --latency 0.005
+    python -m benchmarks.dynamodb_load --unprocessed-rate 0.1 --json
+"""
+
+import argparse
+import json
+import logging
+import os
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+from unittest import mock
+
+from InlineAgent.testing import AgentRuntimeEmulator
+
+TABLE_NAME = "reservations"
+PK = "customer_id"
+SK = "reservation_id"
+CUSTOMERS = 4
+
+_EQUALS = re.compile(r"(#\w+) = (:\w+)")
+_BEGINS_WITH = re.compile(r"begins_with\((#\w+), (:\w+)\)")
+
+
+class DynamoDBStandIn(ThreadingHTTPServer):
+    """Just enough of the DynamoDB JSON protocol for one table with a partition and sort key.
+
+    Every request takes `latency` seconds, pages hold `page_items` items at most like the 1 MB
+    limit of DynamoDB does, and `unprocessed_rate` of the items of batch writes are returned
+    as unprocessed.
+    """
+
+    daemon_threads = True
+
+    def __init__(
+        self,
+        latency: float = 0.005,
+        page_items: int = 100,
+        unprocessed_rate: float = 0.0,
+        seed: Optional[int] = None,
+    ):
+        super().__init__(("127.0.0.1", 0), _DynamoDBHandler)
+        self.latency = latency
+        self.page_items = page_items
+        self.unprocessed_rate = unprocessed_rate
+        self.items: Dict[tuple, Dict] = dict()
+        self.requests = 0
+        self._lock = threading.Lock()
+        self._random = random.Random(seed)
+        self._thread = None
+
+    @property
+    def endpoint_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def __enter__(self):
+        self._thread = threading.Thread(
+            target=self.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True
+        )
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.shutdown()
+        self.server_close()
+
+    @staticmethod
+    def _key(item: Dict) -> tuple:
+        return (item[PK]["S"], item[SK]["S"])
+
+    def _page(self, items: List[Dict], params: Dict) -> Dict:
+        items = sorted(items, key=self._key)
+        if "ExclusiveStartKey" in params:
+            start = self._key(params["ExclusiveStartKey"])
+            items = [item for item in items if self._key(item) > start]
+
+        limit = min(params.get("Limit", self.page_items), self.page_items)
+        page = items[:limit]
+        names = params.get("ExpressionAttributeNames", {})
+        if "ProjectionExpression" in params:
+            attributes = [
+                names.get(name.strip(), name.strip())
+                for name in params["ProjectionExpression"].split(",")
+            ]
+            page = [
+                {name: item[name] for name in attributes if name in item}
+                for item in page
+            ]
+
+        response = {"Items": page, "Count": len(page), "ScannedCount": len(page)}
+        if len(items) > limit:
+            last = items[limit - 1]
+            response["LastEvaluatedKey"] = {PK: last[PK], SK: last[SK]}
+        return response
+
+    def handle_operation(self, operation: str, params: Dict) -> Dict:
+        time.sleep(self.latency)
+        with self._lock:
+            self.requests += 1
+
+            if operation == "DescribeTable":
+                return {
+                    "Table": {
+                        "TableName": TABLE_NAME,
+                        "TableStatus": "ACTIVE",
+                        "KeySchema": [
+                            {"AttributeName": PK, "KeyType": "HASH"},
+                            {"AttributeName": SK, "KeyType": "RANGE"},
+                        ],
+                    }
+                }
+
+            if operation == "PutItem":
+                self.items[self._key(params["Item"])] = params["Item"]
+                return {}
+
+            if operation == "BatchWriteItem":
+                unprocessed = []
+                for request in params["RequestItems"][TABLE_NAME]:
+                    if self._random.random() < self.unprocessed_rate:
+                        unprocessed.append(request)
+                    else:
+                        item = request["PutRequest"]["Item"]
+                        self.items[self._key(item)] = item
+                return {
+                    "UnprocessedItems": (
+                        {TABLE_NAME: unprocessed} if unprocessed else {}
+                    )
+                }
+
+            names = params.get("ExpressionAttributeNames", {})
+            values = params.get("ExpressionAttributeValues", {})
+
+            if operation == "Query":
+                expression = params["KeyConditionExpression"]
+                conditions = [
+                    lambda item, name=name, value=value: item[names[name]]
+                    == values[value]
+                    for name, value in _EQUALS.findall(expression)
+                ] + [
+                    lambda item, name=name, value=value: item[names[name]]["S"].startswith(
+                        values[value]["S"]
+                    )
+                    for name, value in _BEGINS_WITH.findall(expression)
+                ]
+                items = [
+                    item
+                    for item in self.items.values()
+                    if all(condition(item) for condition in conditions)
+                ]
+                return self._page(items, params)
+
+            if operation == "Scan":
+                total_segments = params.get("TotalSegments", 1)
+                segment = params.get("Segment", 0)
+                items = [
+                    item
+                    for item in self.items.values()
+                    if hash(item[PK]["S"]) % total_segments == segment
+                ]
+                return self._page(items, params)
+
+        raise ValueError(f"Unsupported operation: {operation}")
+
+
+class _DynamoDBHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body are written separately, don't wait for an ACK in between
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        operation = self.headers["X-Amz-Target"].split(".")[-1]
+        params = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        try:
+            status, body = 200, self.server.handle_operation(operation, params)
+        except Exception as e:
+            status, body = 400, {
+                "__type": "com.amazon.coral.validate#ValidationException",
+                "message": str(e),
+            }
+        payload = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/x-amz-json-1.0")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+
+def make_items(count: int) -> List[Dict]:
+    return [
+        {
+            PK: f"customer-{idx % CUSTOMERS:03d}",
+            SK: f"reservation-{idx:06d}",
+            "status": "confirmed",
+            "nights": str(1 + idx % 7),
+        }
+        for idx in range(count)
+    ]
+
+
+def _rate(items: int, seconds: float) -> Dict:
+    return {
+        "items": items,
+        "seconds": round(seconds, 3),
+        "items_per_second": round(items / seconds, 1) if seconds else None,
+    }
+
+
+def run(
+    items: int, latency: float, page_items: int, unprocessed_rate: float, segments: int
+) -> Dict:
+    from src.utils.bedrock_agent_helper import AgentsForAmazonBedrock
+
+    _items = make_items(items)
+    report = dict()
+
+    with AgentRuntimeEmulator() as emulator, DynamoDBStandIn(
+        latency=latency, page_items=page_items, unprocessed_rate=unprocessed_rate
+    ) as dynamodb:
+        environ = dict(
+            emulator.environ(), AWS_ENDPOINT_URL_DYNAMODB=dynamodb.endpoint_url
+        )
+        with mock.patch.dict(os.environ, environ):
+            agents_helper = AgentsForAmazonBedrock(on_wait_progress=None)
+            table = agents_helper._dynamodb_resource.Table(TABLE_NAME)
+
+            # Item by item, as load_dynamodb used to
+            start = time.perf_counter()
+            for item in _items:
+                table.put_item(Item=item)
+            report["put_item loop"] = _rate(items, time.perf_counter() - start)
+
+            dynamodb.items.clear()
+            start = time.perf_counter()
+            loaded = agents_helper.load_dynamodb(TABLE_NAME, _items, segments=1)
+            report["load_dynamodb (1 segment)"] = _rate(
+                loaded, time.perf_counter() - start
+            )
+
+            dynamodb.items.clear()
+            start = time.perf_counter()
+            loaded = agents_helper.load_dynamodb(TABLE_NAME, _items, segments=segments)
+            report[f"load_dynamodb ({segments} segments)"] = _rate(
+                loaded, time.perf_counter() - start
+            )
+            if len(dynamodb.items) != items:
+                raise RuntimeError(f"Loaded {len(dynamodb.items)} of {items} items")
+
+            # A single page, as query_dynamodb used to
+            start = time.perf_counter()
+            first_page = table.query(
+                KeyConditionExpression="#pk = :pk",
+                ExpressionAttributeNames={"#pk": PK},
+                ExpressionAttributeValues={":pk": "customer-000"},
+            )["Items"]
+            report["query first page"] = _rate(
+                len(first_page), time.perf_counter() - start
+            )
+
+            start = time.perf_counter()
+            partition = agents_helper.query_dynamodb(TABLE_NAME, PK, "customer-000")
+            report["query_dynamodb"] = _rate(len(partition), time.perf_counter() - start)
+
+            start = time.perf_counter()
+            scanned = agents_helper.scan_dynamodb(TABLE_NAME, segments=1)
+            report["scan_dynamodb (1 segment)"] = _rate(
+                len(scanned), time.perf_counter() - start
+            )
+
+            start = time.perf_counter()
+            scanned = agents_helper.scan_dynamodb(TABLE_NAME, segments=segments)
+            report[f"scan_dynamodb ({segments} segments)"] = _rate(
+                len(scanned), time.perf_counter() - start
+            )
+            if len(scanned) != items:
+                raise RuntimeError(f"Scanned {len(scanned)} of {items} items")
+
+    return report
+
+
+def print_report(report: Dict):
+    print(f"{'':<28}{'items':>8}{'seconds':>10}{'items/s':>12}")
+    for name, row in report.items():
+        print(
+            f"{name:<28}{row['items']:>8}{row['seconds']:>10.3f}"
+            f"{row['items_per_second'] or 0:>12.1f}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--items", type=int, default=2000)
+    parser.add_argument("--latency", type=float, default=0.005, help="Per request")
+    parser.add_argument("--page-items", type=int, default=100)
+    parser.add_argument("--unprocessed-rate", type=float, default=0.0)
+    parser.add_argument("--segments", type=int, default=4)
+    parser.add_argument("--json", action="store_true", help="Print a JSON report")
+    args = parser.parse_args()
+
+    logging.getLogger("botocore").setLevel(logging.WARNING)
+
+    report = run(
+        items=args.items,
+        latency=args.latency,
+        page_items=args.page_items,
+        unprocessed_rate=args.unprocessed_rate,
+        segments=args.segments,
+    )
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+
+
+if __name__ == "__main__":
+    main()
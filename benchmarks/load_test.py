@@ -0,0 +1,332 @@
+"""Load test the Bedrock Agents clients of this repository against a local emulator.
+
+Drives concurrent sessions through ``AgentsForAmazonBedrock.invoke`` (``helper``),
+``InlineAgent.invoke`` (``sdk``) or the Streamlit demo's ``ui_utils.invoke_agent``
+(``streamlit``, requires ``streamlit``) and reports time to first token and total
+latency percentiles. Run from the root of the repository, with the InlineAgent package
+installed::
+
+    python -m benchmarks.load_test --target sdk --sessions 20 --first-event-latency 0.5
+    python -m benchmarks.load_test --target helper --throttle-rate 0.05 --json
+"""
+
+import argparse
+import asyncio
+import io
+import json
+import logging
+import math
+import os
+import tempfile
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import redirect_stdout
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional
+from unittest import mock
+
+from InlineAgent.observability import EventStreamReplayer, PatchedClients
+from InlineAgent.testing import (
+    AgentRuntimeEmulator,
+    echo_script,
+    multi_agent_events,
+    single_agent_events,
+)
+
+INPUT_TEXT = "What is the weather in Seattle?"
+
+
+@dataclass(slots=True)
+class TurnResult:
+    total: float
+    time_to_first_token: Optional[float] = None
+    error: Optional[str] = None
+
+
+class FirstChunkTimer(PatchedClients):
+    """Note when the first chunk event of each session's invocation arrives."""
+
+    def __init__(self):
+        super().__init__(services=("bedrock-agent-runtime",))
+        self.first_chunk: Dict[str, float] = dict()
+
+    def create_client(self, session, original_client, service_name, *args, **kwargs):
+        client = original_client(session, service_name, *args, **kwargs)
+        for operation in ("invoke_agent", "invoke_inline_agent"):
+            setattr(client, operation, self._timed(getattr(client, operation)))
+        return client
+
+    def _timed(self, invoke):
+        def call(**params):
+            response = invoke(**params)
+            response["completion"] = self._time_events(
+                session_id=params["sessionId"], events=response["completion"]
+            )
+            return response
+
+        return call
+
+    def _time_events(self, session_id: str, events):
+        for event in events:
+            if "chunk" in event:
+                self.first_chunk.setdefault(session_id, time.perf_counter())
+            yield event
+
+
+def make_script(scenario: str, recording: Optional[str]):
+    if recording:
+        replayer = EventStreamReplayer(recording)
+        return lambda operation, params: replayer.get_response(
+            service_name="bedrock-agent-runtime", operation=operation, params=params
+        )["completion"]
+
+    if scenario == "echo":
+        return echo_script
+    if scenario == "single":
+        return lambda operation, params: single_agent_events(
+            params["sessionId"], tool_calls=2, knowledge_base_lookups=1
+        )
+    return lambda operation, params: multi_agent_events(
+        params["sessionId"], collaborators=2, tool_calls=2
+    )
+
+
+def helper_target() -> Callable[[str], Callable[[str], None]]:
+    from src.utils.bedrock_agent_helper import AgentsForAmazonBedrock
+
+    agents_helper = AgentsForAmazonBedrock()
+
+    def session(session_id: str):
+        return lambda input_text: agents_helper.invoke(
+            input_text=input_text,
+            agent_id="SUPERVISOR",
+            agent_alias_id="ALIAS",
+            session_id=session_id,
+            enable_trace=True,
+            # Collaborator names are looked up by "<agentId>/<agentAliasId>"
+            multi_agent_names=defaultdict(lambda: "collaborator"),
+        )
+
+    return session
+
+
+def sdk_target() -> Callable[[str], Callable[[str], None]]:
+    from InlineAgent.agent import InlineAgent
+
+    agent = InlineAgent(
+        foundation_model="MOCK_ID",
+        instruction="You are a friendly assistant that is responsible for getting the current weather.",
+        agent_name="LoadTestAgent",
+    )
+
+    def session(session_id: str):
+        return lambda input_text: asyncio.run(
+            agent.invoke(input_text=input_text, session_id=session_id)
+        )
+
+    return session
+
+
+def streamlit_turn(session_id: str, input_text: str):
+    import streamlit as st
+
+    from ui_utils import invoke_agent
+
+    st.session_state["bot_config"] = {
+        "agent_id": "SUPERVISOR",
+        "agent_alias_id": "ALIAS",
+        "inputs": {},
+    }
+    st.write_stream(invoke_agent(input_text, session_id, task_yaml_content={}))
+
+
+def streamlit_target() -> Callable[[str], Callable[[str], None]]:
+    from streamlit.testing.v1 import AppTest
+
+    def session(session_id: str):
+        def turn(input_text: str):
+            app = AppTest.from_function(
+                streamlit_turn,
+                args=(session_id, input_text),
+                default_timeout=600,
+            )
+            app.run()
+            if app.exception:
+                raise RuntimeError(app.exception[0].message)
+
+        return turn
+
+    return session
+
+
+TARGETS = {
+    "helper": helper_target,
+    "sdk": sdk_target,
+    "streamlit": streamlit_target,
+}
+
+
+def run_session(
+    session, session_id: str, turns: int, timer: FirstChunkTimer
+) -> List[TurnResult]:
+    results = list()
+    turn = session(session_id)
+    for _ in range(turns):
+        timer.first_chunk.pop(session_id, None)
+        error = None
+        start = time.perf_counter()
+        try:
+            turn(INPUT_TEXT)
+        except Exception as e:
+            error = type(e).__name__
+        total = time.perf_counter() - start
+
+        first_chunk = timer.first_chunk.get(session_id)
+        results.append(
+            TurnResult(
+                total=total,
+                time_to_first_token=first_chunk - start if first_chunk else None,
+                error=error,
+            )
+        )
+    return results
+
+
+def percentile(values: List[float], pct: float) -> Optional[float]:
+    """Nearest-rank percentile."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(math.ceil(pct / 100 * len(ordered)) - 1, 0)]
+
+
+def summarize(values: List[float]) -> Dict[str, Optional[float]]:
+    return {
+        "p50": percentile(values, 50),
+        "p95": percentile(values, 95),
+        "p99": percentile(values, 99),
+        "max": max(values) if values else None,
+    }
+
+
+def load_test(
+    target: str,
+    emulator: AgentRuntimeEmulator,
+    sessions: int,
+    turns: int,
+) -> Dict:
+    timer = FirstChunkTimer()
+    with emulator, tempfile.TemporaryDirectory() as directory:
+        # `InlineAgent` reads the credentials of the default profile
+        aws_config = os.path.join(directory, "config")
+        with open(aws_config, "w") as file:
+            file.write(
+                "[default]\nregion = us-east-1\n"
+                "aws_access_key_id = emulator\naws_secret_access_key = emulator\n"
+            )
+        environ = dict(emulator.environ(), AWS_CONFIG_FILE=aws_config)
+
+        with mock.patch.dict(os.environ, environ), timer:
+            with redirect_stdout(io.StringIO()):
+                session = TARGETS[target]()
+
+                start = time.perf_counter()
+                with ThreadPoolExecutor(max_workers=sessions) as executor:
+                    futures = [
+                        executor.submit(
+                            run_session,
+                            session=session,
+                            session_id=f"load-test-{idx:04d}",
+                            turns=turns,
+                            timer=timer,
+                        )
+                        for idx in range(sessions)
+                    ]
+                    results = [
+                        result for future in futures for result in future.result()
+                    ]
+                elapsed = time.perf_counter() - start
+
+    errors = [result.error for result in results if result.error]
+    return {
+        "target": target,
+        "sessions": sessions,
+        "turns": len(results),
+        "errors": len(errors),
+        "error_types": sorted(set(errors)),
+        "requests": emulator.stats.requests,
+        "throttled": emulator.stats.throttled,
+        "turns_per_second": len(results) / elapsed,
+        "time_to_first_token": summarize(
+            [
+                result.time_to_first_token
+                for result in results
+                if result.time_to_first_token is not None and not result.error
+            ]
+        ),
+        "total_latency": summarize(
+            [result.total for result in results if not result.error]
+        ),
+    }
+
+
+def print_report(report: Dict):
+    print(
+        f"{report['target']}: {report['sessions']} sessions, {report['turns']} turns "
+        f"({report['turns_per_second']:.1f}/s), {report['errors']} errors "
+        f"{report['error_types'] or ''}, {report['throttled']}/{report['requests']} "
+        "requests throttled"
+    )
+    print(f"{'':>22}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9}")
+    for name in ("time_to_first_token", "total_latency"):
+        row = "".join(
+            f"{value:>9.3f}" if value is not None else f"{'-':>9}"
+            for value in report[name].values()
+        )
+        print(f"{name + ' (s)':<22}{row}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--target", choices=sorted(TARGETS), default="sdk")
+    parser.add_argument("--sessions", type=int, default=10)
+    parser.add_argument("--turns", type=int, default=3)
+    parser.add_argument(
+        "--scenario", choices=("echo", "single", "multi"), default="single"
+    )
+    parser.add_argument("--recording", help="Recording of EventStreamRecorder")
+    parser.add_argument("--first-event-latency", type=float, default=0.5)
+    parser.add_argument("--event-interval", type=float, default=0.01)
+    parser.add_argument("--throughput", type=float, help="Chunk bytes per second")
+    parser.add_argument("--throttle-rate", type=float, default=0.0)
+    parser.add_argument("--max-concurrency", type=int)
+    parser.add_argument("--json", action="store_true", help="Print a JSON report")
+    args = parser.parse_args()
+
+    # Sessions beyond the connection pool of a shared client open new connections
+    logging.getLogger("urllib3.connectionpool").setLevel(logging.ERROR)
+
+    emulator = AgentRuntimeEmulator(
+        script=make_script(args.scenario, args.recording),
+        first_event_latency=args.first_event_latency,
+        event_interval=args.event_interval,
+        throughput=args.throughput,
+        throttle_rate=args.throttle_rate,
+        max_concurrency=args.max_concurrency,
+    )
+    report = load_test(
+        target=args.target,
+        emulator=emulator,
+        sessions=args.sessions,
+        turns=args.turns,
+    )
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,21 @@
 import datetime
 
+# Export the latency breakdown of every turn: None, "stdout", "file:<path>" or "cloudwatch:<namespace>"
+metrics_sink = None
+
+# Answer near-identical prompts from a cache of earlier answers, labelled as cached: None, or
+# e.g. {"similarity_threshold": 0.95, "ttl_seconds": 3600, "max_entries": 500}
+response_cache = None
+
+# Chat messages kept in the session state, older ones are moved to a local SQLite file
+# (None for one in the temporary directory), and deleted from it after the seconds a chat
+# is inactive (None to keep them); messages rendered on a rerun, and loaded by each click
+# on "older messages"
+history_window = 50
+history_store = None
+history_ttl_seconds = 24 * 3600
+history_page_size = 20
+
 # Bot configurations
 bot_configs = [
     {
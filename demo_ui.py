@@ -14,7 +14,8 @@ import importlib
 
 from src.utils.bedrock_agent import agents_helper
 import config
-from ui_utils import invoke_agent, get_error_text
+from ui_history import DEFAULT_PAGE_SIZE, DEFAULT_TTL_SECONDS, DEFAULT_WINDOW, MessageHistory
+from ui_utils import invoke_agent, get_error_text, render_cache_report
 
 def get_agent_id_by_name(agent_name, region=None):
     """根据agent名称获取agent ID"""
@@ -311,8 +312,54 @@ def initialize_session():
             st.session_state['task_yaml_content'] = task_yaml_content
 
             # Initialize session ID and message history
-            st.session_state['session_id'] = str(uuid.uuid4())
-            st.session_state.messages = []
+            start_session()
+
+def get_history():
+    """Message history of the current chat session."""
+    if 'history' not in st.session_state:
+        start_session()
+    return st.session_state['history']
+
+def start_session():
+    """Start a new chat session, forgetting the messages of the previous one."""
+    if 'history' in st.session_state:
+        st.session_state['history'].clear()
+        st.session_state.get('started_sessions', set()).discard(st.session_state['history'].session_id)
+        st.session_state.get('cached_turns', {}).pop(st.session_state['history'].session_id, None)
+    st.session_state['session_id'] = str(uuid.uuid4())
+    st.session_state['history'] = MessageHistory(
+        st.session_state['session_id'],
+        window=getattr(config, 'history_window', DEFAULT_WINDOW),
+        store_path=getattr(config, 'history_store', None),
+        ttl_seconds=getattr(config, 'history_ttl_seconds', DEFAULT_TTL_SECONDS),
+    )
+    st.session_state['history_shown'] = getattr(config, 'history_page_size', DEFAULT_PAGE_SIZE)
+
+def add_message(role, content):
+    """Append a message to the chat, showing the last page of messages again."""
+    get_history().append(role, content)
+    st.session_state['history_shown'] = getattr(config, 'history_page_size', DEFAULT_PAGE_SIZE)
+
+def render_history():
+    """Render the last messages of the chat, with a button loading older ones.
+
+    Only a page of messages is rendered on a rerun by default, so reruns cost the same
+    however long the chat gets.
+    """
+    history = get_history()
+    shown = min(st.session_state.get('history_shown', DEFAULT_PAGE_SIZE), len(history))
+    messages = history.last(shown)
+    if len(messages) < shown:
+        # Older messages expired from the store, the history now starts at the window
+        st.session_state['history_shown'] = getattr(config, 'history_page_size', DEFAULT_PAGE_SIZE)
+        shown = len(messages)
+    if shown < len(history):
+        if st.button(get_ui_text("older_messages").format(len(history) - shown), key="older_messages"):
+            st.session_state['history_shown'] = shown + getattr(config, 'history_page_size', DEFAULT_PAGE_SIZE)
+            st.rerun()
+    for message in messages:
+        with st.chat_message(message["role"]):
+            st.markdown(message["content"])
 
 def get_agent_info_by_alias_id(alias_id, region=None):
     """根据agent alias ID获取agent ID和agent name"""
@@ -395,8 +442,7 @@ def update_custom_config():
         st.session_state['config_applied'] = True
         
         # 重置会话ID和消息历史
-        st.session_state['session_id'] = str(uuid.uuid4())
-        st.session_state.messages = []
+        start_session()
         
         # 设置空的task_yaml_content
         st.session_state['task_yaml_content'] = {}
@@ -428,7 +474,8 @@ def get_ui_text(key):
             "chinese": "中文",
             "english": "English",
             "new_session": "🔄 新建会话",
-            "new_session_help": "清空聊天历史，重新开始对话"
+            "new_session_help": "清空聊天历史，重新开始对话",
+            "older_messages": "加载更早的消息（{} 条）"
         },
         "English": {
             "title": "Agent Configuration",
@@ -454,7 +501,8 @@ def get_ui_text(key):
             "chinese": "中文",
             "english": "English",
             "new_session": "🔄 New Session",
-            "new_session_help": "Clear chat history and start a new conversation"
+            "new_session_help": "Clear chat history and start a new conversation",
+            "older_messages": "Load older messages ({} more)"
         }
     }
     
@@ -563,8 +611,7 @@ def main():
                     st.session_state['config_applied'] = True
                     
                     # 重置会话ID和消息历史
-                    st.session_state['session_id'] = str(uuid.uuid4())
-                    st.session_state.messages = []
+                    start_session()
                     
                     # 加载任务（如果有）
                     task_yaml_content = {}
@@ -667,6 +714,8 @@ def main():
                 else:
                     st.error(message)
         
+        render_cache_report()
+
         # 在侧边栏底部添加语言切换开关
         st.write("")
         st.write("")
@@ -692,14 +741,11 @@ def main():
         # 添加新建会话按钮
         if st.button(get_ui_text("new_session"), help=get_ui_text("new_session_help")):
             # 重置会话ID和消息历史
-            st.session_state['session_id'] = str(uuid.uuid4())
-            st.session_state.messages = []
+            start_session()
             st.rerun()
 
     # Show message history
-    for message in st.session_state.messages:
-        with st.chat_message(message["role"]):
-            st.markdown(message["content"])
+    render_history()
 
     # Handle user input
     if 'user_input' not in st.session_state:
@@ -712,7 +758,7 @@ def main():
         
         if user_query:
             # Display user message
-            st.session_state.messages.append({"role": "user", "content": user_query})
+            add_message("user", user_query)
             with st.chat_message("user"):
                 st.markdown(user_query)
 
@@ -732,7 +778,7 @@ def main():
                     response = "I encountered an error processing your request. Please try again."
 
             # Update chat history
-            st.session_state.messages.append({"role": "assistant", "content": response})
+            add_message("assistant", response)
 
         # Reset input
         user_query = st.chat_input(placeholder=" ", key="user_input", disabled=not st.session_state['config_applied'])
@@ -4,16 +4,90 @@ Bedrock Agents module for interacting with Amazon Bedrock Agents.
 This package provides functionality for working with Amazon Bedrock Agents,
 allowing users to create, manage, and interact with AI agents powered by
 Amazon Bedrock.
+
+Names are imported from their submodule on first access, so that `import InlineAgent`
+does not load boto3, pydantic, OpenTelemetry or the MCP client until they are used.
 """
 
-from .action_group import ActionGroup, ActionGroups
-from .agent import InlineAgent, CollaboratorAgent, require_confirmation
-from .knowledge_base import knowledgebase_plugin
-from .constants import USER_INPUT_ACTION_GROUP_NAME, TraceColor, Level
-from .utils import AgentAppConfig
-from .observability import *
-from .tools import *
-from .types import *
-from . import _version
-
-__version__ = _version.get_versions()["version"]
+import importlib
+from typing import TYPE_CHECKING
+
+# Public name -> submodule defining it
+_LAZY_ATTRIBUTES = {
+    "ActionGroup": ".action_group",
+    "ActionGroups": ".action_group",
+    "InlineAgent": ".agent",
+    "CollaboratorAgent": ".agent",
+    "require_confirmation": ".agent",
+    "AwsContext": ".aws_context",
+    "get_aws_context": ".aws_context",
+    "knowledgebase_plugin": ".knowledge_base",
+    "USER_INPUT_ACTION_GROUP_NAME": ".constants",
+    "TraceColor": ".constants",
+    "Level": ".constants",
+    "AgentAppConfig": ".utils",
+    "ToolResultEncoder": ".tool_results",
+    "ToolResultStore": ".tool_results",
+    "get_tool_result_store": ".tool_results",
+    "read_tool_result": ".tool_results",
+    # from .observability import *
+    "Trace": ".observability",
+    "observe": ".observability",
+    "current_invocation": ".observability",
+    "ObservabilityConfig": ".observability",
+    "EventStreamRecorder": ".observability",
+    "EventStreamReplayer": ".observability",
+    "TraceSampler": ".observability",
+    "create_tracer_provider": ".observability",
+    # from .tools import *
+    "MCPStdio": ".tools",
+    "MCPServer": ".tools",
+    "MCPHttp": ".tools",
+    # from .types import *
+    "Executor": ".types",
+    "Parameter": ".types",
+    "FunctionDefination": ".types",
+    "APISchema": ".types",
+    "InlineCollaboratorAgentConfig": ".types",
+    "InlineCollaboratorConfigurations": ".types",
+    "MCPConfig": ".types",
+    "S3": ".types",
+}
+
+__all__ = list(_LAZY_ATTRIBUTES) + ["__version__"]
+
+
+def __getattr__(name: str):
+    if name in _LAZY_ATTRIBUTES:
+        value = getattr(importlib.import_module(_LAZY_ATTRIBUTES[name], __name__), name)
+    elif name == "__version__":
+        from ._version import get_versions
+
+        # Computed from git in a source checkout, static in a built package
+        value = get_versions()["version"]
+    else:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
+
+
+if TYPE_CHECKING:
+    from .action_group import ActionGroup, ActionGroups
+    from .agent import InlineAgent, CollaboratorAgent, require_confirmation
+    from .aws_context import AwsContext, get_aws_context
+    from .knowledge_base import knowledgebase_plugin
+    from .constants import USER_INPUT_ACTION_GROUP_NAME, TraceColor, Level
+    from .utils import AgentAppConfig
+    from .tool_results import (
+        ToolResultEncoder,
+        ToolResultStore,
+        get_tool_result_store,
+        read_tool_result,
+    )
+    from .observability import *
+    from .tools import *
+    from .types import *
@@ -17,6 +17,8 @@ from inspect import Parameter, signature
 import boto3
 from pydantic import BaseModel, computed_field, model_validator, validate_call, Field
 
+from InlineAgent.aws_context import get_aws_context
+from InlineAgent.tool_results import ToolResultEncoder
 from InlineAgent.tools import MCPServer
 from InlineAgent.types import APISchema, Executor, FunctionDefination
 
@@ -36,6 +38,8 @@ class ActionGroup(BaseModel):
     ] = Field(default_factory=dict)
     argument_key: str = "Parameters:"
     return_key: str = "Returns:"
+    # Encoding of the results of return of control tools, returned as is by default
+    result_encoder: Optional[ToolResultEncoder] = None
     test: bool = False
 
     class Config:
@@ -67,7 +71,7 @@ class ActionGroup(BaseModel):
         print(
             f"Using `{self.profile}` [profile](https://docs.aws.amazon.com/cli/v1/userguide/cli-configure-files.html)."
         )
-        return boto3.Session(profile_name=self.profile)
+        return get_aws_context().session(self.profile)
 
     @computed_field
     @cached_property
@@ -77,9 +81,8 @@ class ActionGroup(BaseModel):
         try:
             if self.test:
                 return "Mock-Account", "Mock-Region"
-            sts_client = self.session.client("sts")
-            identity = sts_client.get_caller_identity()
-            return identity["Account"], self.session.region_name
+            context = get_aws_context()
+            return context.account_id(self.profile), context.region(self.profile)
         except Exception as e:
             return "Mock-Account", "Mock-Region"
 
@@ -249,14 +252,22 @@ class ActionGroups(BaseModel):
         for action_group in self.action_groups:
             if action_group.executor == Executor.RETURN_CONTROL:
 
+                tools = dict()
                 if action_group.tools:
                     for tool in action_group.tools:
-                        tool_map[tool.__name__] = tool
+                        tools[tool.__name__] = tool
 
                 if action_group.mcp_clients:
 
                     for current_client in action_group.mcp_clients:
-                        tool_map.update(current_client.callable_tools)
+                        tools.update(current_client.callable_tools)
+
+                if action_group.result_encoder:
+                    tools = {
+                        name: action_group.result_encoder.wrap(tool)
+                        for name, tool in tools.items()
+                    }
+                tool_map.update(tools)
 
         return tool_map
 
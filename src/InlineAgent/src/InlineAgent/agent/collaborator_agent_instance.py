@@ -16,6 +16,7 @@ from InlineAgent.constants import (
     TraceColor,
 )
 from InlineAgent.agent.process_roc import ProcessROC
+from InlineAgent.aws_context import get_aws_context
 from InlineAgent.observability import Trace
 
 
@@ -29,18 +30,35 @@ class CollaboratorAgent:
 
     @property
     def session(self) -> boto3.Session:
-        """Lazy loading of AWS session"""
-        return boto3.Session(profile_name=self.profile)
+        """AWS session of the profile, shared through the AWS context of the process"""
+        return get_aws_context().session(self.profile)
 
     @property
     def account_id(self) -> str:
-        sts_client = self.session.client("sts")
-        identity = sts_client.get_caller_identity()
-        return identity["Account"]
+        return get_aws_context().account_id(self.profile)
 
     @property
     def region(self) -> str:
-        return self.session.region_name
+        return get_aws_context().region(self.profile)
+
+    @property
+    def agent_arn(self) -> str:
+        """ARN of the agent, resolved once per profile, region and agent name"""
+        return get_aws_context().agent_arn(self.profile, self.agent_name)
+
+    def refresh(self) -> str:
+        """Resolve the ARN of the agent again, e.g. after it was recreated under the same name.
+
+        Returns:
+            str: ARN of the agent
+        """
+        get_aws_context().refresh(self.profile)
+        return self.agent_arn
+
+    @staticmethod
+    def clear_cache():
+        """Forget all sessions, account IDs and agent ARNs, e.g. after switching credentials."""
+        get_aws_context().clear()
 
     def __post_init__(self):
 
@@ -57,16 +75,11 @@ class CollaboratorAgent:
 
     def to_dict(self):
 
-        agent_arn = CollaboratorAgent.get_agent_arn_by_name(
-            agent_name=self.agent_name,
-            region=self.region,
-            account_id=self.account_id,
-            session=self.session,
-        )
-
         if self.routing_instruction == "":
             raise ValueError("routing_instruction cannot be empty")
 
+        agent_arn = self.agent_arn
+
         return {
             "agentAliasArn": f'{agent_arn.replace("agent", "agent-alias")}/{self.agent_alias_id}',
             "collaboratorInstruction": self.routing_instruction,
@@ -16,6 +16,7 @@ from rich.markdown import Markdown
 from InlineAgent.action_group import ActionGroups
 from InlineAgent.action_group.action_group import ActionGroup
 from InlineAgent.agent.collaborator_agent_instance import CollaboratorAgent
+from InlineAgent.aws_context import get_aws_context
 from InlineAgent.constants import (
     USER_INPUT_ACTION_GROUP_NAME,
     TraceColor,
@@ -53,18 +54,16 @@ class InlineAgent:
 
     @property
     def session(self) -> boto3.Session:
-        """Lazy loading of AWS session"""
-        return boto3.Session(profile_name=self.profile)
+        """AWS session of the profile, shared through the AWS context of the process"""
+        return get_aws_context().session(self.profile)
 
     @property
     def account_id(self) -> str:
-        sts_client = self.session.client("sts")
-        identity = sts_client.get_caller_identity()
-        return identity["Account"]
+        return get_aws_context().account_id(self.profile)
 
     @property
     def region(self) -> str:
-        return self.session.region_name
+        return get_aws_context().region(self.profile)
 
     def __post_init__(self):
 
@@ -139,6 +138,18 @@ class InlineAgent:
         if not self.collaborator_configuration.instruction:
             self.collaborator_configuration.instruction = self.instruction
 
+    def refresh_collaborators(self):
+        """Resolve the ARNs of the collaborator agents again, including those of nested collaborators."""
+        get_aws_context().refresh()
+        self._resolve_collaborators()
+
+    def _resolve_collaborators(self):
+        for collaborator in self.collaborators or []:
+            if isinstance(collaborator, CollaboratorAgent):
+                collaborator.agent_arn
+            else:
+                collaborator._resolve_collaborators()
+
     def get_invoke_params(self) -> Dict:
         invokeParams = dict()
         match self.agent_collaboration:
@@ -0,0 +1,196 @@
+"""
+Per-process AWS context shared by the building blocks of an InlineAgent.
+
+InlineAgent, CollaboratorAgent, KnowledgeBasePlugin and ActionGroup resolve names to
+IDs and ARNs when they are built. Going through one AwsContext, they share an account ID
+and control-plane clients per profile, and list the agents and knowledge bases of an
+account once into name to ID indexes rather than once per lookup::
+
+    context = get_aws_context()
+    knowledge_base_id = context.knowledge_base_id("default", "my-knowledge-base")
+
+An index is listed again when a name is missing from it, so resources created after the
+first lookup are still found. `refresh` drops the indexes, and `clear` everything, e.g.
+after switching credentials.
+
+boto3 sessions are not thread-safe: the shared clients are created from a session only
+used under the lock of the context, and `session` gives every thread a session of its
+own. Indexes are listed without holding that lock, so a lookup only waits for the
+listing of the index it needs. A process forked from one with a context starts afresh,
+boto3 sessions not being safe to share across processes either.
+"""
+
+import os
+import threading
+from typing import Dict, Optional, Tuple
+
+import boto3
+
+
+class AwsContext:
+    """Account IDs, clients and name to ID indexes per AWS profile."""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._pid = os.getpid()
+        # Sessions the shared clients are created from, only used under the lock
+        self._sessions: Dict[str, boto3.Session] = dict()
+        # Sessions of every thread, dropped when the generation changes
+        self._local = threading.local()
+        self._generation = 0
+        self._account_ids: Dict[str, str] = dict()
+        self._clients: Dict[Tuple[str, str], object] = dict()
+        self._indexes: Dict[Tuple[str, str, Optional[str]], Dict[str, str]] = dict()
+        self._index_locks: Dict[Tuple[str, str, Optional[str]], threading.Lock] = dict()
+        self.api_calls = 0
+
+    def _check_pid(self):
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._lock = threading.RLock()
+            self._clear()
+
+    def _clear(self):
+        self._sessions.clear()
+        self._generation += 1
+        self._account_ids.clear()
+        self._clients.clear()
+        self._indexes.clear()
+        self._index_locks.clear()
+
+    def _shared_session(self, profile: str) -> boto3.Session:
+        # Called under the lock
+        if profile not in self._sessions:
+            self._sessions[profile] = boto3.Session(profile_name=profile)
+        return self._sessions[profile]
+
+    def session(self, profile: str) -> boto3.Session:
+        """AWS session of a profile for the calling thread, created once per thread."""
+        self._check_pid()
+        if getattr(self._local, "generation", None) != self._generation:
+            self._local.generation = self._generation
+            self._local.sessions = dict()
+        if profile not in self._local.sessions:
+            self._local.sessions[profile] = boto3.Session(profile_name=profile)
+        return self._local.sessions[profile]
+
+    def region(self, profile: str) -> str:
+        self._check_pid()
+        with self._lock:
+            return self._shared_session(profile).region_name
+
+    def client(self, profile: str, service_name: str):
+        """Client of a profile for a service, created once.
+
+        Meant for control-plane lookups; clients are safe to share across threads once
+        created.
+        """
+        self._check_pid()
+        with self._lock:
+            key = (profile, service_name)
+            if key not in self._clients:
+                self._clients[key] = self._shared_session(profile).client(
+                    service_name
+                )
+            return self._clients[key]
+
+    def _count_api_call(self):
+        with self._lock:
+            self.api_calls += 1
+
+    def account_id(self, profile: str) -> str:
+        """ID of the account of a profile, from a single STS call."""
+        self._check_pid()
+        with self._lock:
+            if profile not in self._account_ids:
+                self._count_api_call()
+                self._account_ids[profile] = self.client(
+                    profile, "sts"
+                ).get_caller_identity()["Account"]
+            return self._account_ids[profile]
+
+    def _list_agents(self, profile: str) -> Dict[str, str]:
+        index = dict()
+        paginator = self.client(profile, "bedrock-agent").get_paginator("list_agents")
+        for page in paginator.paginate():
+            self._count_api_call()
+            for agent in page["agentSummaries"]:
+                index[agent["agentName"]] = agent["agentId"]
+        return index
+
+    def _list_knowledge_bases(self, profile: str) -> Dict[str, str]:
+        index = dict()
+        paginator = self.client(profile, "bedrock-agent").get_paginator(
+            "list_knowledge_bases"
+        )
+        for page in paginator.paginate():
+            self._count_api_call()
+            for knowledge_base in page["knowledgeBaseSummaries"]:
+                index[knowledge_base["name"]] = knowledge_base["knowledgeBaseId"]
+        return index
+
+    def _lookup(self, kind: str, profile: str, name: str, list_all) -> Optional[str]:
+        self._check_pid()
+        key = (kind, profile, self.region(profile))
+        with self._lock:
+            index = self._indexes.get(key)
+            if index is not None and name in index:
+                return index[name]
+            index_lock = self._index_locks.setdefault(key, threading.Lock())
+
+        # List again on a miss, the resource may have been created since. Only lookups
+        # of the same index wait for the listing, which doesn't hold the context lock
+        with index_lock:
+            with self._lock:
+                listed = self._indexes.get(key)
+            if listed is not index and listed is not None and name in listed:
+                # Listed by another thread in the meantime
+                return listed[name]
+            listed = list_all(profile)
+            with self._lock:
+                self._indexes[key] = listed
+            return listed.get(name)
+
+    def agent_id(self, profile: str, agent_name: str) -> str:
+        """ID of the agent with a name in the account and region of a profile.
+
+        Raises:
+            ValueError: if there is no such agent
+        """
+        agent_id = self._lookup("agent", profile, agent_name, self._list_agents)
+        if agent_id is None:
+            raise ValueError(f"Agent {agent_name} not found")
+        return agent_id
+
+    def agent_arn(self, profile: str, agent_name: str) -> str:
+        return f"arn:aws:bedrock:{self.region(profile)}:{self.account_id(profile)}:agent/{self.agent_id(profile, agent_name)}"
+
+    def knowledge_base_id(self, profile: str, knowledge_base_name: str) -> Optional[str]:
+        """ID of the knowledge base with a name in the account and region of a profile.
+
+        Returns:
+            Optional[str]: knowledge base ID if found, None otherwise
+        """
+        return self._lookup(
+            "knowledge_base", profile, knowledge_base_name, self._list_knowledge_bases
+        )
+
+    def refresh(self, profile: Optional[str] = None):
+        """Drop the agent and knowledge base indexes, of a profile or of all profiles."""
+        with self._lock:
+            for key in list(self._indexes):
+                if profile is None or key[1] == profile:
+                    del self._indexes[key]
+
+    def clear(self):
+        """Forget all sessions, account IDs, clients and indexes."""
+        with self._lock:
+            self._clear()
+
+
+_context = AwsContext()
+
+
+def get_aws_context() -> AwsContext:
+    """The AwsContext of the process."""
+    return _context
@@ -5,6 +5,8 @@ from typing import Any, Dict, Optional
 import boto3
 from pydantic import BaseModel, Field, computed_field, model_validator, validate_call
 
+from InlineAgent.aws_context import get_aws_context
+
 
 class KnowledgeBasePlugin(BaseModel):
     name: str
@@ -18,16 +20,16 @@ class KnowledgeBasePlugin(BaseModel):
     @computed_field
     @cached_property
     def session(self) -> boto3.Session:
-        """Lazy loading of AWS session"""
-        return boto3.Session(profile_name=self.profile)
+        """AWS session of the profile, shared through the AWS context of the process"""
+        return get_aws_context().session(self.profile)
 
     def to_dict(self) -> dict:
         """Convert the KnowledgeBase instance to a dictionary"""
 
         # Adding for unittest
         if self.name != "SKaEdphpZh":
-            knowledgeBaseId = KnowledgeBasePlugin.get_knowledge_base_id_by_name(
-                self.name, self.session
+            knowledgeBaseId = get_aws_context().knowledge_base_id(
+                self.profile, self.name
             )
             if knowledgeBaseId is None:
                 raise ValueError(f"Knowledge base {self.name} does not exist")
@@ -79,4 +81,4 @@ class KnowledgeBasePlugin(BaseModel):
             if not next_token:
                 break
 
-            raise ValueError(f"Knowledge base {knowledge_base_name} not found")
+        return None
@@ -1,6 +1,48 @@
-from .trace import Trace
-from .agent_instrument import observe
-from .settings_management import ObservabilityConfig
-from .trace_provider import create_tracer_provider
+import importlib
+from typing import TYPE_CHECKING
 
-__all__ = ["Trace", "observe", "ObservabilityConfig", "create_tracer_provider"]
+# Imported on first access, OpenTelemetry and the OTLP exporters are slow to import
+_LAZY_ATTRIBUTES = {
+    "Trace": ".trace",
+    "observe": ".agent_instrument",
+    "current_invocation": ".agent_instrument",
+    "ObservabilityConfig": ".settings_management",
+    "EventStreamRecorder": ".replay",
+    "EventStreamReplayer": ".replay",
+    "PatchedClients": ".replay",
+    "TraceSampler": ".sampling",
+    "create_tracer_provider": ".trace_provider",
+}
+
+__all__ = [
+    "Trace",
+    "observe",
+    "current_invocation",
+    "ObservabilityConfig",
+    "EventStreamRecorder",
+    "EventStreamReplayer",
+    "PatchedClients",
+    "TraceSampler",
+    "create_tracer_provider",
+]
+
+
+def __getattr__(name: str):
+    if name not in _LAZY_ATTRIBUTES:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(_LAZY_ATTRIBUTES[name], __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
+
+
+if TYPE_CHECKING:
+    from .trace import Trace
+    from .agent_instrument import observe, current_invocation
+    from .replay import EventStreamRecorder, EventStreamReplayer, PatchedClients
+    from .sampling import TraceSampler
+    from .settings_management import ObservabilityConfig
+    from .trace_provider import create_tracer_provider
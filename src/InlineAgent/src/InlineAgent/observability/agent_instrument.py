@@ -1,7 +1,12 @@
+import asyncio
+from contextlib import contextmanager
+from contextvars import ContextVar
 from datetime import datetime, timezone
 import functools
+import inspect
 import logging
 import os
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Optional
 from opentelemetry import trace as otel_trace
 from termcolor import colored
 from rich.console import Console
@@ -17,6 +22,7 @@ from openinference.semconv.trace import (
 from .utils import add_citation, get_agent_from_caller_chain
 from .semantics import SpanAttributes, SpanName
 from .process import ProcessL2Trace
+from .sampling import TraceSampler
 from .settings_management import ObservabilityConfig
 from .span_manager import SpanManager
 from .utils import json_safe
@@ -24,453 +30,745 @@ from .utils import json_safe
 
 from InlineAgent.constants import TraceColor
 
-logging.basicConfig(
-    level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
-)
+logger = logging.getLogger(__name__)
 
-config = ObservabilityConfig()
+_config: Optional[ObservabilityConfig] = None
 
-tracer = otel_trace.get_tracer(config.BEDROCK_AGENT_TRACER_NAME)
 
-guardrail_span: otel_trace.Span = None
-output_stream_guardrail_intervene: bool = False
-is_guardrail: bool = False
+def get_config() -> ObservabilityConfig:
+    """Configuration of the module, read from the environment and `.env` on first use."""
+    global _config
+    if _config is None:
+        _config = ObservabilityConfig()
+    return _config
 
 
-def observe(show_traces: bool = True, save_traces: bool = False):
-    def decorator(func):
-        @functools.wraps(func)
-        def wrapper(
-            inputText: str,
-            sessionId: str,
-            **kwargs,
-        ):
-            global guardrail_span
-            global output_stream_guardrail_intervene
-            global is_guardrail
-            # Extract tracing parameters
-            user_id = kwargs.pop("user_id", "anonymous")
-            tags = kwargs.pop("tags", [])
-
-            agent_id = kwargs.get("agentId", "")
-            agent_alias_id = kwargs.get("agentAliasId", "")
-            agent_name = kwargs.pop("agent_name", "")
-
-            if not agent_id or not agent_alias_id:
-                # TODO: Warning
-                pass
+def get_tracer() -> otel_trace.Tracer:
+    return otel_trace.get_tracer(get_config().BEDROCK_AGENT_TRACER_NAME)
 
-            stream_final_response = kwargs.get(
-                "streamingConfigurations", {"streamFinalResponse": False}
-            )
-            
-            stream_final_response= stream_final_response["streamFinalResponse"]
-            span_manager = SpanManager()
 
-            time_before_call = datetime.now(timezone.utc)
-            time_after_call = None
+def __getattr__(name: str):
+    # `config` and `tracer` stay module attributes, without reading `.env` at import
+    if name == "config":
+        return get_config()
+    if name == "tracer":
+        return get_tracer()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
-            if config.PRODUCE_BEDROCK_OTEL_TRACES:
-                root_agent_span = span_manager.create_agent_span_return(
-                    agent_session_id=sessionId,
-                    caller_chain=[
-                        {
-                            "agentAliasArn": f"arn:aws:bedrock:agent:agent-alias/{agent_id}/{agent_alias_id}"
-                        }
-                    ],
-                    # start_time=int(time_before_call.timestamp() * 1e9),
+
+# Invocation observed by the current thread or asyncio task
+_current_invocation: ContextVar[Optional["ObservedInvocation"]] = ContextVar(
+    "current_invocation", default=None
+)
+
+
+def current_invocation() -> Optional["ObservedInvocation"]:
+    """The invocation being observed in the current thread or asyncio task, if any.
+
+    Code called by an observed function, e.g. to handle return of control, can use it
+    to reach the root span of the invocation.
+    """
+    return _current_invocation.get()
+
+
+class ObservedInvocation:
+    """Trace state of one invocation wrapped by ``observe``.
+
+    Each call of an observed function gets its own instance, so that invocations
+    running concurrently in threads or asyncio tasks do not share spans, answers or
+    guardrail state.
+    """
+
+    def __init__(
+        self,
+        inputText: str,
+        sessionId: str,
+        kwargs: Dict,
+        sampler: TraceSampler,
+        show_traces: bool,
+        save_traces: bool,
+    ):
+        self.config = get_config()
+        self.tracer = get_tracer()
+        self.sampler = sampler
+        self.show_traces = show_traces
+        self.save_traces = save_traces
+
+        self.input_text = inputText
+        self.session_id = sessionId
+        # Extract tracing parameters
+        self.user_id = kwargs.pop("user_id", "anonymous")
+        self.tags = kwargs.pop("tags", [])
+
+        self.agent_id = kwargs.get("agentId", "")
+        self.agent_alias_id = kwargs.get("agentAliasId", "")
+        self.agent_name = kwargs.pop("agent_name", "")
+        # Parameters left for the observed function
+        self.kwargs = kwargs
+
+        if not self.agent_id or not self.agent_alias_id:
+            # TODO: Warning
+            pass
+
+        stream_final_response = kwargs.get(
+            "streamingConfigurations", {"streamFinalResponse": False}
+        )
+        self.stream_final_response = stream_final_response["streamFinalResponse"]
+        self.span_manager = SpanManager(debug=self.config.TRACE_DEBUG)
+        self.root_agent_span = None
+
+        self.guardrail_span: otel_trace.Span = None
+        self.output_stream_guardrail_intervene = False
+        self.is_guardrail = False
+
+        self.time_before_call = datetime.now(timezone.utc)
+        self.time_after_call = None
+
+        # Head sampling decision, taken once per invocation
+        self.record_spans = (
+            self.config.PRODUCE_BEDROCK_OTEL_TRACES and sampler.should_sample()
+        )
+
+        # Unsampled invocations only buffer their events, in case a tail rule fires
+        self.deferred_events: Optional[List[Dict]] = None
+        if (
+            self.config.PRODUCE_BEDROCK_OTEL_TRACES
+            and not self.record_spans
+            and sampler.tail_sampling
+        ):
+            self.deferred_events = list()
+
+        if self.record_spans:
+            self.root_agent_span = self.start_root_agent_span(sampling_decision="head")
+
+        self.agent_answer = str()
+        self.cite = None
+        self.citations = list()
+        self.total_input_tokens = 0
+        self.total_output_tokens = 0
+        self.total_llm_calls = 0
+
+    def start_root_agent_span(self, sampling_decision: str):
+        return self.span_manager.create_agent_span_return(
+            agent_session_id=self.session_id,
+            caller_chain=[
+                {
+                    "agentAliasArn": f"arn:aws:bedrock:agent:agent-alias/{self.agent_id}/{self.agent_alias_id}"
+                }
+            ],
+            # start_time=int(time_before_call.timestamp() * 1e9),
+            attributes={
+                OtelSpanAttributes.OPENINFERENCE_SPAN_KIND: OpenInferenceSpanKindValues.AGENT.value,
+                OtelSpanAttributes.INPUT_VALUE: self.input_text,
+                SpanAttributes.AGENT_ID.value: self.agent_id,
+                SpanAttributes.AGENT_ALIAS_ID.value: self.agent_alias_id,
+                OtelSpanAttributes.TAG_TAGS: self.tags,
+                OtelSpanAttributes.USER_ID: self.user_id,
+                OtelSpanAttributes.TOOL_PARAMETERS: json_safe(self.kwargs),
+                OtelSpanAttributes.SESSION_ID: self.session_id,
+                "langfuse.tags": self.tags,
+                OtelSpanAttributes.LLM_SYSTEM: "aws.bedrock",
+                SpanAttributes.SAMPLING_DECISION.value: sampling_decision,
+            },
+            name=f"Agent {self.agent_id}:{self.agent_alias_id}",
+        )
+
+    def process_return_control(self, return_control):
+        roc_span = self.tracer.start_span(
+            name="Return of Control",
+            kind=SpanKind.CLIENT,
+            attributes={SpanAttributes.RETURN_CONTROL.value: json_safe(return_control)},
+            context=otel_trace.set_span_in_context(self.root_agent_span),
+        )
+        roc_span.set_status(Status(StatusCode.OK))
+        roc_span.end()
+
+    def process_guardrail_trace(self, trace_data, replay: bool = False):
+        """Guardrail spans and answer resets, `replay` only records spans."""
+        agent_id, agent_alias_id = self.agent_id, self.agent_alias_id
+
+        session_id = trace_data["sessionId"]
+        caller_chain = trace_data["callerChain"]
+        guardrail_trace = trace_data["trace"]["guardrailTrace"]
+        sub_agent_id, sub_agent_alias_id = get_agent_from_caller_chain(
+            caller_chain=caller_chain, index=-1
+        )
+
+        if (
+            not replay
+            and sub_agent_id == agent_id
+            and sub_agent_alias_id == agent_alias_id
+        ):
+            self.is_guardrail = True
+
+        if "inputAssessments" in guardrail_trace:
+
+            if self.record_spans:
+                agent_span = self.span_manager.create_agent_span_return(
+                    agent_session_id=session_id,
+                    caller_chain=caller_chain,
+                    # start_time=int(event_time.timestamp() * 1e9),
                     attributes={
                         OtelSpanAttributes.OPENINFERENCE_SPAN_KIND: OpenInferenceSpanKindValues.AGENT.value,
-                        OtelSpanAttributes.INPUT_VALUE: inputText,
-                        SpanAttributes.AGENT_ID.value: agent_id,
-                        SpanAttributes.AGENT_ALIAS_ID.value: agent_alias_id,
-                        OtelSpanAttributes.TAG_TAGS: tags,
-                        OtelSpanAttributes.USER_ID: user_id,
-                        OtelSpanAttributes.TOOL_PARAMETERS: json_safe(kwargs),
-                        OtelSpanAttributes.SESSION_ID: sessionId,
-                        "langfuse.tags": tags,
+                        SpanAttributes.AGENT_ID.value: sub_agent_id,
+                        SpanAttributes.AGENT_ALIAS_ID.value: sub_agent_alias_id,
                         OtelSpanAttributes.LLM_SYSTEM: "aws.bedrock",
+                        OtelSpanAttributes.SESSION_ID: session_id,
                     },
                     name=f"Agent {agent_id}:{agent_alias_id}",
                 )
 
-            agent_answer = str()
-            cite = None
-            citations = list()
-            total_input_tokens = 0
-            total_output_tokens = 0
-            total_llm_calls = 0
-            try:
-                response = func(
-                    inputText=inputText,
-                    sessionId=sessionId,
-                    **kwargs,
+            if not replay and guardrail_trace["action"] == "INTERVENED":
+                self.agent_answer = str()
+
+            if self.record_spans:
+                self.guardrail_span = self.tracer.start_span(
+                    name=SpanName.GUARDRAIL.value,
+                    kind=SpanKind.CLIENT,
+                    attributes={
+                        OtelSpanAttributes.OPENINFERENCE_SPAN_KIND: OpenInferenceSpanKindValues.GUARDRAIL.value,
+                        SpanAttributes.GUARDRAIL_ACTION.value: guardrail_trace["action"],
+                    },
+                    context=otel_trace.set_span_in_context(agent_span),
+                )
+                self.guardrail_span.set_attributes(
+                    {
+                        OtelSpanAttributes.INPUT_VALUE: json_safe(
+                            guardrail_trace["inputAssessments"]
+                        ),
+                        OtelSpanAttributes.INPUT_MIME_TYPE: "application/json",
+                    }
                 )
 
-                event_stream = response["completion"]
-
-                for event in event_stream:
-                    if "files" in event:
-                        files_event = event["files"]
-
-                        files_list = files_event["files"]
-                        for idx, this_file in enumerate(files_list):
-                            file_bytes = this_file["bytes"]
-
-                            # save bytes to file, given the name of file and the bytes
-
-                            directory_path = os.path.join(os.getcwd(), "output")
-                            if not os.path.exists(directory_path):
-                                try:
-                                    os.makedirs(directory_path, exist_ok=True)
-                                except OSError as e:
-                                    print(f"Error creating directory output: {e}")
-                                    raise
-
-                            if not os.path.exists(
-                                os.path.join(directory_path, str(sessionId))
-                            ):
-                                try:
-                                    os.makedirs(
-                                        os.path.join(directory_path, str(sessionId)),
-                                        exist_ok=True,
-                                    )
-                                except OSError as e:
-                                    print(f"Error creating directory output: {e}")
-                                    raise
-
-                            file_name = os.path.join(
-                                directory_path, str(sessionId), this_file["name"]
-                            )
-                            with open(file_name, "wb") as f:
-                                f.write(file_bytes)
-
-                            if config.PRODUCE_BEDROCK_OTEL_TRACES:
-                                with open(file_name, "rb") as f:
-                                    root_agent_span.set_attribute(
-                                        SpanAttributes.FILES.value + str(idx + 1),
-                                        f.read().decode("utf8", errors="ignore"),
-                                    )
-
-                        if show_traces:
-                            console = Console()
-                            print("\n\n")
-                            console.print(
-                                Markdown("**Files saved in output directory**")
-                            )
-
-                    if "returnControl" in event:
-                        if config.PRODUCE_BEDROCK_OTEL_TRACES:
-
-                            roc_span = tracer.start_span(
-                                name="Return of Control",
-                                kind=SpanKind.CLIENT,
-                                attributes={
-                                    SpanAttributes.RETURN_CONTROL.value: json_safe(
-                                        event["returnControl"]
-                                    )
-                                },
-                                context=otel_trace.set_span_in_context(root_agent_span),
-                            )
-                            roc_span.set_status(Status(StatusCode.OK))
-                            roc_span.end()
-
-                    if "trace" in event:
-
-                        trace_data = event["trace"]
-
-                        if "trace" in trace_data:
-                            if "guardrailTrace" in trace_data["trace"]:
-                                session_id = trace_data["sessionId"]
-                                caller_chain = trace_data["callerChain"]
-                                guardrail_trace = trace_data["trace"]["guardrailTrace"]
-                                sub_agent_id, sub_agent_alias_id = (
-                                    get_agent_from_caller_chain(
-                                        caller_chain=caller_chain, index=-1
-                                    )
-                                )
-
-                                if (
-                                    sub_agent_id == agent_id
-                                    and sub_agent_alias_id == agent_alias_id
-                                ):
-                                    is_guardrail = True
-
-                                if "inputAssessments" in guardrail_trace:
-
-                                    if config.PRODUCE_BEDROCK_OTEL_TRACES:
-                                        agent_span = span_manager.create_agent_span_return(
-                                            agent_session_id=session_id,
-                                            caller_chain=caller_chain,
-                                            # start_time=int(event_time.timestamp() * 1e9),
-                                            attributes={
-                                                OtelSpanAttributes.OPENINFERENCE_SPAN_KIND: OpenInferenceSpanKindValues.AGENT.value,
-                                                SpanAttributes.AGENT_ID.value: sub_agent_id,
-                                                SpanAttributes.AGENT_ALIAS_ID.value: sub_agent_alias_id,
-                                                OtelSpanAttributes.LLM_SYSTEM: "aws.bedrock",
-                                                OtelSpanAttributes.SESSION_ID: session_id,
-                                            },
-                                            name=f"Agent {agent_id}:{agent_alias_id}",
-                                        )
-
-                                    if guardrail_trace["action"] == "INTERVENED":
-                                        agent_answer = str()
-
-                                    if config.PRODUCE_BEDROCK_OTEL_TRACES:
-                                        guardrail_span = tracer.start_span(
-                                            name=SpanName.GUARDRAIL.value,
-                                            kind=SpanKind.CLIENT,
-                                            attributes={
-                                                OtelSpanAttributes.OPENINFERENCE_SPAN_KIND: OpenInferenceSpanKindValues.GUARDRAIL.value,
-                                                SpanAttributes.GUARDRAIL_ACTION.value: guardrail_trace[
-                                                    "action"
-                                                ],
-                                            },
-                                            context=otel_trace.set_span_in_context(
-                                                agent_span
-                                            ),
-                                        )
-                                        guardrail_span.set_attributes(
-                                            {
-                                                OtelSpanAttributes.INPUT_VALUE: json_safe(
-                                                    guardrail_trace["inputAssessments"]
-                                                ),
-                                                OtelSpanAttributes.INPUT_MIME_TYPE: "application/json",
-                                            }
-                                        )
-
-                                        guardrail_span.set_status(Status(StatusCode.OK))
-                                        guardrail_span.end()
-                                        guardrail_span = None
-
-                                if "outputAssessments" in guardrail_trace:
-                                    if config.PRODUCE_BEDROCK_OTEL_TRACES:
-                                        if stream_final_response is False:
-                                            if (
-                                                guardrail_trace["action"]
-                                                == "INTERVENED"
-                                            ):
-                                                agent_answer = str()
-
-                                            guardrail_span = tracer.start_span(
-                                                name=SpanName.GUARDRAIL.value,
-                                                kind=SpanKind.CLIENT,
-                                                attributes={
-                                                    OtelSpanAttributes.OPENINFERENCE_SPAN_KIND: OpenInferenceSpanKindValues.GUARDRAIL.value,
-                                                    SpanAttributes.GUARDRAIL_ACTION.value: guardrail_trace[
-                                                        "action"
-                                                    ],
-                                                },
-                                                context=otel_trace.set_span_in_context(
-                                                    span_manager.spans[
-                                                        session_id
-                                                    ].agent_span.span
-                                                ),
-                                            )
-                                            guardrail_span.set_attributes(
-                                                {
-                                                    OtelSpanAttributes.OUTPUT_VALUE: json_safe(
-                                                        guardrail_trace[
-                                                            "outputAssessments"
-                                                        ]
-                                                    ),
-                                                    OtelSpanAttributes.OUTPUT_MIME_TYPE: "application/json",
-                                                }
-                                            )
-                                            guardrail_span.set_status(
-                                                Status(StatusCode.OK)
-                                            )
-                                            guardrail_span.end()
-                                        else:
-                                            if (
-                                                not guardrail_span
-                                                and guardrail_trace["action"]
-                                                == "INTERVENED"
-                                            ):
-
-                                                if (
-                                                    sub_agent_id == agent_id
-                                                    and sub_agent_alias_id
-                                                    == agent_alias_id
-                                                ):
-                                                    output_stream_guardrail_intervene = (
-                                                        True
-                                                    )
-
-                                                guardrail_span = tracer.start_span(
-                                                    name=SpanName.GUARDRAIL.value,
-                                                    kind=SpanKind.CLIENT,
-                                                    attributes={
-                                                        OtelSpanAttributes.OPENINFERENCE_SPAN_KIND: OpenInferenceSpanKindValues.GUARDRAIL.value,
-                                                        SpanAttributes.GUARDRAIL_ACTION.value: guardrail_trace[
-                                                            "action"
-                                                        ],
-                                                    },
-                                                    context=otel_trace.set_span_in_context(
-                                                        span_manager.spans[
-                                                            session_id
-                                                        ].agent_span.span
-                                                    ),
-                                                )
-                                                guardrail_span.set_attributes(
-                                                    {
-                                                        OtelSpanAttributes.OUTPUT_VALUE: json_safe(
-                                                            guardrail_trace[
-                                                                "outputAssessments"
-                                                            ]
-                                                        ),
-                                                        OtelSpanAttributes.OUTPUT_MIME_TYPE: "application/json",
-                                                    }
-                                                )
-                                                guardrail_span.set_status(
-                                                    Status(StatusCode.OK)
-                                                )
-                                                guardrail_span.end()
-
-                        input_tokens, output_tokens, llm_calls = (
-                            ProcessL2Trace.process_trace_event(
-                                trace_data=event["trace"],
-                                span_manager=span_manager,
-                                save_traces=save_traces,
-                                session_id=sessionId,
-                                show_traces=show_traces,
-                            )
-                        )
-                        total_input_tokens += int(input_tokens)
-                        total_output_tokens += int(output_tokens)
-                        total_llm_calls += int(llm_calls)
-
-                    # Get Final Answer
-                    if "chunk" in event:
-                        if "attribution" in event["chunk"]:
-                            citations.append(event["chunk"]["attribution"]["citations"])
-                            agent_answer, cite = add_citation(
-                                citations=event["chunk"]["attribution"]["citations"],
-                                cite=1 if not cite else cite,
-                            )
-                        else:
-                            data = event["chunk"]["bytes"]
-                            if stream_final_response is True:
-                                if output_stream_guardrail_intervene is True:
-                                    agent_answer = str()
-                                    agent_answer += data.decode("utf8")
-                                    print(
-                                        colored(
-                                            "\n\n\n" + data.decode("utf-8"),
-                                            TraceColor.error,
-                                        ),
-                                        end="",
-                                    )
-                                else:
-                                    agent_answer += data.decode("utf8")
-                                    print(
-                                        colored(
-                                            data.decode("utf-8"),
-                                            TraceColor.final_output,
-                                        ),
-                                        end="",
-                                    )
-                            else:
-                                agent_answer += data.decode("utf8")
-                                print(
-                                    colored(agent_answer, TraceColor.final_output),
-                                    end="",
-                                )
-
-                time_after_call = datetime.now(timezone.utc)
-
-                if config.PRODUCE_BEDROCK_OTEL_TRACES:
-                    if sessionId not in span_manager.spans:
-                        raise RuntimeError("Root Agent span not found")
-                    if citations and output_stream_guardrail_intervene is False:
-                        root_agent_span.set_attribute(
-                            OtelSpanAttributes.RETRIEVAL_DOCUMENTS, json_safe(citations)
-                        )
+                self.guardrail_span.set_status(Status(StatusCode.OK))
+                self.guardrail_span.end()
+                self.guardrail_span = None
 
-                    if is_guardrail and not guardrail_span:
-                        guardrail_span = tracer.start_span(
+        if (
+            "outputAssessments" in guardrail_trace
+            and self.config.PRODUCE_BEDROCK_OTEL_TRACES
+        ):
+            if self.stream_final_response is False:
+                if not replay and guardrail_trace["action"] == "INTERVENED":
+                    self.agent_answer = str()
+
+                if self.record_spans:
+                    self.guardrail_span = self.tracer.start_span(
+                        name=SpanName.GUARDRAIL.value,
+                        kind=SpanKind.CLIENT,
+                        attributes={
+                            OtelSpanAttributes.OPENINFERENCE_SPAN_KIND: OpenInferenceSpanKindValues.GUARDRAIL.value,
+                            SpanAttributes.GUARDRAIL_ACTION.value: guardrail_trace[
+                                "action"
+                            ],
+                        },
+                        context=otel_trace.set_span_in_context(
+                            self.span_manager.spans[session_id].agent_span.span
+                        ),
+                    )
+                    self.guardrail_span.set_attributes(
+                        {
+                            OtelSpanAttributes.OUTPUT_VALUE: json_safe(
+                                guardrail_trace["outputAssessments"]
+                            ),
+                            OtelSpanAttributes.OUTPUT_MIME_TYPE: "application/json",
+                        }
+                    )
+                    self.guardrail_span.set_status(Status(StatusCode.OK))
+                    self.guardrail_span.end()
+            else:
+                if not self.guardrail_span and guardrail_trace["action"] == "INTERVENED":
+
+                    if (
+                        not replay
+                        and sub_agent_id == agent_id
+                        and sub_agent_alias_id == agent_alias_id
+                    ):
+                        self.output_stream_guardrail_intervene = True
+
+                    if self.record_spans:
+                        self.guardrail_span = self.tracer.start_span(
                             name=SpanName.GUARDRAIL.value,
                             kind=SpanKind.CLIENT,
                             attributes={
                                 OtelSpanAttributes.OPENINFERENCE_SPAN_KIND: OpenInferenceSpanKindValues.GUARDRAIL.value,
-                                SpanAttributes.GUARDRAIL_ACTION.value: "NONE",
+                                SpanAttributes.GUARDRAIL_ACTION.value: guardrail_trace[
+                                    "action"
+                                ],
                             },
-                            context=otel_trace.set_span_in_context(root_agent_span),
+                            context=otel_trace.set_span_in_context(
+                                self.span_manager.spans[session_id].agent_span.span
+                            ),
                         )
-
-                        guardrail_span.set_attributes(
+                        self.guardrail_span.set_attributes(
                             {
-                                OtelSpanAttributes.OUTPUT_VALUE: json_safe([{}]),
+                                OtelSpanAttributes.OUTPUT_VALUE: json_safe(
+                                    guardrail_trace["outputAssessments"]
+                                ),
                                 OtelSpanAttributes.OUTPUT_MIME_TYPE: "application/json",
                             }
                         )
-
-                        guardrail_span.set_status(Status(StatusCode.OK))
-                        guardrail_span.end()
-                        guardrail_span = None
-                    else:
-                        guardrail_span = None
-
-                    root_agent_span.set_attribute(
-                        OtelSpanAttributes.OUTPUT_VALUE, agent_answer
+                        self.guardrail_span.set_status(Status(StatusCode.OK))
+                        self.guardrail_span.end()
+
+    def start_recording(self):
+        """Tail sampling: record the spans of the buffered events after all."""
+        self.record_spans = True
+        self.root_agent_span = self.start_root_agent_span(sampling_decision="tail")
+
+        for deferred_event in self.deferred_events:
+            if "returnControl" in deferred_event:
+                self.process_return_control(deferred_event["returnControl"])
+
+            if "trace" in deferred_event:
+                trace_data = deferred_event["trace"]
+                if "guardrailTrace" in trace_data.get("trace", {}):
+                    self.process_guardrail_trace(trace_data, replay=True)
+
+                ProcessL2Trace.process_trace_event(
+                    trace_data=trace_data,
+                    span_manager=self.span_manager,
+                    save_traces=False,
+                    session_id=self.session_id,
+                    show_traces=False,
+                )
+        self.deferred_events.clear()
+
+    def save_files(self, files_event: Dict):
+        files_list = files_event["files"]
+        for idx, this_file in enumerate(files_list):
+            file_bytes = this_file["bytes"]
+
+            # save bytes to file, given the name of file and the bytes
+
+            directory_path = os.path.join(os.getcwd(), "output")
+            if not os.path.exists(directory_path):
+                try:
+                    os.makedirs(directory_path, exist_ok=True)
+                except OSError as e:
+                    print(f"Error creating directory output: {e}")
+                    raise
+
+            if not os.path.exists(os.path.join(directory_path, str(self.session_id))):
+                try:
+                    os.makedirs(
+                        os.path.join(directory_path, str(self.session_id)),
+                        exist_ok=True,
                     )
-                    root_agent_span.set_attribute(
-                        OtelSpanAttributes.OUTPUT_MIME_TYPE, "text/plain"
+                except OSError as e:
+                    print(f"Error creating directory output: {e}")
+                    raise
+
+            file_name = os.path.join(
+                directory_path, str(self.session_id), this_file["name"]
+            )
+            with open(file_name, "wb") as f:
+                f.write(file_bytes)
+
+            if self.record_spans:
+                with open(file_name, "rb") as f:
+                    self.root_agent_span.set_attribute(
+                        SpanAttributes.FILES.value + str(idx + 1),
+                        f.read().decode("utf8", errors="ignore"),
                     )
-                    # End root span
 
-                    if output_stream_guardrail_intervene is True:
-                        span_manager.end_all_spans(status_code=StatusCode.OK)
+        if self.show_traces:
+            console = Console()
+            print("\n\n")
+            console.print(Markdown("**Files saved in output directory**"))
+
+    def process_event(self, event: Dict):
+        """Trace an event of the completion stream and add its chunk to the answer."""
+        if "files" in event:
+            self.save_files(event["files"])
+
+        if "returnControl" in event:
+            if self.record_spans:
+                self.process_return_control(event["returnControl"])
+            elif self.deferred_events is not None:
+                self.deferred_events.append(event)
+
+        if "trace" in event:
+
+            trace_data = event["trace"]
+
+            if self.deferred_events is not None and not self.record_spans:
+                if self.sampler.is_tail_event(trace_data):
+                    self.start_recording()
+                else:
+                    self.deferred_events.append(event)
+
+            if "trace" in trace_data:
+                if "guardrailTrace" in trace_data["trace"]:
+                    self.process_guardrail_trace(trace_data)
+
+            input_tokens, output_tokens, llm_calls = ProcessL2Trace.process_trace_event(
+                trace_data=event["trace"],
+                span_manager=self.span_manager,
+                save_traces=self.save_traces,
+                session_id=self.session_id,
+                show_traces=self.show_traces,
+                produce_spans=self.record_spans,
+            )
+            self.total_input_tokens += int(input_tokens)
+            self.total_output_tokens += int(output_tokens)
+            self.total_llm_calls += int(llm_calls)
+
+        # Get Final Answer
+        if "chunk" in event:
+            if "attribution" in event["chunk"]:
+                self.citations.append(event["chunk"]["attribution"]["citations"])
+                self.agent_answer, self.cite = add_citation(
+                    citations=event["chunk"]["attribution"]["citations"],
+                    cite=1 if not self.cite else self.cite,
+                )
+            else:
+                data = event["chunk"]["bytes"]
+                if self.stream_final_response is True:
+                    if self.output_stream_guardrail_intervene is True:
+                        self.agent_answer = str()
+                        self.agent_answer += data.decode("utf8")
+                        print(
+                            colored(
+                                "\n\n\n" + data.decode("utf-8"),
+                                TraceColor.error,
+                            ),
+                            end="",
+                        )
                     else:
-                        span_manager.spans[sessionId].agent_span.end_time = int(
-                            time_after_call.timestamp() * 1e9
+                        self.agent_answer += data.decode("utf8")
+                        print(
+                            colored(
+                                data.decode("utf-8"),
+                                TraceColor.final_output,
+                            ),
+                            end="",
                         )
+                else:
+                    self.agent_answer += data.decode("utf8")
+                    print(
+                        colored(self.agent_answer, TraceColor.final_output),
+                        end="",
+                    )
 
-                    if len(span_manager.spans) > 0:
-                        span_manager.end_all_spans(status_code=StatusCode.OK)
+    def finish(self):
+        """End the spans of a completed invocation."""
+        self.time_after_call = datetime.now(timezone.utc)
 
-            except Exception as e:
-                # Handle exceptions
+        if not self.record_spans:
+            return
 
-                if config.PRODUCE_BEDROCK_OTEL_TRACES:
-                    root_agent_span.record_exception(e)
-                    root_agent_span.set_attribute("error.message", str(e))
-                    root_agent_span.set_attribute("error.type", e.__class__.__name__)
-                    root_agent_span.set_status(Status(StatusCode.ERROR))
+        root_agent_span = self.root_agent_span
+        if self.session_id not in self.span_manager.spans:
+            raise RuntimeError("Root Agent span not found")
+        if self.citations and self.output_stream_guardrail_intervene is False:
+            root_agent_span.set_attribute(
+                OtelSpanAttributes.RETRIEVAL_DOCUMENTS, json_safe(self.citations)
+            )
 
-                    agent_answer = str()
-                    agent_answer = json_safe({"error": str(e), "exception": str(e)})
+        if self.is_guardrail and not self.guardrail_span:
+            guardrail_span = self.tracer.start_span(
+                name=SpanName.GUARDRAIL.value,
+                kind=SpanKind.CLIENT,
+                attributes={
+                    OtelSpanAttributes.OPENINFERENCE_SPAN_KIND: OpenInferenceSpanKindValues.GUARDRAIL.value,
+                    SpanAttributes.GUARDRAIL_ACTION.value: "NONE",
+                },
+                context=otel_trace.set_span_in_context(root_agent_span),
+            )
 
-                    root_agent_span.set_attribute(
-                        OtelSpanAttributes.OUTPUT_VALUE, json_safe(agent_answer)
-                    )
-                    root_agent_span.set_attribute(
-                        OtelSpanAttributes.OUTPUT_MIME_TYPE, "application/json"
+            guardrail_span.set_attributes(
+                {
+                    OtelSpanAttributes.OUTPUT_VALUE: json_safe([{}]),
+                    OtelSpanAttributes.OUTPUT_MIME_TYPE: "application/json",
+                }
+            )
+
+            guardrail_span.set_status(Status(StatusCode.OK))
+            guardrail_span.end()
+        self.guardrail_span = None
+
+        root_agent_span.set_attribute(OtelSpanAttributes.OUTPUT_VALUE, self.agent_answer)
+        root_agent_span.set_attribute(OtelSpanAttributes.OUTPUT_MIME_TYPE, "text/plain")
+        # End root span
+
+        if self.output_stream_guardrail_intervene is True:
+            self.span_manager.end_all_spans(status_code=StatusCode.OK)
+        else:
+            self.span_manager.spans[self.session_id].agent_span.end_time = int(
+                self.time_after_call.timestamp() * 1e9
+            )
+
+        if len(self.span_manager.spans) > 0:
+            self.span_manager.end_all_spans(status_code=StatusCode.OK)
+
+    def close(self):
+        """End the spans of an invocation whose stream the caller stopped reading."""
+        try:
+            self.finish()
+        except Exception as e:
+            self.time_after_call = datetime.now(timezone.utc)
+            logger.warning(f"Could not end spans of closed invocation: {e}")
+
+    def fail(self, e: Exception):
+        """Record a failed invocation, raising again when spans are produced."""
+        if self.config.PRODUCE_BEDROCK_OTEL_TRACES:
+            if (
+                not self.record_spans
+                and self.deferred_events is not None
+                and self.sampler.keep_errors
+            ):
+                try:
+                    self.start_recording()
+                except Exception as replay_error:
+                    logger.warning(
+                        f"Could not record spans of failed invocation: {replay_error}"
                     )
 
-                    span_manager.end_all_spans(status_code=StatusCode.ERROR)
+            if self.record_spans:
+                root_agent_span = self.root_agent_span
+                root_agent_span.record_exception(e)
+                root_agent_span.set_attribute("error.message", str(e))
+                root_agent_span.set_attribute("error.type", e.__class__.__name__)
+                root_agent_span.set_status(Status(StatusCode.ERROR))
 
-                    raise Exception(e)
+                self.agent_answer = json_safe({"error": str(e), "exception": str(e)})
 
-                else:
-                    print(f"An error occurred: {str(e)}")
-                    agent_answer = str(e)
+                root_agent_span.set_attribute(
+                    OtelSpanAttributes.OUTPUT_VALUE, json_safe(self.agent_answer)
+                )
+                root_agent_span.set_attribute(
+                    OtelSpanAttributes.OUTPUT_MIME_TYPE, "application/json"
+                )
+
+                self.span_manager.end_all_spans(status_code=StatusCode.ERROR)
+
+            raise Exception(e)
+
+        print(f"An error occurred: {str(e)}")
+        self.agent_answer = str(e)
+        self.time_after_call = datetime.now(timezone.utc)
+
+    @contextmanager
+    def active(self):
+        """Make this the current invocation, see `current_invocation`."""
+        token = _current_invocation.set(self)
+        try:
+            yield self
+        finally:
+            _current_invocation.reset(token)
+
+    def print_stats(self):
+        duration = (self.time_after_call - self.time_before_call).total_seconds()
+
+        print(
+            colored(
+                f"\nAgent made a total of {self.total_llm_calls} LLM calls, "
+                + f"using {self.total_input_tokens+self.total_output_tokens} tokens "
+                + f"(in: {self.total_input_tokens}, out: {self.total_output_tokens})"
+                + f", and took {duration} total seconds",
+                TraceColor.stats,
+            )
+        )
+
+
+_STREAM_END = object()
+
+# Events passed on to the caller by `observe(stream=True)`, traces are consumed
+STREAMED_EVENTS = ("chunk", "files", "returnControl")
 
-                time_after_call = datetime.now(timezone.utc)
 
-            duration = (time_after_call - time_before_call).total_seconds()
+async def _events(completion: Any):
+    """Events of a completion stream, iterating a synchronous one in worker threads."""
+    if hasattr(completion, "__aiter__"):
+        async for event in completion:
+            yield event
+        return
 
-            print(
-                colored(
-                    f"\nAgent made a total of {total_llm_calls} LLM calls, "
-                    + f"using {total_input_tokens+total_output_tokens} tokens "
-                    + f"(in: {total_input_tokens}, out: {total_output_tokens})"
-                    + f", and took {duration} total seconds",
-                    TraceColor.stats,
+    # A botocore EventStream blocks on the network, keep it off the event loop
+    iterator = iter(completion)
+    while True:
+        event = await asyncio.to_thread(next, iterator, _STREAM_END)
+        if event is _STREAM_END:
+            return
+        yield event
+
+
+def _close(completion: Any):
+    """Release the connection of a completion stream the caller stopped reading."""
+    close = getattr(completion, "close", None)
+    if callable(close):
+        close()
+
+
+def _stream(
+    invocation: ObservedInvocation, func: Callable, kwargs: Dict
+) -> Iterator[Dict]:
+    """Trace an observed call, yielding its streamed events as they arrive."""
+    completion = None
+    try:
+        with invocation.active():
+            response = func(
+                inputText=invocation.input_text,
+                sessionId=invocation.session_id,
+                **kwargs,
+            )
+        completion = response["completion"]
+
+        for event in completion:
+            with invocation.active():
+                invocation.process_event(event)
+            if any(key in event for key in STREAMED_EVENTS):
+                yield event
+        invocation.finish()
+    except GeneratorExit:
+        # Closed early by the caller, the spans end with the answer so far
+        invocation.close()
+        _close(completion)
+    except Exception as e:
+        invocation.fail(e)
+
+    invocation.print_stats()
+
+
+async def _astream(
+    invocation: ObservedInvocation, func: Callable, kwargs: Dict
+) -> AsyncIterator[Dict]:
+    """`_stream` of a coroutine function or an async generator function."""
+    completion = None
+    events = None
+    try:
+        with invocation.active():
+            if inspect.isasyncgenfunction(func):
+                completion = func(
+                    inputText=invocation.input_text,
+                    sessionId=invocation.session_id,
+                    **kwargs,
                 )
+            else:
+                response = await func(
+                    inputText=invocation.input_text,
+                    sessionId=invocation.session_id,
+                    **kwargs,
+                )
+                completion = response["completion"]
+
+        events = _events(completion)
+        async for event in events:
+            with invocation.active():
+                invocation.process_event(event)
+            if any(key in event for key in STREAMED_EVENTS):
+                yield event
+        invocation.finish()
+    except GeneratorExit:
+        # Closed early by the caller, the spans end with the answer so far
+        invocation.close()
+        if events is not None:
+            await events.aclose()
+        _close(completion)
+    except Exception as e:
+        invocation.fail(e)
+
+    invocation.print_stats()
+
+
+def observe(
+    show_traces: bool = True,
+    save_traces: bool = False,
+    sample_rate: Optional[float] = None,
+    stream: bool = False,
+):
+    """Instrument a function returning an ``invoke_agent`` response.
+
+    The function may be synchronous, a coroutine function, or an async generator
+    function yielding the events of the completion stream; the wrapper is then
+    asynchronous. The ``completion`` of the response may be a synchronous or an
+    asynchronous iterable. Every call is traced on its own, so observed functions can
+    serve concurrent sessions from threads or asyncio tasks.
+
+    Args:
+        show_traces: Print traces to the console.
+        save_traces: Save raw trace events to ``trace/<sessionId>.json``.
+        sample_rate: Fraction of invocations that produce OpenTelemetry spans,
+            defaults to ``TRACE_SAMPLE_RATE``. Unsampled invocations are still
+            recorded when they fail or a guardrail intervenes, unless disabled with
+            ``TRACE_KEEP_ERRORS`` and ``TRACE_KEEP_GUARDRAIL_INTERVENTIONS``.
+        stream: Make the wrapper a generator, or an async generator, of the
+            ``chunk``, ``files`` and ``returnControl`` events as they arrive, instead
+            of returning the answer at the end. Spans end when the generator is
+            exhausted or closed.
+    """
+    sampler = TraceSampler.from_config(config=get_config(), sample_rate=sample_rate)
+
+    def decorator(func):
+
+        def start(inputText: str, sessionId: str, kwargs: Dict) -> ObservedInvocation:
+            return ObservedInvocation(
+                inputText=inputText,
+                sessionId=sessionId,
+                kwargs=kwargs,
+                sampler=sampler,
+                show_traces=show_traces,
+                save_traces=save_traces,
             )
 
-            return agent_answer
+        if inspect.isasyncgenfunction(func) or inspect.iscoroutinefunction(func):
+
+            if stream:
+
+                @functools.wraps(func)
+                async def async_stream_wrapper(
+                    inputText: str,
+                    sessionId: str,
+                    **kwargs,
+                ):
+                    invocation = start(inputText, sessionId, kwargs)
+                    events = _astream(invocation, func, kwargs)
+                    try:
+                        async for event in events:
+                            yield event
+                    finally:
+                        # Async generators are not closed by their consumer's aclose
+                        await events.aclose()
+
+                return async_stream_wrapper
+
+            @functools.wraps(func)
+            async def async_wrapper(
+                inputText: str,
+                sessionId: str,
+                **kwargs,
+            ):
+                invocation = start(inputText, sessionId, kwargs)
+                async for _ in _astream(invocation, func, kwargs):
+                    pass
+                return invocation.agent_answer
+
+            return async_wrapper
+
+        if stream:
+
+            @functools.wraps(func)
+            def stream_wrapper(
+                inputText: str,
+                sessionId: str,
+                **kwargs,
+            ):
+                invocation = start(inputText, sessionId, kwargs)
+                yield from _stream(invocation, func, kwargs)
+
+            return stream_wrapper
+
+        @functools.wraps(func)
+        def wrapper(
+            inputText: str,
+            sessionId: str,
+            **kwargs,
+        ):
+            invocation = start(inputText, sessionId, kwargs)
+            for _ in _stream(invocation, func, kwargs):
+                pass
+            return invocation.agent_answer
 
         return wrapper
 
@@ -1,16 +1,15 @@
 import json
-import logging
-from typing import Any, Dict, Literal
+from typing import Any, Dict, Literal, Optional
 
 import os
 from opentelemetry.trace import StatusCode
-from opentelemetry import trace as otel_trace
 from openinference.semconv.trace import (
     SpanAttributes as OtelSpanAttributes,
     OpenInferenceSpanKindValues,
 )
 
 from InlineAgent.constants import TraceColor
+from InlineAgent.tool_results import token_savings
 
 from .utils import (
     get_agent_from_caller_chain,
@@ -31,13 +30,22 @@ from termcolor import colored
 from rich.console import Console
 from rich.markdown import Markdown
 
-config = ObservabilityConfig()
+_config: Optional[ObservabilityConfig] = None
 
-tracer = otel_trace.get_tracer(config.BEDROCK_AGENT_TRACER_NAME)
 
-logging.basicConfig(
-    level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
-)
+def get_config() -> ObservabilityConfig:
+    """Configuration of the module, read from the environment and `.env` on first use."""
+    global _config
+    if _config is None:
+        _config = ObservabilityConfig()
+    return _config
+
+
+def __getattr__(name: str):
+    # `config` stays a module attribute, without reading `.env` at import
+    if name == "config":
+        return get_config()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 class ProcessL2Trace:
@@ -74,6 +82,31 @@ class ProcessL2Trace:
         except Exception as e:
             print(f"An error occurred: {str(e)}")
 
+    @staticmethod
+    def get_token_usage(trace_data: Dict):
+        """Token usage of a single trace event without touching any span."""
+        trace = trace_data.get("trace", {})
+
+        for key in (
+            L2Traces.preProcessingTrace.value,
+            L2Traces.orchestrationTrace.value,
+            L2Traces.postProcessingTrace.value,
+            L2Traces.routingClassifierTrace.value,
+        ):
+            model_invocation_output = trace.get(key, {}).get(
+                L3OrchestrationTraces.modelInvocationOutput.value
+            )
+            if model_invocation_output is None:
+                continue
+
+            usage = model_invocation_output.get("metadata", {}).get("usage")
+            if usage is None:
+                return 0, 0, 0
+
+            return usage.get("inputTokens", 0), usage.get("outputTokens", 0), 1
+
+        return 0, 0, 0
+
     @staticmethod
     def process_trace_event(
         trace_data: Dict,
@@ -81,6 +114,7 @@ class ProcessL2Trace:
         save_traces: bool,
         session_id: str,
         show_traces: bool,
+        produce_spans: bool = True,
     ):
         input_tokens = 0
         output_tokens = 0
@@ -89,6 +123,14 @@ class ProcessL2Trace:
         if save_traces:
             ProcessL2Trace.save_trace(trace_data=trace_data, session_id=session_id)
 
+        if not produce_spans:
+            # Unsampled invocation: skip span bookkeeping and only report usage
+            if show_traces:
+                ProcessL5InvocationInputTrace.print_generated_code(
+                    trace_data=trace_data
+                )
+            return ProcessL2Trace.get_token_usage(trace_data=trace_data)
+
         if "trace" in trace_data:
 
             trace = trace_data["trace"]
@@ -413,17 +455,25 @@ class ProcessL4Trace:
                             )
                         )
 
-                    if config.PRODUCE_BEDROCK_OTEL_TRACES:
+                    if get_config().PRODUCE_BEDROCK_OTEL_TRACES:
+                        # The L4 model input text is the largest attribute of a trace,
+                        # serialize it once and only when it is captured
+                        input_attributes = {}
+                        if get_config().TRACE_CAPTURE_MODEL_INPUT:
+                            input_attributes = {
+                                OtelSpanAttributes.INPUT_VALUE: json_safe(
+                                    model_invocation_input["text"]
+                                ),
+                                OtelSpanAttributes.INPUT_MIME_TYPE: "application/json",
+                            }
+
                         agent_span = span_manager.create_agent_span_return(
                             agent_session_id=session_id,
                             caller_chain=caller_chain,
                             # start_time=int(event_time.timestamp() * 1e9),
                             attributes={
                                 OtelSpanAttributes.OPENINFERENCE_SPAN_KIND: OpenInferenceSpanKindValues.AGENT.value,
-                                OtelSpanAttributes.INPUT_VALUE: json_safe(
-                                    model_invocation_input["text"]
-                                ),
-                                OtelSpanAttributes.INPUT_MIME_TYPE: "application/json",
+                                **input_attributes,
                                 SpanAttributes.AGENT_ID.value: agent_id,
                                 SpanAttributes.AGENT_ALIAS_ID.value: agent_alias_id,
                                 OtelSpanAttributes.LLM_SYSTEM: "aws.bedrock",
@@ -445,15 +495,8 @@ class ProcessL4Trace:
                                 OtelSpanAttributes.LLM_MODEL_NAME, model_id
                             )
 
-                        if len(caller_chain) > 1:
-                            agent_span.set_attributes(
-                                {
-                                    OtelSpanAttributes.INPUT_VALUE: json_safe(
-                                        model_invocation_input["text"]
-                                    ),
-                                    OtelSpanAttributes.INPUT_MIME_TYPE: "application/json",
-                                }
-                            )
+                        if len(caller_chain) > 1 and input_attributes:
+                            agent_span.set_attributes(input_attributes)
 
                         span_manager.assign_new_l2_return(
                             l2_name=key_name,
@@ -470,10 +513,7 @@ class ProcessL4Trace:
                             },
                             l3_attributes={
                                 OtelSpanAttributes.OPENINFERENCE_SPAN_KIND: OpenInferenceSpanKindValues.LLM.value,
-                                OtelSpanAttributes.INPUT_VALUE: json_safe(
-                                    model_invocation_input["text"]
-                                ),
-                                OtelSpanAttributes.INPUT_MIME_TYPE: "application/json",
+                                **input_attributes,
                                 SpanAttributes.MAX_TOKENS.value: inference_configuration[
                                     "maximumLength"
                                 ],
@@ -545,15 +585,11 @@ class ProcessL4Trace:
 
                     try:
                         json_model = json.loads(raw_response)
-                        model = (
-                            json.loads(raw_response)["model"]
-                            if "model" in json.loads(raw_response)
-                            else None
-                        )
+                        model = json_model["model"] if "model" in json_model else None
                     except Exception as e:
                         model = None
 
-                    if config.PRODUCE_BEDROCK_OTEL_TRACES:
+                    if get_config().PRODUCE_BEDROCK_OTEL_TRACES:
                         span_manager.spans[session_id].l3_span[
                             f"{agent_id}:{agent_alias_id}"
                         ].span.set_attributes(
@@ -801,7 +837,7 @@ class ProcessL4Trace:
                         caller_chain=caller_chain, index=-1
                     )
 
-                    if config.PRODUCE_BEDROCK_OTEL_TRACES:
+                    if get_config().PRODUCE_BEDROCK_OTEL_TRACES:
                         span_manager.spans[session_id].l2_span.span.set_attributes(
                             attributes={SpanName.RATIONALE.value: text}
                         )
@@ -811,6 +847,27 @@ class ProcessL4Trace:
 
 class ProcessL5InvocationInputTrace:
 
+    @staticmethod
+    def print_generated_code(
+        trace_data: Dict,
+        key: Literal[
+            "routingClassifierTrace", "orchestrationTrace"
+        ] = "orchestrationTrace",
+    ):
+        invocation_input = (
+            trace_data.get("trace", {}).get(key, {}).get("invocationInput", {})
+        )
+        if "codeInterpreterInvocationInput" not in invocation_input:
+            return
+
+        print(colored(f"Code interpreter:", TraceColor.invocation_input))
+        console = Console()
+        console.print(
+            Markdown(
+                f"**Generated code**\n```python\n{invocation_input['codeInterpreterInvocationInput']['code']}\n```"
+            )
+        )
+
     @staticmethod
     def process_action_group_invocation_input(
         trace_data: Dict,
@@ -853,7 +910,7 @@ class ProcessL5InvocationInputTrace:
                             name = action_group_invocation_input["apiPath"]
                             parameters = action_group_invocation_input["requestBody"]
 
-                        if config.PRODUCE_BEDROCK_OTEL_TRACES:
+                        if get_config().PRODUCE_BEDROCK_OTEL_TRACES:
                             span_manager.assign_new_l3_return(
                                 agent_session_id=session_id,
                                 collab_agent_trace_id=f"{agent_id}:{agent_alias_id}",
@@ -924,7 +981,7 @@ class ProcessL5InvocationInputTrace:
                             ]
                         )
 
-                        if config.PRODUCE_BEDROCK_OTEL_TRACES:
+                        if get_config().PRODUCE_BEDROCK_OTEL_TRACES:
 
                             l3_span = span_manager.assign_new_l3_return(
                                 agent_session_id=session_id,
@@ -946,7 +1003,7 @@ class ProcessL5InvocationInputTrace:
                             )
 
                         if "text" in agent_collaborator_invocation_input["input"]:
-                            if config.PRODUCE_BEDROCK_OTEL_TRACES:
+                            if get_config().PRODUCE_BEDROCK_OTEL_TRACES:
 
                                 l3_span.set_attribute(
                                     OtelSpanAttributes.INPUT_VALUE,
@@ -966,7 +1023,7 @@ class ProcessL5InvocationInputTrace:
                             "returnControlResults"
                             in agent_collaborator_invocation_input["input"]
                         ):
-                            if config.PRODUCE_BEDROCK_OTEL_TRACES:
+                            if get_config().PRODUCE_BEDROCK_OTEL_TRACES:
 
                                 l3_span.set_attribute(
                                     OtelSpanAttributes.INPUT_VALUE,
@@ -1015,19 +1072,11 @@ class ProcessL5InvocationInputTrace:
                         )
 
                         if show_traces:
-                            print(
-                                colored(
-                                    f"Code interpreter:", TraceColor.invocation_input
-                                )
-                            )
-                            console = Console()
-                            console.print(
-                                Markdown(
-                                    f"**Generated code**\n```python\n{code_interpreter_invocation_input['code']}\n```"
-                                )
+                            ProcessL5InvocationInputTrace.print_generated_code(
+                                trace_data=trace_data, key=key
                             )
 
-                        if config.PRODUCE_BEDROCK_OTEL_TRACES:
+                        if get_config().PRODUCE_BEDROCK_OTEL_TRACES:
                             span_manager.assign_new_l3_return(
                                 agent_session_id=session_id,
                                 collab_agent_trace_id=f"{agent_id}:{agent_alias_id}",
@@ -1085,7 +1134,7 @@ class ProcessL5InvocationInputTrace:
                             caller_chain=caller_chain, index=-1
                         )
 
-                        if config.PRODUCE_BEDROCK_OTEL_TRACES:
+                        if get_config().PRODUCE_BEDROCK_OTEL_TRACES:
 
                             span_manager.assign_new_l3_return(
                                 agent_session_id=session_id,
@@ -1142,17 +1191,28 @@ class ProcessL5Obervation:
                             caller_chain=caller_chain, index=-1
                         )
 
-                        if config.PRODUCE_BEDROCK_OTEL_TRACES:
+                        if get_config().PRODUCE_BEDROCK_OTEL_TRACES:
+                            attributes = {
+                                OtelSpanAttributes.OUTPUT_VALUE: action_group_invocation_output[
+                                    "text"
+                                ],
+                                OtelSpanAttributes.OUTPUT_MIME_TYPE: "application/json",
+                            }
+                            # Results encoded by a ToolResultEncoder estimate their tokens
+                            savings = token_savings(action_group_invocation_output["text"])
+                            if savings:
+                                tokens, raw_tokens = savings
+                                attributes.update(
+                                    {
+                                        SpanAttributes.TOOL_RESULT_TOKENS.value: tokens,
+                                        SpanAttributes.TOOL_RESULT_RAW_TOKENS.value: raw_tokens,
+                                        SpanAttributes.TOOL_RESULT_TOKENS_SAVED.value: raw_tokens
+                                        - tokens,
+                                    }
+                                )
                             span_manager.spans[session_id].l3_span[
                                 f"{agent_id}:{agent_alias_id}"
-                            ].span.set_attributes(
-                                attributes={
-                                    OtelSpanAttributes.OUTPUT_VALUE: action_group_invocation_output[
-                                        "text"
-                                    ],
-                                    OtelSpanAttributes.OUTPUT_MIME_TYPE: "application/json",
-                                },
-                            )
+                            ].span.set_attributes(attributes=attributes)
 
                             span_manager.delete_l3_span(
                                 agent_session_id=session_id,
@@ -1203,7 +1263,7 @@ class ProcessL5Obervation:
 
                         if "text" in agent_collaborator_invocation_output["output"]:
 
-                            if config.PRODUCE_BEDROCK_OTEL_TRACES:
+                            if get_config().PRODUCE_BEDROCK_OTEL_TRACES:
                                 span_manager.spans[session_id].l3_span[
                                     f"{collab_agent_id}:{collab_agent_alias_id}"
                                 ].span.set_attributes(
@@ -1221,7 +1281,7 @@ class ProcessL5Obervation:
                             "returnControlPayload"
                             in agent_collaborator_invocation_output["output"]
                         ):
-                            if config.PRODUCE_BEDROCK_OTEL_TRACES:
+                            if get_config().PRODUCE_BEDROCK_OTEL_TRACES:
                                 span_manager.spans[session_id].l3_span[
                                     "{collab_agent_id}:{collab_agent_alias_id}"
                                 ].span.set_attributes(
@@ -1235,7 +1295,7 @@ class ProcessL5Obervation:
                                     },
                                 )
 
-                        if config.PRODUCE_BEDROCK_OTEL_TRACES:
+                        if get_config().PRODUCE_BEDROCK_OTEL_TRACES:
                             span_manager.delete_l3_span(
                                 agent_session_id=session_id,
                                 collab_agent_trace_id=f"{collab_agent_id}:{collab_agent_alias_id}",
@@ -1280,7 +1340,7 @@ class ProcessL5Obervation:
                             or "executionTimeout" in code_interpreter_invocation_output
                         ):
                             if "executionError" in code_interpreter_invocation_output:
-                                if config.PRODUCE_BEDROCK_OTEL_TRACES:
+                                if get_config().PRODUCE_BEDROCK_OTEL_TRACES:
                                     span_manager.spans[session_id].l3_span[
                                         f"{agent_id}:{agent_alias_id}"
                                     ].span.set_attributes(
@@ -1292,7 +1352,7 @@ class ProcessL5Obervation:
                                     )
 
                             if "executionTimeout" in code_interpreter_invocation_output:
-                                if config.PRODUCE_BEDROCK_OTEL_TRACES:
+                                if get_config().PRODUCE_BEDROCK_OTEL_TRACES:
                                     span_manager.spans[session_id].l3_span[
                                         f"{agent_id}:{agent_alias_id}"
                                     ].span.set_attributes(
@@ -1303,7 +1363,7 @@ class ProcessL5Obervation:
                                         },
                                     )
 
-                            if config.PRODUCE_BEDROCK_OTEL_TRACES:
+                            if get_config().PRODUCE_BEDROCK_OTEL_TRACES:
                                 span_manager.delete_l3_span(
                                     agent_session_id=session_id,
                                     trace_id=observation["traceId"],
@@ -1313,7 +1373,7 @@ class ProcessL5Obervation:
                                 )
 
                         else:
-                            if config.PRODUCE_BEDROCK_OTEL_TRACES:
+                            if get_config().PRODUCE_BEDROCK_OTEL_TRACES:
                                 span_manager.spans[session_id].l3_span[
                                     f"{agent_id}:{agent_alias_id}"
                                 ].span.set_attributes(
@@ -1382,7 +1442,7 @@ class ProcessL5Obervation:
                             caller_chain=caller_chain, index=-1
                         )
 
-                        if config.PRODUCE_BEDROCK_OTEL_TRACES:
+                        if get_config().PRODUCE_BEDROCK_OTEL_TRACES:
                             span_manager.spans[session_id].l3_span[
                                 f"{agent_id}:{agent_alias_id}"
                             ].span.set_attributes(
@@ -1438,7 +1498,7 @@ class ProcessL5Obervation:
                             caller_chain, -1
                         )
 
-                        if config.PRODUCE_BEDROCK_OTEL_TRACES:
+                        if get_config().PRODUCE_BEDROCK_OTEL_TRACES:
 
                             span_manager.spans[
                                 session_id
@@ -1471,7 +1531,7 @@ class ProcessL5Obervation:
                             span_manager.spans[session_id].l2_span = None
 
                         if len(caller_chain) != 1:
-                            if config.PRODUCE_BEDROCK_OTEL_TRACES:
+                            if get_config().PRODUCE_BEDROCK_OTEL_TRACES:
 
                                 span_manager.spans[session_id].agent_span.end_time = (
                                     int(event_time.timestamp() * 1e9)
@@ -0,0 +1,342 @@
+"""Record Amazon Bedrock Agent event streams to JSONL and replay them offline."""
+
+import base64
+import json
+import threading
+import time
+from abc import ABC, abstractmethod
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import boto3
+
+REPLAY_SERVICES = ("bedrock-agent-runtime", "bedrock-agent")
+
+
+def _encode(obj):
+    if isinstance(obj, (bytes, bytearray)):
+        return {"__bytes__": base64.b64encode(obj).decode("ascii")}
+    if isinstance(obj, datetime):
+        return {"__datetime__": obj.isoformat()}
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def _decode(obj: Dict):
+    if "__bytes__" in obj:
+        return base64.b64decode(obj["__bytes__"])
+    if "__datetime__" in obj:
+        return datetime.fromisoformat(obj["__datetime__"])
+    return obj
+
+
+def dumps(obj, **kwargs) -> str:
+    """JSON encode a record, keeping bytes and datetimes of events round-trippable."""
+    return json.dumps(obj, default=_encode, **kwargs)
+
+
+def loads(line: str):
+    return json.loads(line, object_hook=_decode)
+
+
+class PatchedClients(ABC):
+    """Route `boto3` clients of `services` through `create_client` while active.
+
+    Subclasses wrap or replace the clients, e.g. to time their calls::
+
+        class Timed(PatchedClients):
+            def create_client(self, session, original_client, *args, **kwargs):
+                client = original_client(session, *args, **kwargs)
+                ...
+                return client
+
+        with Timed(services=("bedrock-agent-runtime",)):
+            ...
+    """
+
+    _lock = threading.Lock()
+
+    def __init__(self, services: Iterable[str]):
+        self.services = tuple(services)
+        self._original_client = None
+
+    @abstractmethod
+    def create_client(self, session, original_client, service_name, *args, **kwargs):
+        """Client of `service_name` for `session`, `original_client` being the
+        unpatched `boto3.session.Session.client`."""
+
+    def __enter__(self):
+        with PatchedClients._lock:
+            original_client = boto3.session.Session.client
+            services = self.services
+            patch = self
+
+            def client(session, service_name, *args, **kwargs):
+                if service_name in services:
+                    return patch.create_client(
+                        session, original_client, service_name, *args, **kwargs
+                    )
+                return original_client(session, service_name, *args, **kwargs)
+
+            self._original_client = original_client
+            boto3.session.Session.client = client
+        return self
+
+    def __exit__(self, *exc_info):
+        with PatchedClients._lock:
+            boto3.session.Session.client = self._original_client
+            self._original_client = None
+
+
+class _RecordingClient:
+
+    def __init__(self, client, recorder: "EventStreamRecorder", service_name: str):
+        self._client = client
+        self._recorder = recorder
+        self._service_name = service_name
+
+    def __getattr__(self, operation: str):
+        attribute = getattr(self._client, operation)
+        if not callable(attribute) or operation.startswith("_"):
+            return attribute
+
+        def call(**params):
+            start = time.perf_counter()
+            response = attribute(**params)
+            return self._recorder.record_call(
+                service_name=self._service_name,
+                operation=operation,
+                params=params,
+                response=response,
+                start=start,
+            )
+
+        return call
+
+
+class EventStreamRecorder(PatchedClients):
+    """Record Bedrock Agents API calls and their completion event streams.
+
+    Every call made through a `boto3` client of `services` is written to `path`
+    as a JSON line, each event of a `completion` stream as a further line with its
+    offset in seconds from the start of the call::
+
+        with EventStreamRecorder("recordings/weather.jsonl"):
+            asyncio.run(agent.invoke(input_text="What is the weather?"))
+    """
+
+    def __init__(self, path: str, services: Iterable[str] = REPLAY_SERVICES):
+        super().__init__(services=services)
+        self.path = path
+        self._file = None
+        self._write_lock = threading.Lock()
+        self._streams = 0
+
+    def __enter__(self):
+        self.open()
+        return super().__enter__()
+
+    def __exit__(self, *exc_info):
+        super().__exit__(*exc_info)
+        self.close()
+
+    def open(self):
+        if self._file is None:
+            self._file = open(self.path, "w", encoding="utf-8")
+        return self
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def create_client(self, session, original_client, service_name, *args, **kwargs):
+        client = original_client(session, service_name, *args, **kwargs)
+        return _RecordingClient(client=client, recorder=self, service_name=service_name)
+
+    def _write(self, record: Dict):
+        line = dumps(record)
+        with self._write_lock:
+            self._file.write(line + "\n")
+
+    def _next_stream(self) -> int:
+        with self._write_lock:
+            stream = self._streams
+            self._streams += 1
+        return stream
+
+    def record_call(
+        self,
+        service_name: str,
+        operation: str,
+        params: Dict,
+        response: Dict,
+        start: Optional[float] = None,
+    ) -> Dict:
+        """Record a call, returning the response with its event stream recorded."""
+        start = time.perf_counter() if start is None else start
+        record = {"service": service_name, "operation": operation, "params": params}
+
+        if isinstance(response, dict) and "completion" in response:
+            stream = self._next_stream()
+            record["stream"] = stream
+            record["response"] = {
+                key: value for key, value in response.items() if key != "completion"
+            }
+            self._write(record)
+
+            response = dict(response)
+            response["completion"] = self._record_events(
+                stream=stream, events=response["completion"], start=start
+            )
+            return response
+
+        record["response"] = response
+        self._write(record)
+        return response
+
+    def _record_events(self, stream: int, events: Iterable[Dict], start: float):
+        for event in events:
+            self._write(
+                {
+                    "stream": stream,
+                    "offset": round(time.perf_counter() - start, 6),
+                    "event": event,
+                }
+            )
+            yield event
+
+    def write_stream(
+        self,
+        events: Iterable[Dict],
+        operation: str = "invoke_agent",
+        params: Optional[Dict] = None,
+        interval: float = 0.0,
+    ):
+        """Write an already available event stream, e.g. a synthetic one."""
+        stream = self._next_stream()
+        self._write(
+            {
+                "service": "bedrock-agent-runtime",
+                "operation": operation,
+                "params": params or {},
+                "stream": stream,
+                "response": {"contentType": "application/json"},
+            }
+        )
+        for idx, event in enumerate(events):
+            self._write({"stream": stream, "offset": idx * interval, "event": event})
+
+
+class ReplayClient:
+    """Stand-in for a `boto3` client answering from an `EventStreamReplayer`."""
+
+    def __init__(self, replayer: "EventStreamReplayer", service_name: str):
+        self._replayer = replayer
+        self._service_name = service_name
+
+    def __getattr__(self, operation: str):
+        if operation.startswith("_"):
+            raise AttributeError(operation)
+
+        def call(**params):
+            return self._replayer.get_response(
+                service_name=self._service_name, operation=operation, params=params
+            )
+
+        return call
+
+
+class EventStreamReplayer(PatchedClients):
+    """Replay a recording of `EventStreamRecorder` without calling AWS.
+
+    Calls are answered with the recorded call of the same operation and parameters,
+    or else with the recorded calls of that operation in order, starting over once
+    all of them were used. `speed` of 0 replays events as fast as they are consumed,
+    1.0 at their original pace and 2.0 twice as fast::
+
+        with EventStreamReplayer("recordings/weather.jsonl", speed=1.0):
+            asyncio.run(agent.invoke(input_text="What is the weather?"))
+    """
+
+    def __init__(
+        self,
+        path: str,
+        speed: float = 0.0,
+        services: Optional[Iterable[str]] = None,
+    ):
+        self.path = path
+        self.speed = speed
+
+        self._calls: Dict[Tuple[str, str], List[Dict]] = dict()
+        self._events: Dict[int, List[Tuple[float, Dict]]] = dict()
+        self._cursors: Dict[Tuple, int] = dict()
+        self._cursor_lock = threading.Lock()
+
+        with open(path, "r", encoding="utf-8") as file:
+            for line in file:
+                if line.strip():
+                    self._load_record(loads(line))
+
+        super().__init__(
+            services=(
+                services
+                if services is not None
+                else {service for service, _ in self._calls}
+            )
+        )
+
+    def _load_record(self, record: Dict):
+        if "operation" in record:
+            record["key"] = dumps(record["params"], sort_keys=True)
+            self._calls.setdefault(
+                (record["service"], record["operation"]), list()
+            ).append(record)
+        else:
+            self._events.setdefault(record["stream"], list()).append(
+                (record["offset"], record["event"])
+            )
+
+    @property
+    def streams(self) -> int:
+        return len(self._events)
+
+    def create_client(self, session, original_client, service_name, *args, **kwargs):
+        return self.client(service_name)
+
+    def client(self, service_name: str = "bedrock-agent-runtime") -> ReplayClient:
+        return ReplayClient(replayer=self, service_name=service_name)
+
+    def _next(self, cursor: Tuple, calls: List[Dict]) -> Dict:
+        with self._cursor_lock:
+            idx = self._cursors.get(cursor, 0)
+            self._cursors[cursor] = idx + 1
+        return calls[idx % len(calls)]
+
+    def get_response(self, service_name: str, operation: str, params: Dict) -> Dict:
+        calls = self._calls.get((service_name, operation))
+        if not calls:
+            raise RuntimeError(
+                f"No recorded {operation} call for {service_name} in {self.path}"
+            )
+
+        key = dumps(params, sort_keys=True)
+        matching_calls = [call for call in calls if call["key"] == key]
+        if matching_calls:
+            call = self._next((service_name, operation, key), matching_calls)
+        else:
+            call = self._next((service_name, operation), calls)
+
+        response = dict(call["response"])
+        if "stream" in call:
+            response["completion"] = self.replay(stream=call["stream"])
+        return response
+
+    def replay(self, stream: int = 0):
+        """Events of a recorded stream, paced according to `speed`."""
+        start = time.perf_counter()
+        for offset, event in self._events.get(stream, []):
+            if self.speed:
+                delay = offset / self.speed - (time.perf_counter() - start)
+                if delay > 0:
+                    time.sleep(delay)
+            yield event
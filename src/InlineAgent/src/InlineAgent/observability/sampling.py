@@ -0,0 +1,63 @@
+import random
+from typing import Dict, Optional
+
+from .settings_management import ObservabilityConfig
+
+
+class TraceSampler:
+    """Head and tail sampling decisions for ``observe``.
+
+    The head decision is taken once per invocation from ``sample_rate``. When an
+    invocation is not sampled its trace events are only buffered, and the whole
+    trace is recorded after all if a tail rule fires (an error or a guardrail
+    intervention).
+    """
+
+    def __init__(
+        self,
+        sample_rate: float = 1.0,
+        keep_errors: bool = True,
+        keep_guardrail_interventions: bool = True,
+    ):
+        if not 0.0 <= sample_rate <= 1.0:
+            raise ValueError("sample_rate must be between 0.0 and 1.0")
+
+        self.sample_rate = sample_rate
+        self.keep_errors = keep_errors
+        self.keep_guardrail_interventions = keep_guardrail_interventions
+
+    @classmethod
+    def from_config(
+        cls, config: ObservabilityConfig, sample_rate: Optional[float] = None
+    ) -> "TraceSampler":
+        return cls(
+            sample_rate=(
+                config.TRACE_SAMPLE_RATE if sample_rate is None else sample_rate
+            ),
+            keep_errors=config.TRACE_KEEP_ERRORS,
+            keep_guardrail_interventions=config.TRACE_KEEP_GUARDRAIL_INTERVENTIONS,
+        )
+
+    @property
+    def tail_sampling(self) -> bool:
+        return self.keep_errors or self.keep_guardrail_interventions
+
+    def should_sample(self) -> bool:
+        if self.sample_rate >= 1.0:
+            return True
+        if self.sample_rate <= 0.0:
+            return False
+        return random.random() < self.sample_rate
+
+    def is_tail_event(self, trace_data: Dict) -> bool:
+        """Whether a trace event forces an unsampled invocation to be recorded."""
+        trace = trace_data.get("trace", {})
+
+        if self.keep_guardrail_interventions and "guardrailTrace" in trace:
+            if trace["guardrailTrace"].get("action") == "INTERVENED":
+                return True
+
+        if self.keep_errors and "failureTrace" in trace:
+            return True
+
+        return False
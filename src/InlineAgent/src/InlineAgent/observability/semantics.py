@@ -24,6 +24,12 @@ class SpanAttributes(Enum):
     GUARDRAIL_ACTION = "bedrock.guardrail.action"
     RETURN_CONTROL = "bedrock.agent.return_control"
 
+    TOOL_RESULT_TOKENS = "bedrock.agent.tool_result.tokens"
+    TOOL_RESULT_RAW_TOKENS = "bedrock.agent.tool_result.raw_tokens"
+    TOOL_RESULT_TOKENS_SAVED = "bedrock.agent.tool_result.tokens_saved"
+
+    SAMPLING_DECISION = "bedrock.agent.sampling.decision"
+
     RAW_RESPONSE = "bedrock.agent.raw_response"
     RESONING_CONTENT = "bedrock.agent.resoning_content"
 
@@ -18,3 +18,15 @@ class ObservabilityConfig(BaseSettings):
     LANGFUSE_SECRET_KEY: Optional[str] = None
     BEDROCK_AGENT_TRACER_NAME: str = Field(default="bedrock-agent-tracer")
     PRODUCE_BEDROCK_OTEL_TRACES: bool = Field(default=False)
+
+    # Sampling
+    TRACE_SAMPLE_RATE: float = Field(default=1.0, ge=0.0, le=1.0)
+    TRACE_KEEP_ERRORS: bool = Field(default=True)
+    TRACE_KEEP_GUARDRAIL_INTERVENTIONS: bool = Field(default=True)
+
+    # Verbosity
+    TRACE_CAPTURE_MODEL_INPUT: bool = Field(default=True)
+    TRACE_MAX_ATTRIBUTE_LENGTH: Optional[int] = Field(default=None, gt=0)
+
+    # Validate span manager calls, slower but catches malformed trace events early
+    TRACE_DEBUG: bool = Field(default=False)
@@ -1,50 +1,52 @@
 # Class to manage spans
 
+import functools
+from dataclasses import dataclass, field
 from typing import Dict, Any, Literal, Optional
 
 from opentelemetry import trace
 from opentelemetry.trace import Status, StatusCode, SpanKind, Span
 
-from pydantic import (
-    BaseModel,
-    ConfigDict,
-    ValidationInfo,
-    field_validator,
-    validate_call,
-)
+from pydantic import ConfigDict, validate_call
 
 from .utils import get_agent_from_caller_chain
 
+tracer = trace.get_tracer("bedrock-agent-tracing")
 
-from pydantic import BaseModel
-from typing import Dict, Any
 
-tracer = trace.get_tracer("bedrock-agent-tracing")
+def validate_in_debug(func):
+    """Validate the arguments of a `SpanManager` method when `debug` is set."""
+    validated_func = validate_call(config=ConfigDict(arbitrary_types_allowed=True))(
+        func
+    )
+
+    @functools.wraps(func)
+    def wrapper(self, *args, **kwargs):
+        if self.debug:
+            return validated_func(self, *args, **kwargs)
+        return func(self, *args, **kwargs)
 
+    return wrapper
 
-class SpanModel(BaseModel):
+
+@dataclass(slots=True)
+class SpanModel:
     span: Span
     end_time: int = 0
-    end: Optional[bool] = None
+    _end: Optional[bool] = field(default=None, repr=False)
 
-    class Config:
-        arbitrary_types_allowed = True
-        extra = "forbid"
-        validate_assignment = True
+    @property
+    def end(self) -> Optional[bool]:
+        return self._end
 
-    @field_validator("end", mode="after")
-    @classmethod
-    def validate_end(cls, value: bool, info: ValidationInfo):
-        # Check if we're trying to set a non-zero end_time
+    @end.setter
+    def end(self, value: Optional[bool]):
+        # Setting end to True ends the span, at end_time if one was assigned
         if value is True:
-
-            SpanModel.process_end(
-                span=info.data["span"], end_time=info.data["end_time"]
-            )
-        return value
+            SpanModel.process_end(span=self.span, end_time=self.end_time)
+        self._end = value
 
     @staticmethod
-    @validate_call(config=ConfigDict(arbitrary_types_allowed=True))
     def process_end(span: Span, end_time: int):
         if span.is_recording():
             if end_time:
@@ -53,31 +55,25 @@ class SpanModel(BaseModel):
                 span.end()
 
 
-class SpanFamily(BaseModel):
+@dataclass(slots=True)
+class SpanFamily:
     family: str
     counter: str
     agent_span: SpanModel
     l2_span: Optional[SpanModel] = (
         None  # If counter changes end l2 span, if family changes end l2 span
     )
-    l3_span: Dict[str, SpanModel] = {}
+    l3_span: Dict[str, SpanModel] = field(default_factory=dict)
 
-    class Config:
-        arbitrary_types_allowed = True  # Needed for the Span object
-        extra = "forbid"  # Prevents additional fields
 
+@dataclass(slots=True)
+class SpanManager:
 
-class SpanManager(BaseModel):
+    spans: Dict[str, SpanFamily] = field(default_factory=dict)
+    agent_session_id_dict: Dict[str, str] = field(default_factory=dict)
+    debug: bool = False
 
-    spans: Optional[Dict[str, SpanFamily]] = {}
-    agent_session_id_dict: Optional[Dict[str, str]] = {}
-
-    class Config:
-        arbitrary_types_allowed = True
-        extra = "forbid"
-        validate_assignment = True
-
-    @validate_call(config=ConfigDict(arbitrary_types_allowed=True))
+    @validate_in_debug
     def create_agent_span_return(
         self,
         agent_session_id: str,
@@ -89,13 +85,13 @@ class SpanManager(BaseModel):
         # new agent
         parent_span = None
 
-        if agent_session_id in self.spans:
-            return self.spans[agent_session_id].agent_span.span
+        span_family = self.spans.get(agent_session_id)
+        if span_family is not None:
+            return span_family.agent_span.span
 
         agent_id, agent_alias_id = get_agent_from_caller_chain(
             caller_chain=caller_chain, index=-1
         )
-        collaborator_session_id = str()
 
         if len(caller_chain) > 1:
             collaborator_agent_id, collaborator_agent_alias_id = (
@@ -104,31 +100,22 @@ class SpanManager(BaseModel):
             collaborator_session_id = self.agent_session_id_dict[
                 f"{collaborator_agent_id}:{collaborator_agent_alias_id}"
             ]
+            collaborator_family = self.spans.get(collaborator_session_id)
 
-        if collaborator_session_id in self.spans:
-            # print(self.spans)
-
-            if (
-                len(self.spans[collaborator_session_id].l3_span)
-                and f"{agent_id}:{agent_alias_id}"
-                in self.spans[collaborator_session_id].l3_span
-                and self.spans[collaborator_session_id]
-                .l3_span[f"{agent_id}:{agent_alias_id}"]
-                .span
-            ):
-                parent_span = (
-                    self.spans[collaborator_session_id]
-                    .l3_span[f"{agent_id}:{agent_alias_id}"]
-                    .span
-                )
-            else:
-                raise RuntimeError("L3 span not found while creating sub agent span.")
-        else:
-            if len(caller_chain) > 1:
+            if collaborator_family is None:
                 raise RuntimeError(
                     "Collaborator span not found while creating agent span."
                 )
 
+            # The supervisor's L3 span is keyed by the collaborator it invokes
+            collaborator_l3_span = collaborator_family.l3_span.get(
+                f"{agent_id}:{agent_alias_id}"
+            )
+            if collaborator_l3_span is None or not collaborator_l3_span.span:
+                raise RuntimeError("L3 span not found while creating sub agent span.")
+
+            parent_span = collaborator_l3_span.span
+
         span = tracer.start_span(
             name=name,
             kind=SpanKind.CLIENT,
@@ -137,18 +124,16 @@ class SpanManager(BaseModel):
             # start_time=start_time,
         )
 
-        span_family = SpanFamily(
+        self.spans[agent_session_id] = SpanFamily(
             family="",
             counter="",
             agent_span=SpanModel(span=span),
         )
-
-        self.spans[agent_session_id] = span_family
         self.agent_session_id_dict[f"{agent_id}:{agent_alias_id}"] = agent_session_id
 
         return span
 
-    @validate_call(config=ConfigDict(arbitrary_types_allowed=True))
+    @validate_in_debug
     def delete_agent_span(
         self,
         agent_session_id: str,
@@ -157,19 +142,21 @@ class SpanManager(BaseModel):
         if agent_session_id not in self.spans:
             raise RuntimeError("Agent span not found while deleting agent span.")
 
-        if self.spans[agent_session_id].l2_span:
+        span_family = self.spans[agent_session_id]
+
+        if span_family.l2_span:
             raise RuntimeError("Close l2 span first before clossing agent span")
 
-        if agent_session_id in self.spans[agent_session_id].l3_span:
+        if agent_session_id in span_family.l3_span:
             raise RuntimeError("Close l3 span first before clossing agent span")
 
-        self.spans[agent_session_id].agent_span.span.set_status(Status(StatusCode.OK))
-        # self.spans[agent_session_id].agent_span.end_time = end_time
-        self.spans[agent_session_id].agent_span.end = True
+        span_family.agent_span.span.set_status(Status(StatusCode.OK))
+        # span_family.agent_span.end_time = end_time
+        span_family.agent_span.end = True
 
         del self.spans[agent_session_id]
 
-    @validate_call(config=ConfigDict(arbitrary_types_allowed=True))
+    @validate_in_debug
     def assign_new_l2_return(
         self,
         agent_session_id: str,
@@ -185,48 +172,36 @@ class SpanManager(BaseModel):
             caller_chain=caller_chain, index=-1
         )
         l2_span = None
-        if agent_session_id not in self.spans:
+        span_family = self.spans.get(agent_session_id)
+        if span_family is None:
             raise RuntimeError("Agent span not found")
 
         family = trace_id[:36]
         counter = trace_id[37:]
 
-        if self.spans[agent_session_id].family and self.spans[agent_session_id].counter:
-            if family != self.spans[agent_session_id].family:
+        if span_family.family and span_family.counter:
+            if family != span_family.family:
                 raise RuntimeError("New Agent span should be assigned first")
             else:
-                if counter == self.spans[agent_session_id].counter:
-                    return self.spans[agent_session_id].l2_span.span
+                if counter == span_family.counter:
+                    return span_family.l2_span.span
                 else:
-                    if (
-                        len(self.spans[agent_session_id].l3_span)
-                        and self.spans[agent_session_id]
-                        .l3_span[f"{agent_id}:{agent_alias_id}"]
-                        .span
-                    ):
-
-                        self.spans[agent_session_id].l3_span[
-                            f"{agent_id}:{agent_alias_id}"
-                        ].span.end = True
-                        del self.spans[agent_session_id].l3_span[
-                            f"{agent_id}:{agent_alias_id}"
-                        ]
-
-                    if (
-                        self.spans[agent_session_id].l2_span
-                        and self.spans[agent_session_id].l2_span.span
-                    ):
-                        self.spans[agent_session_id].l2_span.end = True
-                        self.spans[agent_session_id].l2_span = None
+                    l3_span = span_family.l3_span.pop(
+                        f"{agent_id}:{agent_alias_id}", None
+                    )
+                    if l3_span and l3_span.span:
+                        l3_span.end = True
+
+                    if span_family.l2_span and span_family.l2_span.span:
+                        span_family.l2_span.end = True
+                        span_family.l2_span = None
 
         # Save new l2 span
         l2_span = tracer.start_span(
             name=l2_name,
             kind=SpanKind.CLIENT,
             attributes=l2_attributes or {},
-            context=trace.set_span_in_context(
-                self.spans[agent_session_id].agent_span.span
-            ),
+            context=trace.set_span_in_context(span_family.agent_span.span),
         )
 
         l3_span = tracer.start_span(
@@ -236,18 +211,28 @@ class SpanManager(BaseModel):
             context=trace.set_span_in_context(l2_span),
         )
 
-        self.spans[agent_session_id].l2_span = SpanModel(span=l2_span)
+        span_family.l2_span = SpanModel(span=l2_span)
+        span_family.l3_span[f"{agent_id}:{agent_alias_id}"] = SpanModel(span=l3_span)
 
-        self.spans[agent_session_id].l3_span.update(
-            {f"{agent_id}:{agent_alias_id}": SpanModel(span=l3_span)}
-        )
-
-        self.spans[agent_session_id].family = family
-        self.spans[agent_session_id].counter = counter
+        span_family.family = family
+        span_family.counter = counter
 
         return l2_span
 
-    @validate_call(config=ConfigDict(arbitrary_types_allowed=True))
+    def _get_current_family(self, agent_session_id: str, trace_id: str) -> SpanFamily:
+        span_family = self.spans.get(agent_session_id)
+        if span_family is None:
+            raise RuntimeError("Agent span not found")
+
+        if trace_id[:36] != span_family.family:
+            raise RuntimeError("New Agent span should be assigned first")
+
+        if trace_id[37:] != span_family.counter:
+            raise RuntimeError("Assign a new L2 span")
+
+        return span_family
+
+    @validate_in_debug
     def assign_new_l3_return(
         self,
         agent_session_id: str,
@@ -256,24 +241,14 @@ class SpanManager(BaseModel):
         attributes: Dict[str, Any],
         name: str,
     ) -> Span:
-        l3_span = None
-
-        if agent_session_id not in self.spans:
-            raise RuntimeError("Agent span not found")
-
-        family = trace_id[:36]
-        counter = trace_id[37:]
-
-        if family != self.spans[agent_session_id].family:
-            raise RuntimeError("New Agent span should be assigned first")
-
-        if counter != self.spans[agent_session_id].counter:
-            raise RuntimeError("Assign a new L2 span")
+        span_family = self._get_current_family(
+            agent_session_id=agent_session_id, trace_id=trace_id
+        )
 
-        if not self.spans[agent_session_id].l2_span:
+        if not span_family.l2_span:
             raise RuntimeError("L2 span does not exists")
 
-        if collab_agent_trace_id in self.spans[agent_session_id].l3_span:
+        if collab_agent_trace_id in span_family.l3_span:
             raise RuntimeError("L3 span already exists")
 
         # Assign New
@@ -281,20 +256,16 @@ class SpanManager(BaseModel):
             name=name,
             kind=SpanKind.CLIENT,
             attributes=attributes or {},
-            context=trace.set_span_in_context(
-                self.spans[agent_session_id].l2_span.span
-            ),
+            context=trace.set_span_in_context(span_family.l2_span.span),
         )
 
-        self.spans[agent_session_id].l3_span.update(
-            {collab_agent_trace_id: SpanModel(span=l3_span)}
-        )
+        span_family.l3_span[collab_agent_trace_id] = SpanModel(span=l3_span)
 
         self.agent_session_id_dict[collab_agent_trace_id] = agent_session_id
 
         return l3_span
 
-    @validate_call(config=ConfigDict(arbitrary_types_allowed=True))
+    @validate_in_debug
     def delete_l3_span(
         self,
         agent_session_id: str,
@@ -302,32 +273,22 @@ class SpanManager(BaseModel):
         trace_id: str,
         status=StatusCode.OK,
     ) -> Span:
-        if agent_session_id not in self.spans:
-            raise RuntimeError("Agent span not found")
-
-        family = trace_id[:36]
-        counter = trace_id[37:]
-
-        if family != self.spans[agent_session_id].family:
-            raise RuntimeError("New Agent span should be assigned first")
-
-        if counter != self.spans[agent_session_id].counter:
-            raise RuntimeError("Assign a new L2 span")
+        span_family = self._get_current_family(
+            agent_session_id=agent_session_id, trace_id=trace_id
+        )
 
-        if not self.spans[agent_session_id].l2_span:
+        if not span_family.l2_span:
             raise RuntimeError("L2 span not found")
 
-        if collab_agent_trace_id not in self.spans[agent_session_id].l3_span:
+        l3_span = span_family.l3_span.pop(collab_agent_trace_id, None)
+        if l3_span is None:
             raise RuntimeError("L3 span not found")
 
-        self.spans[agent_session_id].l3_span[collab_agent_trace_id].span.set_status(
-            Status(status)
-        )
-        # self.spans[agent_session_id].l3_span.end_time = end_time
-        self.spans[agent_session_id].l3_span[collab_agent_trace_id].end = True
-        del self.spans[agent_session_id].l3_span[collab_agent_trace_id]
+        l3_span.span.set_status(Status(status))
+        # l3_span.end_time = end_time
+        l3_span.end = True
 
-        # self.spans[agent_session_id].l2_span.end_time = end_time
+        # span_family.l2_span.end_time = end_time
 
     def end_all_spans(self, status_code: Literal[StatusCode.OK, StatusCode.ERROR]):
 
@@ -1,6 +1,7 @@
 from enum import Enum
 from typing import Dict, List
 from InlineAgent.constants import Level, TraceColor
+from InlineAgent.tool_results import token_savings
 from termcolor import colored
 from rich.console import Console
 from rich.markdown import Markdown
@@ -474,12 +475,23 @@ class RoutingAndOrchestrationTrace:
         if "observation" in trace:
 
             if "actionGroupInvocationOutput" in trace["observation"]:
+                tool_output = trace["observation"]["actionGroupInvocationOutput"]["text"]
                 print(
                     colored(
-                        f"Tool use output: {trace['observation']['actionGroupInvocationOutput']['text']}",
+                        f"Tool use output: {tool_output}",
                         TraceColor.invocation_output,
                     )
                 )
+                savings = token_savings(tool_output)
+                if savings:
+                    tokens, raw_tokens = savings
+                    print(
+                        colored(
+                            f"Tool result: ~{tokens} tokens, ~{raw_tokens} before encoding"
+                            f" ({raw_tokens - tokens} saved)",
+                            TraceColor.stats,
+                        )
+                    )
 
             if "agentCollaboratorInvocationOutput" in trace["observation"]:
                 if (
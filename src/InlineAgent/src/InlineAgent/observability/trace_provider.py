@@ -4,7 +4,7 @@ import base64
 import logging
 
 from opentelemetry import trace
-from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace import SpanLimits, TracerProvider
 from opentelemetry.sdk.resources import Resource
 from openinference.semconv.resource import ResourceAttributes
 from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
@@ -17,10 +17,6 @@ from opentelemetry.sdk.resources import Resource
 
 from .settings_management import ObservabilityConfig
 
-logging.basicConfig(
-    level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
-)
-
 logger = logging.getLogger(__name__)
 
 
@@ -36,8 +32,13 @@ def create_tracer_provider(config: ObservabilityConfig, timeout: int = 300):
         }
     )
 
-    # Create tracer provider with resource
-    tracer_provider = TracerProvider(resource=resource)
+    # Create tracer provider with resource, capping attribute sizes if requested
+    span_limits = None
+    if config.TRACE_MAX_ATTRIBUTE_LENGTH:
+        span_limits = SpanLimits(
+            max_span_attribute_length=config.TRACE_MAX_ATTRIBUTE_LENGTH
+        )
+    tracer_provider = TracerProvider(resource=resource, span_limits=span_limits)
 
     if config.API_URL and config.PRODUCE_BEDROCK_OTEL_TRACES:
         endpoint = f"{config.API_URL}/v1/traces"
@@ -1,7 +1,7 @@
+import functools
 import json
 from typing import List, Tuple
 
-from pydantic import validate_call
 from InlineAgent.constants import TraceColor
 from termcolor import colored
 
@@ -13,7 +13,6 @@ def json_safe(obj):
     return obj
 
 
-@validate_call
 def get_agent_from_caller_chain(caller_chain: list, index: int) -> Tuple[str, str]:
 
     alias_id = caller_chain[index]["agentAliasArn"]
@@ -21,6 +20,7 @@ def get_agent_from_caller_chain(caller_chain: list, index: int) -> Tuple[str, st
     return get_agent_id_aliasid(alias_id)
 
 
+@functools.lru_cache(maxsize=1024)
 def get_agent_id_aliasid(arn: str):
     trace_id = arn.split("agent-alias/")[1].replace("/", ":")
     agent_id, agent_alias_id = trace_id.split(":")
@@ -0,0 +1,13 @@
+"""Helpers to exercise Amazon Bedrock Agents clients without calling AWS."""
+
+from .emulator import AgentRuntimeEmulator, EmulatorStats, echo_script, text_events
+from .trace_events import multi_agent_events, single_agent_events
+
+__all__ = [
+    "AgentRuntimeEmulator",
+    "EmulatorStats",
+    "echo_script",
+    "multi_agent_events",
+    "single_agent_events",
+    "text_events",
+]
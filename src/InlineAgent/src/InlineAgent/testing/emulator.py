@@ -0,0 +1,394 @@
+"""Local stand-in for the Amazon Bedrock Agent Runtime, for tests and load tests."""
+
+import base64
+import json
+import random
+import re
+import struct
+import sys
+import threading
+import time
+import uuid
+from binascii import crc32
+from dataclasses import dataclass
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Iterable, List, Optional, Union
+from urllib.parse import parse_qsl
+
+EVENT_STREAM_CONTENT_TYPE = "application/vnd.amazon.eventstream"
+
+Script = Callable[[str, Dict], Iterable[Dict]]
+
+_ROUTES = (
+    (
+        "POST",
+        re.compile(
+            r"^/agents/(?P<agentId>[^/]+)/agentAliases/(?P<agentAliasId>[^/]+)"
+            r"/sessions/(?P<sessionId>[^/]+)/text$"
+        ),
+        "invoke_agent",
+    ),
+    ("POST", re.compile(r"^/agents/(?P<sessionId>[^/]+)$"), "invoke_inline_agent"),
+    ("GET", re.compile(r"^/agents/(?P<agentId>[^/]+)/$"), "get_agent"),
+    # STS query protocol, for helpers looking up the account on construction
+    ("POST", re.compile(r"^/$"), "get_caller_identity"),
+)
+
+ACCOUNT_ID = "123456789012"
+
+_CALLER_IDENTITY = f"""<GetCallerIdentityResponse xmlns="https://sts.amazonaws.com/doc/2011-06-15/">
+  <GetCallerIdentityResult>
+    <Arn>arn:aws:iam::{ACCOUNT_ID}:user/emulator</Arn>
+    <UserId>EMULATOR</UserId>
+    <Account>{ACCOUNT_ID}</Account>
+  </GetCallerIdentityResult>
+</GetCallerIdentityResponse>""".encode(
+    "utf-8"
+)
+
+
+def text_events(text: str, chunk_size: Optional[int] = None) -> List[Dict]:
+    """Chunk events of `text`, split every `chunk_size` characters if given."""
+    if not chunk_size:
+        return [{"chunk": {"bytes": text.encode("utf-8")}}]
+    return [
+        {"chunk": {"bytes": text[idx : idx + chunk_size].encode("utf-8")}}
+        for idx in range(0, len(text), chunk_size)
+    ]
+
+
+def echo_script(operation: str, params: Dict) -> List[Dict]:
+    """Answer every invocation with its input text."""
+    return text_events(f"Echo: {params.get('inputText', '')}", chunk_size=16)
+
+
+def _encode(obj):
+    if isinstance(obj, (bytes, bytearray)):
+        return base64.b64encode(obj).decode("ascii")
+    if isinstance(obj, datetime):
+        return obj.timestamp()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def encode_message(headers: Dict[str, str], payload: bytes) -> bytes:
+    """Encode a message of the `application/vnd.amazon.eventstream` format."""
+    encoded_headers = b""
+    for name, value in headers.items():
+        name, value = name.encode("utf-8"), value.encode("utf-8")
+        # Header value type 7 is a string
+        encoded_headers += (
+            struct.pack("!B", len(name))
+            + name
+            + b"\x07"
+            + struct.pack("!H", len(value))
+            + value
+        )
+
+    total_length = 12 + len(encoded_headers) + len(payload) + 4
+    prelude = struct.pack("!II", total_length, len(encoded_headers))
+    message = (
+        prelude
+        + struct.pack("!I", crc32(prelude) & 0xFFFFFFFF)
+        + encoded_headers
+        + payload
+    )
+    return message + struct.pack("!I", crc32(message) & 0xFFFFFFFF)
+
+
+def encode_event(event: Dict) -> bytes:
+    """Encode an event as returned by `boto3`, e.g. `{"chunk": {"bytes": b"..."}}`.
+
+    Events named like `throttlingException` are sent as modeled stream exceptions.
+    """
+    (event_type, body), *_ = event.items()
+    payload = json.dumps(body, default=_encode).encode("utf-8")
+
+    if event_type.endswith("Exception"):
+        headers = {
+            ":message-type": "exception",
+            ":exception-type": event_type,
+            ":content-type": "application/json",
+        }
+    else:
+        headers = {
+            ":message-type": "event",
+            ":event-type": event_type,
+            ":content-type": "application/json",
+        }
+    return encode_message(headers=headers, payload=payload)
+
+
+@dataclass(slots=True)
+class EmulatorStats:
+    requests: int = 0
+    throttled: int = 0
+    active: int = 0
+    max_active: int = 0
+
+
+class _Server(ThreadingHTTPServer):
+
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Clients closing idle keep-alive connections is not an error
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+class _Handler(BaseHTTPRequestHandler):
+
+    protocol_version = "HTTP/1.1"
+    emulator: "AgentRuntimeEmulator"
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_response(self, code, message=None):
+        super().send_response(code, message)
+        self.send_header("x-amzn-RequestId", str(uuid.uuid4()))
+
+    def do_GET(self):
+        self.emulator._handle(self, "GET")
+
+    def do_POST(self):
+        self.emulator._handle(self, "POST")
+
+    def read_params(self, path_params: Dict) -> Dict:
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length) if length else b""
+        if self.headers.get("Content-Type", "").startswith(
+            "application/x-www-form-urlencoded"
+        ):
+            params = dict(parse_qsl(body.decode("utf-8")))
+        else:
+            params = json.loads(body) if body else {}
+        params.update(path_params)
+        return params
+
+    def send_body(
+        self,
+        status: int,
+        payload: bytes,
+        content_type: str,
+        error_type: Optional[str] = None,
+    ):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(payload)))
+        if error_type:
+            self.send_header("x-amzn-ErrorType", error_type)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def send_json(self, status: int, body: Dict, error_type: Optional[str] = None):
+        self.send_body(
+            status,
+            payload=json.dumps(body, default=_encode).encode("utf-8"),
+            content_type="application/json",
+            error_type=error_type,
+        )
+
+    def write_chunk(self, data: bytes):
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+        self.wfile.flush()
+
+
+class AgentRuntimeEmulator:
+    """Serve `InvokeAgent` and `InvokeInlineAgent` from scripted event streams.
+
+    Responses use the event stream wire format of the service, so unmodified
+    `boto3` clients consume them. `environ` points clients at the emulator through
+    the `AWS_ENDPOINT_URL_*` variables::
+
+        with AgentRuntimeEmulator(first_event_latency=0.5) as emulator:
+            with mock.patch.dict(os.environ, emulator.environ()):
+                asyncio.run(agent.invoke(input_text="What is the weather?"))
+
+    `script` is the list of events of every response, or a callable of the operation
+    name and request parameters returning them. Events take the shape `boto3`
+    returns, e.g. `{"chunk": {"bytes": b"..."}}`, `{"trace": {...}}`,
+    `{"returnControl": {...}}` or `{"files": {...}}`.
+
+    Latency is shaped by `first_event_latency`, `event_interval` between events and
+    `throughput` in bytes per second of chunk events. A share of `throttle_rate`
+    requests, and requests beyond `max_concurrency` open streams, are rejected with
+    a `ThrottlingException`.
+    """
+
+    def __init__(
+        self,
+        script: Union[Script, List[Dict], None] = None,
+        first_event_latency: float = 0.0,
+        event_interval: float = 0.0,
+        throughput: Optional[float] = None,
+        throttle_rate: float = 0.0,
+        max_concurrency: Optional[int] = None,
+        agents: Optional[Dict[str, str]] = None,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        seed: Optional[int] = None,
+    ):
+        if not 0.0 <= throttle_rate <= 1.0:
+            raise ValueError(
+                f"throttle_rate must be between 0.0 and 1.0, got {throttle_rate}"
+            )
+
+        if script is None:
+            script = echo_script
+        elif not callable(script):
+            events = list(script)
+            script = lambda operation, params: events  # noqa: E731
+
+        self.script = script
+        self.first_event_latency = first_event_latency
+        self.event_interval = event_interval
+        self.throughput = throughput
+        self.throttle_rate = throttle_rate
+        self.max_concurrency = max_concurrency
+        self.agents = agents or dict()
+        self.stats = EmulatorStats()
+
+        self._host = host
+        self._port = port
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server: Optional[_Server] = None
+        self._thread: Optional[threading.Thread] = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def start(self):
+        if self._server is None:
+            handler = type("Handler", (_Handler,), {"emulator": self})
+            self._server = _Server((self._host, self._port), handler)
+            self._thread = threading.Thread(
+                target=self._server.serve_forever,
+                kwargs={"poll_interval": 0.05},
+                daemon=True,
+            )
+            self._thread.start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._thread.join()
+            self._server = None
+            self._thread = None
+
+    @property
+    def endpoint_url(self) -> str:
+        if self._server is None:
+            raise RuntimeError("Start the emulator before using its endpoint")
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def environ(self, region_name: str = "us-east-1") -> Dict[str, str]:
+        """Variables routing `boto3` Bedrock Agents and STS clients to the emulator.
+
+        Includes a region and placeholder credentials, requests are still signed.
+        """
+        return {
+            "AWS_ENDPOINT_URL_BEDROCK_AGENT_RUNTIME": self.endpoint_url,
+            "AWS_ENDPOINT_URL_BEDROCK_AGENT": self.endpoint_url,
+            "AWS_ENDPOINT_URL_STS": self.endpoint_url,
+            "AWS_DEFAULT_REGION": region_name,
+            "AWS_ACCESS_KEY_ID": "emulator",
+            "AWS_SECRET_ACCESS_KEY": "emulator",
+        }
+
+    def _acquire(self) -> bool:
+        with self._lock:
+            self.stats.requests += 1
+            if (
+                self.throttle_rate and self._random.random() < self.throttle_rate
+            ) or (
+                self.max_concurrency is not None
+                and self.stats.active >= self.max_concurrency
+            ):
+                self.stats.throttled += 1
+                return False
+
+            self.stats.active += 1
+            self.stats.max_active = max(self.stats.max_active, self.stats.active)
+            return True
+
+    def _release(self):
+        with self._lock:
+            self.stats.active -= 1
+
+    def _handle(self, request: _Handler, method: str):
+        path = request.path.split("?", 1)[0]
+        for route_method, pattern, operation in _ROUTES:
+            match = pattern.match(path)
+            if route_method == method and match:
+                break
+        else:
+            request.send_json(
+                404,
+                {"message": f"No emulated operation for {method} {path}"},
+                error_type="ResourceNotFoundException",
+            )
+            return
+
+        params = request.read_params(match.groupdict())
+
+        if operation == "get_caller_identity":
+            request.send_body(200, payload=_CALLER_IDENTITY, content_type="text/xml")
+            return
+
+        if operation == "get_agent":
+            agent_id = params["agentId"]
+            request.send_json(
+                200,
+                {
+                    "agent": {
+                        "agentId": agent_id,
+                        "agentName": self.agents.get(agent_id, agent_id),
+                        "agentStatus": "PREPARED",
+                    }
+                },
+            )
+            return
+
+        if not self._acquire():
+            request.send_json(
+                429, {"message": "Rate exceeded"}, error_type="ThrottlingException"
+            )
+            return
+
+        try:
+            self._stream(
+                request, events=self.script(operation, params), params=params
+            )
+        except ConnectionError:
+            # The client stopped reading the stream
+            pass
+        finally:
+            self._release()
+
+    def _stream(self, request: _Handler, events: Iterable[Dict], params: Dict):
+        request.send_response(200)
+        request.send_header("Content-Type", EVENT_STREAM_CONTENT_TYPE)
+        request.send_header("Transfer-Encoding", "chunked")
+        request.send_header("x-amzn-bedrock-agent-content-type", "application/json")
+        request.send_header("x-amz-bedrock-agent-session-id", params["sessionId"])
+        request.end_headers()
+
+        delay = self.first_event_latency
+        for event in events:
+            if "chunk" in event and self.throughput:
+                delay += len(event["chunk"].get("bytes", b"")) / self.throughput
+            if delay > 0:
+                time.sleep(delay)
+            request.write_chunk(encode_event(event))
+            delay = self.event_interval
+
+        request.write_chunk(b"")
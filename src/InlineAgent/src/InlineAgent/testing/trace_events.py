@@ -0,0 +1,392 @@
+"""Synthetic `invoke_agent` completion events shaped like Amazon Bedrock Agent traces,
+for tests, benchmarks and load tests."""
+
+import uuid
+from datetime import datetime, timezone
+
+INFERENCE_CONFIGURATION = {
+    "maximumLength": 2048,
+    "temperature": 0.0,
+    "topP": 1.0,
+    "topK": 250,
+    "stopSequences": ["</invoke>", "</answer>", "</error>"],
+}
+
+
+def alias_arn(agent_id: str, agent_alias_id: str):
+    return f"arn:aws:bedrock:us-east-1:123456789012:agent-alias/{agent_id}/{agent_alias_id}"
+
+
+def trace_event(session_id: str, caller_chain: list, trace: dict):
+    agent_id, agent_alias_id = caller_chain[-1]["agentAliasArn"].split("/")[-2:]
+    return {
+        "trace": {
+            "agentId": agent_id,
+            "agentAliasId": agent_alias_id,
+            "agentVersion": "1",
+            "sessionId": session_id,
+            "callerChain": caller_chain,
+            "eventTime": datetime.now(timezone.utc),
+            "trace": trace,
+        }
+    }
+
+
+def model_invocation_events(
+    session_id: str,
+    caller_chain: list,
+    trace_id: str,
+    prompt: str = "Human: What is the weather?",
+    input_tokens: int = 100,
+    output_tokens: int = 20,
+):
+    return [
+        trace_event(
+            session_id,
+            caller_chain,
+            {
+                "orchestrationTrace": {
+                    "modelInvocationInput": {
+                        "traceId": trace_id,
+                        "text": prompt,
+                        "type": "ORCHESTRATION",
+                        "foundationModel": "anthropic.claude-3-haiku-20240307-v1:0",
+                        "inferenceConfiguration": INFERENCE_CONFIGURATION,
+                    }
+                }
+            },
+        ),
+        trace_event(
+            session_id,
+            caller_chain,
+            {
+                "orchestrationTrace": {
+                    "modelInvocationOutput": {
+                        "traceId": trace_id,
+                        "rawResponse": {"content": '{"model": "claude"}'},
+                        "metadata": {
+                            "usage": {
+                                "inputTokens": input_tokens,
+                                "outputTokens": output_tokens,
+                            }
+                        },
+                    }
+                }
+            },
+        ),
+    ]
+
+
+def tool_call_events(session_id: str, caller_chain: list, trace_id: str):
+    return [
+        trace_event(
+            session_id,
+            caller_chain,
+            {
+                "orchestrationTrace": {
+                    "rationale": {"traceId": trace_id, "text": "Use the weather tool"}
+                }
+            },
+        ),
+        trace_event(
+            session_id,
+            caller_chain,
+            {
+                "orchestrationTrace": {
+                    "invocationInput": {
+                        "traceId": trace_id,
+                        "invocationType": "ACTION_GROUP",
+                        "actionGroupInvocationInput": {
+                            "actionGroupName": "WeatherActionGroup",
+                            "function": "get_current_weather",
+                            "parameters": [
+                                {"name": "location", "type": "string", "value": "Seattle"}
+                            ],
+                        },
+                    }
+                }
+            },
+        ),
+        trace_event(
+            session_id,
+            caller_chain,
+            {
+                "orchestrationTrace": {
+                    "observation": {
+                        "traceId": trace_id,
+                        "type": "ACTION_GROUP",
+                        "actionGroupInvocationOutput": {"text": "70 fahrenheit"},
+                    }
+                }
+            },
+        ),
+    ]
+
+
+def knowledge_base_reference(idx: int):
+    return {
+        "content": {"text": f"Passage {idx} about the weather in Seattle.", "type": "TEXT"},
+        "location": {
+            "s3Location": {"uri": f"s3://knowledge-base-bucket/weather-{idx}.pdf"},
+            "type": "S3",
+        },
+        "metadata": {
+            "x-amz-bedrock-kb-source-uri": f"s3://knowledge-base-bucket/weather-{idx}.pdf",
+            "x-amz-bedrock-kb-data-source-id": "DATASOURCE",
+        },
+    }
+
+
+def knowledge_base_events(
+    session_id: str, caller_chain: list, trace_id: str, references: int = 5
+):
+    return [
+        trace_event(
+            session_id,
+            caller_chain,
+            {
+                "orchestrationTrace": {
+                    "invocationInput": {
+                        "traceId": trace_id,
+                        "invocationType": "KNOWLEDGE_BASE",
+                        "knowledgeBaseLookupInput": {
+                            "text": "weather in Seattle",
+                            "knowledgeBaseId": "KNOWLEDGEBASE",
+                        },
+                    }
+                }
+            },
+        ),
+        trace_event(
+            session_id,
+            caller_chain,
+            {
+                "orchestrationTrace": {
+                    "observation": {
+                        "traceId": trace_id,
+                        "type": "KNOWLEDGE_BASE",
+                        "knowledgeBaseLookupOutput": {
+                            "retrievedReferences": [
+                                knowledge_base_reference(idx)
+                                for idx in range(references)
+                            ]
+                        },
+                    }
+                }
+            },
+        ),
+    ]
+
+
+def citation_chunk(answer: str, references: int = 5):
+    return {
+        "chunk": {
+            "bytes": answer.encode("utf-8"),
+            "attribution": {
+                "citations": [
+                    {
+                        "generatedResponsePart": {
+                            "textResponsePart": {
+                                "text": answer,
+                                "span": {"start": 0, "end": len(answer) - 1},
+                            }
+                        },
+                        "retrievedReferences": [
+                            knowledge_base_reference(idx) for idx in range(references)
+                        ],
+                    }
+                ]
+            },
+        }
+    }
+
+
+def final_response_events(session_id: str, caller_chain: list, trace_id: str):
+    return [
+        trace_event(
+            session_id,
+            caller_chain,
+            {
+                "orchestrationTrace": {
+                    "observation": {
+                        "traceId": trace_id,
+                        "type": "FINISH",
+                        "finalResponse": {"text": "It is 70 fahrenheit."},
+                    }
+                }
+            },
+        )
+    ]
+
+
+def agent_turn_events(
+    session_id: str,
+    caller_chain: list,
+    tool_calls: int = 1,
+    knowledge_base_lookups: int = 0,
+    references: int = 5,
+    family: str = None,
+):
+    """Orchestration events of one agent answering after tool and KB steps."""
+    family = family or str(uuid.uuid4())
+    events = list()
+
+    for step in range(tool_calls):
+        trace_id = f"{family}-{step}"
+        events += model_invocation_events(session_id, caller_chain, trace_id)
+        events += tool_call_events(session_id, caller_chain, trace_id)
+
+    for step in range(tool_calls, tool_calls + knowledge_base_lookups):
+        trace_id = f"{family}-{step}"
+        events += model_invocation_events(session_id, caller_chain, trace_id)
+        events += knowledge_base_events(
+            session_id, caller_chain, trace_id, references=references
+        )
+
+    trace_id = f"{family}-{tool_calls + knowledge_base_lookups}"
+    events += model_invocation_events(session_id, caller_chain, trace_id)
+    events += final_response_events(session_id, caller_chain, trace_id)
+    return events
+
+
+def collaborator_events(
+    session_id: str,
+    supervisor_chain: list,
+    trace_id: str,
+    collaborator_id: str,
+    collaborator_alias_id: str,
+    tool_calls: int = 1,
+    knowledge_base_lookups: int = 0,
+    references: int = 5,
+):
+    """Supervisor delegating to a collaborator, including the collaborator's trace."""
+    collaborator_arn = alias_arn(collaborator_id, collaborator_alias_id)
+    collaborator_chain = supervisor_chain + [{"agentAliasArn": collaborator_arn}]
+
+    events = [
+        trace_event(
+            session_id,
+            supervisor_chain,
+            {
+                "orchestrationTrace": {
+                    "invocationInput": {
+                        "traceId": trace_id,
+                        "invocationType": "AGENT_COLLABORATOR",
+                        "agentCollaboratorInvocationInput": {
+                            "agentCollaboratorName": f"collaborator-{collaborator_id}",
+                            "agentCollaboratorAliasArn": collaborator_arn,
+                            "input": {"text": "What is the weather?", "type": "TEXT"},
+                        },
+                    }
+                }
+            },
+        )
+    ]
+    events += agent_turn_events(
+        session_id=f"{session_id}-{collaborator_id}",
+        caller_chain=collaborator_chain,
+        tool_calls=tool_calls,
+        knowledge_base_lookups=knowledge_base_lookups,
+        references=references,
+    )
+    events.append(
+        trace_event(
+            session_id,
+            supervisor_chain,
+            {
+                "orchestrationTrace": {
+                    "observation": {
+                        "traceId": trace_id,
+                        "type": "AGENT_COLLABORATOR",
+                        "agentCollaboratorInvocationOutput": {
+                            "agentCollaboratorName": f"collaborator-{collaborator_id}",
+                            "agentCollaboratorAliasArn": collaborator_arn,
+                            "output": {"text": "It is 70 fahrenheit.", "type": "TEXT"},
+                        },
+                    }
+                }
+            },
+        )
+    )
+    return events
+
+
+def multi_agent_events(
+    session_id: str,
+    agent_id: str = "SUPERVISOR",
+    agent_alias_id: str = "ALIAS",
+    collaborators: int = 2,
+    tool_calls: int = 1,
+    knowledge_base_lookups: int = 0,
+    references: int = 5,
+    answer: str = "It is 70 fahrenheit.",
+):
+    """Completion events of a supervisor consulting `collaborators` sub-agents."""
+    supervisor_chain = [{"agentAliasArn": alias_arn(agent_id, agent_alias_id)}]
+    family = str(uuid.uuid4())
+    events = list()
+
+    for step in range(collaborators):
+        trace_id = f"{family}-{step}"
+        events += model_invocation_events(session_id, supervisor_chain, trace_id)
+        events += collaborator_events(
+            session_id=session_id,
+            supervisor_chain=supervisor_chain,
+            trace_id=trace_id,
+            collaborator_id=f"COLLAB{step}",
+            collaborator_alias_id="ALIAS",
+            tool_calls=tool_calls,
+            knowledge_base_lookups=knowledge_base_lookups,
+            references=references,
+        )
+
+    trace_id = f"{family}-{collaborators}"
+    events += model_invocation_events(session_id, supervisor_chain, trace_id)
+    events += final_response_events(session_id, supervisor_chain, trace_id)
+    events.append({"chunk": {"bytes": answer.encode("utf-8")}})
+    return events
+
+
+def single_agent_events(
+    session_id: str,
+    agent_id: str = "AGENT",
+    agent_alias_id: str = "ALIAS",
+    tool_calls: int = 1,
+    knowledge_base_lookups: int = 0,
+    references: int = 5,
+    answer: str = "It is 70 fahrenheit.",
+):
+    """Completion events of a single agent calling tools and knowledge bases."""
+    caller_chain = [{"agentAliasArn": alias_arn(agent_id, agent_alias_id)}]
+    events = agent_turn_events(
+        session_id,
+        caller_chain,
+        tool_calls=tool_calls,
+        knowledge_base_lookups=knowledge_base_lookups,
+        references=references,
+    )
+    if knowledge_base_lookups:
+        events.append(citation_chunk(answer, references=references))
+    else:
+        events.append({"chunk": {"bytes": answer.encode("utf-8")}})
+    return events
+
+
+def guardrail_event(
+    session_id: str,
+    agent_id: str = "AGENT",
+    agent_alias_id: str = "ALIAS",
+    action: str = "INTERVENED",
+):
+    caller_chain = [{"agentAliasArn": alias_arn(agent_id, agent_alias_id)}]
+    return trace_event(
+        session_id,
+        caller_chain,
+        {
+            "guardrailTrace": {
+                "traceId": f"{uuid.uuid4()}-guardrail-pre-0",
+                "action": action,
+                "inputAssessments": [{"topicPolicy": {"topics": []}}],
+            }
+        },
+    )
@@ -0,0 +1,340 @@
+"""
+Compact encoding of the results of return of control tools.
+
+Whatever a tool returns goes back to the agent as text, and stays in its prompt for every
+later orchestration step. A ToolResultEncoder turns tabular results, i.e. DataFrames,
+lists of records, columnar dicts or their JSON, into CSV or TSV. Columns are pruned, numbers
+rounded and long tables downsampled to evenly spaced rows along the way. Encoded results
+start with a header estimating their tokens, before and after encoding::
+
+    #tool_result format=csv rows=20/250 columns=3/8 tokens=212 raw_tokens=4810
+
+Results still larger than `spill_tokens` are kept in a ToolResultStore. The agent gets
+their first rows and a handle, and can page through the rest with `read_tool_result`
+when it is one of its tools::
+
+    ActionGroup(
+        name="StockActionGroup",
+        tools=[get_prices, read_tool_result],
+        result_encoder=ToolResultEncoder(columns=["date", "close"], spill_tokens=2000),
+    )
+
+The observability traces and the demo UI report the token savings of the header.
+"""
+
+import csv
+import functools
+import hashlib
+import inspect
+import io
+import json
+import math
+import re
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Literal, Optional, Tuple
+
+# Rough size of a token in English text and numbers
+CHARS_PER_TOKEN = 4
+HEADER_PREFIX = "#tool_result"
+HANDLE_PREFIX = "tool-result://"
+_HEADER_PATTERN = re.compile(rf"^{HEADER_PREFIX}((?: \w+=\S+)*)")
+_DELIMITERS = {"csv": ",", "tsv": "\t"}
+
+
+def estimate_tokens(text: str) -> int:
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def parse_header(text: Any) -> Optional[Dict[str, str]]:
+    """Fields of the `#tool_result` header of an encoded result, None without one."""
+    if not isinstance(text, str):
+        return None
+    match = _HEADER_PATTERN.match(text)
+    if match is None:
+        return None
+    return dict(field.split("=", 1) for field in match.group(1).split())
+
+
+def token_savings(text: Any) -> Optional[Tuple[int, int]]:
+    """Estimated tokens of an encoded result and of the result before encoding, from
+    its header, None without one."""
+    header = parse_header(text)
+    if not header or "tokens" not in header or "raw_tokens" not in header:
+        return None
+    try:
+        return int(header["tokens"]), int(header["raw_tokens"])
+    except ValueError:
+        return None
+
+
+@dataclass(frozen=True)
+class EncodedToolResult:
+    text: str
+    tokens: int
+    raw_tokens: int
+    handle: Optional[str] = None
+
+    @property
+    def tokens_saved(self) -> int:
+        return self.raw_tokens - self.tokens
+
+
+class ToolResultStore:
+    """Results too large to be returned to the agent, by handle, least recently used
+    ones dropped beyond `max_entries`."""
+
+    def __init__(self, max_entries: int = 256):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._results: "OrderedDict[str, Tuple[Optional[str], List[str]]]" = (
+            OrderedDict()
+        )
+
+    def put(self, lines: List[str], columns: Optional[str] = None) -> str:
+        """Store the lines of a result, `columns` being the header line of a table
+        repeated on every page. Returns the handle of the result."""
+        digest = hashlib.sha256("\n".join([columns or ""] + lines).encode("utf-8"))
+        handle = HANDLE_PREFIX + digest.hexdigest()[:16]
+        with self._lock:
+            self._results[handle] = (columns, lines)
+            self._results.move_to_end(handle)
+            while len(self._results) > self.max_entries:
+                self._results.popitem(last=False)
+        return handle
+
+    def read(self, handle: str, offset: int = 0, limit: int = 50) -> str:
+        with self._lock:
+            if handle not in self._results:
+                raise KeyError(f"Unknown or expired tool result {handle}")
+            self._results.move_to_end(handle)
+            columns, lines = self._results[handle]
+        page = lines[offset : offset + limit]
+        header = (
+            f"{HEADER_PREFIX} rows={len(page)}/{len(lines)} offset={offset} ref={handle}"
+        )
+        return "\n".join([header] + ([columns] if columns else []) + page)
+
+    def __len__(self) -> int:
+        return len(self._results)
+
+    def clear(self):
+        with self._lock:
+            self._results.clear()
+
+
+_store_lock = threading.Lock()
+_store: Optional[ToolResultStore] = None
+
+
+def get_tool_result_store() -> ToolResultStore:
+    """Store of the process, shared by encoders without a store of their own."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = ToolResultStore()
+        return _store
+
+
+def read_tool_result(handle: str, offset: int = 0, limit: int = 50) -> str:
+    """
+    Read more rows of a tool result that was too large to be returned at once.
+
+    Parameters:
+        handle: The ref of the tool result, starting with tool-result://
+        offset: Index of the first row to read
+        limit: Number of rows to read
+    """
+    try:
+        return get_tool_result_store().read(handle, int(offset), int(limit))
+    except KeyError as e:
+        return str(e.args[0])
+
+
+def _cell(value: Any, precision: Optional[int]) -> Any:
+    if value is None:
+        return ""
+    if hasattr(value, "item") and not isinstance(value, (str, bytes)):
+        # NumPy scalars
+        value = value.item()
+    if isinstance(value, int):
+        return value
+    if isinstance(value, (list, dict)):
+        return json.dumps(value, separators=(",", ":"), default=str)
+    if isinstance(value, float):
+        if math.isnan(value):
+            return ""
+        if precision is not None:
+            value = round(value, precision)
+            if value == int(value) and abs(value) < 1e15:
+                return int(value)
+        return value
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    return value
+
+
+def _to_table(result: Any) -> Optional[Tuple[List[str], List[List[Any]]]]:
+    """Columns and rows of a tabular result, None when it is not tabular."""
+    if isinstance(result, (str, bytes)):
+        text = result.strip()
+        if not text.startswith(("[", "{")):
+            return None
+        try:
+            return _to_table(json.loads(text))
+        except ValueError:
+            return None
+
+    # pandas DataFrames, without importing pandas
+    if hasattr(result, "columns") and hasattr(result, "itertuples"):
+        index = result.index
+        if index.name is not None or type(index).__name__ != "RangeIndex":
+            result = result.reset_index()
+        return [str(column) for column in result.columns], [
+            list(row) for row in result.itertuples(index=False)
+        ]
+
+    if isinstance(result, dict):
+        if isinstance(result.get("columns"), list) and isinstance(
+            result.get("rows"), list
+        ):
+            return [str(column) for column in result["columns"]], result["rows"]
+        values = list(result.values())
+        if (
+            values
+            and all(isinstance(value, list) for value in values)
+            and len({len(value) for value in values}) == 1
+        ):
+            return [str(key) for key in result], [list(row) for row in zip(*values)]
+        return None
+
+    if isinstance(result, list) and result and all(isinstance(r, dict) for r in result):
+        columns = list(dict.fromkeys(key for record in result for key in record))
+        return [str(column) for column in columns], [
+            [record.get(column) for column in columns] for record in result
+        ]
+    return None
+
+
+def _downsample(rows: List, max_rows: Optional[int]) -> List:
+    """Evenly spaced rows, keeping the first and the last."""
+    if max_rows is None or len(rows) <= max_rows:
+        return rows
+    if max_rows <= 1:
+        return rows[-max_rows:] if max_rows else []
+    step = (len(rows) - 1) / (max_rows - 1)
+    return [rows[round(idx * step)] for idx in range(max_rows)]
+
+
+@dataclass
+class ToolResultEncoder:
+    """Encoding of the results of the tools of an action group.
+
+    Args:
+        columns (List[str], optional): columns to keep, in this order, all by default
+            or when the result has none of them
+        precision (int, optional): decimals numbers are rounded to, None not to round
+        max_rows (int, optional): rows of longer tables are downsampled to
+        format (str): "csv" or "tsv"
+        spill_tokens (int, optional): results estimated to be larger are stored, and
+            only their first `preview_rows` returned with a handle
+        preview_rows (int): rows of stored results returned to the agent
+        store (ToolResultStore, optional): store of large results, the store of the
+            process by default
+    """
+
+    columns: Optional[List[str]] = None
+    precision: Optional[int] = 4
+    max_rows: Optional[int] = None
+    format: Literal["csv", "tsv"] = "csv"
+    spill_tokens: Optional[int] = None
+    preview_rows: int = 10
+    store: Optional[Any] = None
+
+    def __post_init__(self):
+        if self.format not in _DELIMITERS:
+            raise ValueError(f"format must be one of {list(_DELIMITERS)}")
+
+    def _lines(self, rows: List[List[Any]]) -> List[str]:
+        buffer = io.StringIO()
+        writer = csv.writer(
+            buffer, delimiter=_DELIMITERS[self.format], lineterminator="\n"
+        )
+        writer.writerows(rows)
+        return buffer.getvalue().splitlines()
+
+    def _header(self, text: str, raw_tokens: int, **fields) -> str:
+        """`text` preceded by the header, whose own size is part of the estimate."""
+        fields = "".join(f" {key}={value}" for key, value in fields.items())
+        header = f"{HEADER_PREFIX}{fields} tokens={{}} raw_tokens={raw_tokens}"
+        tokens = estimate_tokens(header.format(estimate_tokens(text)) + "\n" + text)
+        return header.format(tokens) + "\n" + text
+
+    def encode(self, result: Any) -> EncodedToolResult:
+        if isinstance(result, str):
+            raw = result
+        elif hasattr(result, "to_json"):
+            # What DataFrames are usually returned as
+            raw = result.to_json(orient="split", date_format="iso")
+        else:
+            raw = json.dumps(result, default=str)
+        raw_tokens = estimate_tokens(raw)
+
+        table = _to_table(result)
+        if table is None:
+            fields = dict()
+            columns_line, lines = None, raw.splitlines()
+            text = raw
+        else:
+            columns, rows = table
+            keep = list(range(len(columns)))
+            if self.columns:
+                # All of them when none of `columns` are in the result
+                keep = [columns.index(c) for c in self.columns if c in columns] or keep
+            columns_line = self._lines([[columns[idx] for idx in keep]])[0]
+            rows = [[_cell(row[idx], self.precision) for idx in keep] for row in rows]
+            sampled = _downsample(rows, self.max_rows)
+            fields = {
+                "format": self.format,
+                "rows": f"{len(sampled)}/{len(rows)}",
+                "columns": f"{len(keep)}/{len(columns)}",
+            }
+            lines = self._lines(sampled)
+            text = "\n".join([columns_line] + lines)
+
+        if self.spill_tokens is None or estimate_tokens(text) <= self.spill_tokens:
+            if table is None:
+                # Plain text is returned as is, a header would only add to it
+                tokens = estimate_tokens(text)
+                return EncodedToolResult(text, tokens=tokens, raw_tokens=raw_tokens)
+            text = self._header(text, raw_tokens, **fields)
+            return EncodedToolResult(text, estimate_tokens(text), raw_tokens)
+
+        store = self.store if self.store is not None else get_tool_result_store()
+        handle = store.put(lines, columns=columns_line)
+        preview = lines[: self.preview_rows]
+        fields["rows"] = f"{len(preview)}/{len(lines)}"
+        text = "\n".join(
+            ([columns_line] if columns_line else [])
+            + preview
+            + [f"#more rows with read_tool_result(handle={handle}, offset={len(preview)})"]
+        )
+        text = self._header(text, raw_tokens, **fields, ref=handle)
+        return EncodedToolResult(text, estimate_tokens(text), raw_tokens, handle)
+
+    def wrap(self, tool: Callable) -> Callable:
+        """`tool` returning its encoded result, as the tool of an action group."""
+        if inspect.iscoroutinefunction(tool):
+
+            @functools.wraps(tool)
+            async def async_wrapper(*args, **kwargs):
+                return self.encode(await tool(*args, **kwargs)).text
+
+            return async_wrapper
+
+        @functools.wraps(tool)
+        def wrapper(*args, **kwargs):
+            return self.encode(tool(*args, **kwargs)).text
+
+        return wrapper
@@ -0,0 +1,131 @@
+"""Throughput of the trace processors on synthetic traces, replayed offline.
+
+Run from ``src``::
+
+    python -m pytest benchmarks -o python_files="bench_*.py"
+"""
+
+import asyncio
+import io
+import os
+from contextlib import redirect_stdout
+from unittest import mock
+
+import pytest
+
+pytest.importorskip("pytest_benchmark")
+
+from opentelemetry import trace as otel_trace  # noqa: E402
+from opentelemetry.sdk.trace import TracerProvider  # noqa: E402
+
+from InlineAgent.agent import InlineAgent  # noqa: E402
+from InlineAgent.observability import (  # noqa: E402
+    EventStreamReplayer,
+    Trace,
+    observe,
+)
+from InlineAgent.observability import agent_instrument, process  # noqa: E402
+from InlineAgent.observability.process import ProcessL2Trace  # noqa: E402
+from InlineAgent.observability.span_manager import SpanManager  # noqa: E402
+
+SESSION_ID = "benchmark-session"
+
+
+@pytest.fixture(scope="module", autouse=True)
+def tracer_provider():
+    # Spans are recorded but not exported, only the processing cost is measured
+    otel_trace.set_tracer_provider(TracerProvider())
+
+
+@pytest.fixture(params=[False, True], ids=["otel_off", "otel_on"])
+def produce_otel_traces(request):
+    with mock.patch.object(
+        agent_instrument.config, "PRODUCE_BEDROCK_OTEL_TRACES", request.param
+    ), mock.patch.object(
+        process.config, "PRODUCE_BEDROCK_OTEL_TRACES", request.param
+    ):
+        yield request.param
+
+
+def run_quietly(benchmark, func, events):
+    benchmark.extra_info["events"] = len(events)
+
+    def quiet():
+        with redirect_stdout(io.StringIO()):
+            return func()
+
+    return benchmark(quiet)
+
+
+def test_parse_trace(benchmark, events):
+    traces = [event["trace"]["trace"] for event in events if "trace" in event]
+
+    def parse():
+        for trace in traces:
+            Trace.parse_trace(trace=trace, agentName="benchmark")
+
+    run_quietly(benchmark, parse, events)
+
+
+def test_process_trace_event(benchmark, events):
+    trace_events = [event["trace"] for event in events if "trace" in event]
+
+    def process_trace_events():
+        span_manager = SpanManager()
+        for trace_data in trace_events:
+            ProcessL2Trace.process_trace_event(
+                trace_data=trace_data,
+                span_manager=span_manager,
+                save_traces=False,
+                session_id=SESSION_ID,
+                show_traces=False,
+            )
+        span_manager.end_all_spans(status_code=otel_trace.StatusCode.OK)
+
+    with mock.patch.object(process.config, "PRODUCE_BEDROCK_OTEL_TRACES", True):
+        run_quietly(benchmark, process_trace_events, events)
+
+
+def test_observe(benchmark, events, recording, produce_otel_traces):
+    replayer = EventStreamReplayer(recording)
+
+    @observe(show_traces=False)
+    def invoke_agent(inputText, sessionId, **kwargs):
+        return replayer.client().invoke_agent(
+            inputText=inputText, sessionId=sessionId, **kwargs
+        )
+
+    agent_id = "SUPERVISOR" if "SUPERVISOR" in str(events[0]) else "AGENT"
+    answer = run_quietly(
+        benchmark,
+        lambda: invoke_agent(
+            inputText="What is the weather?",
+            sessionId=SESSION_ID,
+            agentId=agent_id,
+            agentAliasId="ALIAS",
+        ),
+        events,
+    )
+    assert answer
+
+
+def test_inline_agent_invoke(benchmark, events, recording, tmp_path):
+    aws_config = tmp_path / "config"
+    aws_config.write_text("[default]\nregion = us-east-1\n")
+
+    agent = InlineAgent(
+        foundation_model="MOCK_ID",
+        instruction="You are a friendly assistant that is responsible for getting the current weather.",
+        agent_name="MockAgent",
+    )
+
+    with mock.patch.dict(os.environ, {"AWS_CONFIG_FILE": str(aws_config)}):
+        with EventStreamReplayer(recording):
+            answer = run_quietly(
+                benchmark,
+                lambda: asyncio.run(
+                    agent.invoke(input_text="What is the weather?", add_citation=True)
+                ),
+                events,
+            )
+    assert answer
@@ -0,0 +1,47 @@
+import os
+import sys
+
+import pytest
+
+# Run from `src` so the synthetic trace builders of the test suite are importable
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from InlineAgent.observability import EventStreamRecorder  # noqa: E402
+
+from tests.observability.trace_events import (  # noqa: E402
+    multi_agent_events,
+    single_agent_events,
+)
+
+SESSION_ID = "benchmark-session"
+
+TRACES = {
+    # Supervisor consulting many collaborators, each calling tools
+    "long_supervisor": lambda: multi_agent_events(
+        SESSION_ID, collaborators=10, tool_calls=5
+    ),
+    # Single agent answering from many knowledge base references
+    "many_kb_references": lambda: single_agent_events(
+        SESSION_ID, tool_calls=2, knowledge_base_lookups=10, references=50
+    ),
+}
+
+
+@pytest.fixture(scope="session", params=sorted(TRACES))
+def trace_name(request):
+    return request.param
+
+
+@pytest.fixture(scope="session")
+def events(trace_name):
+    return TRACES[trace_name]()
+
+
+@pytest.fixture(scope="session")
+def recording(tmp_path_factory, trace_name, events):
+    """JSONL recording of the synthetic trace, for both runtime operations."""
+    path = tmp_path_factory.mktemp("recordings") / f"{trace_name}.jsonl"
+    with EventStreamRecorder(str(path)) as recorder:
+        recorder.write_stream(events=events, operation="invoke_agent")
+        recorder.write_stream(events=events, operation="invoke_inline_agent")
+    return str(path)
@@ -0,0 +1,112 @@
+"""Measure the cold import time of the InlineAgent package with ``python -X importtime``.
+
+Each module is imported in fresh interpreters, and the median cumulative import time
+is compared with its budget. ``import InlineAgent`` has to stay cheap for Lambda and
+short-lived workers: names are loaded on first access, so it must not pull boto3,
+pydantic, OpenTelemetry or the MCP client. Run from ``src``::
+
+    python -m benchmarks.import_time
+    python -m benchmarks.import_time --runs 10 --json
+"""
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+from typing import Dict, List, Optional
+
+SRC = Path(__file__).resolve().parents[1]
+
+# Module -> budget of its median cumulative import time in milliseconds, None to
+# only report it
+BUDGETS_MS: Dict[str, Optional[float]] = {
+    "InlineAgent": 50.0,
+    "InlineAgent.observability": 50.0,
+    "InlineAgent.observability.agent_instrument": None,
+    "InlineAgent.agent": None,
+}
+
+# Top-level packages `import InlineAgent` must not load
+HEAVY_MODULES = ("boto3", "botocore", "pydantic", "opentelemetry", "mcp", "rich")
+
+
+def import_time_ms(module: str) -> float:
+    """Cumulative import time of a module in a fresh interpreter, in milliseconds."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=SRC,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    # import time: self [us] | cumulative | imported package
+    for line in reversed(result.stderr.splitlines()):
+        _, _, fields = line.partition("import time:")
+        columns = [column.strip() for column in fields.split("|")]
+        if len(columns) == 3 and columns[2] == module:
+            return int(columns[1]) / 1000
+    raise RuntimeError(f"No import time reported for {module}")
+
+
+def loaded_modules(module: str) -> List[str]:
+    """Top-level packages loaded in a fresh interpreter by importing a module."""
+    result = subprocess.run(
+        [
+            sys.executable,
+            "-c",
+            f"import json, sys; import {module}; "
+            "print(json.dumps(sorted({name.split('.')[0] for name in sys.modules})))",
+        ],
+        cwd=SRC,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return json.loads(result.stdout)
+
+
+def run(runs: int) -> Dict:
+    report = dict()
+    for module, budget in BUDGETS_MS.items():
+        median = statistics.median(import_time_ms(module) for _ in range(runs))
+        report[module] = {
+            "median_ms": round(median, 2),
+            "budget_ms": budget,
+            "within_budget": budget is None or median <= budget,
+        }
+    report["InlineAgent"]["heavy_modules"] = sorted(
+        set(loaded_modules("InlineAgent")) & set(HEAVY_MODULES)
+    )
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    args = parser.parse_args()
+
+    report = run(args.runs)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        for module, result in report.items():
+            budget = (
+                f"budget {result['budget_ms']:.0f} ms"
+                if result["budget_ms"] is not None
+                else "no budget"
+            )
+            print(f"{module:>44}: {result['median_ms']:9.2f} ms ({budget})")
+        if report["InlineAgent"]["heavy_modules"]:
+            print(f"import InlineAgent loads {report['InlineAgent']['heavy_modules']}")
+
+    if not all(result["within_budget"] for result in report.values()) or (
+        report["InlineAgent"]["heavy_modules"]
+    ):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""Replay a multi-agent trace through ``ProcessL2Trace.process_trace_event``.
+
+Run from ``src``::
+
+    python -m benchmarks.trace_processing
+    python -m benchmarks.trace_processing --trace trace/<sessionId>.json
+"""
+
+import argparse
+import json
+import time
+from datetime import datetime
+from unittest import mock
+
+from opentelemetry import trace as otel_trace
+from opentelemetry.sdk.trace import TracerProvider
+
+from InlineAgent.observability import process
+from InlineAgent.observability.process import ProcessL2Trace
+from InlineAgent.observability.span_manager import SpanManager
+
+from tests.observability.trace_events import multi_agent_events
+
+
+def load_trace(path: str):
+    """Load trace events saved with ``@observe(save_traces=True)``."""
+    with open(path, "r") as file:
+        trace_events = json.load(file)
+
+    for trace_data in trace_events:
+        trace_data["eventTime"] = datetime.fromisoformat(trace_data["eventTime"])
+    return trace_events
+
+
+def replay(trace_events, session_id: str):
+    span_manager = SpanManager()
+    for trace_data in trace_events:
+        ProcessL2Trace.process_trace_event(
+            trace_data=trace_data,
+            span_manager=span_manager,
+            save_traces=False,
+            session_id=session_id,
+            show_traces=False,
+        )
+    span_manager.end_all_spans(status_code=otel_trace.StatusCode.OK)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--trace", help="Trace file saved with save_traces=True")
+    parser.add_argument("--collaborators", type=int, default=4)
+    parser.add_argument("--tool-calls", type=int, default=3)
+    parser.add_argument("--iterations", type=int, default=200)
+    args = parser.parse_args()
+
+    if args.trace:
+        trace_events = load_trace(args.trace)
+        session_id = trace_events[0]["sessionId"]
+    else:
+        session_id = "benchmark-session"
+        trace_events = [
+            event["trace"]
+            for event in multi_agent_events(
+                session_id,
+                collaborators=args.collaborators,
+                tool_calls=args.tool_calls,
+            )
+            if "trace" in event
+        ]
+
+    # Spans are recorded but not exported, only the processing cost is measured
+    otel_trace.set_tracer_provider(TracerProvider())
+
+    with mock.patch.object(process.config, "PRODUCE_BEDROCK_OTEL_TRACES", True):
+        replay(trace_events, session_id)  # warm up
+
+        start = time.perf_counter()
+        for _ in range(args.iterations):
+            replay(trace_events, session_id)
+        elapsed = time.perf_counter() - start
+
+    total_events = len(trace_events) * args.iterations
+    print(
+        f"{len(trace_events)} events x {args.iterations} iterations in {elapsed:.3f}s: "
+        f"{total_events / elapsed:,.0f} events/sec"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+import os
+import threading
+import unittest
+from unittest import mock
+
+from InlineAgent.agent import CollaboratorAgent, InlineAgent
+from InlineAgent.aws_context import AwsContext, get_aws_context
+from InlineAgent.knowledge_base import KnowledgeBasePlugin
+
+
+def pages(key, name_key, id_key, ids, page_size=2):
+    """Pages of a list_agents or list_knowledge_bases paginator."""
+    items = [{name_key: name, id_key: value} for name, value in ids.items()]
+    return [
+        {key: items[idx : idx + page_size]} for idx in range(0, len(items), page_size)
+    ] or [{key: []}]
+
+
+def mock_session(agent_ids, knowledge_base_ids):
+    """A boto3 session whose STS and Bedrock Agent clients record their calls."""
+    sts = mock.Mock()
+    sts.get_caller_identity.return_value = {"Account": "123456789012"}
+
+    paginators = {
+        "list_agents": mock.Mock(),
+        "list_knowledge_bases": mock.Mock(),
+    }
+    paginators["list_agents"].paginate.side_effect = lambda: pages(
+        "agentSummaries", "agentName", "agentId", agent_ids
+    )
+    paginators["list_knowledge_bases"].paginate.side_effect = lambda: pages(
+        "knowledgeBaseSummaries", "name", "knowledgeBaseId", knowledge_base_ids
+    )
+    bedrock_agent = mock.Mock()
+    bedrock_agent.get_paginator.side_effect = lambda operation: paginators[operation]
+
+    session = mock.Mock(region_name="us-east-1")
+    session.client.side_effect = lambda service: {
+        "sts": sts,
+        "bedrock-agent": bedrock_agent,
+    }[service]
+    return session, sts, paginators
+
+
+class TestAwsContext(unittest.TestCase):
+
+    def setUp(self):
+        get_aws_context().clear()
+        self.agent_ids = {f"collaborator-{idx}": f"AGENT{idx}" for idx in range(5)}
+        self.knowledge_base_ids = {f"kb-{idx}": f"KB{idx}" for idx in range(5)}
+        self.session, self.sts, self.paginators = mock_session(
+            self.agent_ids, self.knowledge_base_ids
+        )
+        patcher = mock.patch("boto3.Session", return_value=self.session)
+        self.Session = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(get_aws_context().clear)
+
+    def test_agent_with_knowledge_bases_and_collaborators(self):
+        supervisor = InlineAgent(
+            foundation_model="MOCK_ID",
+            instruction="You are a supervisor of weather agents.",
+            agent_name="Supervisor",
+            agent_collaboration="SUPERVISOR",
+            knowledge_bases=[
+                KnowledgeBasePlugin(name=name, description=f"About {name}")
+                for name in self.knowledge_base_ids
+            ],
+            collaborators=[
+                CollaboratorAgent(
+                    agent_name=name,
+                    agent_alias_id="ALIAS",
+                    routing_instruction=f"Ask {name}",
+                )
+                for name in self.agent_ids
+            ],
+        )
+        invoke_params = supervisor.get_invoke_params()
+
+        self.assertEqual(
+            [kb["knowledgeBaseId"] for kb in invoke_params["knowledgeBases"]],
+            list(self.knowledge_base_ids.values()),
+        )
+        self.assertEqual(
+            invoke_params["collaboratorConfigurations"][0]["agentAliasArn"],
+            "arn:aws:bedrock:us-east-1:123456789012:agent-alias/AGENT0/ALIAS",
+        )
+        self.assertEqual(self.Session.call_count, 1)
+        self.assertEqual(self.sts.get_caller_identity.call_count, 1)
+        self.assertEqual(self.paginators["list_agents"].paginate.call_count, 1)
+        self.assertEqual(self.paginators["list_knowledge_bases"].paginate.call_count, 1)
+        # One STS call, three pages of agents and three of knowledge bases
+        self.assertEqual(get_aws_context().api_calls, 7)
+
+    def test_lookup_lists_again_on_miss(self):
+        context = get_aws_context()
+        self.assertEqual(context.knowledge_base_id("default", "kb-4"), "KB4")
+        self.assertIsNone(context.knowledge_base_id("default", "kb-5"))
+
+        self.knowledge_base_ids["kb-5"] = "KB5"
+        self.assertEqual(context.knowledge_base_id("default", "kb-5"), "KB5")
+        self.assertEqual(context.knowledge_base_id("default", "kb-0"), "KB0")
+        self.assertEqual(self.paginators["list_knowledge_bases"].paginate.call_count, 3)
+
+    def test_missing_agent(self):
+        with self.assertRaisesRegex(ValueError, "Agent missing not found"):
+            get_aws_context().agent_id("default", "missing")
+
+    def test_refresh(self):
+        context = get_aws_context()
+        context.agent_id("default", "collaborator-0")
+        self.agent_ids["collaborator-0"] = "RECREATED"
+        self.assertEqual(context.agent_id("default", "collaborator-0"), "AGENT0")
+
+        context.refresh("other")
+        self.assertEqual(context.agent_id("default", "collaborator-0"), "AGENT0")
+
+        context.refresh("default")
+        self.assertEqual(context.agent_id("default", "collaborator-0"), "RECREATED")
+        self.assertEqual(self.sts.get_caller_identity.call_count, 0)
+
+    def test_forked_process_starts_afresh(self):
+        context = AwsContext()
+        context.account_id("default")
+
+        with mock.patch("os.getpid", return_value=os.getpid() + 1):
+            context.account_id("default")
+
+        self.assertEqual(self.Session.call_count, 2)
+        self.assertEqual(self.sts.get_caller_identity.call_count, 2)
+
+    def test_session_per_thread(self):
+        context = AwsContext()
+        sessions = []
+        thread = threading.Thread(
+            target=lambda: sessions.append(context.session("default"))
+        )
+        thread.start()
+        thread.join()
+        self.assertIs(context.session("default"), context.session("default"))
+        self.assertEqual(self.Session.call_count, 2)
+
+        # Clients come from a session of the context, not from those of the threads
+        context.client("default", "sts")
+        self.assertEqual(self.Session.call_count, 3)
+
+    def test_lookup_lists_without_context_lock(self):
+        context = AwsContext()
+        listing = threading.Event()
+        resume = threading.Event()
+        paginate = self.paginators["list_agents"].paginate.side_effect
+
+        def slow_paginate():
+            listing.set()
+            resume.wait(5)
+            return paginate()
+
+        self.paginators["list_agents"].paginate.side_effect = slow_paginate
+        thread = threading.Thread(
+            target=context.agent_id, args=("default", "collaborator-0")
+        )
+        thread.start()
+        listing.wait(5)
+        # Other lookups go on while the agents are listed
+        self.assertEqual(context.knowledge_base_id("default", "kb-0"), "KB0")
+        self.assertEqual(context.account_id("default"), "123456789012")
+        resume.set()
+        thread.join()
+        self.assertEqual(context.agent_id("default", "collaborator-0"), "AGENT0")
+        self.assertEqual(self.paginators["list_agents"].paginate.call_count, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,118 @@
+import unittest
+from unittest import mock
+
+from InlineAgent.agent import CollaboratorAgent, InlineAgent
+
+
+def mock_session(agent_ids):
+    """A boto3 session whose STS and Bedrock Agent clients record their calls."""
+    sts = mock.Mock()
+    sts.get_caller_identity.return_value = {"Account": "123456789012"}
+
+    bedrock_agent = mock.Mock()
+    bedrock_agent.get_paginator.return_value.paginate.side_effect = lambda: [
+        {
+            "agentSummaries": [
+                {"agentName": name, "agentId": agent_id}
+                for name, agent_id in agent_ids.items()
+            ]
+        }
+    ]
+
+    session = mock.Mock(region_name="us-east-1")
+    session.client.side_effect = lambda service: {
+        "sts": sts,
+        "bedrock-agent": bedrock_agent,
+    }[service]
+    return session, sts, bedrock_agent
+
+
+class TestCollaboratorAgent(unittest.TestCase):
+
+    def setUp(self):
+        CollaboratorAgent.clear_cache()
+        self.agent_ids = {f"collaborator-{idx}": f"AGENT{idx}" for idx in range(5)}
+        self.session, self.sts, self.bedrock_agent = mock_session(self.agent_ids)
+        patcher = mock.patch("boto3.Session", return_value=self.session)
+        self.Session = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(CollaboratorAgent.clear_cache)
+
+        self.collaborators = [
+            CollaboratorAgent(
+                agent_name=name,
+                agent_alias_id="ALIAS",
+                routing_instruction=f"Ask {name}",
+            )
+            for name in self.agent_ids
+        ]
+
+    def test_to_dict_resolves_agent_arn(self):
+        self.assertEqual(
+            self.collaborators[0].to_dict(),
+            {
+                "agentAliasArn": "arn:aws:bedrock:us-east-1:123456789012:agent-alias/AGENT0/ALIAS",
+                "collaboratorInstruction": "Ask collaborator-0",
+                "collaboratorName": "collaborator-0",
+                "relayConversationHistory": "DISABLED",
+            },
+        )
+
+    def test_get_invoke_params_resolves_collaborators_once(self):
+        supervisor = InlineAgent(
+            foundation_model="MOCK_ID",
+            instruction="You are a supervisor of weather agents.",
+            agent_name="Supervisor",
+            agent_collaboration="SUPERVISOR",
+            collaborators=self.collaborators,
+        )
+
+        first = supervisor.get_invoke_params()
+        for _ in range(3):
+            self.assertEqual(supervisor.get_invoke_params(), first)
+
+        self.assertEqual(self.Session.call_count, 1)
+        self.assertEqual(self.sts.get_caller_identity.call_count, 1)
+        self.assertEqual(
+            self.bedrock_agent.get_paginator.return_value.paginate.call_count, 1
+        )
+
+    def test_refresh_resolves_agent_arn_again(self):
+        collaborator = self.collaborators[0]
+        collaborator.to_dict()
+
+        self.agent_ids["collaborator-0"] = "RECREATED"
+        self.assertIn("/AGENT0/", collaborator.to_dict()["agentAliasArn"])
+
+        self.assertEqual(
+            collaborator.refresh(),
+            "arn:aws:bedrock:us-east-1:123456789012:agent/RECREATED",
+        )
+        self.assertIn("/RECREATED/", collaborator.to_dict()["agentAliasArn"])
+
+    def test_refresh_collaborators(self):
+        supervisor = InlineAgent(
+            foundation_model="MOCK_ID",
+            instruction="You are a supervisor of weather agents.",
+            agent_name="Supervisor",
+            agent_collaboration="SUPERVISOR",
+            collaborators=self.collaborators[:2],
+        )
+        supervisor.get_invoke_params()
+        paginate = self.bedrock_agent.get_paginator.return_value.paginate
+
+        supervisor.refresh_collaborators()
+
+        self.assertEqual(paginate.call_count, 2)
+
+    def test_empty_routing_instruction_makes_no_calls(self):
+        collaborator = CollaboratorAgent(agent_name="collaborator-0", agent_alias_id="ALIAS")
+
+        with self.assertRaises(ValueError):
+            collaborator.to_dict()
+
+        self.Session.assert_not_called()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,4 +1,7 @@
 import unittest
+from unittest import mock
+
+import boto3
 
 from InlineAgent.knowledge_base import KnowledgeBasePlugin as KnowledgeBase
 
@@ -95,6 +98,25 @@ class TestKnowledgeBase(unittest.TestCase):
                 )
             idx += 1
 
+    def test_get_knowledge_base_id_by_name_paginates(self):
+        bedrock_agent = mock.Mock()
+        bedrock_agent.list_knowledge_bases.side_effect = lambda **kwargs: (
+            {"knowledgeBaseSummaries": [{"name": "MOCK_2", "knowledgeBaseId": "ID_2"}]}
+            if kwargs.get("nextToken") == "page-2"
+            else {
+                "knowledgeBaseSummaries": [{"name": "MOCK_1", "knowledgeBaseId": "ID_1"}],
+                "nextToken": "page-2",
+            }
+        )
+        session = mock.Mock(spec=boto3.Session)
+        session.client.return_value = bedrock_agent
+
+        self.assertEqual(
+            KnowledgeBase.get_knowledge_base_id_by_name("MOCK_2", session), "ID_2"
+        )
+        self.assertIsNone(KnowledgeBase.get_knowledge_base_id_by_name("MOCK_3", session))
+        self.assertEqual(bedrock_agent.list_knowledge_bases.call_count, 4)
+
 
 if __name__ == "__main__":
     unittest.main()
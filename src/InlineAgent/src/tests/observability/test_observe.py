@@ -0,0 +1,321 @@
+import asyncio
+import threading
+import unittest
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from InlineAgent.observability import current_invocation, observe
+from InlineAgent.tool_results import ToolResultEncoder
+
+from .test_sampling import otel_config
+from .trace_events import alias_arn, single_agent_events, span_exporter, trace_event
+
+ANSWER = "It is 70 fahrenheit."
+
+
+def output_guardrail_event(session_id: str):
+    return trace_event(
+        session_id,
+        [{"agentAliasArn": alias_arn("AGENT", "ALIAS")}],
+        {
+            "guardrailTrace": {
+                "traceId": f"{uuid.uuid4()}-guardrail-post-0",
+                "action": "INTERVENED",
+                "outputAssessments": [{"topicPolicy": {"topics": []}}],
+            }
+        },
+    )
+
+
+def chunk(text: str):
+    return {"chunk": {"bytes": text.encode("utf-8")}}
+
+
+class TestObserve(unittest.TestCase):
+
+    def setUp(self):
+        self.exporter = span_exporter()
+        self.exporter.clear()
+        self.patches = otel_config()
+        for patch in self.patches:
+            patch.start()
+        self.addCleanup(lambda: [patch.stop() for patch in self.patches])
+
+    def invoke_params(self, session_id: str, **kwargs):
+        return dict(
+            inputText="What is the weather?",
+            sessionId=session_id,
+            agentId="AGENT",
+            agentAliasId="ALIAS",
+            **kwargs,
+        )
+
+    def root_spans(self):
+        return {
+            span.attributes["session.id"]: span
+            for span in self.exporter.get_finished_spans()
+            if span.name == "Agent AGENT:ALIAS" and "session.id" in span.attributes
+        }
+
+    def test_concurrent_threads_do_not_share_guardrail_state(self):
+        intervened = threading.Event()
+
+        def completion(session_id):
+            if session_id == "session-1":
+                yield output_guardrail_event(session_id)
+                intervened.set()
+                yield chunk("Sorry, I cannot answer.")
+            else:
+                # Streamed after the guardrail of the other session intervened
+                intervened.wait(timeout=5)
+                yield chunk("It is ")
+                yield chunk("70 fahrenheit.")
+
+        @observe(show_traces=False, sample_rate=1.0)
+        def invoke_agent(inputText, sessionId, **kwargs):
+            return {"completion": completion(sessionId)}
+
+        streaming = {"streamFinalResponse": True}
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            answers = list(
+                executor.map(
+                    lambda session_id: invoke_agent(
+                        **self.invoke_params(
+                            session_id, streamingConfigurations=streaming
+                        )
+                    ),
+                    ["session-1", "session-2"],
+                )
+            )
+
+        self.assertEqual(answers, ["Sorry, I cannot answer.", ANSWER])
+        root_spans = self.root_spans()
+        self.assertEqual(set(root_spans), {"session-1", "session-2"})
+        self.assertEqual(root_spans["session-2"].attributes["output.value"], ANSWER)
+
+    def test_coroutine_function(self):
+        @observe(show_traces=False, sample_rate=1.0)
+        async def invoke_agent(inputText, sessionId, **kwargs):
+            self.assertEqual(current_invocation().session_id, sessionId)
+            return {"completion": iter(single_agent_events(sessionId))}
+
+        self.assertIsNone(current_invocation())
+        answer = asyncio.run(invoke_agent(**self.invoke_params("session-1")))
+
+        self.assertEqual(answer, ANSWER)
+        self.assertIsNone(current_invocation())
+        self.assertIn("session-1", self.root_spans())
+
+    def test_async_completion(self):
+        async def completion(session_id):
+            for event in single_agent_events(session_id):
+                await asyncio.sleep(0)
+                yield event
+
+        @observe(show_traces=False, sample_rate=1.0)
+        async def invoke_agent(inputText, sessionId, **kwargs):
+            return {"completion": completion(sessionId)}
+
+        async def invoke_all():
+            return await asyncio.gather(
+                *[
+                    invoke_agent(**self.invoke_params(f"session-{idx}"))
+                    for idx in range(4)
+                ]
+            )
+
+        self.assertEqual(asyncio.run(invoke_all()), [ANSWER] * 4)
+        self.assertEqual(
+            set(self.root_spans()), {f"session-{idx}" for idx in range(4)}
+        )
+
+    def test_async_generator_function(self):
+        @observe(show_traces=False, sample_rate=1.0)
+        async def invoke_agent(inputText, sessionId, **kwargs):
+            for event in single_agent_events(sessionId):
+                yield event
+
+        answer = asyncio.run(invoke_agent(**self.invoke_params("session-1")))
+
+        self.assertEqual(answer, ANSWER)
+        self.assertIn("session-1", self.root_spans())
+
+    def test_tool_result_token_savings(self):
+        encoded = ToolResultEncoder(columns=["close"]).encode(
+            [{"date": f"2025-03-{day:02d}", "close": 200.0 + day} for day in range(1, 31)]
+        )
+
+        def completion(session_id):
+            for event in single_agent_events(session_id):
+                observation = event.get("trace", {}).get("trace", {})
+                observation = observation.get("orchestrationTrace", {}).get(
+                    "observation", {}
+                )
+                if "actionGroupInvocationOutput" in observation:
+                    observation["actionGroupInvocationOutput"]["text"] = encoded.text
+                yield event
+
+        @observe(show_traces=False, sample_rate=1.0)
+        def invoke_agent(inputText, sessionId, **kwargs):
+            return {"completion": completion(sessionId)}
+
+        invoke_agent(**self.invoke_params("session-1"))
+
+        tool_span = next(
+            span for span in self.exporter.get_finished_spans() if span.name == "Tool"
+        )
+        self.assertEqual(
+            tool_span.attributes["bedrock.agent.tool_result.tokens"], encoded.tokens
+        )
+        self.assertEqual(
+            tool_span.attributes["bedrock.agent.tool_result.tokens_saved"],
+            encoded.tokens_saved,
+        )
+
+    def test_async_error(self):
+        @observe(show_traces=False, sample_rate=1.0)
+        async def invoke_agent(inputText, sessionId, **kwargs):
+            raise RuntimeError("throttled")
+
+        with self.assertRaises(Exception):
+            asyncio.run(invoke_agent(**self.invoke_params("session-1")))
+
+        root_span = self.root_spans()["session-1"]
+        self.assertEqual(root_span.attributes["error.type"], "RuntimeError")
+        self.assertIsNone(current_invocation())
+
+
+class TestObserveStream(unittest.TestCase):
+
+    def setUp(self):
+        self.exporter = span_exporter()
+        self.exporter.clear()
+        self.patches = otel_config()
+        for patch in self.patches:
+            patch.start()
+        self.addCleanup(lambda: [patch.stop() for patch in self.patches])
+
+    def invoke_params(self, session_id: str):
+        return dict(
+            inputText="What is the weather?",
+            sessionId=session_id,
+            agentId="AGENT",
+            agentAliasId="ALIAS",
+        )
+
+    def root_span(self):
+        root_spans = [
+            span
+            for span in self.exporter.get_finished_spans()
+            if span.name == "Agent AGENT:ALIAS"
+        ]
+        return root_spans[0] if root_spans else None
+
+    def completion(self, session_id: str):
+        """Completion events of an answer streamed in two chunks."""
+        events = [
+            event for event in single_agent_events(session_id) if "chunk" not in event
+        ]
+        return events + [chunk("It is "), chunk("70 fahrenheit.")]
+
+    def test_stream_yields_events_as_they_arrive(self):
+        produced = list()
+
+        def completion(events):
+            for event in events:
+                produced.append(event)
+                yield event
+
+        @observe(show_traces=False, sample_rate=1.0, stream=True)
+        def invoke_agent(inputText, sessionId, **kwargs):
+            return {"completion": completion(self.completion(sessionId))}
+
+        received = list()
+        for event in invoke_agent(**self.invoke_params("session-1")):
+            # Passed on before the next event is read, and before the root span ends
+            self.assertIs(event, produced[-1])
+            self.assertIsNone(self.root_span())
+            received.append(event)
+
+        self.assertEqual(
+            [event["chunk"]["bytes"] for event in received],
+            [b"It is ", b"70 fahrenheit."],
+        )
+        self.assertEqual(self.root_span().attributes["output.value"], ANSWER)
+
+    def test_stream_passes_return_control(self):
+        return_control = {"invocationId": "ID", "invocationInputs": []}
+
+        @observe(show_traces=False, sample_rate=1.0, stream=True)
+        def invoke_agent(inputText, sessionId, **kwargs):
+            return {"completion": iter([{"returnControl": return_control}])}
+
+        events = list(invoke_agent(**self.invoke_params("session-1")))
+
+        self.assertEqual(events, [{"returnControl": return_control}])
+        span_names = [span.name for span in self.exporter.get_finished_spans()]
+        self.assertIn("Return of Control", span_names)
+        self.assertIn("Agent AGENT:ALIAS", span_names)
+
+    def test_stream_closed_early(self):
+        class Completion:
+            closed = False
+
+            def __init__(self, events):
+                self.events = events
+
+            def __iter__(self):
+                return iter(self.events)
+
+            def close(self):
+                Completion.closed = True
+
+        @observe(show_traces=False, sample_rate=1.0, stream=True)
+        def invoke_agent(inputText, sessionId, **kwargs):
+            return {"completion": Completion(self.completion(sessionId))}
+
+        events = invoke_agent(**self.invoke_params("session-1"))
+        self.assertEqual(next(events)["chunk"]["bytes"], b"It is ")
+        self.assertIsNone(self.root_span())
+        events.close()
+
+        self.assertTrue(Completion.closed)
+        self.assertEqual(self.root_span().attributes["output.value"], "It is ")
+
+    def test_async_stream_closed_early(self):
+        @observe(show_traces=False, sample_rate=1.0, stream=True)
+        async def invoke_agent(inputText, sessionId, **kwargs):
+            for event in self.completion(sessionId):
+                yield event
+
+        async def first_chunk():
+            events = invoke_agent(**self.invoke_params("session-1"))
+            async for event in events:
+                await events.aclose()
+                return event
+
+        event = asyncio.run(first_chunk())
+
+        self.assertEqual(event["chunk"]["bytes"], b"It is ")
+        self.assertEqual(self.root_span().attributes["output.value"], "It is ")
+
+    def test_async_stream(self):
+        @observe(show_traces=False, sample_rate=1.0, stream=True)
+        async def invoke_agent(inputText, sessionId, **kwargs):
+            return {"completion": iter(self.completion(sessionId))}
+
+        async def collect():
+            events = invoke_agent(**self.invoke_params("session-1"))
+            return [event async for event in events]
+
+        events = asyncio.run(collect())
+
+        self.assertEqual(
+            b"".join(event["chunk"]["bytes"] for event in events),
+            ANSWER.encode("utf-8"),
+        )
+        self.assertEqual(self.root_span().attributes["output.value"], ANSWER)
+
+
+if __name__ == "__main__":
+    unittest.main()
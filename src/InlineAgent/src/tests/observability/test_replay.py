@@ -0,0 +1,175 @@
+import asyncio
+import io
+import os
+import tempfile
+import time
+import unittest
+from contextlib import redirect_stdout
+from datetime import datetime, timezone
+from unittest import mock
+
+import boto3
+
+from InlineAgent.agent import InlineAgent
+from InlineAgent.observability import (
+    EventStreamRecorder,
+    EventStreamReplayer,
+    PatchedClients,
+    observe,
+)
+from InlineAgent.observability.replay import dumps, loads
+
+from .trace_events import multi_agent_events, single_agent_events
+
+
+class TestReplayEncoding(unittest.TestCase):
+
+    def test_dumps_1(self):
+        event = {
+            "chunk": {"bytes": b"\x00answer"},
+            "eventTime": datetime(2025, 1, 1, tzinfo=timezone.utc),
+        }
+        self.assertEqual(loads(dumps(event)), event)
+
+
+class TestPatchedClients(unittest.TestCase):
+
+    def test_create_client_1(self):
+        with self.assertRaises(TypeError):
+            PatchedClients(services=("bedrock-agent-runtime",))
+
+    def test_create_client_2(self):
+        class Named(PatchedClients):
+            def create_client(self, session, original_client, service_name, **kwargs):
+                return service_name
+
+        with Named(services=("bedrock-agent-runtime",)):
+            session = boto3.session.Session(region_name="us-east-1")
+            self.assertEqual(session.client("bedrock-agent-runtime"), "bedrock-agent-runtime")
+            self.assertNotEqual(session.client("sts"), "sts")
+
+
+class TestEventStreamReplayer(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "recording.jsonl")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def write(self, *streams, operation="invoke_agent", interval=0.0):
+        with EventStreamRecorder(self.path) as recorder:
+            for events in streams:
+                recorder.write_stream(
+                    events=events, operation=operation, interval=interval
+                )
+
+    def test_record_call_1(self):
+        events = single_agent_events("session-1")
+        recorder = EventStreamRecorder(self.path).open()
+        response = recorder.record_call(
+            service_name="bedrock-agent-runtime",
+            operation="invoke_agent",
+            params={"sessionId": "session-1", "inputText": "weather?"},
+            response={"completion": iter(events), "sessionId": "session-1"},
+        )
+        self.assertEqual(list(response["completion"]), events)
+        recorder.record_call(
+            service_name="bedrock-agent",
+            operation="get_agent",
+            params={"agentId": "AGENT"},
+            response={"agent": {"agentName": "weather"}},
+        )
+        recorder.close()
+
+        replayer = EventStreamReplayer(self.path)
+        client = replayer.client("bedrock-agent-runtime")
+        response = client.invoke_agent(sessionId="session-2", inputText="weather?")
+
+        self.assertEqual(response["sessionId"], "session-1")
+        self.assertEqual(list(response["completion"]), events)
+        self.assertEqual(
+            replayer.client("bedrock-agent").get_agent(agentId="AGENT"),
+            {"agent": {"agentName": "weather"}},
+        )
+        self.assertCountEqual(
+            replayer.services, ["bedrock-agent-runtime", "bedrock-agent"]
+        )
+
+    def test_get_response_1(self):
+        first = single_agent_events("session-1", answer="first")
+        second = single_agent_events("session-1", answer="second")
+        self.write(first, second)
+
+        client = EventStreamReplayer(self.path).client()
+        answers = [
+            list(client.invoke_agent()["completion"])[-1]["chunk"]["bytes"]
+            for _ in range(3)
+        ]
+
+        self.assertEqual(answers, [b"first", b"second", b"first"])
+
+    def test_get_response_2(self):
+        self.write(single_agent_events("session-1"))
+
+        with self.assertRaises(RuntimeError):
+            EventStreamReplayer(self.path).client().invoke_inline_agent()
+
+    def test_replay_1(self):
+        self.write(single_agent_events("session-1")[:5], interval=0.02)
+
+        start = time.perf_counter()
+        list(EventStreamReplayer(self.path, speed=1.0).replay())
+        self.assertGreaterEqual(time.perf_counter() - start, 0.08)
+
+        start = time.perf_counter()
+        list(EventStreamReplayer(self.path, speed=0.0).replay())
+        self.assertLess(time.perf_counter() - start, 0.08)
+
+    def test_replay_observe(self):
+        self.write(multi_agent_events("session-1", collaborators=2))
+        replayer = EventStreamReplayer(self.path)
+
+        @observe(show_traces=False)
+        def invoke_agent(inputText, sessionId, **kwargs):
+            return replayer.client().invoke_agent(
+                inputText=inputText, sessionId=sessionId, **kwargs
+            )
+
+        with redirect_stdout(io.StringIO()):
+            answer = invoke_agent(
+                inputText="What is the weather?",
+                sessionId="session-1",
+                agentId="SUPERVISOR",
+                agentAliasId="ALIAS",
+            )
+
+        self.assertEqual(answer, "It is 70 fahrenheit.")
+
+    def test_replay_inline_agent(self):
+        self.write(
+            single_agent_events("session-1", knowledge_base_lookups=1),
+            operation="invoke_inline_agent",
+        )
+        aws_config = os.path.join(self.directory.name, "config")
+        with open(aws_config, "w") as file:
+            file.write("[default]\nregion = us-east-1\n")
+
+        agent = InlineAgent(
+            foundation_model="MOCK_ID",
+            instruction="You are a friendly assistant that is responsible for getting the current weather.",
+            agent_name="MockAgent",
+        )
+
+        original_client = boto3.session.Session.client
+        with mock.patch.dict(os.environ, {"AWS_CONFIG_FILE": aws_config}):
+            with EventStreamReplayer(self.path):
+                self.assertIsNot(boto3.session.Session.client, original_client)
+                with redirect_stdout(io.StringIO()):
+                    answer = asyncio.run(
+                        agent.invoke(input_text="What is the weather?")
+                    )
+
+        self.assertIs(boto3.session.Session.client, original_client)
+        self.assertEqual(answer, "It is 70 fahrenheit.")
@@ -0,0 +1,180 @@
+import unittest
+from unittest import mock
+
+from InlineAgent.observability import TraceSampler, observe
+from InlineAgent.observability import agent_instrument, process
+from InlineAgent.observability.process import ProcessL2Trace
+from InlineAgent.observability.semantics import SpanAttributes
+
+from .trace_events import (
+    guardrail_event,
+    model_invocation_events,
+    single_agent_events,
+    span_exporter,
+    alias_arn,
+)
+
+
+def otel_config(**overrides):
+    """Patch both module level configurations of the observability package."""
+    overrides.setdefault("PRODUCE_BEDROCK_OTEL_TRACES", True)
+    patches = list()
+    for module in (agent_instrument, process):
+        for name, value in overrides.items():
+            patches.append(mock.patch.object(module.config, name, value))
+    return patches
+
+
+class TestTraceSampler(unittest.TestCase):
+
+    def test___init___1(self):
+        with self.assertRaises(ValueError):
+            TraceSampler(sample_rate=1.5)
+
+    def test_should_sample_1(self):
+        self.assertTrue(TraceSampler(sample_rate=1.0).should_sample())
+        self.assertFalse(TraceSampler(sample_rate=0.0).should_sample())
+
+    def test_should_sample_2(self):
+        sampler = TraceSampler(sample_rate=0.25)
+        with mock.patch("random.random", return_value=0.1):
+            self.assertTrue(sampler.should_sample())
+        with mock.patch("random.random", return_value=0.9):
+            self.assertFalse(sampler.should_sample())
+
+    def test_is_tail_event_1(self):
+        sampler = TraceSampler(sample_rate=0.0)
+        self.assertTrue(sampler.is_tail_event(guardrail_event("s")["trace"]))
+        self.assertFalse(
+            sampler.is_tail_event(guardrail_event("s", action="NONE")["trace"])
+        )
+        self.assertTrue(
+            sampler.is_tail_event({"trace": {"failureTrace": {"failureReason": "x"}}})
+        )
+
+    def test_is_tail_event_2(self):
+        sampler = TraceSampler(
+            sample_rate=0.0, keep_errors=False, keep_guardrail_interventions=False
+        )
+        self.assertFalse(sampler.tail_sampling)
+        self.assertFalse(sampler.is_tail_event(guardrail_event("s")["trace"]))
+
+
+class TestGetTokenUsage(unittest.TestCase):
+
+    def test_get_token_usage_1(self):
+        chain = [{"agentAliasArn": alias_arn("AGENT", "ALIAS")}]
+        model_input, model_output = model_invocation_events(
+            "s", chain, "trace-0", input_tokens=12, output_tokens=3
+        )
+        self.assertEqual(
+            ProcessL2Trace.get_token_usage(model_input["trace"]), (0, 0, 0)
+        )
+        self.assertEqual(
+            ProcessL2Trace.get_token_usage(model_output["trace"]), (12, 3, 1)
+        )
+
+
+class TestObserveSampling(unittest.TestCase):
+
+    def setUp(self):
+        self.exporter = span_exporter()
+        self.exporter.clear()
+        self.patches = otel_config()
+        for patch in self.patches:
+            patch.start()
+
+    def tearDown(self):
+        for patch in self.patches:
+            patch.stop()
+
+    def invoke(self, events, sample_rate):
+        @observe(show_traces=False, sample_rate=sample_rate)
+        def invoke_agent(inputText, sessionId, **kwargs):
+            return {"completion": iter(events)}
+
+        return invoke_agent(
+            inputText="What is the weather?",
+            sessionId="session-1",
+            agentId="AGENT",
+            agentAliasId="ALIAS",
+        )
+
+    def root_span(self):
+        return [
+            span
+            for span in self.exporter.get_finished_spans()
+            if span.name == "Agent AGENT:ALIAS"
+        ][0]
+
+    def test_observe_head_sampled(self):
+        answer = self.invoke(single_agent_events("session-1"), sample_rate=1.0)
+
+        self.assertEqual(answer, "It is 70 fahrenheit.")
+        self.assertEqual(
+            self.root_span().attributes[SpanAttributes.SAMPLING_DECISION.value], "head"
+        )
+        self.assertIn("Tool", [span.name for span in self.exporter.get_finished_spans()])
+
+    def test_observe_unsampled(self):
+        answer = self.invoke(single_agent_events("session-1"), sample_rate=0.0)
+
+        self.assertEqual(answer, "It is 70 fahrenheit.")
+        self.assertEqual(len(self.exporter.get_finished_spans()), 0)
+
+    def test_observe_tail_guardrail(self):
+        events = single_agent_events("session-1")
+        events.insert(3, guardrail_event("session-1"))
+
+        self.invoke(events, sample_rate=0.0)
+
+        self.assertEqual(
+            self.root_span().attributes[SpanAttributes.SAMPLING_DECISION.value], "tail"
+        )
+        span_names = [span.name for span in self.exporter.get_finished_spans()]
+        self.assertIn("Guardrail", span_names)
+        self.assertIn("LLM", span_names)
+
+    def test_observe_tail_error(self):
+        def failing_events():
+            yield from single_agent_events("session-1")[:4]
+            raise RuntimeError("throttled")
+
+        with self.assertRaises(Exception):
+            self.invoke(failing_events(), sample_rate=0.0)
+
+        root_span = self.root_span()
+        self.assertEqual(root_span.attributes["error.type"], "RuntimeError")
+        self.assertEqual(
+            root_span.attributes[SpanAttributes.SAMPLING_DECISION.value], "tail"
+        )
+
+    def test_observe_tail_disabled(self):
+        patches = otel_config(TRACE_KEEP_GUARDRAIL_INTERVENTIONS=False)
+        for patch in patches:
+            patch.start()
+        self.addCleanup(lambda: [patch.stop() for patch in patches])
+
+        events = single_agent_events("session-1")
+        events.insert(3, guardrail_event("session-1"))
+        self.invoke(events, sample_rate=0.0)
+
+        self.assertEqual(len(self.exporter.get_finished_spans()), 0)
+
+    def test_observe_drop_model_input(self):
+        patches = otel_config(TRACE_CAPTURE_MODEL_INPUT=False)
+        for patch in patches:
+            patch.start()
+        self.addCleanup(lambda: [patch.stop() for patch in patches])
+
+        self.invoke(single_agent_events("session-1"), sample_rate=1.0)
+
+        llm_spans = [
+            span
+            for span in self.exporter.get_finished_spans()
+            if span.name == "LLM"
+        ]
+        self.assertTrue(llm_spans)
+        for span in llm_spans:
+            self.assertNotIn("input.value", span.attributes)
+            self.assertIn("output.value", span.attributes)
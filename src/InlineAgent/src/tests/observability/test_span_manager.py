@@ -0,0 +1,162 @@
+import unittest
+
+from opentelemetry.trace import StatusCode
+from pydantic import ValidationError
+
+from InlineAgent.observability.span_manager import SpanManager, SpanModel
+
+from .trace_events import alias_arn, span_exporter
+
+SUPERVISOR_CHAIN = [{"agentAliasArn": alias_arn("SUPERVISOR", "ALIAS")}]
+COLLABORATOR_CHAIN = SUPERVISOR_CHAIN + [
+    {"agentAliasArn": alias_arn("COLLAB", "ALIAS")}
+]
+FAMILY = "00000000-0000-0000-0000-000000000000"
+
+
+class TestSpanModel(unittest.TestCase):
+
+    def setUp(self):
+        self.exporter = span_exporter()
+        self.exporter.clear()
+
+    def test_end_1(self):
+        span_manager = SpanManager()
+        span = span_manager.create_agent_span_return(
+            agent_session_id="s", caller_chain=SUPERVISOR_CHAIN, attributes={}, name="a"
+        )
+        span_model = SpanModel(span=span, end_time=1_000)
+
+        span_model.end = True
+
+        self.assertTrue(span_model.end)
+        self.assertEqual(self.exporter.get_finished_spans()[0].end_time, 1_000)
+
+
+class TestSpanManager(unittest.TestCase):
+
+    def setUp(self):
+        self.exporter = span_exporter()
+        self.exporter.clear()
+
+    def supervisor(self, span_manager: SpanManager):
+        span_manager.create_agent_span_return(
+            agent_session_id="s",
+            caller_chain=SUPERVISOR_CHAIN,
+            attributes={},
+            name="Agent SUPERVISOR:ALIAS",
+        )
+        span_manager.assign_new_l2_return(
+            agent_session_id="s",
+            caller_chain=SUPERVISOR_CHAIN,
+            trace_id=f"{FAMILY}-0",
+            l2_attributes={},
+            l3_attributes={},
+            l2_name="Orchestration",
+            l3_name="LLM",
+        )
+        span_manager.delete_l3_span(
+            agent_session_id="s",
+            collab_agent_trace_id="SUPERVISOR:ALIAS",
+            trace_id=f"{FAMILY}-0",
+        )
+
+    def test_create_agent_span_return_1(self):
+        span_manager = SpanManager()
+        self.supervisor(span_manager)
+        sub_agent_span = span_manager.assign_new_l3_return(
+            agent_session_id="s",
+            collab_agent_trace_id="COLLAB:ALIAS",
+            trace_id=f"{FAMILY}-0",
+            attributes={},
+            name="Sub Agent",
+        )
+
+        collaborator_span = span_manager.create_agent_span_return(
+            agent_session_id="s-collab",
+            caller_chain=COLLABORATOR_CHAIN,
+            attributes={},
+            name="Agent COLLAB:ALIAS",
+        )
+
+        self.assertEqual(
+            collaborator_span.parent.span_id, sub_agent_span.get_span_context().span_id
+        )
+        self.assertIs(
+            span_manager.create_agent_span_return(
+                agent_session_id="s-collab",
+                caller_chain=COLLABORATOR_CHAIN,
+                attributes={},
+                name="Agent COLLAB:ALIAS",
+            ),
+            collaborator_span,
+        )
+
+    def test_create_agent_span_return_2(self):
+        span_manager = SpanManager()
+        self.supervisor(span_manager)
+
+        with self.assertRaises(RuntimeError):
+            span_manager.create_agent_span_return(
+                agent_session_id="s-collab",
+                caller_chain=COLLABORATOR_CHAIN,
+                attributes={},
+                name="Agent COLLAB:ALIAS",
+            )
+
+    def test_assign_new_l2_return_1(self):
+        span_manager = SpanManager()
+        self.supervisor(span_manager)
+
+        span_manager.assign_new_l2_return(
+            agent_session_id="s",
+            caller_chain=SUPERVISOR_CHAIN,
+            trace_id=f"{FAMILY}-1",
+            l2_attributes={},
+            l3_attributes={},
+            l2_name="Orchestration",
+            l3_name="LLM",
+        )
+
+        # The previous orchestration step and its LLM call have ended
+        self.assertEqual(
+            sorted(span.name for span in self.exporter.get_finished_spans()),
+            ["LLM", "Orchestration"],
+        )
+
+        span_manager.end_all_spans(status_code=StatusCode.OK)
+        self.assertEqual(len(self.exporter.get_finished_spans()), 5)
+        self.assertEqual(span_manager.spans, {})
+
+    def test_delete_l3_span_1(self):
+        span_manager = SpanManager()
+        self.supervisor(span_manager)
+
+        with self.assertRaises(RuntimeError):
+            span_manager.delete_l3_span(
+                agent_session_id="s",
+                collab_agent_trace_id="SUPERVISOR:ALIAS",
+                trace_id=f"{FAMILY}-0",
+            )
+
+    def test_debug_1(self):
+        span_manager = SpanManager(debug=True)
+
+        with self.assertRaises(ValidationError):
+            span_manager.create_agent_span_return(
+                agent_session_id="s",
+                caller_chain=SUPERVISOR_CHAIN,
+                attributes=None,
+                name="Agent SUPERVISOR:ALIAS",
+            )
+
+    def test_debug_2(self):
+        span_manager = SpanManager()
+
+        span_manager.create_agent_span_return(
+            agent_session_id="s",
+            caller_chain=SUPERVISOR_CHAIN,
+            attributes=None,
+            name="Agent SUPERVISOR:ALIAS",
+        )
+        self.assertIn("s", span_manager.spans)
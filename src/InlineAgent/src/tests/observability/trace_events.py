@@ -0,0 +1,40 @@
+"""Synthetic `invoke_agent` completion events shaped like Amazon Bedrock Agent traces."""
+
+from InlineAgent.testing.trace_events import (  # noqa: F401
+    INFERENCE_CONFIGURATION,
+    agent_turn_events,
+    alias_arn,
+    citation_chunk,
+    collaborator_events,
+    final_response_events,
+    guardrail_event,
+    knowledge_base_events,
+    knowledge_base_reference,
+    model_invocation_events,
+    multi_agent_events,
+    single_agent_events,
+    tool_call_events,
+    trace_event,
+)
+
+_span_exporter = None
+
+
+def span_exporter():
+    """In-memory exporter installed once on the global tracer provider."""
+    global _span_exporter
+
+    if _span_exporter is None:
+        from opentelemetry import trace as otel_trace
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import SimpleSpanProcessor
+        from opentelemetry.sdk.trace.export.in_memory_span_exporter import (
+            InMemorySpanExporter,
+        )
+
+        _span_exporter = InMemorySpanExporter()
+        tracer_provider = TracerProvider()
+        tracer_provider.add_span_processor(SimpleSpanProcessor(_span_exporter))
+        otel_trace.set_tracer_provider(tracer_provider)
+
+    return _span_exporter
@@ -0,0 +1,60 @@
+import subprocess
+import sys
+import unittest
+
+from benchmarks.import_time import (
+    BUDGETS_MS,
+    HEAVY_MODULES,
+    SRC,
+    import_time_ms,
+    loaded_modules,
+)
+
+
+class TestImportTime(unittest.TestCase):
+
+    def test_import_within_budget(self):
+        for module, budget in BUDGETS_MS.items():
+            if budget is None:
+                continue
+            with self.subTest(module=module):
+                # Best of three, a single import may be slowed down by a busy machine
+                best = min(import_time_ms(module) for _ in range(3))
+                self.assertLessEqual(best, budget)
+
+    def test_import_loads_no_heavy_modules(self):
+        self.assertEqual(
+            set(loaded_modules("InlineAgent")) & set(HEAVY_MODULES), set()
+        )
+
+    def test_import_has_no_side_effects(self):
+        result = subprocess.run(
+            [
+                sys.executable,
+                "-c",
+                "import logging\n"
+                "from InlineAgent.observability import agent_instrument, process, trace_provider\n"
+                "print(logging.getLogger().handlers, agent_instrument._config, process._config)",
+            ],
+            cwd=SRC,
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        self.assertEqual(result.stdout.strip(), "[] None None")
+
+    def test_lazy_attributes(self):
+        import InlineAgent
+
+        from InlineAgent.agent import InlineAgent as Agent
+        from InlineAgent.observability import observe
+
+        self.assertIs(InlineAgent.InlineAgent, Agent)
+        self.assertIs(InlineAgent.observe, observe)
+        self.assertIn("MCPStdio", dir(InlineAgent))
+        with self.assertRaises(AttributeError):
+            InlineAgent.missing
+
+
+if __name__ == "__main__":
+    unittest.main()
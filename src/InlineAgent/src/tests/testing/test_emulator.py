@@ -0,0 +1,227 @@
+import asyncio
+import io
+import os
+import tempfile
+import threading
+import time
+import unittest
+from contextlib import redirect_stdout
+from datetime import datetime, timezone
+from unittest import mock
+
+import boto3
+from botocore.config import Config
+from botocore.eventstream import EventStreamBuffer
+from botocore.exceptions import ClientError, EventStreamError
+
+from InlineAgent.action_group import ActionGroup
+from InlineAgent.agent import InlineAgent
+from InlineAgent.testing import AgentRuntimeEmulator, text_events
+from InlineAgent.testing.emulator import encode_event
+
+
+def get_current_weather(location: str, state: str, unit: str = "fahrenheit") -> dict:
+    """Get the current weather in a given location.
+
+    Args:
+        location: The city, e.g., San Francisco
+        state: The state eg CA
+        unit: The unit to use, e.g., fahrenheit or celsius. Defaults to "fahrenheit"
+    """
+    return f"Weather in {location}, {state} is 70{unit} and clear skies."
+
+
+def return_control_event():
+    return {
+        "returnControl": {
+            "invocationId": "invocation-1",
+            "invocationInputs": [
+                {
+                    "functionInvocationInput": {
+                        "actionGroup": "WeatherActionGroup",
+                        "actionInvocationType": "RESULT",
+                        "agentId": "INLINE_AGENT",
+                        "function": "get_current_weather",
+                        "parameters": [
+                            {"name": "location", "type": "string", "value": "Seattle"},
+                            {"name": "state", "type": "string", "value": "WA"},
+                        ],
+                    }
+                }
+            ],
+        }
+    }
+
+
+class TestEncodeEvent(unittest.TestCase):
+
+    def test_encode_event_1(self):
+        buffer = EventStreamBuffer()
+        buffer.add_data(encode_event({"chunk": {"bytes": b"answer"}}))
+
+        message = next(iter(buffer))
+
+        self.assertEqual(message.headers[":event-type"], "chunk")
+        self.assertEqual(message.headers[":message-type"], "event")
+        self.assertEqual(message.payload, b'{"bytes": "YW5zd2Vy"}')
+
+
+class TestAgentRuntimeEmulator(unittest.TestCase):
+
+    def setUp(self):
+        self.emulators = list()
+
+    def tearDown(self):
+        for emulator in self.emulators:
+            emulator.stop()
+
+    def client(self, emulator: AgentRuntimeEmulator, service_name="bedrock-agent-runtime"):
+        self.emulators.append(emulator.start())
+        with mock.patch.dict(os.environ, emulator.environ()):
+            return boto3.client(
+                service_name, config=Config(retries={"total_max_attempts": 1})
+            )
+
+    def invoke_agent(self, client, session_id="session-1"):
+        return client.invoke_agent(
+            agentId="AGENT",
+            agentAliasId="ALIAS",
+            sessionId=session_id,
+            inputText="What is the weather?",
+        )
+
+    def test___init___1(self):
+        with self.assertRaises(ValueError):
+            AgentRuntimeEmulator(throttle_rate=2.0)
+
+    def test_invoke_agent_1(self):
+        events = [
+            {
+                "trace": {
+                    "agentId": "AGENT",
+                    "sessionId": "session-1",
+                    "eventTime": datetime(2025, 1, 1, tzinfo=timezone.utc),
+                    "trace": {"orchestrationTrace": {"rationale": {"text": "why"}}},
+                }
+            },
+            return_control_event(),
+            {"files": {"files": [{"name": "a.txt", "type": "text/plain", "bytes": b"a"}]}},
+            *text_events("It is 70 fahrenheit.", chunk_size=8),
+        ]
+        client = self.client(AgentRuntimeEmulator(script=events))
+
+        response = self.invoke_agent(client)
+
+        self.assertEqual(response["sessionId"], "session-1")
+        self.assertEqual(list(response["completion"]), events)
+
+    def test_invoke_agent_2(self):
+        emulator = AgentRuntimeEmulator(first_event_latency=0.1, event_interval=0.05)
+        client = self.client(emulator)
+
+        start = time.perf_counter()
+        completion = self.invoke_agent(client)["completion"]
+        first_event = next(iter(completion))
+        time_to_first_event = time.perf_counter() - start
+        list(completion)
+        total = time.perf_counter() - start
+
+        self.assertEqual(first_event, {"chunk": {"bytes": b"Echo: What is th"}})
+        self.assertGreaterEqual(time_to_first_event, 0.1)
+        self.assertGreaterEqual(total, 0.1 + 0.05)
+
+    def test_invoke_agent_3(self):
+        emulator = AgentRuntimeEmulator(
+            script=[{"throttlingException": {"message": "Slow down"}}]
+        )
+        client = self.client(emulator)
+
+        with self.assertRaises(EventStreamError):
+            list(self.invoke_agent(client)["completion"])
+
+    def test_throttle_rate_1(self):
+        emulator = AgentRuntimeEmulator(throttle_rate=1.0)
+        client = self.client(emulator)
+
+        with self.assertRaises(ClientError) as context:
+            self.invoke_agent(client)
+
+        self.assertEqual(
+            context.exception.response["Error"]["Code"], "ThrottlingException"
+        )
+        self.assertEqual(emulator.stats.throttled, 1)
+
+    def test_max_concurrency_1(self):
+        emulator = AgentRuntimeEmulator(first_event_latency=0.3, max_concurrency=1)
+        client = self.client(emulator)
+
+        first = threading.Thread(
+            target=lambda: list(self.invoke_agent(client)["completion"])
+        )
+        first.start()
+        time.sleep(0.1)
+        with self.assertRaises(ClientError):
+            self.invoke_agent(client, session_id="session-2")
+        first.join()
+
+        self.assertEqual(emulator.stats.max_active, 1)
+        self.assertEqual(emulator.stats.requests, 2)
+
+    def test_get_agent_1(self):
+        emulator = AgentRuntimeEmulator(agents={"AGENT": "weather"})
+        client = self.client(emulator, service_name="bedrock-agent")
+
+        self.assertEqual(
+            client.get_agent(agentId="AGENT")["agent"]["agentName"], "weather"
+        )
+
+    def test_invoke_inline_agent_1(self):
+        def script(operation, params):
+            self.assertEqual(operation, "invoke_inline_agent")
+            results = params.get("inlineSessionState", {}).get(
+                "returnControlInvocationResults"
+            )
+            if not results:
+                return [return_control_event()]
+            return text_events(
+                results[0]["functionResult"]["responseBody"]["TEXT"]["body"]
+            )
+
+        emulator = AgentRuntimeEmulator(script=script).start()
+        self.emulators.append(emulator)
+        agent = InlineAgent(
+            foundation_model="MOCK_ID",
+            instruction="You are a friendly assistant that is responsible for getting the current weather.",
+            action_groups=[
+                ActionGroup(
+                    name="WeatherActionGroup",
+                    tools=[get_current_weather],
+                    argument_key="Args:",
+                    test=True,
+                )
+            ],
+            user_input=False,
+            agent_name="MockAgent",
+        )
+
+        with tempfile.TemporaryDirectory() as directory:
+            aws_config = os.path.join(directory, "config")
+            with open(aws_config, "w") as file:
+                file.write(
+                    "[default]\nregion = us-east-1\n"
+                    "aws_access_key_id = emulator\naws_secret_access_key = emulator\n"
+                )
+
+            environ = dict(emulator.environ(), AWS_CONFIG_FILE=aws_config)
+            with mock.patch.dict(os.environ, environ):
+                with redirect_stdout(io.StringIO()):
+                    answer = asyncio.run(
+                        agent.invoke(
+                            input_text="What is the weather?", session_id="session-1"
+                        )
+                    )
+
+        self.assertEqual(
+            answer, "Weather in Seattle, WA is 70fahrenheit and clear skies."
+        )
+        self.assertEqual(emulator.stats.requests, 2)
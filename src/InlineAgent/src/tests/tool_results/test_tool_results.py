@@ -0,0 +1,163 @@
+import asyncio
+import json
+import unittest
+
+from InlineAgent.action_group import ActionGroup, ActionGroups
+from InlineAgent.tool_results import (
+    ToolResultEncoder,
+    ToolResultStore,
+    estimate_tokens,
+    parse_header,
+    read_tool_result,
+    token_savings,
+)
+
+PRICES = [
+    {"date": f"2025-03-{day:02d}", "ticker": "AMZN", "close": 200 + day / 3, "volume": 10**6}
+    for day in range(1, 31)
+]
+
+
+def get_prices(ticker: str) -> str:
+    """
+    Get the daily prices of a stock.
+
+    Parameters:
+        ticker: The ticker of the stock
+    """
+    return json.dumps(PRICES)
+
+
+async def get_prices_async(ticker: str) -> list:
+    """
+    Get the daily prices of a stock.
+
+    Parameters:
+        ticker: The ticker of the stock
+    """
+    return PRICES
+
+
+class TestToolResultEncoder(unittest.TestCase):
+
+    def test_records_as_csv(self):
+        encoded = ToolResultEncoder(columns=["date", "close"], precision=2).encode(
+            PRICES
+        )
+
+        lines = encoded.text.splitlines()
+        header = parse_header(lines[0])
+        self.assertEqual(header["format"], "csv")
+        self.assertEqual(header["rows"], "30/30")
+        self.assertEqual(header["columns"], "2/4")
+        self.assertEqual(lines[1], "date,close")
+        self.assertEqual(lines[2], "2025-03-01,200.33")
+        self.assertEqual(len(lines), 32)
+        self.assertEqual(token_savings(encoded.text), (encoded.tokens, encoded.raw_tokens))
+        self.assertEqual(encoded.tokens, estimate_tokens(encoded.text))
+        self.assertGreater(encoded.tokens_saved, encoded.tokens)
+
+    def test_columnar_json_as_tsv(self):
+        columnar = json.dumps({"date": ["2025-03-01", "2025-03-02"], "close": [1.0, 2.5]})
+
+        encoded = ToolResultEncoder(format="tsv").encode(columnar)
+
+        self.assertEqual(
+            encoded.text.splitlines()[1:], ["date\tclose", "2025-03-01\t1", "2025-03-02\t2.5"]
+        )
+
+    def test_downsampling_keeps_first_and_last_rows(self):
+        encoded = ToolResultEncoder(columns=["date"], max_rows=4).encode(PRICES)
+
+        lines = encoded.text.splitlines()
+        self.assertEqual(parse_header(lines[0])["rows"], "4/30")
+        self.assertEqual(lines[2:], ["2025-03-01", "2025-03-11", "2025-03-20", "2025-03-30"])
+
+    def test_all_columns_without_matching_ones(self):
+        encoded = ToolResultEncoder(columns=["Date", "Close"]).encode(PRICES)
+
+        lines = encoded.text.splitlines()
+        self.assertEqual(parse_header(lines[0])["columns"], "4/4")
+        self.assertEqual(lines[1], "date,ticker,close,volume")
+        self.assertEqual(len(lines), 32)
+
+    def test_plain_text_is_returned_as_is(self):
+        encoded = ToolResultEncoder().encode("Weather in Seattle is 70 fahrenheit.")
+
+        self.assertEqual(encoded.text, "Weather in Seattle is 70 fahrenheit.")
+        self.assertIsNone(parse_header(encoded.text))
+        self.assertEqual(encoded.tokens, encoded.raw_tokens)
+
+    def test_large_results_spill_to_the_store(self):
+        store = ToolResultStore()
+        encoder = ToolResultEncoder(spill_tokens=50, preview_rows=3, store=store)
+
+        encoded = encoder.encode(PRICES)
+
+        lines = encoded.text.splitlines()
+        self.assertEqual(parse_header(lines[0])["ref"], encoded.handle)
+        self.assertEqual(parse_header(lines[0])["rows"], "3/30")
+        self.assertEqual(len(lines), 1 + 1 + 3 + 1)
+        page = store.read(encoded.handle, offset=28, limit=5).splitlines()
+        self.assertEqual(parse_header(page[0])["rows"], "2/30")
+        self.assertEqual(page[1], "date,ticker,close,volume")
+        self.assertTrue(page[-1].startswith("2025-03-30,AMZN,210,"))
+
+    def test_read_tool_result_of_the_process_store(self):
+        encoded = ToolResultEncoder(spill_tokens=50).encode(PRICES)
+
+        self.assertIn("2025-03-30", read_tool_result(encoded.handle, offset=29, limit=1))
+        self.assertIn("Unknown", read_tool_result("tool-result://missing"))
+
+    def test_store_evicts_least_recently_used(self):
+        store = ToolResultStore(max_entries=2)
+        first = store.put(["1"])
+        second = store.put(["2"])
+        store.read(first)
+        store.put(["3"])
+
+        self.assertEqual(len(store), 2)
+        store.read(first)
+        with self.assertRaises(KeyError):
+            store.read(second)
+
+
+class TestActionGroupResultEncoder(unittest.TestCase):
+
+    def test_tool_map_returns_encoded_results(self):
+        action_groups = ActionGroups(
+            action_groups=[
+                ActionGroup(
+                    name="StockActionGroup",
+                    tools=[get_prices, get_prices_async],
+                    result_encoder=ToolResultEncoder(columns=["date", "close"]),
+                    test=True,
+                )
+            ]
+        )
+        tool_map = action_groups.tool_map
+
+        result = tool_map["get_prices"](ticker="AMZN")
+        async_result = asyncio.run(tool_map["get_prices_async"](ticker="AMZN"))
+
+        self.assertEqual(result, async_result)
+        self.assertEqual(result.splitlines()[1], "date,close")
+        # Function schemas still describe the tools themselves
+        functions = action_groups.actionGroups[0]["functionSchema"]["functions"]
+        self.assertEqual(
+            [function["name"] for function in functions],
+            ["get_prices", "get_prices_async"],
+        )
+
+    def test_tools_are_not_wrapped_by_default(self):
+        action_groups = ActionGroups(
+            action_groups=[
+                ActionGroup(name="StockActionGroup", tools=[get_prices], test=True)
+            ]
+        )
+
+        self.assertIs(action_groups.tool_map["get_prices"], get_prices)
+
+
+if __name__ == "__main__":
+    unittest.main()
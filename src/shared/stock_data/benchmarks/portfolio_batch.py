@@ -0,0 +1,116 @@
+"""Benchmark batch portfolio optimization of the stock_data Lambda function.
+
+Scores candidate portfolios, random subsets of a small universe of tickers over fake
+prices, through the ``portfolio_optimization`` function of the Lambda function.
+Compares one request per candidate, the single-portfolio path, with one request
+passing every candidate as ``portfolios``, which estimates returns and covariance
+once. Both solve max Sharpe portfolios and pass prices in columnar format. Needs
+pandas, numpy and PyPortfolioOpt. Run from ``src/shared/stock_data``::
+
+    python -m benchmarks.portfolio_batch
+    python -m benchmarks.portfolio_batch --portfolios 50 --repeat 5 --json
+"""
+
+import argparse
+import json
+import logging
+import random
+import statistics
+import time
+from typing import Dict, List
+
+from .stock_data_tools import UNIVERSE, FakePriceSource, load_lambda_function
+
+
+def make_portfolios(portfolios: int, seed: int) -> List[List[str]]:
+    rng = random.Random(seed)
+    return [
+        rng.sample(UNIVERSE, rng.randint(3, len(UNIVERSE))) for _ in range(portfolios)
+    ]
+
+
+def event(parameters: Dict[str, str]) -> Dict:
+    return {
+        "actionGroup": "stock_data",
+        "function": "portfolio_optimization",
+        "parameters": [
+            {"name": name, "value": value} for name, value in parameters.items()
+        ],
+    }
+
+
+def body(response: Dict) -> str:
+    return response["response"]["functionResponse"]["responseBody"]["TEXT"]["body"]
+
+
+def single(lambda_function, prices: str, portfolios: List[List[str]]) -> float:
+    """One request per candidate portfolio, seconds per candidate."""
+    start = time.perf_counter()
+    for tickers in portfolios:
+        response = lambda_function.lambda_handler(
+            event({"tickers": ",".join(tickers), "prices": prices}), None
+        )
+        assert body(response).startswith("Optimized Weights"), body(response)
+    return (time.perf_counter() - start) / len(portfolios)
+
+
+def batch(lambda_function, prices: str, portfolios: List[List[str]]) -> float:
+    """One request scoring every candidate portfolio, seconds per candidate."""
+    candidates = json.dumps([{"tickers": tickers} for tickers in portfolios])
+    start = time.perf_counter()
+    response = lambda_function.lambda_handler(
+        event({"portfolios": candidates, "prices": prices}), None
+    )
+    seconds = time.perf_counter() - start
+    table = json.loads(body(response)[len("Portfolios: ") :])
+    errors = [row for row in table["rows"] if row[-1] is not None]
+    assert len(table["rows"]) == len(portfolios) and not errors, errors
+    return seconds / len(portfolios)
+
+
+def run(portfolios: int, repeat: int, seed: int) -> Dict:
+    lambda_function = load_lambda_function()
+    lambda_function.logger.setLevel(logging.WARNING)
+    source = FakePriceSource(latency=0.0)
+    prices = json.dumps(lambda_function.to_columnar(source(UNIVERSE)))
+    candidates = make_portfolios(portfolios, seed)
+
+    # Warm up the solver before timing
+    batch(lambda_function, prices, candidates[:1])
+    report = dict()
+    for name, path in [("single", single), ("batch", batch)]:
+        seconds = [path(lambda_function, prices, candidates) for _ in range(repeat)]
+        report[name] = {
+            "ms_per_portfolio": round(statistics.median(seconds) * 1e3, 3),
+            "requests": portfolios if name == "single" else 1,
+        }
+    report["speedup"] = round(
+        report["single"]["ms_per_portfolio"] / report["batch"]["ms_per_portfolio"], 2
+    )
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--portfolios", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    args = parser.parse_args()
+
+    report = run(args.portfolios, args.repeat, args.seed)
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+
+    for name in ["single", "batch"]:
+        result = report[name]
+        print(
+            f"{name:>6}: {result['ms_per_portfolio']:8.3f} ms per portfolio, "
+            f"{result['requests']:4d} requests"
+        )
+    print(f"speedup: {report['speedup']}x")
+
+
+if __name__ == "__main__":
+    main()
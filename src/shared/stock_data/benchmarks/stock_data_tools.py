@@ -0,0 +1,192 @@
+"""Benchmark the price lookups of the stock_data Lambda function with fake prices.
+
+Replays sessions of ``stock_data_lookup`` calls over a small universe of tickers, each
+followed by a ``portfolio_optimization`` payload, through the Lambda function of
+``docker_files``. A fake price source with a fixed latency per request stands
+in for Yahoo Finance. Compares the warm-container cache, batched download and columnar
+payload with fetching one ticker per request and exchanging ``to_json(orient="split")``
+text, and reports source requests, latency and payload size. Needs pandas and numpy.
+Run from ``src/shared/stock_data``::
+
+    python -m benchmarks.stock_data_tools
+    python -m benchmarks.stock_data_tools --sessions 50 --latency 0.05 --json
+"""
+
+import argparse
+import importlib.util
+import json
+import logging
+import random
+import time
+from pathlib import Path
+from typing import Dict, List
+
+LAMBDA_FUNCTION = (
+    Path(__file__).resolve().parents[1] / "docker_files" / "lambda_function.py"
+)
+
+UNIVERSE = ["AMZN", "GOOG", "MSFT", "AAPL", "NVDA", "META", "TSLA", "JPM"]
+
+
+def load_lambda_function():
+    spec = importlib.util.spec_from_file_location("stock_data_lambda", LAMBDA_FUNCTION)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+class FakePriceSource:
+    """A month of random daily prices per ticker, `latency` seconds per request."""
+
+    def __init__(self, latency: float):
+        import numpy as np
+        import pandas as pd
+
+        self.latency = latency
+        self.requests = 0
+        dates = pd.bdate_range(end="2025-03-31", periods=21)
+        self.prices = dict()
+        for idx, ticker in enumerate(UNIVERSE):
+            rng = np.random.default_rng(idx)
+            returns = rng.normal(0.001, 0.02, len(dates))
+            close = 50.0 * (idx + 1) * np.cumprod(1 + returns)
+            self.prices[ticker] = pd.DataFrame(
+                {
+                    "Open": close * (1 + rng.normal(0, 0.005, len(dates))),
+                    "High": close * 1.01,
+                    "Low": close * 0.99,
+                    "Close": close,
+                    "Volume": rng.integers(1_000_000, 50_000_000, len(dates)),
+                    "Dividends": 0.0,
+                    "Stock Splits": 0.0,
+                },
+                index=dates.tz_localize("America/New_York").rename("Date"),
+            )
+
+    def __call__(self, tickers: List[str]) -> Dict:
+        self.requests += 1
+        time.sleep(self.latency)
+        return {
+            ticker: self.prices[ticker][["Open", "High", "Low", "Close", "Volume"]]
+            for ticker in tickers
+        }
+
+    def history(self, ticker: str):
+        """``yf.Ticker(ticker).history(period="1mo")`` of the fake source."""
+        self.requests += 1
+        time.sleep(self.latency)
+        return self.prices[ticker]
+
+
+def make_sessions(
+    sessions: int, tickers_per_session: int, seed: int
+) -> List[List[str]]:
+    rng = random.Random(seed)
+    return [rng.sample(UNIVERSE, tickers_per_session) for _ in range(sessions)]
+
+
+def per_ticker_split_json(source: FakePriceSource, sessions: List[List[str]]) -> Dict:
+    """One request per ticker and call, and `to_json(orient="split")` text."""
+    import pandas as pd
+
+    payload_bytes = 0
+    parse_seconds = 0.0
+    start = time.perf_counter()
+    for tickers in sessions:
+        closes = dict()
+        for ticker in tickers:
+            hist = source.history(ticker)
+            text = hist.reset_index().to_json(
+                orient="split", index=False, date_format="iso"
+            )
+            payload_bytes += len(text)
+
+            parse_start = time.perf_counter()
+            split = json.loads(text)
+            frame = pd.DataFrame(split["data"], columns=split["columns"])
+            closes[ticker] = frame.set_index("Date")["Close"]
+            parse_seconds += time.perf_counter() - parse_start
+
+        # The agent passes the close prices on to portfolio_optimization
+        prices = json.dumps(pd.DataFrame(closes).to_dict(orient="index"), default=str)
+        payload_bytes += len(prices)
+        parse_start = time.perf_counter()
+        frame = pd.DataFrame.from_dict(json.loads(prices), orient="index")
+        frame.index = pd.to_datetime(frame.index)
+        parse_seconds += time.perf_counter() - parse_start
+    return {
+        "seconds": time.perf_counter() - start,
+        "source_requests": source.requests,
+        "payload_bytes": payload_bytes,
+        "parse_seconds": parse_seconds,
+    }
+
+
+def cached_columnar(lambda_function, sessions: List[List[str]]) -> Dict:
+    """Warm-container cache, one batched request for missing tickers, columnar JSON."""
+    payload_bytes = 0
+    parse_seconds = 0.0
+    start = time.perf_counter()
+    for tickers in sessions:
+        text = lambda_function.stock_data_lookup(",".join(tickers))
+        payload_bytes += len(text)
+
+        # The agent passes the lookup on to portfolio_optimization as is
+        payload_bytes += len(text)
+        parse_start = time.perf_counter()
+        lambda_function.from_columnar(json.loads(text))
+        parse_seconds += time.perf_counter() - parse_start
+    return {
+        "seconds": time.perf_counter() - start,
+        "source_requests": lambda_function.price_source.requests,
+        "payload_bytes": payload_bytes,
+        "parse_seconds": parse_seconds,
+    }
+
+
+def run(sessions: int, tickers_per_session: int, latency: float, seed: int) -> Dict:
+    lambda_function = load_lambda_function()
+    lambda_function.logger.setLevel(logging.WARNING)
+    workload = make_sessions(sessions, tickers_per_session, seed)
+
+    report = {
+        "per ticker, split json": per_ticker_split_json(
+            FakePriceSource(latency), workload
+        )
+    }
+    lambda_function.price_source = FakePriceSource(latency)
+    report["cached, columnar"] = cached_columnar(lambda_function, workload)
+    for result in report.values():
+        result["seconds"] = round(result["seconds"], 3)
+        parse_seconds = result.pop("parse_seconds")
+        result["parse_ms_per_session"] = round(parse_seconds / sessions * 1e3, 3)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=20)
+    parser.add_argument("--tickers", type=int, default=3, help="Tickers per session")
+    parser.add_argument(
+        "--latency", type=float, default=0.02, help="Seconds per request"
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    args = parser.parse_args()
+
+    report = run(args.sessions, args.tickers, args.latency, args.seed)
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+
+    for name, result in report.items():
+        print(
+            f"{name:>22}: {result['seconds']:7.3f}s, "
+            f"{result['source_requests']:4d} requests, "
+            f"{result['payload_bytes']:>9,} payload bytes, "
+            f"{result['parse_ms_per_session']:.3f} ms parsing per session"
+        )
+
+
+if __name__ == "__main__":
+    main()
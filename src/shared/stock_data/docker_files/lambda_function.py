@@ -1,12 +1,14 @@
 import json
 import logging
 import os
-import yfinance as yf
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Tuple
+from zoneinfo import ZoneInfo
+
+import numpy as np
 import pandas as pd
-from pypfopt.efficient_frontier import EfficientFrontier
-from pypfopt import risk_models, expected_returns
-from pypfopt.discrete_allocation import DiscreteAllocation, get_latest_prices
-from pypfopt.risk_models import fix_nonpositive_semidefinite
 
 log_level = os.environ.get("LOG_LEVEL", "INFO").strip().upper()
 logging.basicConfig(
@@ -23,11 +25,164 @@ def get_named_parameter(event, name):
     return next(item for item in event["parameters"] if item["name"] == name)["value"]
 
 
-def stock_data_lookup(ticker):
-    stock = yf.Ticker(ticker)
-    hist = stock.history(period="1mo")
-    hist = hist.reset_index().to_json(orient="split", index=False, date_format="iso")
-    return hist
+# Prices are cached per ticker for the life of a warm container. While the market is
+# open they expire after PRICE_CACHE_TTL_SECONDS, when it is closed at the next open.
+PRICE_CACHE_TTL_SECONDS = int(os.environ.get("PRICE_CACHE_TTL_SECONDS", "300"))
+PRICE_PERIOD = "1mo"
+MARKET_TIMEZONE = ZoneInfo("America/New_York")
+MARKET_OPEN = (9, 30)
+MARKET_CLOSE = (16, 0)
+PRICE_COLUMNS = ["Open", "High", "Low", "Close", "Volume"]
+
+_price_cache: Dict[str, Tuple[float, pd.DataFrame]] = dict()
+_price_cache_lock = threading.Lock()
+
+
+def yfinance_prices(tickers: List[str]) -> Dict[str, pd.DataFrame]:
+    """Daily prices of the last month of tickers, downloaded in a single request."""
+    # Imported on first use, stock lookups of a warm container do not need it again
+    import yfinance as yf
+
+    data = yf.download(
+        tickers,
+        period=PRICE_PERIOD,
+        group_by="ticker",
+        auto_adjust=True,
+        progress=False,
+        threads=False,
+    )
+    prices = dict()
+    for ticker in tickers:
+        frame = data[ticker] if isinstance(data.columns, pd.MultiIndex) else data
+        columns = [column for column in PRICE_COLUMNS if column in frame.columns]
+        frame = frame[columns].dropna(how="all")
+        if not frame.empty:
+            prices[ticker] = frame
+    return prices
+
+
+# Source of prices, `tickers -> {ticker: DataFrame}`, replaceable in benchmarks
+price_source: Callable[[List[str]], Dict[str, pd.DataFrame]] = yfinance_prices
+
+
+def price_cache_ttl(now: datetime = None) -> float:
+    """Seconds prices fetched now stay fresh: a few minutes while the market is open,
+    until the next open otherwise. Holidays are treated as trading days."""
+    now = (now or datetime.now(MARKET_TIMEZONE)).astimezone(MARKET_TIMEZONE)
+    open_time = now.replace(
+        hour=MARKET_OPEN[0], minute=MARKET_OPEN[1], second=0, microsecond=0
+    )
+    close_time = now.replace(
+        hour=MARKET_CLOSE[0], minute=MARKET_CLOSE[1], second=0, microsecond=0
+    )
+    if now.weekday() < 5 and open_time <= now < close_time:
+        return float(PRICE_CACHE_TTL_SECONDS)
+
+    next_open = open_time if now < open_time else open_time + timedelta(days=1)
+    while next_open.weekday() >= 5:
+        next_open += timedelta(days=1)
+    return max((next_open - now).total_seconds(), float(PRICE_CACHE_TTL_SECONDS))
+
+
+def get_prices(tickers: List[str]) -> Dict[str, pd.DataFrame]:
+    """Prices of tickers from the cache, fetching the missing ones in one request."""
+    now = time.monotonic()
+    with _price_cache_lock:
+        prices = {
+            ticker: _price_cache[ticker][1]
+            for ticker in tickers
+            if ticker in _price_cache and _price_cache[ticker][0] > now
+        }
+    missing = [ticker for ticker in tickers if ticker not in prices]
+    if missing:
+        logger.info(f"Fetching prices of {missing}")
+        fetched = price_source(missing)
+        expires = time.monotonic() + price_cache_ttl()
+        with _price_cache_lock:
+            for ticker, frame in fetched.items():
+                _price_cache[ticker] = (expires, frame)
+        prices.update(fetched)
+    return prices
+
+
+def parse_tickers(tickers: str) -> List[str]:
+    return list(dict.fromkeys(t.strip() for t in tickers.split(",") if t.strip()))
+
+
+def to_columnar(prices: Dict[str, pd.DataFrame]) -> Dict:
+    """Compact exchange format of prices, an array per field and ticker over shared dates.
+
+    ``{"dates": [...], "close": {"AMZN": [...]}, "open": {...}, ...}``, prices rounded
+    to cents. ``portfolio_optimization`` reads it back with ``from_columnar``.
+    """
+    if not prices:
+        return {"dates": []}
+    frames = {
+        ticker: frame[~frame.index.duplicated()] for ticker, frame in prices.items()
+    }
+    dates = sorted(set().union(*(frame.index for frame in frames.values())))
+    columnar = {"dates": [pd.Timestamp(date).strftime("%Y-%m-%d") for date in dates]}
+    for column in PRICE_COLUMNS:
+        values = dict()
+        for ticker, frame in frames.items():
+            if column not in frame.columns:
+                continue
+            series = frame[column].reindex(dates)
+            series = series.round(0 if column == "Volume" else 2)
+            cast = int if column == "Volume" else float
+            values[ticker] = [
+                None if pd.isna(value) else cast(value) for value in series
+            ]
+        if values:
+            columnar[column.lower()] = values
+    return columnar
+
+
+def from_columnar(prices: Dict) -> pd.DataFrame:
+    """Close prices of the columnar exchange format, a column per ticker."""
+    return pd.DataFrame(prices["close"], index=pd.to_datetime(prices["dates"]))
+
+
+def stock_data_lookup(ticker, fields=None):
+    """Last month of daily prices of one or several comma-separated tickers, as
+    compact columnar JSON, with only the comma-separated `fields` if given."""
+    tickers = parse_tickers(ticker)
+    columnar = to_columnar(get_prices(tickers))
+    if fields:
+        keep = {"dates"} | {field.lower() for field in parse_tickers(fields)}
+        columnar = {key: value for key, value in columnar.items() if key in keep}
+    return json.dumps(columnar, separators=(",", ":"))
+
+
+# Characters per value of a price history as split-oriented JSON, about 14 for dates
+# and prices with the 10 digits of to_json
+SPLIT_JSON_CHARS_PER_VALUE = 14
+
+
+def split_json_tokens(ticker) -> int:
+    """Estimated tokens of the prices of one or several comma-separated tickers as
+    stock_data_lookup returned them before the columnar format, the split-oriented JSON
+    of every price history. Estimated from the size of the cached price histories, rather
+    than by serializing them again."""
+    values = sum(
+        len(frame) * (len(frame.columns) + 1)
+        for frame in get_prices(parse_tickers(ticker)).values()
+    )
+    return -(-values * SPLIT_JSON_CHARS_PER_VALUE // 4)
+
+
+def estimate_tokens(text: str) -> int:
+    return -(-len(text) // 4)
+
+
+def tool_result_header(text: str, raw_tokens: int, **fields) -> str:
+    """The "#tool_result" header of tool results encoded by InlineAgent, which traces
+    and the demo UI read the token savings of a tool result from. Like InlineAgent's,
+    its estimate includes the header itself."""
+    fields = "".join(f" {key}={value}" for key, value in fields.items())
+    header = f"#tool_result{fields} tokens={{}} raw_tokens={raw_tokens}"
+    tokens = estimate_tokens(header.format(estimate_tokens(text)) + "\n" + text)
+    return header.format(tokens)
 
 
 def build_response(event, responseBody):
@@ -47,41 +202,259 @@ def build_response(event, responseBody):
     return function_response
 
 
+# Assets returning less are left out of max Sharpe portfolios
+MIN_RETURN_THRESHOLD = 0.001
+DEFAULT_PORTFOLIO_VALUE = 10000
+OBJECTIVES = ["max_sharpe", "min_volatility", "efficient_return"]
+PORTFOLIO_COLUMNS = [
+    "objective",
+    "tickers",
+    "weights",
+    "return",
+    "volatility",
+    "sharpe",
+    "allocation",
+    "leftover",
+    "error",
+]
+
+
+def parse_prices(tickers: List[str], prices_data_str: str) -> pd.DataFrame:
+    """Close prices of tickers, a column per ticker, from the `prices` parameter in
+    columnar or legacy format, or from the price cache when it is empty."""
+    if prices_data_str:
+        # Agents may pass on the "#tool_result" header of stock_data_lookup
+        raw_prices = json.loads(
+            "\n".join(
+                line
+                for line in prices_data_str.splitlines()
+                if not line.startswith("#")
+            )
+        )
+    else:
+        # Prices of a previous stock_data_lookup are usually still cached
+        raw_prices = to_columnar(get_prices(tickers))
+    if "dates" in raw_prices and "close" in raw_prices:
+        df = from_columnar(raw_prices)
+    else:
+        first_key = next(iter(raw_prices.keys()))
+        if first_key in tickers:
+            df = pd.DataFrame.from_dict(raw_prices, orient="index").T
+        else:
+            df = pd.DataFrame.from_dict(raw_prices, orient="index")
+        df.index = pd.to_datetime(df.index)
+    return df[tickers]
+
+
+def annualized_inputs(
+    prices: pd.DataFrame, span: int = 500, frequency: int = 252
+) -> Tuple[pd.Series, pd.DataFrame]:
+    """Expected returns and covariance matrix of prices, computed once with NumPy.
+
+    Same estimates as pypfopt's `ema_historical_return` and `sample_cov`, made
+    symmetric and positive semidefinite.
+    """
+    values = prices.to_numpy(dtype=float)
+    returns = values[1:] / values[:-1] - 1
+    returns = returns[~np.isnan(returns).all(axis=1)]
+    if len(returns) < 2:
+        raise ValueError("At least three days of prices are required.")
+
+    # Exponentially weighted mean, the most recent day weighs the most
+    decay = 1 - 2 / (span + 1)
+    weights = decay ** np.arange(len(returns) - 1, -1, -1)[:, None]
+    observed = ~np.isnan(returns)
+    ema = (np.where(observed, returns, 0) * weights).sum(axis=0) / (
+        weights * observed
+    ).sum(axis=0)
+    mu = (1 + ema) ** frequency - 1
+
+    if observed.all():
+        cov = np.cov(returns, rowvar=False)
+    else:
+        cov = pd.DataFrame(returns).cov().to_numpy()
+    cov = np.atleast_2d(cov) * frequency
+    cov = (cov + cov.T) / 2
+    eigenvalues, eigenvectors = np.linalg.eigh(cov)
+    if eigenvalues.min() < -1e-8:
+        cov = eigenvectors @ np.diag(np.clip(eigenvalues, 0, None)) @ eigenvectors.T
+
+    tickers = prices.columns
+    S = pd.DataFrame(cov, index=tickers, columns=tickers)
+    return pd.Series(mu, index=tickers), S
+
+
+def optimize(mu: pd.Series, S: pd.DataFrame, objective: str, target_return=None):
+    """Solve one objective over shared inputs, building a single EfficientFrontier.
+
+    max_sharpe only considers assets returning more than MIN_RETURN_THRESHOLD, and
+    switches to min_volatility when there are none. Returns the objective solved and
+    the frontier, or raises when the optimization fails.
+    """
+    from pypfopt.efficient_frontier import EfficientFrontier
+
+    if objective not in OBJECTIVES:
+        raise ValueError(f"Unknown objective {objective}, expected one of {OBJECTIVES}")
+    if objective == "max_sharpe":
+        mu_filtered = mu[mu > MIN_RETURN_THRESHOLD]
+        if mu_filtered.empty:
+            logger.warning(
+                "All assets have low returns. Switching to minimum volatility strategy."
+            )
+            objective = "min_volatility"
+        else:
+            mu, S = mu_filtered, S.loc[mu_filtered.index, mu_filtered.index]
+
+    ef = EfficientFrontier(mu, S)
+    if objective == "max_sharpe":
+        ef.max_sharpe()
+    elif objective == "min_volatility":
+        ef.min_volatility()
+    else:
+        if target_return is None:
+            raise ValueError("efficient_return requires a target_return.")
+        ef.efficient_return(float(target_return))
+    return objective, ef
+
+
+def allocate(weights: Dict[str, float], latest_prices: pd.Series, value: float):
+    from pypfopt.discrete_allocation import DiscreteAllocation
+
+    da = DiscreteAllocation(weights, latest_prices, total_portfolio_value=value)
+    allocation, leftover = da.greedy_portfolio()
+    return {k: int(v) for k, v in allocation.items()}, float(leftover)
+
+
+def parse_portfolios(portfolios_str: str, tickers: List[str]) -> List[Dict]:
+    """Candidate portfolios of the `portfolios` parameter, a JSON list of
+    ``{"tickers": "AMZN,GOOG", "objective": "max_sharpe", "target_return": 0.2,
+    "portfolio_value": 10000}``, every key optional. Portfolios without tickers use
+    all the tickers of the request."""
+    portfolios = json.loads(portfolios_str)
+    if isinstance(portfolios, dict):
+        portfolios = [portfolios]
+    parsed = list()
+    for portfolio in portfolios:
+        portfolio_tickers = portfolio.get("tickers") or tickers
+        if isinstance(portfolio_tickers, str):
+            portfolio_tickers = parse_tickers(portfolio_tickers)
+        parsed.append(
+            {
+                "tickers": list(dict.fromkeys(portfolio_tickers)),
+                "objective": portfolio.get("objective", "max_sharpe"),
+                "target_return": portfolio.get("target_return"),
+                "portfolio_value": float(
+                    portfolio.get("portfolio_value", DEFAULT_PORTFOLIO_VALUE)
+                ),
+            }
+        )
+    return parsed
+
+
+def optimize_portfolios(df: pd.DataFrame, portfolios: List[Dict]) -> Dict:
+    """Solve candidate portfolios over prices shared by all of them.
+
+    Expected returns, covariance and latest prices are computed once over all the
+    tickers, each portfolio solves over its slice. Returns a compact table,
+    ``{"columns": PORTFOLIO_COLUMNS, "rows": [...]}``, a row per portfolio with
+    weights in the order of its tickers.
+    """
+    mu, S = annualized_inputs(df)
+    latest_prices = df.ffill().iloc[-1]
+
+    rows = list()
+    for portfolio in portfolios:
+        tickers = portfolio["tickers"]
+        row = dict.fromkeys(PORTFOLIO_COLUMNS)
+        row.update(objective=portfolio["objective"], tickers=",".join(tickers))
+        try:
+            objective, ef = optimize(
+                mu[tickers],
+                S.loc[tickers, tickers],
+                portfolio["objective"],
+                portfolio["target_return"],
+            )
+            weights = {k: float(v) for k, v in ef.clean_weights().items()}
+            expected_return, volatility, sharpe = ef.portfolio_performance()
+            allocation, leftover = allocate(
+                weights, latest_prices[list(weights)], portfolio["portfolio_value"]
+            )
+            row.update(
+                objective=objective,
+                weights=[round(weights.get(ticker, 0.0), 4) for ticker in tickers],
+                allocation=allocation,
+                leftover=round(leftover, 2),
+                **{
+                    "return": round(float(expected_return), 4),
+                    "volatility": round(float(volatility), 4),
+                    "sharpe": round(float(sharpe), 4),
+                },
+            )
+        except Exception as e:
+            logger.warning(f"Optimization of {tickers} failed: {str(e)}")
+            row["error"] = str(e)
+        rows.append([row[column] for column in PORTFOLIO_COLUMNS])
+    return {"columns": PORTFOLIO_COLUMNS, "rows": rows}
+
+
 def portfolio_optimization(event):
-    logger.info(event)
+    logger.debug(event)
     parameters = {
         param["name"]: param["value"] for param in event.get("parameters", [])
     }
-    tickers = [t.strip() for t in parameters.get("tickers", "").split(",")]
+    tickers = parse_tickers(parameters.get("tickers", ""))
     prices_data_str = parameters.get("prices", "")
+    portfolios_str = parameters.get("portfolios", "")
 
-    if not tickers or not prices_data_str:
+    portfolios = None
+    if portfolios_str:
+        try:
+            portfolios = parse_portfolios(portfolios_str, tickers)
+        except Exception as e:
+            logger.error(f"Error processing portfolios: {str(e)}")
+            responseBody = {"TEXT": {"body": "Error: Invalid portfolios format."}}
+            return build_response(event, responseBody)
+        # Prices of every ticker of the candidate portfolios are loaded once
+        tickers = list(
+            dict.fromkeys(
+                tickers + [t for portfolio in portfolios for t in portfolio["tickers"]]
+            )
+        )
+
+    if not tickers:
         responseBody = {"TEXT": {"body": "Error: Tickers and prices are required."}}
         return build_response(event, responseBody)
 
     try:
-        raw_prices = json.loads(prices_data_str)
-        first_key = next(iter(raw_prices.keys()))
-        if first_key in tickers:
-            df = pd.DataFrame.from_dict(raw_prices, orient="index").T
-        else:
-            df = pd.DataFrame.from_dict(raw_prices, orient="index")
-        df.index = pd.to_datetime(df.index)
-        df = df[tickers]
+        df = parse_prices(tickers, prices_data_str)
     except Exception as e:
         logger.error(f"Error processing price data: {str(e)}")
         responseBody = {"TEXT": {"body": "Error: Invalid price data format."}}
         return build_response(event, responseBody)
 
-    logger.info(f"Processed DataFrame:\n{df}")
+    logger.debug(f"Processed DataFrame:\n{df}")
 
-    mu = expected_returns.ema_historical_return(df)
-    S = risk_models.sample_cov(df)
-    S = (S + S.T) / 2
-    S = fix_nonpositive_semidefinite(S)
+    if portfolios is not None:
+        try:
+            table = optimize_portfolios(df, portfolios)
+        except Exception as e:
+            logger.error(f"Error in batch portfolio optimization: {str(e)}")
+            responseBody = {"TEXT": {"body": "Error: Portfolio optimization failed."}}
+            return build_response(event, responseBody)
+        logger.info(f"Optimized {len(table['rows'])} portfolios")
+        responseBody = {
+            "TEXT": {"body": "Portfolios: " + json.dumps(table, separators=(",", ":"))}
+        }
+        return build_response(event, responseBody)
+
+    try:
+        mu, S = annualized_inputs(df)
+    except ValueError as e:
+        logger.error(f"Error estimating returns: {str(e)}")
+        mu, S = pd.Series(float("nan"), index=df.columns), None
 
-    logger.info(f"Expected Returns (mu):\n{mu}")
-    logger.info(f"Covariance Matrix (S):\n{S}")
+    logger.debug(f"Expected Returns (mu):\n{mu}")
+    logger.debug(f"Covariance Matrix (S):\n{S}")
 
     if mu.isna().any():
         logger.error("Error: Expected returns contain NaN values.")
@@ -92,44 +465,24 @@ def portfolio_optimization(event):
         }
         return build_response(event, responseBody)
 
-    min_return_threshold = 0.001
-    mu_filtered = mu[mu > min_return_threshold]
-
-    if mu_filtered.empty:
-        logger.warning(
-            "All assets have low returns. Switching to minimum volatility strategy."
-        )
-        try:
-            ef = EfficientFrontier(mu, S)
-            ef.min_volatility()
-            weights = ef.clean_weights()
-        except Exception as e:
-            logger.error(f"Error in min_volatility optimization: {str(e)}")
-            responseBody = {
-                "TEXT": {
-                    "body": "Error: Portfolio optimization failed, even with min_volatility fallback."
-                }
-            }
-            return build_response(event, responseBody)
-    else:
-        try:
-            ef = EfficientFrontier(
-                mu_filtered, S.loc[mu_filtered.index, mu_filtered.index]
-            )
-            ef.max_sharpe()
-            weights = ef.clean_weights()
-        except Exception as e:
-            logger.error(f"Error in portfolio optimization: {str(e)}")
-            responseBody = {"TEXT": {"body": "Error: Portfolio optimization failed."}}
-            return build_response(event, responseBody)
+    objective = "max_sharpe"
+    try:
+        objective, ef = optimize(mu, S, objective)
+        weights = ef.clean_weights()
+    except Exception as e:
+        logger.error(f"Error in {objective} optimization: {str(e)}")
+        body = "Error: Portfolio optimization failed."
+        if objective == "min_volatility":
+            body = body[:-1] + ", even with min_volatility fallback."
+        responseBody = {"TEXT": {"body": body}}
+        return build_response(event, responseBody)
 
     weights = {k: float(v) for k, v in weights.items()}
 
-    latest_prices = get_latest_prices(df)
-    da = DiscreteAllocation(weights, latest_prices, total_portfolio_value=10000)
-    allocation, leftover = da.greedy_portfolio()
-    allocation = {k: int(v) for k, v in allocation.items()}
-    leftover = float(leftover)
+    latest_prices = df.ffill().iloc[-1]
+    allocation, leftover = allocate(
+        weights, latest_prices[list(weights)], DEFAULT_PORTFOLIO_VALUE
+    )
 
     logger.info(f"Optimal Weights: {weights}")
     logger.info(f"Discrete Allocation: {allocation}")
@@ -163,12 +516,22 @@ def lambda_handler(event, context):
             if not ticker:
                 responseBody = {"TEXT": {"body": "Missing mandatory parameter: ticker"}}
             else:
-                hist = stock_data_lookup(ticker)
-                responseBody = {
-                    "TEXT": {
-                        "body": f"Price history for last 1 month for ticker: {ticker} is as follows:\n{str(hist)}"
-                    }
-                }
+                fields = next(
+                    (
+                        item["value"]
+                        for item in event.get("parameters", [])
+                        if item["name"] == "fields"
+                    ),
+                    None,
+                )
+                prefix = f"Price history for last 1 month for ticker: {ticker} is as follows:\n"
+                body = prefix + stock_data_lookup(ticker, fields)
+                # Tokens saved compared with the split JSON of every price history
+                raw_tokens = estimate_tokens(prefix) + split_json_tokens(ticker)
+                header = tool_result_header(
+                    body, raw_tokens, format="json", ticker=ticker.replace(" ", "")
+                )
+                responseBody = {"TEXT": {"body": f"{header}\n{body}"}}
         elif function == "portfolio_optimization":
             return portfolio_optimization(event)
     else:
@@ -0,0 +1,893 @@
+# Copyright 2024 Amazon.com and its affiliates; all rights reserved.
+# This file is AWS Content and may not be duplicated or distributed without permission
+
+"""
+Processing of the event stream returned when invoking Agents for Amazon Bedrock.
+
+An AgentEventProcessor consumes the completion events of one invocation. Trace events go
+through a dispatch table keyed by trace type, whose handlers only turn the trace into
+TraceRecords and have no side effects. The processor keeps the running state of the
+invocation, such as step numbers and token counts, and hands every chunk and record to its
+sinks, which print them, collect them or call back into the caller. The answer is kept as a
+list of parts and only joined once it is asked for:
+
+    result = ResultSink()
+    processor = AgentEventProcessor([ConsoleSink(trace_level="core"), result])
+    state = processor.run(response["completion"])
+    print(state.answer, result.result.llm_calls)
+
+`stream` yields the chunks of the answer as they arrive instead, for UIs rendering them.
+"""
+
+import datetime
+import json
+import os
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional
+
+from termcolor import colored
+from rich.console import Console
+from rich.markdown import Markdown
+
+try:
+    # Header of tool results encoded by a ToolResultEncoder of InlineAgent
+    from InlineAgent.tool_results import token_savings
+except ImportError:
+    token_savings = None
+
+UNDECIDABLE_CLASSIFICATION = "undecidable"
+KEEP_PREVIOUS_AGENT_CLASSIFICATION = "keep_previous_agent"
+TRACE_TRUNCATION_LENGTH = 300
+UNKNOWN_AGENT_NAME = "<collab-name-not-yet-provided>"
+
+
+class Usage(NamedTuple):
+    input_tokens: int
+    output_tokens: int
+
+
+@dataclass(frozen=True)
+class TraceRecord:
+    """What a trace event reports, e.g. a tool being called or a model invocation ending.
+
+    Args:
+        kind (str): one of "routing_input", "routing_output", "failure", "rationale",
+        "tool_input", "collaborator_input", "code_input", "kb_input", "tool_output",
+        "collaborator_output", "code_output", "kb_output", "final_response",
+        "model_output", "pre_processing" and "post_processing"
+        data (Dict): fields of the record, depending on its kind
+        trace (Dict): the "trace" part of the event, with agentId, callerChain and eventTime
+        usage (Usage, optional): tokens used by the model invocation the record ends
+    """
+
+    kind: str
+    data: Dict[str, Any]
+    trace: Dict[str, Any]
+    usage: Optional[Usage] = None
+
+
+def _usage(model_invocation_output: Dict) -> Optional[Usage]:
+    if "metadata" not in model_invocation_output:
+        return None
+    _usage = model_invocation_output["metadata"].get("usage", {})
+    return Usage(_usage.get("inputTokens", 0), _usage.get("outputTokens", 0))
+
+
+def _classification(model_invocation_output: Dict) -> str:
+    _content = json.loads(model_invocation_output["rawResponse"]["content"])
+    if "content" in _content:
+        _text = _content["content"][0]["text"]
+    else:
+        _text = _content["output"]["message"]["content"][0]["text"]
+    return _text.replace("<a>", "").replace("</a>", "")
+
+
+def _routing_records(trace: Dict, route: Dict) -> List[TraceRecord]:
+    records = []
+    if "modelInvocationInput" in route:
+        records.append(TraceRecord("routing_input", {}, trace))
+    if "modelInvocationOutput" in route:
+        _output = route["modelInvocationOutput"]
+        records.append(
+            TraceRecord(
+                "routing_output",
+                {
+                    "classification": _classification(_output),
+                    "total_time_ms": _output.get("metadata", {}).get("totalTimeMs"),
+                },
+                trace,
+                _usage(_output) or Usage(0, 0),
+            )
+        )
+    return records
+
+
+def _failure_records(trace: Dict, failure: Dict) -> List[TraceRecord]:
+    return [TraceRecord("failure", {"reason": failure.get("failureReason")}, trace)]
+
+
+def _tool_input(trace: Dict, _input: Dict) -> TraceRecord:
+    return TraceRecord(
+        "tool_input",
+        {
+            "function": _input.get("function"),
+            "parameters": _input.get("parameters"),
+            "execution_type": _input.get("executionType"),
+            "input": _input,
+        },
+        trace,
+    )
+
+
+def _collaborator_input(trace: Dict, _input: Dict) -> TraceRecord:
+    return TraceRecord(
+        "collaborator_input",
+        {
+            "name": _input["agentCollaboratorName"],
+            "text": _input["input"]["text"],
+            "alias_arn": _input["agentCollaboratorAliasArn"],
+        },
+        trace,
+    )
+
+
+def _code_input(trace: Dict, _input: Dict) -> TraceRecord:
+    return TraceRecord("code_input", {"code": _input["code"]}, trace)
+
+
+def _kb_input(trace: Dict, _input: Dict) -> TraceRecord:
+    return TraceRecord(
+        "kb_input",
+        {"knowledge_base_id": _input["knowledgeBaseId"], "text": _input["text"]},
+        trace,
+    )
+
+
+def tool_result_tokens(text: str) -> Optional[Dict[str, int]]:
+    """Estimated tokens of a tool result and of the result before it was encoded, from
+    the "#tool_result ... tokens=<n> raw_tokens=<n>" header of encoded results, read by
+    InlineAgent. None without InlineAgent installed."""
+    if token_savings is None:
+        return None
+    savings = token_savings(text)
+    if savings is None:
+        return None
+    return {"tokens": savings[0], "raw_tokens": savings[1]}
+
+
+def _tool_output(trace: Dict, _output: Dict) -> TraceRecord:
+    return TraceRecord(
+        "tool_output",
+        {"text": _output["text"], "tokens": tool_result_tokens(_output["text"])},
+        trace,
+    )
+
+
+def _collaborator_output(trace: Dict, _output: Dict) -> TraceRecord:
+    return TraceRecord(
+        "collaborator_output",
+        {"name": _output["agentCollaboratorName"], "text": _output["output"]["text"]},
+        trace,
+    )
+
+
+def _code_output(trace: Dict, _output: Dict) -> TraceRecord:
+    return TraceRecord(
+        "code_output",
+        {
+            "output": _output.get("executionOutput"),
+            "error": _output.get("executionError"),
+            "files": _output.get("files"),
+        },
+        trace,
+    )
+
+
+def _kb_output(trace: Dict, _output: Dict) -> TraceRecord:
+    return TraceRecord(
+        "kb_output", {"references": _output["retrievedReferences"]}, trace
+    )
+
+
+def _final_response(trace: Dict, _output: Dict) -> TraceRecord:
+    return TraceRecord("final_response", {"text": _output["text"]}, trace)
+
+
+# When an agent invokes several tools in parallel, their inputs still come one per trace
+INVOCATION_INPUT_HANDLERS: Dict[str, Callable[[Dict, Dict], TraceRecord]] = {
+    "actionGroupInvocationInput": _tool_input,
+    "agentCollaboratorInvocationInput": _collaborator_input,
+    "codeInterpreterInvocationInput": _code_input,
+    "knowledgeBaseLookupInput": _kb_input,
+}
+
+OBSERVATION_HANDLERS: Dict[str, Callable[[Dict, Dict], TraceRecord]] = {
+    "actionGroupInvocationOutput": _tool_output,
+    "agentCollaboratorInvocationOutput": _collaborator_output,
+    "codeInterpreterInvocationOutput": _code_output,
+    "knowledgeBaseLookupOutput": _kb_output,
+    "finalResponse": _final_response,
+}
+
+
+def _orchestration_records(trace: Dict, orch: Dict) -> List[TraceRecord]:
+    records = []
+    if "rationale" in orch:
+        records.append(TraceRecord("rationale", {"text": orch["rationale"]["text"]}, trace))
+
+    if "invocationInput" in orch:
+        _input = orch["invocationInput"]
+        for key, handler in INVOCATION_INPUT_HANDLERS.items():
+            if key in _input:
+                records.append(handler(trace, _input[key]))
+                break
+
+    if "observation" in orch:
+        _output = orch["observation"]
+        for key, handler in OBSERVATION_HANDLERS.items():
+            if key in _output:
+                records.append(handler(trace, _output[key]))
+
+    if "modelInvocationOutput" in orch:
+        records.append(
+            TraceRecord(
+                "model_output", {}, trace, _usage(orch["modelInvocationOutput"])
+            )
+        )
+    return records
+
+
+def _processing_records(kind: str) -> Callable[[Dict, Dict], List[TraceRecord]]:
+    def records(trace: Dict, processing: Dict) -> List[TraceRecord]:
+        if "modelInvocationOutput" not in processing:
+            return []
+        return [
+            TraceRecord(
+                kind,
+                {},
+                trace,
+                _usage(processing["modelInvocationOutput"]) or Usage(0, 0),
+            )
+        ]
+
+    return records
+
+
+# Trace types without a handler, e.g. guardrailTrace, do not produce any record
+TRACE_HANDLERS: Dict[str, Callable[[Dict, Dict], List[TraceRecord]]] = {
+    "routingClassifierTrace": _routing_records,
+    "failureTrace": _failure_records,
+    "orchestrationTrace": _orchestration_records,
+    "preProcessingTrace": _processing_records("pre_processing"),
+    "postProcessingTrace": _processing_records("post_processing"),
+}
+
+
+def trace_records(trace: Dict) -> List[TraceRecord]:
+    """Records of the "trace" part of a trace event."""
+    records = []
+    for trace_type, payload in trace["trace"].items():
+        handler = TRACE_HANDLERS.get(trace_type)
+        if handler is not None:
+            records += handler(trace, payload)
+    return records
+
+
+def _event_time(trace: Dict) -> datetime.datetime:
+    # The time the service emitted the trace, rather than when it was processed
+    return trace.get("eventTime") or datetime.datetime.now(datetime.timezone.utc)
+
+
+class AnswerBuffer:
+    """Parts of an answer, joined once when the text is asked for rather than on every chunk."""
+
+    def __init__(self):
+        self._parts: List[str] = []
+        self._text: Optional[str] = ""
+
+    def append(self, part: str):
+        self._parts.append(part)
+        self._text = None
+
+    @property
+    def text(self) -> str:
+        if self._text is None:
+            self._text = "".join(self._parts)
+            self._parts = [self._text]
+        return self._text
+
+    def __len__(self) -> int:
+        return len(self.text)
+
+    def __str__(self) -> str:
+        return self.text
+
+
+@dataclass
+class InvocationState:
+    """Running state of an invocation, updated by the processor before the sinks see a record.
+
+    `duration` is the number of seconds taken by the step the last record completed, for
+    "routing_output" and "model_output" records.
+    """
+
+    step: int = 0
+    sub_step: int = 0
+    sub_agent_name: str = UNKNOWN_AGENT_NAME
+    # "<agentId>/<agentAliasId>" of the collaborator the current trace comes from, if any
+    sub_agent_alias_id: Optional[str] = None
+    input_tokens: int = 0
+    output_tokens: int = 0
+    llm_calls: int = 0
+    chunks: int = 0
+    duration: Optional[float] = None
+    time_to_first_token: Optional[float] = None
+    started_at: float = field(default_factory=time.monotonic)
+    answer_buffer: AnswerBuffer = field(default_factory=AnswerBuffer)
+    citations_event: Optional[Dict] = None
+    return_control: Optional[Dict] = None
+    files: List[Dict] = field(default_factory=list)
+    _first_event_time: Optional[datetime.datetime] = None
+    _routing_started_at: Optional[datetime.datetime] = None
+    _step_started_at: Optional[datetime.datetime] = None
+
+    @property
+    def answer(self) -> str:
+        return self.answer_buffer.text
+
+    @property
+    def citations(self) -> List[Dict]:
+        if self.citations_event is None:
+            return []
+        return self.citations_event["chunk"]["attribution"]["citations"]
+
+    @property
+    def total_tokens(self) -> int:
+        return self.input_tokens + self.output_tokens
+
+    def _add_usage(self, usage: Optional[Usage]):
+        if usage is not None:
+            self.input_tokens += usage.input_tokens
+            self.output_tokens += usage.output_tokens
+
+    def account(self, record: TraceRecord):
+        """Updates step numbers, token counts and durations with a record."""
+        if record.kind == "routing_input":
+            self.step += 1
+            self._routing_started_at = _event_time(record.trace)
+
+        elif record.kind == "routing_output":
+            self._add_usage(record.usage)
+            self.llm_calls += 1
+            if record.data["total_time_ms"] is not None:
+                self.duration = record.data["total_time_ms"] / 1000
+            elif self._routing_started_at is not None:
+                self.duration = (
+                    _event_time(record.trace) - self._routing_started_at
+                ).total_seconds()
+            else:
+                self.duration = None
+            if record.data["classification"] not in (
+                UNDECIDABLE_CLASSIFICATION,
+                KEEP_PREVIOUS_AGENT_CLASSIFICATION,
+            ):
+                self.sub_agent_name = record.data["classification"]
+
+        elif record.kind == "collaborator_input":
+            self.sub_agent_name = record.data["name"]
+
+        elif record.kind == "model_output":
+            if self.sub_agent_alias_id is not None:
+                self.sub_step += 1
+            else:
+                self.step += 1
+                self.sub_step = 0
+            self.llm_calls += 1
+            self._add_usage(record.usage)
+            ended_at = _event_time(record.trace)
+            started_at = self._step_started_at or self._first_event_time
+            self.duration = (ended_at - started_at).total_seconds()
+            # restart the clock for next step/sub-step
+            self._step_started_at = ended_at
+
+        elif record.kind in ("pre_processing", "post_processing"):
+            self._add_usage(record.usage)
+            self.llm_calls += 1
+
+
+class EventSink:
+    """Receives the events of an invocation from an AgentEventProcessor.
+
+    Subclasses override the methods for what they are interested in.
+    """
+
+    def on_event(self, event: Dict, state: InvocationState):
+        """Called with every raw event, before it is processed."""
+
+    def on_chunk(self, text: str, chunk: Dict, state: InvocationState):
+        """Called with every chunk of the answer."""
+
+    def on_record(self, record: TraceRecord, state: InvocationState):
+        """Called with every record of a trace event, once the state accounts for it."""
+
+    def on_files(self, files: List[Dict], state: InvocationState):
+        """Called with the files of a files event."""
+
+    def on_end(self, state: InvocationState):
+        """Called once the event stream is exhausted."""
+
+
+class AgentEventProcessor:
+    """Processes the completion events of one invocation, handing them to sinks.
+
+    Args:
+        sinks (Iterable[EventSink], optional): sinks to hand chunks and records to
+        agent_names (Dict[str, str], optional): names of collaborators by
+        "<agentId>/<agentAliasId>", used for the traces of sub-agents
+    """
+
+    def __init__(
+        self,
+        sinks: Iterable[EventSink] = (),
+        agent_names: Optional[Dict[str, str]] = None,
+    ):
+        self.sinks = list(sinks)
+        self.agent_names = agent_names or {}
+        self.state = InvocationState()
+
+    def _process_chunk(self, event: Dict) -> str:
+        state = self.state
+        chunk = event["chunk"]
+        text = chunk["bytes"].decode("utf8")
+        state.answer_buffer.append(text)
+        if state.chunks == 0:
+            state.time_to_first_token = time.monotonic() - state.started_at
+        state.chunks += 1
+        # remember the citations, if any are provided
+        if "citations" in chunk.get("attribution", {}):
+            state.citations_event = event
+        for sink in self.sinks:
+            sink.on_chunk(text, chunk, state)
+        return text
+
+    def _process_trace(self, trace: Dict):
+        state = self.state
+        if state._first_event_time is None:
+            state._first_event_time = _event_time(trace)
+
+        state.sub_agent_alias_id = None
+        caller_chain = trace.get("callerChain", [])
+        if len(caller_chain) > 1:
+            # get sub agent id by grabbing all text following the first '/' character
+            state.sub_agent_alias_id = caller_chain[1]["agentAliasArn"].split("/", 1)[1]
+            state.sub_agent_name = self.agent_names.get(
+                state.sub_agent_alias_id, state.sub_agent_name
+            )
+
+        for record in trace_records(trace):
+            state.account(record)
+            for sink in self.sinks:
+                sink.on_record(record, state)
+
+    def stream(self, event_stream: Iterable[Dict]) -> Iterator[str]:
+        """Processes an event stream, yielding the chunks of the answer as they arrive."""
+        state = self.state
+        for event in event_stream:
+            for sink in self.sinks:
+                sink.on_event(event, state)
+
+            if "chunk" in event:
+                yield self._process_chunk(event)
+            elif "returnControl" in event:
+                state.return_control = event["returnControl"]
+
+            if "trace" in event:
+                self._process_trace(event["trace"])
+
+            if "files" in event:
+                files = event["files"]["files"]
+                state.files.extend(files)
+                for sink in self.sinks:
+                    sink.on_files(files, state)
+
+        for sink in self.sinks:
+            sink.on_end(state)
+
+    def run(self, event_stream: Iterable[Dict]) -> InvocationState:
+        """Processes a whole event stream.
+
+        Returns:
+            InvocationState: final state of the invocation, with its answer
+        """
+        for _ in self.stream(event_stream):
+            pass
+        return self.state
+
+
+@dataclass
+class InvocationResult:
+    answer: str
+    citations: List[Dict]
+    return_control: Optional[Dict]
+    records: List[TraceRecord]
+    files: List[Dict]
+    input_tokens: int
+    output_tokens: int
+    llm_calls: int
+    time_to_first_token: Optional[float]
+    duration: float
+
+
+class ResultSink(EventSink):
+    """Collects the records of an invocation into an InvocationResult."""
+
+    def __init__(self):
+        self.records: List[TraceRecord] = []
+        self.result: Optional[InvocationResult] = None
+
+    def on_record(self, record: TraceRecord, state: InvocationState):
+        self.records.append(record)
+
+    def on_end(self, state: InvocationState):
+        self.result = InvocationResult(
+            answer=state.answer,
+            citations=state.citations,
+            return_control=state.return_control,
+            records=self.records,
+            files=list(state.files),
+            input_tokens=state.input_tokens,
+            output_tokens=state.output_tokens,
+            llm_calls=state.llm_calls,
+            time_to_first_token=state.time_to_first_token,
+            duration=time.monotonic() - state.started_at,
+        )
+
+
+class CallbackSink(EventSink):
+    """Calls back with the chunks, records and final state of an invocation.
+
+    Args:
+        on_chunk (Callable[[str], None], optional): called with every chunk of the answer
+        on_record (Callable[[TraceRecord], None], optional): called with every trace record
+        on_end (Callable[[InvocationState], None], optional): called at the end of the stream
+    """
+
+    def __init__(
+        self,
+        on_chunk: Optional[Callable[[str], None]] = None,
+        on_record: Optional[Callable[[TraceRecord], None]] = None,
+        on_end: Optional[Callable[[InvocationState], None]] = None,
+    ):
+        self._on_chunk = on_chunk
+        self._on_record = on_record
+        self._on_end = on_end
+
+    def on_chunk(self, text: str, chunk: Dict, state: InvocationState):
+        if self._on_chunk is not None:
+            self._on_chunk(text)
+
+    def on_record(self, record: TraceRecord, state: InvocationState):
+        if self._on_record is not None:
+            self._on_record(record)
+
+    def on_end(self, state: InvocationState):
+        if self._on_end is not None:
+            self._on_end(state)
+
+
+class ConsoleSink(EventSink):
+    """Prints the trace of an invocation to the console.
+
+    Args:
+        trace_level (str, optional): "outline", "core" or "all". Defaults to "core".
+        stream_final_response (bool, optional): whether the final response is streamed,
+        printing the time to first token and the first chunks. Defaults to False.
+        output_dir (str, optional): directory to save the files generated by the agent in.
+        Defaults to "output".
+    """
+
+    def __init__(
+        self,
+        trace_level: str = "core",
+        stream_final_response: bool = False,
+        output_dir: str = "output",
+    ):
+        self.trace_level = trace_level
+        self.stream_final_response = stream_final_response
+        self.output_dir = output_dir
+        self._created_at = time.monotonic()
+        self._renderers = {
+            "routing_input": self._routing_input,
+            "routing_output": self._routing_output,
+            "failure": self._failure,
+            "model_output": self._model_output,
+            "pre_processing": self._pre_processing,
+            "post_processing": self._post_processing,
+        }
+        if trace_level in ["core", "outline"]:
+            self._renderers.update(
+                rationale=self._rationale,
+                tool_input=self._tool_input,
+                collaborator_input=self._collaborator_input,
+                code_input=self._code_input,
+                kb_input=self._kb_input,
+            )
+        if trace_level == "core":
+            self._renderers.update(
+                tool_output=self._tool_output,
+                collaborator_output=self._collaborator_output,
+                code_output=self._code_output,
+                kb_output=self._kb_output,
+                final_response=self._final_response,
+            )
+
+    def on_event(self, event: Dict, state: InvocationState):
+        if "trace" in event and self.trace_level == "all":
+            print("---")
+            print(json.dumps(event["trace"], indent=2, default=str))
+
+    def on_chunk(self, text: str, chunk: Dict, state: InvocationState):
+        if self.trace_level == "all":
+            print(
+                f"tmp answer: '{text}', streaming: {self.stream_final_response}, trace: True"
+            )
+        if self.stream_final_response:
+            if state.chunks == 1:
+                print(
+                    colored(
+                        f"Time to first token: {state.time_to_first_token:,.1f}s\n",
+                        "yellow",
+                    )
+                )
+            if state.chunks < 3:
+                print(colored(f"Answer chunk [{state.chunks}]: {text}", "blue"))
+        if self.trace_level == "all":
+            # print all keys in the chunk if more than just 'bytes' provided
+            if len(chunk.keys()) > 1:
+                print(f"chunk keys beyond just 'bytes': {list(chunk.keys())}")
+            if "citations" in chunk.get("attribution", {}):
+                print(colored(f"Citations: {chunk['attribution']['citations']}", "blue"))
+
+    def on_record(self, record: TraceRecord, state: InvocationState):
+        renderer = self._renderers.get(record.kind)
+        if renderer is not None:
+            renderer(record, state)
+
+    def _routing_input(self, record: TraceRecord, state: InvocationState):
+        print(colored(f"---- Step {state.step} ----", "green"))
+        print(
+            colored(
+                "Classifying request to immediately route to one collaborator if possible.",
+                "blue",
+            )
+        )
+
+    def _routing_output(self, record: TraceRecord, state: InvocationState):
+        _classification = record.data["classification"]
+        if _classification == UNDECIDABLE_CLASSIFICATION:
+            print(
+                colored(
+                    f"Routing classifier did not find a matching collaborator. Reverting to 'SUPERVISOR' mode.",
+                    "magenta",
+                )
+            )
+        elif _classification == KEEP_PREVIOUS_AGENT_CLASSIFICATION:
+            print(
+                colored(
+                    f"Continuing conversation with previous collaborator.",
+                    "magenta",
+                )
+            )
+        else:
+            print(
+                colored(
+                    f"Routing classifier chose collaborator: '{_classification}'",
+                    "magenta",
+                )
+            )
+        _in_tokens, _out_tokens = record.usage
+        print(
+            colored(
+                f"Routing classifier took {state.duration or 0:,.1f}s, using {_in_tokens+_out_tokens} tokens (in: {_in_tokens}, out: {_out_tokens}).\n",
+                "yellow",
+            )
+        )
+
+    def _failure(self, record: TraceRecord, state: InvocationState):
+        print(colored(f"Agent error: {record.data['reason']}", "red"))
+
+    def _rationale(self, record: TraceRecord, state: InvocationState):
+        print(colored(f"{record.data['text']}", "blue"))
+
+    def _tool_input(self, record: TraceRecord, state: InvocationState):
+        _function = record.data["function"]
+        if self.trace_level == "outline":
+            print(colored(f"Using tool: {_function}", "magenta"))
+        elif _function is None:
+            print(
+                colored(
+                    f"EXPECTING to capture 'Using tool', but 'function' not found\n{record.data['input']}",
+                    "red",
+                )
+            )
+        else:
+            print(colored(f"Using tool: {_function} with these inputs:", "magenta"))
+            _parameters = record.data["parameters"]
+            if _parameters is None:
+                print(colored(f"    no input parameters being sent\n", "magenta"))
+            elif len(_parameters) == 1 and _parameters[0]["name"] == "input_text":
+                print(colored(f"{_parameters[0]['value']}", "magenta"))
+            else:
+                print(colored(f"{_parameters}\n", "magenta"))
+
+    def _collaborator_input(self, record: TraceRecord, state: InvocationState):
+        _collab_name = record.data["name"]
+        _collab_ids = record.data["alias_arn"].split("/", 1)[1]
+        if self.trace_level == "outline":
+            print(
+                colored(
+                    f"Using sub-agent collaborator: '{_collab_name} [{_collab_ids}]'",
+                    "magenta",
+                )
+            )
+        else:
+            print(
+                colored(
+                    f"Using sub-agent collaborator: '{_collab_name} [{_collab_ids}]' passing input text:",
+                    "magenta",
+                )
+            )
+            print(
+                colored(
+                    f"{record.data['text'][0:TRACE_TRUNCATION_LENGTH]}\n", "magenta"
+                )
+            )
+
+    def _code_input(self, record: TraceRecord, state: InvocationState):
+        if self.trace_level == "outline":
+            print(colored(f"Using code interpreter", "magenta"))
+        else:
+            _code = f"```python\n{record.data['code']}\n```"
+            Console().print(Markdown(f"**Generated code**\n{_code}"))
+
+    def _kb_input(self, record: TraceRecord, state: InvocationState):
+        if self.trace_level == "outline":
+            print(colored(f"Using knowledge base", "magenta"))
+        else:
+            print(
+                colored(
+                    f"Using knowledge base id: {record.data['knowledge_base_id']} to search for:",
+                    "magenta",
+                )
+            )
+            print(colored(f"  {record.data['text']}\n", "magenta"))
+
+    def _tool_output(self, record: TraceRecord, state: InvocationState):
+        print(
+            colored(
+                f"--tool outputs:\n{record.data['text'][0:TRACE_TRUNCATION_LENGTH]}...\n",
+                "magenta",
+            )
+        )
+        if record.data["tokens"]:
+            tokens = record.data["tokens"]
+            print(
+                colored(
+                    f"--tool result tokens: ~{tokens['tokens']}, "
+                    f"~{tokens['raw_tokens']} before encoding\n",
+                    "magenta",
+                )
+            )
+
+    def _collaborator_output(self, record: TraceRecord, state: InvocationState):
+        print(
+            colored(
+                f"\n----sub-agent {record.data['name']} output text:\n{record.data['text'][0:TRACE_TRUNCATION_LENGTH]}...\n",
+                "magenta",
+            )
+        )
+
+    def _code_output(self, record: TraceRecord, state: InvocationState):
+        if record.data["error"] is not None:
+            print(
+                colored(
+                    f"--- Code interpreter execution ERROR:\n{record.data['error']}\n---\n",
+                    "red",
+                )
+            )
+        elif record.data["output"] is not None:
+            print(
+                colored(
+                    f"--- Code interpreter execution OUTPUT:\n{record.data['output']}\n---\n",
+                    "magenta",
+                )
+            )
+
+    def _kb_output(self, record: TraceRecord, state: InvocationState):
+        _refs = record.data["references"]
+        print(
+            colored(
+                f"Knowledge base lookup output, {len(_refs)} references:\n",
+                "magenta",
+            )
+        )
+        for _curr, _ref in enumerate(_refs, 1):
+            print(
+                colored(
+                    f"  ({_curr}) {_ref['content']['text'][0:TRACE_TRUNCATION_LENGTH]}...\n",
+                    "magenta",
+                )
+            )
+
+    def _final_response(self, record: TraceRecord, state: InvocationState):
+        print(
+            colored(
+                f"Final response:\n{record.data['text'][0:TRACE_TRUNCATION_LENGTH]}...",
+                "cyan",
+            )
+        )
+
+    def _model_output(self, record: TraceRecord, state: InvocationState):
+        if state.sub_agent_alias_id is not None:
+            print(
+                colored(
+                    f"---- Step {state.step}.{state.sub_step} [using sub-agent name:{state.sub_agent_name}, id:{state.sub_agent_alias_id}] ----",
+                    "green",
+                )
+            )
+        else:
+            print(colored(f"---- Step {state.step} ----", "green"))
+
+        if record.usage is not None:
+            _in_tokens, _out_tokens = record.usage
+            print(
+                colored(
+                    f"Took {state.duration:,.1f}s, using {_in_tokens+_out_tokens} tokens (in: {_in_tokens}, out: {_out_tokens}) to complete prior action, observe, orchestrate.",
+                    "yellow",
+                )
+            )
+        else:
+            print(
+                colored(
+                    f"Took {state.duration:,.1f}s [token count metadata was not returned] to complete prior action, observe, orchestrate.",
+                    "yellow",
+                )
+            )
+
+    def _pre_processing(self, record: TraceRecord, state: InvocationState):
+        _in_tokens, _out_tokens = record.usage
+        print(
+            colored("Pre-processing trace, agent came up with an initial plan.", "yellow")
+        )
+        print(colored(f"Used LLM tokens, in: {_in_tokens}, out: {_out_tokens}", "yellow"))
+
+    def _post_processing(self, record: TraceRecord, state: InvocationState):
+        _in_tokens, _out_tokens = record.usage
+        print(colored("Agent post-processing complete.", "yellow"))
+        print(colored(f"Used LLM tokens, in: {_in_tokens}, out: {_out_tokens}", "yellow"))
+
+    def on_files(self, files: List[Dict], state: InvocationState):
+        Console().print(Markdown("**Files**"))
+        os.makedirs(self.output_dir, exist_ok=True)
+        for this_file in files:
+            print(f"{this_file['name']} ({this_file['type']})")
+            # save bytes to file, given the name of file and the bytes
+            with open(os.path.join(self.output_dir, this_file["name"]), "wb") as f:
+                f.write(this_file["bytes"])
+
+    def on_end(self, state: InvocationState):
+        if self.trace_level in ["core", "outline"]:
+            duration = time.monotonic() - self._created_at
+            print(
+                colored(
+                    f"Agent made a total of {state.llm_calls} LLM calls, "
+                    + f"using {state.total_tokens} tokens "
+                    + f"(in: {state.input_tokens}, out: {state.output_tokens})"
+                    + f", and took {duration:,.1f} total seconds",
+                    "yellow",
+                )
+            )
+
+        if self.trace_level == "all":
+            print(f"Returning agent answer as: {state.answer}")
@@ -34,6 +34,8 @@ from typing import Self, Callable, Union
 from enum import Enum
 import yaml
 from src.utils.bedrock_agent_helper import AgentsForAmazonBedrock
+from src.utils.provisioning import DEFAULT_MAX_WORKERS, ProvisioningPlan
+from src.utils.reconcile import ActionGroupSpec, AgentSpec, reconcile_agent
 import json
 
 print(f"boto3 version: {boto3.__version__}")
@@ -292,6 +294,8 @@ class Agent:
         kb_descr: str = " ",
         llm: str = None,
         verbose: bool = False,
+        reconcile: bool = False,
+        dry_run: bool = False,
     ):
         self.name = name
 
@@ -329,7 +333,13 @@ class Agent:
         else:
             self.llm = DEFAULT_AGENT_MODEL
 
-        if not Agent.default_force_recreate:
+        # if the agent already exists, only update what differs from its definition
+        if reconcile and self._reconcile(
+            guardrail, tools, kb_id, kb_descr, dry_run, verbose
+        ):
+            return
+
+        if not reconcile and not Agent.default_force_recreate:
             # if the agent already exists, get its agent_id and move on.
             try:
                 self.agent_id = agents_helper.get_agent_id_by_name(self.name)
@@ -354,20 +364,18 @@ class Agent:
             )
             try:
                 agents_helper.delete_lambda(f"{self.name}_ag")
+                # each tool has a Lambda function of its own
+                for _tool_num in range(1, len(tools or []) + 1):
+                    agents_helper.delete_lambda(f"{self.name}_ag_{_tool_num}")
+                # returns once the agent is gone
                 agents_helper.delete_agent(self.name, verbose=True)
-                time.sleep(4)
             except:
                 pass
 
             # now create a new bedrock agent
             print(f"Creating agent {self.name}...")
 
-            self.instructions = f"Role: {self.role}, \nGoal: {self.goal}, \nInstructions: {self.instructions}"
-
-            # add workaround in instructions, since default prompts can yield hallucinations for tool use calls
-            # if self.tool_code is None and self.tool_defs is None:
-            if tools is None and self.tool_code is None and self.tool_defs is None:
-                self.instructions += Agent.NO_TOOL_USE_INSTRUCTION
+            self.instructions = self._agent_instructions(tools)
 
             (self.agent_id, self.agent_alias_id, self.agent_alias_arn) = (
                 agents_helper.create_agent(
@@ -419,13 +427,16 @@ class Agent:
                     f"Set of functions for {self.name}",
                 )
             elif tools is not None:
+                agents_helper.build_lambda_packages(
+                    [_tool["code"] for _tool in tools if "arn:" not in _tool["code"]]
+                )
                 _tool_num = 1
                 for _tool in tools:
                     print(f"Adding tool: {_tool['definition']['name']}...")
                     # print(f"Adding action group for tool: {str(_tool.definition['name'])}...")
                     resp = agents_helper.add_action_group_with_lambda(
                         self.name,
-                        f"{self.name}_ag",
+                        f"{self.name}_ag_{_tool_num}",
                         _tool["code"],
                         [_tool["definition"]],
                         f"actions_{_tool_num}_{self.name}",
@@ -457,6 +468,92 @@ class Agent:
             f"DONE: Agent: {self.name}, id: {self.agent_id}, alias id: {self.agent_alias_id}\n"
         )
 
+    def _agent_instructions(self, tools: List[Tool] = None) -> str:
+        _instructions = f"Role: {self.role}, \nGoal: {self.goal}, \nInstructions: {self.instructions}"
+
+        # add workaround in instructions, since default prompts can yield hallucinations for tool use calls
+        # if self.tool_code is None and self.tool_defs is None:
+        if tools is None and self.tool_code is None and self.tool_defs is None:
+            _instructions += Agent.NO_TOOL_USE_INSTRUCTION
+        return _instructions
+
+    def _agent_spec(
+        self,
+        guardrail: Guardrail = None,
+        tools: List[Tool] = None,
+        kb_id: str = None,
+        kb_descr: str = " ",
+    ) -> AgentSpec:
+        """The definition of this agent, as it would be created"""
+        _instructions = self._agent_instructions(tools)
+        _spec = AgentSpec(
+            instruction=dedent(_instructions),
+            description=dedent(_instructions[0 : MAX_DESCR_SIZE - 1]).replace("\n", ""),
+            foundation_model=self.llm,
+            guardrail_id=guardrail.guardrail_id if guardrail is not None else None,
+            code_interpreter=bool(self.code_interpreter),
+        )
+        if kb_id is not None:
+            _spec.knowledge_bases[kb_id] = kb_descr
+
+        if tools is None and self.tool_code is not None and self.tool_code != "ROC":
+            _spec.action_groups[f"actions_{self.name}"] = ActionGroupSpec(
+                functions=self.tool_defs,
+                description=f"Set of functions for {self.name}",
+                source_code_file=self.tool_code,
+                lambda_function_name=f"{self.name}_ag",
+                additional_function_iam_policy=self.additional_function_iam_policy,
+            )
+        elif tools is None and self.tool_code == "ROC":
+            _spec.action_groups[f"actions_{self.name}"] = ActionGroupSpec(
+                functions=self.tool_defs,
+                description=f"Set of functions for {self.name}",
+                executor="RETURN_CONTROL",
+            )
+        elif tools is not None:
+            for _tool_num, _tool in enumerate(tools, start=1):
+                _spec.action_groups[f"actions_{_tool_num}_{self.name}"] = (
+                    ActionGroupSpec(
+                        functions=[_tool["definition"]],
+                        description=f"Set of functions for {self.name}",
+                        source_code_file=_tool["code"],
+                        lambda_function_name=f"{self.name}_ag_{_tool_num}",
+                        additional_function_iam_policy=self.additional_function_iam_policy,
+                    )
+                )
+        return _spec
+
+    def _reconcile(
+        self,
+        guardrail: Guardrail,
+        tools: List[Tool],
+        kb_id: str,
+        kb_descr: str,
+        dry_run: bool,
+        verbose: bool,
+    ) -> bool:
+        """Update an existing agent to match its definition, False if the agent does not exist"""
+        self.agent_id = agents_helper.get_agent_id_by_name(self.name)
+        if self.agent_id is None:
+            if dry_run:
+                print(f"Agent {self.name}:\n  + agent:{self.name}")
+                self.changes = None
+                return True
+            return False
+
+        self.changes = reconcile_agent(
+            agents_helper,
+            self.name,
+            self._agent_spec(guardrail, tools, kb_id, kb_descr),
+            dry_run=dry_run,
+            verbose=verbose,
+        )
+        self.agent_alias_id = agents_helper.get_agent_latest_alias_id(self.agent_id)
+        self.agent_alias_arn = agents_helper.get_agent_alias_arn(
+            self.agent_id, self.agent_alias_id
+        )
+        return True
+
     def attach_knowledge_base(self, knowledge_base_id: str, description: str):
         """Attach a knowledge base to the agent"""
         agents_helper.wait_agent_status_update(
@@ -755,8 +852,15 @@ class Agent:
         kb_descr: str = " ",
         llm: str = None,
         verbose: bool = False,
+        reconcile: bool = False,
+        dry_run: bool = False,
     ):
-        """Create an agent from a YAML file (default 'agents.yaml')"""
+        """Create an agent from a YAML file (default 'agents.yaml')
+
+        With `reconcile`, an existing agent is updated in place to match its definition,
+        making only the calls for the fields that changed. With `dry_run` as well, the
+        changes are only printed.
+        """
         with open(yaml_file, "r") as f:
             yaml_content = yaml.safe_load(f)
             return Agent(
@@ -770,6 +874,8 @@ class Agent:
                 kb_descr=kb_descr,
                 llm=llm,
                 verbose=verbose,
+                reconcile=reconcile,
+                dry_run=dry_run,
             )
 
     def delete(self, verbose: bool = False):
@@ -798,7 +904,23 @@ class SupervisorAgent:
         kb_descr: str = " ",
         llm: str = None,
         verbose: bool = False,
+        max_workers: int = DEFAULT_MAX_WORKERS,
     ):
+        self._configure(name, yaml_content, collaborator_objects, verbose)
+
+        if not Agent.default_force_recreate:
+            # if the supervisor agent already exists, get its agent_id and move on.
+            self._attach_existing(verbose)
+            return
+
+        # create the supervisor, associate its collaborators, tools and KB concurrently,
+        # and prepare it once they are all in place
+        _plan = ProvisioningPlan(max_workers=max_workers, verbose=verbose)
+        self._add_provisioning_steps(_plan, guardrail, kb_id, kb_descr, llm, verbose)
+        _plan.run()
+        self._provisioned(verbose)
+
+    def _configure(self, name: str, yaml_content, collaborator_objects: List, verbose):
         self.name = name
 
         if "collaboration_type" in yaml_content[name]:
@@ -835,98 +957,154 @@ class SupervisorAgent:
         self.supervisor_agent_alias_id = None
         self.supervisor_agent_alias_arn = None
 
-        if not Agent.default_force_recreate:
-            # if the supervisor agent already exists, get its agent_id and move on.
-            try:
-                if verbose:
-                    print(f"Checking if supervisor agent exists: {self.name}...")
-                self.supervisor_agent_id = agents_helper.get_agent_id_by_name(self.name)
-                if verbose:
-                    print(
-                        f"Found existing supervisor agent: {self.name}, id: {self.supervisor_agent_id}"
-                    )
-                self.supervisor_agent_alias_id = (
-                    agents_helper.get_agent_latest_alias_id(
-                        self.supervisor_agent_id, verbose=verbose
-                    )
+    def _set_multi_agent_names(self):
+        # make a mapping dictionary that takes a given id (ID/Alias-ID) to its name.
+        # trace can use this to make more meaningful output. workaround until invokeAgent
+        # trace returns collaborator names in the callerChain.
+        self.multi_agent_names = {}
+        for _collab in self.collaborator_objects:
+            self.multi_agent_names[_collab.agent_alias_arn.split("/", 1)[1]] = (
+                _collab.name
+            )
+        self.multi_agent_names[self.supervisor_agent_alias_arn.split("/", 1)[1]] = (
+            self.name
+        )
+
+    def _attach_existing(self, verbose: bool = False):
+        try:
+            if verbose:
+                print(f"Checking if supervisor agent exists: {self.name}...")
+            self.supervisor_agent_id = agents_helper.get_agent_id_by_name(self.name)
+            if verbose:
+                print(
+                    f"Found existing supervisor agent: {self.name}, id: {self.supervisor_agent_id}"
                 )
-                if verbose:
-                    print(
-                        f"Found existing supervisor agent: {self.name}, id: {self.supervisor_agent_id}, alias id: {self.supervisor_agent_alias_id}"
-                    )
-                self.supervisor_agent_alias_arn = agents_helper.get_agent_alias_arn(
-                    self.supervisor_agent_id,
-                    self.supervisor_agent_alias_id,
-                    verbose=verbose,
+            self.supervisor_agent_alias_id = agents_helper.get_agent_latest_alias_id(
+                self.supervisor_agent_id, verbose=verbose
+            )
+            if verbose:
+                print(
+                    f"Found existing supervisor agent: {self.name}, id: {self.supervisor_agent_id}, alias id: {self.supervisor_agent_alias_id}"
+                )
+            self.supervisor_agent_alias_arn = agents_helper.get_agent_alias_arn(
+                self.supervisor_agent_id,
+                self.supervisor_agent_alias_id,
+                verbose=verbose,
+            )
+            if verbose:
+                print(
+                    f"Found existing supervisor agent: {self.name}, id: {self.supervisor_agent_id}, alias id: {self.supervisor_agent_alias_id}"
                 )
-                if verbose:
-                    print(
-                        f"Found existing supervisor agent: {self.name}, id: {self.supervisor_agent_id}, alias id: {self.supervisor_agent_alias_id}"
-                    )
 
-                # make a mapping dictionary that takes a given id (ID/Alias-ID) to its name.
-                # trace can use this to make more meaningful output. workaround until invokeAgent
-                # trace returns collaborator names in the callerChain.
-                self.multi_agent_names = {}
-                for _collab in self.collaborator_objects:
-                    self.multi_agent_names[_collab.agent_alias_arn.split("/", 1)[1]] = (
-                        _collab.name
-                    )
-                self.multi_agent_names[
-                    self.supervisor_agent_alias_arn.split("/", 1)[1]
-                ] = self.name
+            self._set_multi_agent_names()
 
-                if verbose:
-                    print(f"multi_agent_names: {self.multi_agent_names}")
-            except Exception as e:
-                print(f"Error finding existing supervisor agent: {e}")
-                raise
-            return
+            if verbose:
+                print(f"multi_agent_names: {self.multi_agent_names}")
+        except Exception as e:
+            print(f"Error finding existing supervisor agent: {e}")
+            raise
+
+    def _add_provisioning_steps(
+        self,
+        plan: ProvisioningPlan,
+        guardrail: Guardrail = None,
+        kb_id: str = None,
+        kb_descr: str = " ",
+        llm: str = None,
+        verbose: bool = False,
+        collaborator_steps: Dict[str, str] = None,
+    ) -> str:
+        """Add the steps creating this supervisor to a provisioning plan.
+
+        Collaborators are associated as soon as both the supervisor and the collaborator
+        exist, with `collaborator_steps` naming the steps creating collaborators in the
+        same plan. The supervisor is prepared once, after all its associations.
+        """
+        if collaborator_steps is None:
+            collaborator_steps = {}
+
+        if llm is not None:
+            self.llm = llm
+        else:
+            self.llm = DEFAULT_SUPERVISOR_MODEL
+
+        # First create the supervisor agent.
+        _supervisor_step = plan.add(
+            f"supervisor:{self.name}",
+            lambda: self._create_supervisor(guardrail, kb_id, verbose),
+        )
 
         # associate sub-agents / collaborators to the supervisor
-        _collab_list = []
         if verbose:
             print(f"  Supervisor '{self.name}' is adding the following collaborators:")
-
+        _steps = []
         for _collab_agent in self.collaborator_agents:
-            if "name" in _collab_agent:
-                _collab_agent_name = _collab_agent["name"]
-            else:
-                _collab_agent_name = _collab_agent["agent"]
-
-            if "relay_conversation_history" in _collab_agent:
-                _relay_conversation_history = _collab_agent[
-                    "relay_conversation_history"
-                ]
-            else:
-                _relay_conversation_history = "DISABLED"
-
-            _new_collab_item = {
-                "sub_agent_association_name": _collab_agent_name,
-                "sub_agent_instruction": _collab_agent["instructions"],
-                "sub_agent_alias_arn": self._get_collab_alias_arn(_collab_agent_name),
-                "relay_conversation_history": _relay_conversation_history,
-            }
-            _collab_list.append(_new_collab_item)
+            _collab_agent_name = _collab_agent.get("name", _collab_agent["agent"])
             if verbose:
-                print(_new_collab_item)
                 print(
-                    f"   {len(_collab_list)}) name: {_new_collab_item['sub_agent_association_name']}, "
+                    f"   {len(_steps) + 1}) name: {_collab_agent_name}, "
                     + f"underlying sub-agent name: {_collab_agent['agent']}"
                 )
+            _depends_on = [_supervisor_step]
+            for _agent_name in {_collab_agent_name, _collab_agent["agent"]}:
+                if _agent_name in collaborator_steps:
+                    _depends_on.append(collaborator_steps[_agent_name])
+            _steps.append(
+                plan.add(
+                    f"collaborator:{self.name}:{_collab_agent_name}",
+                    lambda _collab_agent=_collab_agent: self._associate_collaborator(
+                        _collab_agent, verbose
+                    ),
+                    depends_on=_depends_on,
+                )
+            )
 
-        # clean up existing supervisor if needed
-        agents_helper.delete_lambda(f"{name}_lambda")
-        agents_helper.delete_agent(name, verbose=True)
-        time.sleep(4)
+        # Now add the tools to the supervisor if any
+        if self.tool_code is not None and self.tool_defs is not None:
+            _steps.append(
+                plan.add(
+                    f"action_group:{self.name}",
+                    lambda: agents_helper.add_action_group_with_lambda(
+                        self.name,
+                        f"{self.name}_ag",
+                        self.tool_code,
+                        self.tool_defs,
+                        f"actions_{self.name}",
+                        f"Set of functions for {self.name}",
+                        verbose=verbose,
+                    ),
+                    depends_on=[_supervisor_step],
+                )
+            )
 
-        # create the supervisor
-        if llm is not None:
-            self.llm = llm
-        else:
-            self.llm = DEFAULT_SUPERVISOR_MODEL
+        # Now associate the KB if any
+        if kb_id is not None:
+            _steps.append(
+                plan.add(
+                    f"knowledge_base:{self.name}",
+                    lambda: agents_helper.associate_kb_with_agent(
+                        self.supervisor_agent_id, kb_descr, kb_id, prepare=False
+                    ),
+                    depends_on=[_supervisor_step],
+                )
+            )
+
+        # NOTE: a supervisor can't be prepared w/o sub-agents, so prepare once all are associated
+        _prepare_step = plan.add(
+            f"prepare:{self.name}",
+            lambda: agents_helper.prepare_agent_by_id(self.supervisor_agent_id),
+            depends_on=[_supervisor_step, *_steps],
+        )
+        return plan.add(
+            f"alias:{self.name}", self._create_alias, depends_on=[_prepare_step]
+        )
+
+    def _create_supervisor(self, guardrail: Guardrail, kb_id: str, verbose: bool):
+        # clean up existing supervisor if needed
+        agents_helper.delete_lambda(f"{self.name}_lambda")
+        # returns once the agent is gone
+        agents_helper.delete_agent(self.name, verbose=True)
 
-        # First create the supervisor agent.
         self.not_used = None
 
         if verbose:
@@ -957,69 +1135,32 @@ class SupervisorAgent:
             f"\nCreated supervisor, id: {self.supervisor_agent_id}, alias id: {self.supervisor_agent_alias_id}\n"
         )
 
-        # Now associate the sub-agents
-        print(f"  associating sub-agents / collaborators to supervisor...")
-        self.supervisor_agent_alias_id, self.supervisor_agent_alias_arn = (
-            agents_helper.associate_sub_agents(self.supervisor_agent_id, _collab_list)
-        )
-
-        # Now add the tools to the supervisor if any
-        if self.tool_code is not None and self.tool_defs is not None:
-            print(f"Adding action group with Lambda: {self.tool_code}...")
-            agents_helper.add_action_group_with_lambda(
-                self.name,
-                f"{self.name}_ag",
-                self.tool_code,
-                self.tool_defs,
-                f"actions_{self.name}",
-                f"Set of functions for {self.name}",
-                verbose=verbose,
-            )
-            agents_helper.wait_agent_status_update(
-                self.supervisor_agent_id
-            )  # wait to be out of "Versioning" state
-            agents_helper.prepare(self.name)
-            agents_helper.wait_agent_status_update(
-                self.supervisor_agent_id
-            )  # wait to be out of "Preparing" state
-        # if self.tool_code is not None and self.tool_defs is not None:
-        #     agents_helper.add_tools_to_agent(self.supervisor_agent_id, self.tool_code, self.tool_defs)
-
-        # Now associate the KB if any
-        # NOTE: this can't happen before the sub-agent association, because we can't prepare a supervisor
-        # w/o sub-agents
-        if kb_id is not None:
-            print(f"Associating KB: {kb_id} to supervisor...")
-            agents_helper.wait_agent_status_update(
-                self.supervisor_agent_id
-            )  # wait to be out of "Versioning" state
-            agents_helper.associate_kb_with_agent(
-                self.supervisor_agent_id, kb_descr, kb_id
-            )
-            agents_helper.wait_agent_status_update(
-                self.supervisor_agent_id
-            )  # wait to be out of "Versioning" state
+    def _associate_collaborator(self, collab_agent: Dict, verbose: bool):
+        _collab_agent_name = collab_agent.get("name", collab_agent["agent"])
+        _sub_agent = {
+            "sub_agent_association_name": _collab_agent_name,
+            "sub_agent_instruction": collab_agent["instructions"],
+            "sub_agent_alias_arn": self._get_collab_alias_arn(_collab_agent_name),
+            "relay_conversation_history": collab_agent.get(
+                "relay_conversation_history", "DISABLED"
+            ),
+        }
+        if verbose:
+            print(_sub_agent)
+        return agents_helper.associate_sub_agent(self.supervisor_agent_id, _sub_agent)
 
-        # Make sure we have the final alias id saved.
-        self.supervisor_agent_alias_id = agents_helper.get_agent_latest_alias_id(
-            self.supervisor_agent_id
+    def _create_alias(self):
+        _agent_alias = agents_helper._bedrock_agent_client.create_agent_alias(
+            agentAliasName="multi-agent", agentId=self.supervisor_agent_id
         )
-        _old_alias_id = self.supervisor_agent_alias_arn.split("/")[-1]
-        self.supervisor_agent_alias_arn = self.supervisor_agent_alias_arn.replace(
-            _old_alias_id, self.supervisor_agent_alias_id
+        self.supervisor_agent_alias_id = _agent_alias["agentAlias"]["agentAliasId"]
+        self.supervisor_agent_alias_arn = _agent_alias["agentAlias"]["agentAliasArn"]
+        agents_helper.wait_agent_alias_status_update(
+            self.supervisor_agent_id, self.supervisor_agent_alias_id
         )
 
-        # make a mapping dictionary that takes a given id (ID/Alias-ID) to its name.
-        # trace can use this to make more meaningful output. workaround until invokeAgent
-        # trace returns collaborator names in the callerChain.
-        self.multi_agent_names = {}
-        for _collab in self.collaborator_objects:
-            self.multi_agent_names[_collab.agent_alias_arn.split("/", 1)[1]] = (
-                _collab.name
-            )
-        self.multi_agent_names[self.supervisor_agent_alias_arn.split("/", 1)[1]] = (
-            self.name
-        )
+    def _provisioned(self, verbose: bool = False):
+        self._set_multi_agent_names()
 
         if verbose:
             print(f"  multi-agent names: {self.multi_agent_names}")
@@ -1069,6 +1210,74 @@ class SupervisorAgent:
             verbose=verbose,
         )
 
+    @classmethod
+    def create_team(
+        cls,
+        name: str,
+        yaml_content,
+        collaborators: Dict[str, Dict],
+        guardrail: Guardrail = None,
+        kb_id: str = None,
+        kb_descr: str = " ",
+        llm: str = None,
+        max_workers: int = DEFAULT_MAX_WORKERS,
+        verbose: bool = False,
+    ):
+        """Create a supervisor and its collaborator agents, concurrently where possible.
+
+        `collaborators` maps the name of each collaborator agent to the keyword arguments of
+        its Agent, e.g. {"news_agent": {"yaml_content": agents_yaml, "tool_code": ...}}.
+        The collaborators and the supervisor are created in parallel, each collaborator is
+        associated as soon as it is ready, and the supervisor is prepared once at the end.
+        """
+        if not Agent.default_force_recreate:
+            return cls(
+                name,
+                yaml_content,
+                collaborator_objects=[
+                    Agent(_agent_name, **_kwargs)
+                    for _agent_name, _kwargs in collaborators.items()
+                ],
+                guardrail=guardrail,
+                kb_id=kb_id,
+                kb_descr=kb_descr,
+                llm=llm,
+                verbose=verbose,
+            )
+
+        _supervisor = cls.__new__(cls)
+        _supervisor._configure(name, yaml_content, [], verbose)
+
+        def _create_collaborator(agent_name: str, kwargs: Dict) -> Agent:
+            _agent = Agent(agent_name, **kwargs)
+            _supervisor.collaborator_objects.append(_agent)
+            return _agent
+
+        _plan = ProvisioningPlan(max_workers=max_workers, verbose=verbose)
+        _collaborator_steps = {
+            _agent_name: _plan.add(
+                f"agent:{_agent_name}",
+                lambda _agent_name=_agent_name, _kwargs=_kwargs: _create_collaborator(
+                    _agent_name, _kwargs
+                ),
+            )
+            for _agent_name, _kwargs in collaborators.items()
+        }
+        _supervisor._add_provisioning_steps(
+            _plan,
+            guardrail=guardrail,
+            kb_id=kb_id,
+            kb_descr=kb_descr,
+            llm=llm,
+            verbose=verbose,
+            collaborator_steps=_collaborator_steps,
+        )
+        if verbose:
+            print(f"Provisioning plan:\n{_plan}")
+        _plan.run()
+        _supervisor._provisioned(verbose)
+        return _supervisor
+
     def _get_collab_alias_arn(self, collab_name):
         # print(f"Finding argn for collab: {collab_name}")
         for _collab_obj in self.collaborator_objects:
@@ -7,23 +7,21 @@ The AgentsForAmazonBedrock class provides a convenient interface for working wit
 It includes methods for creating, updating, and invoking Agents, as well as managing
 IAM roles and Lambda functions for action groups.
 """
-import copy
-
 import boto3
 import json
 import time
 import uuid
-import zipfile
 from dateutil.tz import tzutc
 import os
 import datetime
-from io import BytesIO
-from typing import List, Dict, Tuple
+from typing import List, Dict, Iterator, Tuple
 import re
 from boto3.session import Session
 from botocore.config import Config
+from botocore.exceptions import ClientError
 from boto3.dynamodb.conditions import Key
 import inspect
+from concurrent.futures import ThreadPoolExecutor
 from typing import Callable
 from textwrap import dedent
 
@@ -32,17 +30,33 @@ from textwrap import dedent
 # from IPython.display import display, Markdown
 
 from termcolor import colored
-from rich.console import Console
-from rich.markdown import Markdown
+
+from src.utils.agent_events import (
+    TRACE_TRUNCATION_LENGTH,
+    UNDECIDABLE_CLASSIFICATION,
+    AgentEventProcessor,
+    ConsoleSink,
+    EventSink,
+)
+from src.utils.iam_roles import IamRoleManager
+from src.utils.lambda_packaging import LambdaBuildCache, LambdaPackage
+from src.utils.provisioning import DEFAULT_MAX_WORKERS, ProvisioningPlan
+from src.utils.waiters import (
+    Waiter,
+    WaiterProgress,
+    agent_alias_status,
+    agent_status,
+    is_role_propagation_error,
+    is_settled,
+    print_progress,
+)
 
 
 PYTHON_TIMEOUT = 180
 PYTHON_RUNTIME = "python3.12"
 DEFAULT_ALIAS = "TSTALIASID"
 DEFAULT_CI_ACTION_GROUP_NAME = "CodeInterpreterAction"
-UNDECIDABLE_CLASSIFICATION = "undecidable"
 ROUTER_MODEL = "us.anthropic.claude-3-haiku-20240307-v1:0"
-TRACE_TRUNCATION_LENGTH = 300
 
 # TODO: Take advantage of a default execution role so that we do not need to have lengthy
 # waiting times when creating a new Agent or new Lambda to give time for the IAM role to
@@ -124,11 +138,33 @@ DEFAULT_AGENT_IAM_POLICY = {
 # logger = logging.getLogger(__name__)
 
 
+def _is_retryable(error: Exception) -> bool:
+    if is_role_propagation_error(error):
+        return True
+    if isinstance(error, ClientError):
+        return error.response.get("Error", {}).get("Code") in (
+            "ConflictException",
+            "ThrottlingException",
+        )
+    return False
+
+
 class AgentsForAmazonBedrock:
     """Provides an easy to use wrapper for Agents for Amazon Bedrock."""
 
-    def __init__(self):
-        """Constructs an instance."""
+    def __init__(
+        self,
+        on_wait_progress: Callable[[WaiterProgress], None] = print_progress,
+        lambda_build_cache: LambdaBuildCache = None,
+    ):
+        """Constructs an instance.
+
+        Args:
+            on_wait_progress (Callable[[WaiterProgress], None], optional): called while waiting for
+            agents, aliases and IAM roles to settle. Defaults to printing the current status.
+            lambda_build_cache (LambdaBuildCache, optional): cache of the Lambda packages of action
+            groups. Defaults to a cache in the system temporary directory.
+        """
         self._boto_session = Session()
         self._region = self._boto_session.region_name
         self._account_id = boto3.client("sts").get_caller_identity()["Account"]
@@ -148,6 +184,13 @@ class AgentsForAmazonBedrock:
         self._dynamodb_resource = boto3.resource("dynamodb", region_name=self._region)
 
         self._suffix = f"{self._region}-{self._account_id}"
+        self._on_wait_progress = on_wait_progress
+        self._lambda_build_cache = lambda_build_cache or LambdaBuildCache()
+        self._iam_roles = IamRoleManager(self._iam_client)
+        self._lambda_files = dict()
+
+    def _waiter(self, description: str, **kwargs) -> Waiter:
+        return Waiter(description, on_progress=self._on_wait_progress, **kwargs)
 
     def get_region(self) -> str:
         """Returns the region for this instance."""
@@ -176,39 +219,17 @@ class AgentsForAmazonBedrock:
         _lambda_function_role_name = f"{agent_name}-lambda-role-{self._suffix}"
         _dynamodb_access_policy_name = f"{agent_name}-dynamodb-policy"
 
-        # Create IAM Role for the Lambda function
-        try:
-            _assume_role_policy_document = {
-                "Version": "2012-10-17",
-                "Statement": [
-                    {
-                        "Effect": "Allow",
-                        "Action": "bedrock:InvokeModel",
-                        "Principal": {"Service": "lambda.amazonaws.com"},
-                        "Action": "sts:AssumeRole",
-                    }
-                ],
-            }
-
-            _assume_role_policy_document_json = json.dumps(_assume_role_policy_document)
-
-            _lambda_iam_role = self._iam_client.create_role(
-                RoleName=_lambda_function_role_name,
-                AssumeRolePolicyDocument=_assume_role_policy_document_json,
-            )
-
-            # Pause to make sure role is created
-            time.sleep(10)
-        except:
-            _lambda_iam_role = self._iam_client.get_role(
-                RoleName=_lambda_function_role_name
-            )
-
-        # attach Lambda basic execution policy to the role
-        self._iam_client.attach_role_policy(
-            RoleName=_lambda_function_role_name,
-            PolicyArn="arn:aws:iam::aws:policy/service-role/AWSLambdaBasicExecutionRole",
-        )
+        _assume_role_policy_document = {
+            "Version": "2012-10-17",
+            "Statement": [
+                {
+                    "Effect": "Allow",
+                    "Principal": {"Service": "lambda.amazonaws.com"},
+                    "Action": "sts:AssumeRole",
+                }
+            ],
+        }
+        _inline_policies = dict()
 
         # If an additional IAM policy has been provided, attach it to the role as well.
         if additional_function_iam_policy is not None:
@@ -216,10 +237,8 @@ class AgentsForAmazonBedrock:
                 print(
                     f"Attaching additional IAM policy to Lambda role:\n{additional_function_iam_policy}"
                 )
-            self._iam_client.put_role_policy(
-                PolicyDocument=additional_function_iam_policy,
-                PolicyName="additional_function_policy",
-                RoleName=_lambda_function_role_name,
+            _inline_policies["additional_function_policy"] = (
+                additional_function_iam_policy
             )
 
         # create a policy to allow Lambda to invoke sub-agents and look up info about each sub-agent.
@@ -229,7 +248,7 @@ class AgentsForAmazonBedrock:
                 _sub_agent_arn.replace(":agent/", ":agent*/") + "*"
                 for _sub_agent_arn in sub_agent_arns
             ]
-            _sub_agent_policy_document = {
+            _inline_policies["sub_agent_policy"] = {
                 "Version": "2012-10-17",
                 "Statement": [
                     {
@@ -248,17 +267,10 @@ class AgentsForAmazonBedrock:
                     },
                 ],
             }
-            # Attach the inline policy to the Lambda function's role
-            sub_agent_policy_json = json.dumps(_sub_agent_policy_document)
-            self._iam_client.put_role_policy(
-                PolicyDocument=sub_agent_policy_json,
-                PolicyName="sub_agent_policy",
-                RoleName=_lambda_function_role_name,
-            )
 
         # Create a policy to grant access to the DynamoDB table
         if dynamodb_table_name:
-            _dynamodb_access_policy = {
+            _inline_policies[_dynamodb_access_policy_name] = {
                 "Version": "2012-10-17",
                 "Statement": [
                     {
@@ -277,14 +289,16 @@ class AgentsForAmazonBedrock:
                 ],
             }
 
-            # Attach the inline policy to the Lambda function's role
-            _dynamodb_access_policy_json = json.dumps(_dynamodb_access_policy)
-            self._iam_client.put_role_policy(
-                PolicyDocument=_dynamodb_access_policy_json,
-                PolicyName=_dynamodb_access_policy_name,
-                RoleName=_lambda_function_role_name,
-            )
-        return _lambda_iam_role["Role"]["Arn"]
+        # Reuses the role as is if it already has these policies, with the Lambda basic
+        # execution policy attached
+        return self._iam_roles.ensure_role(
+            _lambda_function_role_name,
+            trust_policy=_assume_role_policy_document,
+            inline_policies=_inline_policies,
+            managed_policy_arns=[
+                "arn:aws:iam::aws:policy/service-role/AWSLambdaBasicExecutionRole"
+            ],
+        )
 
     def get_agent_latest_alias_id(self, agent_id: str, verbose: bool = False) -> str:
         """Gets the latest alias ID for the specified Agent.
@@ -359,22 +373,31 @@ class AgentsForAmazonBedrock:
         else:
             return _target_agent["agentId"]
 
-    def associate_kb_with_agent(self, agent_id, description, kb_id):
+    def associate_kb_with_agent(self, agent_id, description, kb_id, prepare=True):
         """Associates a Knowledge Base with an Agent, and prepares the agent.
 
         Args:
             agent_id (str): Id of the agent
             description (str): Description of the KB
             kb_id (str): Id of the KB
+            prepare (bool, Optional): Whether to prepare the agent, e.g. not when it is prepared
+            once all its changes are made. Defaults to True.
         """
-        _resp = self._bedrock_agent_client.associate_agent_knowledge_base(
-            agentId=agent_id,
-            agentVersion="DRAFT",
-            description=description,
-            knowledgeBaseId=kb_id,
-            knowledgeBaseState="ENABLED",
+        # retry while another change, e.g. a collaborator association, is updating the agent
+        _resp = self._waiter(
+            f"knowledge base {kb_id} to be associated", timeout=120
+        ).retry(
+            lambda: self._bedrock_agent_client.associate_agent_knowledge_base(
+                agentId=agent_id,
+                agentVersion="DRAFT",
+                description=description,
+                knowledgeBaseId=kb_id,
+                knowledgeBaseState="ENABLED",
+            ),
+            retryable=_is_retryable,
         )
-        _resp = self._bedrock_agent_client.prepare_agent(agentId=agent_id)
+        if prepare:
+            _resp = self._bedrock_agent_client.prepare_agent(agentId=agent_id)
 
     def get_agent_arn_by_name(self, agent_name: str) -> str:
         """Gets the Agent ARN for the specified Agent.
@@ -416,14 +439,17 @@ class AgentsForAmazonBedrock:
             agent_id (str): Id of the agent
             lambda_function_name (str): Name of the Lambda function
         """
-        # Create allow invoke permission on lambda
-        _permission_resp = self._lambda_client.add_permission(
-            FunctionName=lambda_function_name,
-            StatementId=f"allow_bedrock_{agent_id}",
-            Action="lambda:InvokeFunction",
-            Principal="bedrock.amazonaws.com",
-            SourceArn=f"arn:aws:bedrock:{self._region}:{self._account_id}:agent/{agent_id}",
-        )
+        # Create allow invoke permission on lambda, unless a redeploy already has it
+        try:
+            _permission_resp = self._lambda_client.add_permission(
+                FunctionName=lambda_function_name,
+                StatementId=f"allow_bedrock_{agent_id}",
+                Action="lambda:InvokeFunction",
+                Principal="bedrock.amazonaws.com",
+                SourceArn=f"arn:aws:bedrock:{self._region}:{self._account_id}:agent/{agent_id}",
+            )
+        except self._lambda_client.exceptions.ResourceConflictException:
+            pass
 
     def _make_agent_string(self, agent_arns: List[str] = None) -> str:
         """Makes a comma separated string of agent ids from a list of agent ARNs.
@@ -439,6 +465,62 @@ class AgentsForAmazonBedrock:
                 _agent_string += _agent_arn.split("/")[1] + ","
             return _agent_string.strip()[:-1]
 
+    def _get_lambda_configuration(self, lambda_function_name: str) -> Dict:
+        """Returns the configuration of a Lambda function, or None if it does not exist."""
+        try:
+            return self._lambda_client.get_function_configuration(
+                FunctionName=lambda_function_name
+            )
+        except self._lambda_client.exceptions.ResourceNotFoundException:
+            return None
+
+    def _update_lambda(
+        self,
+        configuration: Dict,
+        package: LambdaPackage,
+        handler: str,
+        env_variables: Dict,
+        role: str,
+    ) -> None:
+        """Updates the code, handler, environment and role of an existing Lambda function, if they changed.
+
+        Args:
+            configuration (Dict): current configuration of the function
+            package (LambdaPackage): package with the new code
+            handler (str): new handler of the function
+            env_variables (Dict): new environment of the function
+            role (str): ARN of the new role of the function
+        """
+        _function_name = configuration["FunctionName"]
+        _waiter = self._lambda_client.get_waiter("function_updated")
+        if configuration["CodeSha256"] != package.code_sha256:
+            self._lambda_client.update_function_code(
+                FunctionName=_function_name, ZipFile=package.zip_content
+            )
+            _waiter.wait(FunctionName=_function_name)
+        _variables = configuration.get("Environment", {}).get("Variables", {})
+        if (
+            configuration["Handler"] != handler
+            or _variables != env_variables["Variables"]
+            or configuration["Role"] != role
+        ):
+            self._lambda_client.update_function_configuration(
+                FunctionName=_function_name,
+                Handler=handler,
+                Environment=env_variables,
+                Role=role,
+            )
+            _waiter.wait(FunctionName=_function_name)
+
+    def build_lambda_packages(self, source_code_files: List[str]) -> None:
+        """Zips the source files of several Lambda functions in parallel, so that creating
+        the functions afterwards reuses the packages.
+
+        Args:
+            source_code_files (List[str]): paths of the source code files
+        """
+        self._lambda_build_cache.build_many(source_code_files)
+
     def create_lambda(
         self,
         agent_name: str,
@@ -468,12 +550,9 @@ class AgentsForAmazonBedrock:
 
         _base_filename = source_code_file.split(".py")[0]
 
-        # Package up the lambda function code
-        s = BytesIO()
-        z = zipfile.ZipFile(s, "w")
-        z.write(f"{source_code_file}")
-        z.close()
-        zip_content = s.getvalue()
+        # Package up the lambda function code, reusing the zip of an unchanged source
+        _package = self._lambda_build_cache.build(source_code_file)
+        zip_content = _package.zip_content
         # TODO: make this an optional keyword arg. only supply it when sub-agent-arns are provided or DynamoDB variables are provided
         if sub_agent_arns:
             env_variables = {
@@ -481,28 +560,58 @@ class AgentsForAmazonBedrock:
             }
         else:
             env_variables = {"Variables": {}}
+        if dynamo_args:
+            env_variables["Variables"]["dynamodb_table"] = dynamo_args[0]
+            env_variables["Variables"]["dynamodb_pk"] = dynamo_args[1]
+            env_variables["Variables"]["dynamodb_sk"] = dynamo_args[2]
+
+        # The role and table are ensured on redeploys too, as the sub-agents, additional
+        # policy or table may have changed; an unchanged role is reused as is
         if dynamo_args:
             # add DynamoDB Table permissions to the Lambda Function
             lambda_role = self._create_lambda_iam_role(
-                agent_name, sub_agent_arns, dynamodb_table_name=dynamo_args[0]
+                agent_name,
+                additional_function_iam_policy=additional_function_iam_policy,
+                sub_agent_arns=sub_agent_arns,
+                dynamodb_table_name=dynamo_args[0],
             )
             # create DynamoDB Table to be used on Lambda Code
             self.create_dynamodb(dynamo_args[0], dynamo_args[1], dynamo_args[2])
-            env_variables["Variables"]["dynamodb_table"] = dynamo_args[0]
-            env_variables["Variables"]["dynamodb_pk"] = dynamo_args[1]
-            env_variables["Variables"]["dynamodb_sk"] = dynamo_args[2]
         else:
-            lambda_role = self._create_lambda_iam_role(agent_name, sub_agent_arns)
+            lambda_role = self._create_lambda_iam_role(
+                agent_name,
+                additional_function_iam_policy=additional_function_iam_policy,
+                sub_agent_arns=sub_agent_arns,
+            )
+
+        # Redeploying an existing function only updates what changed
+        _existing = self._get_lambda_configuration(lambda_function_name)
+        if _existing is not None:
+            self._update_lambda(
+                _existing,
+                _package,
+                f"{_base_filename}.lambda_handler",
+                env_variables,
+                lambda_role,
+            )
+            self._allow_agent_lambda(_agent_id, lambda_function_name)
+            return _existing["FunctionArn"]
 
         # Create Lambda Function
-        _lambda_function = self._lambda_client.create_function(
-            FunctionName=lambda_function_name,
-            Runtime=PYTHON_RUNTIME,
-            Timeout=PYTHON_TIMEOUT,
-            Role=lambda_role,
-            Code={"ZipFile": zip_content},
-            Handler=f"{_base_filename}.lambda_handler",
-            Environment=env_variables,
+        # retry until the new role can be assumed by Lambda
+        _lambda_function = self._waiter(
+            f"role {lambda_role} to propagate", timeout=60, initial_delay=1
+        ).retry(
+            lambda: self._lambda_client.create_function(
+                FunctionName=lambda_function_name,
+                Runtime=PYTHON_RUNTIME,
+                Timeout=PYTHON_TIMEOUT,
+                Role=lambda_role,
+                Code={"ZipFile": zip_content},
+                Handler=f"{_base_filename}.lambda_handler",
+                Environment=env_variables,
+            ),
+            retryable=is_role_propagation_error,
         )
 
         self._allow_agent_lambda(_agent_id, lambda_function_name)
@@ -535,6 +644,7 @@ class AgentsForAmazonBedrock:
                     PolicyArn="arn:aws:iam::aws:policy/service-role/AWSLambdaBasicExecutionRole",
                 )
                 self._iam_client.delete_role(RoleName=_role_name)
+                self._iam_roles.forget(_role_name)
             except:
                 pass
 
@@ -611,6 +721,10 @@ class AgentsForAmazonBedrock:
                     response = self._bedrock_agent_client.delete_agent_alias(
                         agentAliasId=alias_id, agentId=_agent_id
                     )
+                for alias in _agent_aliases["agentAliasSummaries"]:
+                    self.wait_agent_alias_status_update(
+                        _agent_id, alias["agentAliasId"], verbose=verbose
+                    )
             except Exception as e:
                 print(f"Error deleting aliases: {e}")
                 pass
@@ -621,9 +735,9 @@ class AgentsForAmazonBedrock:
 
             if verbose:
                 print(f"Deleting agent: {_agent_id}...")
-            time.sleep(5)
+            self.wait_agent_status_update(_agent_id)
             self._bedrock_agent_client.delete_agent(agentId=_agent_id)
-            time.sleep(5)
+            self.wait_agent_status_update(_agent_id)
 
         # TODO: add delete_lambda_flag parameter to optionall take care of
         # deleting the lambda function associated with the agent.
@@ -657,6 +771,7 @@ class AgentsForAmazonBedrock:
 
             try:
                 self._iam_client.delete_role(RoleName=_agent_role_name)
+                self._iam_roles.forget(_agent_role_name)
             except Exception as e:
                 pass
 
@@ -685,84 +800,20 @@ class AgentsForAmazonBedrock:
             print(f"Creating IAM role for agent: {agent_name}")
 
         if reuse_default:
-            _agent_role_name = DEFAULT_AGENT_IAM_ROLE_NAME
-
-            # try creating the default role, which may already exist
-            try:
-                # create the default role w/ the proper assume role policy
-                _assume_role_policy_document_json = DEFAULT_AGENT_IAM_ASSUME_ROLE_POLICY
-                _assume_role_policy_document = json.dumps(
-                    _assume_role_policy_document_json
-                )
-
-                _bedrock_agent_bedrock_allow_policy_document_json = (
-                    DEFAULT_AGENT_IAM_POLICY
-                )
-                _bedrock_agent_bedrock_allow_policy_document = json.dumps(
-                    _bedrock_agent_bedrock_allow_policy_document_json
-                )
-
-                _agent_role = self._iam_client.create_role(
-                    RoleName=_agent_role_name,
-                    AssumeRolePolicyDocument=_assume_role_policy_document,
-                )
-            except Exception as e:
-                if verbose:
-                    print(
-                        f"Caught exc when creating default role for role: {_agent_role_name}: {e}"
-                    )
-                    print(f"using assume role json: {_assume_role_policy_document}")
-            else:
-                self._iam_client.put_role_policy(
-                    PolicyDocument=_bedrock_agent_bedrock_allow_policy_document,
-                    PolicyName="bedrock_allow_policy",
-                    RoleName=_agent_role_name,
-                )
-
-            return f"arn:aws:iam::{self._account_id}:role/{DEFAULT_AGENT_IAM_ROLE_NAME}"
+            # created once, then reused by every agent without waiting for IAM again
+            return self._iam_roles.ensure_role(
+                DEFAULT_AGENT_IAM_ROLE_NAME,
+                trust_policy=DEFAULT_AGENT_IAM_ASSUME_ROLE_POLICY,
+                inline_policies={"bedrock_allow_policy": DEFAULT_AGENT_IAM_POLICY},
+            )
 
         else:
             _agent_role_name = f"AmazonBedrockExecutionRoleForAgents_{agent_name}"
-            # _tmp_resources = [f"arn:aws:bedrock:{self._region}::foundation-model/{_model}" for _model in agent_foundation_models]
-
-            # Create IAM policies for agent
-            _assume_role_policy_document = DEFAULT_AGENT_IAM_ASSUME_ROLE_POLICY
-            _assume_role_policy_document_json = json.dumps(_assume_role_policy_document)
-
-            _agent_role = self._iam_client.create_role(
-                RoleName=_agent_role_name,
-                AssumeRolePolicyDocument=_assume_role_policy_document_json,
-            )
-
-            # Pause to make sure role is created
-            time.sleep(10)
-
-            _bedrock_agent_bedrock_allow_policy_statement = DEFAULT_AGENT_IAM_POLICY
-            _bedrock_policy_json = json.dumps(
-                _bedrock_agent_bedrock_allow_policy_statement
-            )
-            if verbose:
-                print(
-                    f"Role {_agent_role_name} created. ARN: {_agent_role['Role']['Arn']}"
-                )
-                print(
-                    f"Adding bedrock_allow_policy to role {_agent_role_name}\n{_bedrock_policy_json}..."
-                )
-
-            _bedrock_agent_bedrock_allow_policy_statement = DEFAULT_AGENT_IAM_POLICY
-            _bedrock_policy_json = json.dumps(
-                _bedrock_agent_bedrock_allow_policy_statement
-            )
-
-            self._iam_client.put_role_policy(
-                PolicyDocument=_bedrock_policy_json,
-                PolicyName="bedrock_allow_policy",
-                RoleName=_agent_role_name,
-            )
+            _inline_policies = {"bedrock_allow_policy": DEFAULT_AGENT_IAM_POLICY}
 
             # add Knowledge Base retrieve and retrieve and generate permissions if agent has KB attached to it
             if kb_arns is not None:
-                _kb_policy_doc = {
+                _inline_policies["bedrock_kb_allow_policy"] = {
                     "Version": "2012-10-17",
                     "Statement": [
                         {
@@ -776,19 +827,10 @@ class AgentsForAmazonBedrock:
                         }
                     ],
                 }
-                _kb_policy_json = json.dumps(_kb_policy_doc)
-                self._iam_client.put_role_policy(
-                    PolicyDocument=_kb_policy_json,
-                    PolicyName="bedrock_kb_allow_policy",
-                    RoleName=_agent_role_name,
-                )
-
-                # Pause to make sure role is updated
-                time.sleep(10)
 
             # TODO: scope down GR access to a single GR passed as param
             # # Support Guardrail access
-            # _gr_policy_doc = {
+            # _inline_policies["bedrock_gr_allow_policy"] = {
             #     "Version": "2012-10-17",
             #     "Statement": [{
             #         "Sid": "AmazonBedrockAgentBedrockInvokeGuardrailModelPolicy",
@@ -799,74 +841,150 @@ class AgentsForAmazonBedrock:
             #                 "bedrock:ApplyGuardrail"
             #             ],
             #             "Resource": f"arn:aws:bedrock:*:{self._account_id}:guardrail/*"
-            #         }]
+            #     }]
             # }
-            # _gr_policy_json = json.dumps(_gr_policy_doc)
-            # self._iam_client.put_role_policy(
-            #     PolicyDocument=_gr_policy_json,
-            #     PolicyName="bedrock_gr_allow_policy",
-            #     RoleName=_agent_role_name
-            # )
-
-            return _agent_role["Role"]["Arn"]
-
-    def wait_agent_status_update(self, agent_id):
-        response = self._bedrock_agent_client.get_agent(agentId=agent_id)
-        agent_status = response["agent"]["agentStatus"]
-        _waited_at_least_once = False
-        while agent_status.endswith("ING"):
-            print(f"Waiting for agent status to change. Current status {agent_status}")
-            time.sleep(5)
-            _waited_at_least_once = True
-            try:
-                response = self._bedrock_agent_client.get_agent(agentId=agent_id)
-                agent_status = response["agent"]["agentStatus"]
-            except self._bedrock_agent_client.exceptions.ResourceNotFoundException:
-                agent_status = "DELETED"
-        if _waited_at_least_once:
-            print(f"Agent id {agent_id} current status: {agent_status}")
-
-    def wait_agent_alias_status_update(self, agent_id, agent_alias_id, verbose=False):
-        response = self._bedrock_agent_client.get_agent_alias(
-            agentId=agent_id, agentAliasId=agent_alias_id
-        )
-        agent_alias_status = response["agentAlias"]["agentAliasStatus"]
-        while agent_alias_status.endswith("ING"):
+
             if verbose:
                 print(
-                    f"Waiting for agent ALIAS status to change. Current status {agent_alias_status}"
+                    f"Ensuring role {_agent_role_name} with policies {list(_inline_policies)}..."
                 )
-            time.sleep(5)
-            try:
-                response = self._bedrock_agent_client.get_agent_alias(
-                    agentId=agent_id, agentAliasId=agent_alias_id
-                )
-                agent_alias_status = response["agentAlias"]["agentAliasStatus"]
-            except self._bedrock_agent_client.exceptions.ResourceNotFoundException:
-                agent_status = "DELETED"
+
+            return self._iam_roles.ensure_role(
+                _agent_role_name,
+                trust_policy=DEFAULT_AGENT_IAM_ASSUME_ROLE_POLICY,
+                inline_policies=_inline_policies,
+            )
+
+    def wait_agent_status_update(self, agent_id: str, timeout: float = 300) -> str:
+        """Waits until an agent leaves a transitional status such as CREATING or PREPARING.
+
+        Args:
+            agent_id (str): ID of the agent
+            timeout (float, optional): seconds to wait at most. Defaults to 300.
+
+        Returns:
+            str: the settled status of the agent, DELETED if it no longer exists
+        """
+        _waited = []
+
+        def _on_progress(progress: WaiterProgress):
+            _waited.append(progress)
+            if self._on_wait_progress is not None:
+                self._on_wait_progress(progress)
+
+        _agent_status = Waiter(
+            f"agent {agent_id} status to change",
+            timeout=timeout,
+            on_progress=_on_progress,
+        ).wait(agent_status(self._bedrock_agent_client, agent_id), until=is_settled)
+        if _waited:
+            print(f"Agent id {agent_id} current status: {_agent_status}")
+        return _agent_status
+
+    def wait_agent_alias_status_update(
+        self, agent_id: str, agent_alias_id: str, verbose: bool = False, timeout: float = 300
+    ) -> str:
+        """Waits until an agent alias leaves a transitional status such as CREATING or UPDATING.
+
+        Args:
+            agent_id (str): ID of the agent
+            agent_alias_id (str): ID of the agent alias
+            verbose (bool, optional): whether to report progress. Defaults to False.
+            timeout (float, optional): seconds to wait at most. Defaults to 300.
+
+        Returns:
+            str: the settled status of the alias, DELETED if it no longer exists
+        """
+        _agent_alias_status = Waiter(
+            f"agent {agent_id} alias {agent_alias_id} status to change",
+            timeout=timeout,
+            on_progress=self._on_wait_progress if verbose else None,
+        ).wait(
+            agent_alias_status(self._bedrock_agent_client, agent_id, agent_alias_id),
+            until=is_settled,
+        )
         if verbose:
             print(
-                f"Agent id {agent_id}, Alias {agent_alias_id} current status: {agent_alias_status}"
+                f"Agent id {agent_id}, Alias {agent_alias_id} current status: {_agent_alias_status}"
             )
+        return _agent_alias_status
 
-    def associate_sub_agents(self, supervisor_agent_id, sub_agents_list):
-        for sub_agent in sub_agents_list:
-            self.wait_agent_status_update(
-                supervisor_agent_id
-            )  # Be sure agent is not still in CREATING state
-            association_response = (
-                self._bedrock_agent_client.associate_agent_collaborator(
-                    agentId=supervisor_agent_id,
-                    agentVersion="DRAFT",
-                    agentDescriptor={"aliasArn": sub_agent["sub_agent_alias_arn"]},
-                    collaboratorName=sub_agent["sub_agent_association_name"],
-                    collaborationInstruction=sub_agent["sub_agent_instruction"],
-                    relayConversationHistory=sub_agent["relay_conversation_history"],
-                )
+    def associate_sub_agent(self, supervisor_agent_id: str, sub_agent: Dict) -> Dict:
+        """Associates a single sub-agent with a supervisor, without preparing the supervisor.
+
+        Args:
+            supervisor_agent_id (str): ID of the supervisor agent
+            sub_agent (Dict): sub-agent as in `build_sub_agent_list`
+
+        Returns:
+            Dict: the agent collaborator
+        """
+        # retry while another association is updating the supervisor
+        return self._waiter(
+            f"collaborator {sub_agent['sub_agent_association_name']} to be associated",
+            timeout=120,
+        ).retry(
+            lambda: self._bedrock_agent_client.associate_agent_collaborator(
+                agentId=supervisor_agent_id,
+                agentVersion="DRAFT",
+                agentDescriptor={"aliasArn": sub_agent["sub_agent_alias_arn"]},
+                collaboratorName=sub_agent["sub_agent_association_name"],
+                collaborationInstruction=sub_agent["sub_agent_instruction"],
+                relayConversationHistory=sub_agent.get(
+                    "relay_conversation_history", "DISABLED"
+                ),
+            )["agentCollaborator"],
+            retryable=_is_retryable,
+        )
+
+    def prepare_agent_by_id(self, agent_id: str) -> str:
+        """Prepares an agent and waits until it is prepared.
+
+        Returns:
+            str: the status of the agent once settled
+        """
+        self.wait_agent_status_update(agent_id)
+        self._bedrock_agent_client.prepare_agent(agentId=agent_id)
+        return self.wait_agent_status_update(agent_id)
+
+    def associate_sub_agents(
+        self,
+        supervisor_agent_id: str,
+        sub_agents_list: List[Dict],
+        max_workers: int = DEFAULT_MAX_WORKERS,
+    ) -> Tuple[str, str]:
+        """Associates sub-agents with a supervisor, prepares it once and creates an alias.
+
+        The associations are made concurrently, with at most `max_workers` at a time.
+
+        Args:
+            supervisor_agent_id (str): ID of the supervisor agent
+            sub_agents_list (List[Dict]): sub-agents as in `build_sub_agent_list`
+            max_workers (int, optional): associations made at the same time at most. Defaults to 4.
+
+        Returns:
+            Tuple[str, str]: ID and ARN of the new supervisor alias
+        """
+        self.wait_agent_status_update(
+            supervisor_agent_id
+        )  # Be sure agent is not still in CREATING state
+
+        _plan = ProvisioningPlan(max_workers=max_workers)
+        _associations = [
+            _plan.add(
+                f"collaborator:{sub_agent['sub_agent_association_name']}",
+                lambda sub_agent=sub_agent: self.associate_sub_agent(
+                    supervisor_agent_id, sub_agent
+                ),
             )
-            self.wait_agent_status_update(supervisor_agent_id)
-            self._bedrock_agent_client.prepare_agent(agentId=supervisor_agent_id)
-            self.wait_agent_status_update(supervisor_agent_id)
+            for sub_agent in sub_agents_list
+        ]
+        _plan.add(
+            "prepare",
+            lambda: self.prepare_agent_by_id(supervisor_agent_id),
+            depends_on=_associations,
+        )
+        _plan.run()
 
         supervisor_agent_alias = self._bedrock_agent_client.create_agent_alias(
             agentAliasName="multi-agent", agentId=supervisor_agent_id
@@ -941,9 +1059,6 @@ class AgentsForAmazonBedrock:
             print(f"Created agent IAM role: {_role_arn}...")
             print(f"Creating agent: {agent_name} with model: {_model_id}...")
 
-        _num_tries = 0
-        _agent_created = False
-        _create_agent_response = None
         _agent_id = None
 
         _kwargs = {}
@@ -966,45 +1081,35 @@ class AgentsForAmazonBedrock:
                 "guardrailVersion": "DRAFT",
             }
 
-        while not _agent_created and _num_tries <= 2:
-            try:
-                if verbose:
-                    print(f"kwargs: {_kwargs}")
-                _create_agent_response = self._bedrock_agent_client.create_agent(
-                    agentName=agent_name,
-                    agentResourceRoleArn=_role_arn,
-                    description=agent_description.replace(
-                        "\n", ""
-                    ),  # console doesn't like newlines for subsequent editing
-                    idleSessionTTLInSeconds=1800,
-                    foundationModel=_model_id,
-                    instruction=agent_instructions,
-                    agentCollaboration=agent_collaboration,
-                    **_kwargs,
-                )
-                _agent_id = _create_agent_response["agent"]["agentId"]
-                if verbose:
-                    print(f"Created agent, resulting id: {_agent_id}")
-                    _get_resp = self._bedrock_agent_client.get_agent(agentId=_agent_id)
-                    print(_get_resp)
-                _agent_created = True
+        def _create_agent():
+            if verbose:
+                print(f"kwargs: {_kwargs}")
+            return self._bedrock_agent_client.create_agent(
+                agentName=agent_name,
+                agentResourceRoleArn=_role_arn,
+                description=agent_description.replace(
+                    "\n", ""
+                ),  # console doesn't like newlines for subsequent editing
+                idleSessionTTLInSeconds=1800,
+                foundationModel=_model_id,
+                instruction=agent_instructions,
+                agentCollaboration=agent_collaboration,
+                **_kwargs,
+            )
 
-            except Exception as e:
-                if verbose:
-                    print(
-                        f"Error creating agent: {e}\n. Retrying in case it was just waiting to be deleted."
-                    )
-                _num_tries += 1
-                if _num_tries <= 2:
-                    time.sleep(4)
-                    pass
-                else:
-                    if verbose:
-                        print(f"Giving up on agent creation after 2 tries.")
-                    raise e
+        # retry while an agent of the same name is still being deleted, or the role
+        # has not propagated yet
+        _create_agent_response = self._waiter(
+            f"agent {agent_name} to be created", timeout=60, initial_delay=1
+        ).retry(_create_agent, retryable=_is_retryable)
+        _agent_id = _create_agent_response["agent"]["agentId"]
+        if verbose:
+            print(f"Created agent, resulting id: {_agent_id}")
+            _get_resp = self._bedrock_agent_client.get_agent(agentId=_agent_id)
+            print(_get_resp)
+        self.wait_agent_status_update(_agent_id)
 
         if code_interpretation:
-            # possible time.sleep(15) needed here
             self.add_code_interpreter(agent_name)
 
         _agent_alias_id = DEFAULT_ALIAS
@@ -1022,7 +1127,8 @@ class AgentsForAmazonBedrock:
             return "Agent not found"
 
         _resp = self._bedrock_agent_client.prepare_agent(agentId=_agent_id)
-        time.sleep(5)  # make sure agent is ready to be invoked as soon as we return
+        # make sure agent is ready to be invoked as soon as we return
+        self.wait_agent_status_update(_agent_id)
         return
 
     def create_agent_alias(self, agent_id: str, alias_name: str) -> Tuple[str, str]:
@@ -1063,7 +1169,8 @@ class AgentsForAmazonBedrock:
         # check the response and if successful, prepare the agent
         if _agent_action_group_resp["ResponseMetadata"]["HTTPStatusCode"] == 200:
             _resp = self._bedrock_agent_client.prepare_agent(agentId=_agent_id)
-            time.sleep(5)  # make sure agent is ready to be invoked as soon as we return
+            # make sure agent is ready to be invoked as soon as we return
+            self.wait_agent_status_update(_agent_id)
         else:
             print(f"Error adding code interpreter to agent: {_agent_action_group_resp}")
         return
@@ -1119,13 +1226,19 @@ class AgentsForAmazonBedrock:
             print(f"Lambda ARN: {_lambda_arn}")
             print(f"Agent functions: {agent_functions}")
 
-        _agent_action_group_resp = self._bedrock_agent_client.create_agent_action_group(
-            agentId=_agent_id,
-            agentVersion="DRAFT",
-            actionGroupExecutor={"lambda": _lambda_arn},
-            actionGroupName=agent_action_group_name,
-            functionSchema={"functions": agent_functions},
-            description=agent_action_group_description[0:199],
+        # retry while another change, e.g. a collaborator association, is updating the agent
+        _agent_action_group_resp = self._waiter(
+            f"action group {agent_action_group_name} to be created", timeout=120
+        ).retry(
+            lambda: self._bedrock_agent_client.create_agent_action_group(
+                agentId=_agent_id,
+                agentVersion="DRAFT",
+                actionGroupExecutor={"lambda": _lambda_arn},
+                actionGroupName=agent_action_group_name,
+                functionSchema={"functions": agent_functions},
+                description=agent_action_group_description[0:199],
+            ),
+            retryable=_is_retryable,
         )
         return
 
@@ -1155,7 +1268,8 @@ class AgentsForAmazonBedrock:
             description=agent_action_group_description,
         )
         _resp = self._bedrock_agent_client.prepare_agent(agentId=agent_id)
-        time.sleep(5)  # make sure agent is ready to be invoked as soon as we return
+        # make sure agent is ready to be invoked as soon as we return
+        self.wait_agent_status_update(agent_id)
         return
 
     def get_function_defs(self, agent_name: str) -> List[dict]:
@@ -1273,32 +1387,36 @@ class AgentsForAmazonBedrock:
                 supervisor_agent_name, model_ids
             )
 
-        time.sleep(20)
-
-        _response = self._bedrock_agent_client.create_agent(
-            agentName=supervisor_agent_name,
-            agentResourceRoleArn=_supervisor_role_arn,
-            description=supervisor_description.replace(
-                "\n", ""
-            ),  # console doesn't like newlines for subsequent editing
-            idleSessionTTLInSeconds=1800,
-            foundationModel=model_ids[0],
-            promptOverrideConfiguration={
-                "promptConfigurations": [
-                    {
-                        "promptType": "ROUTING_CLASSIFIER",
-                        "foundationModel": ROUTER_MODEL,
-                        "parserMode": "DEFAULT",
-                        "promptCreationMode": "DEFAULT",
-                        "promptState": "ENABLED",
-                    }
-                ]
-            },
-            instruction=supervisor_instructions,
+        # retry until the new role can be assumed by Bedrock
+        _response = self._waiter(
+            f"role {_supervisor_role_arn} to propagate", timeout=60, initial_delay=1
+        ).retry(
+            lambda: self._bedrock_agent_client.create_agent(
+                agentName=supervisor_agent_name,
+                agentResourceRoleArn=_supervisor_role_arn,
+                description=supervisor_description.replace(
+                    "\n", ""
+                ),  # console doesn't like newlines for subsequent editing
+                idleSessionTTLInSeconds=1800,
+                foundationModel=model_ids[0],
+                promptOverrideConfiguration={
+                    "promptConfigurations": [
+                        {
+                            "promptType": "ROUTING_CLASSIFIER",
+                            "foundationModel": ROUTER_MODEL,
+                            "parserMode": "DEFAULT",
+                            "promptCreationMode": "DEFAULT",
+                            "promptState": "ENABLED",
+                        }
+                    ]
+                },
+                instruction=supervisor_instructions,
+            ),
+            retryable=is_role_propagation_error,
         )
         _supervisor_agent_arn = _response["agent"]["agentArn"]
         _supervisor_agent_id = _response["agent"]["agentId"]
-        time.sleep(15)
+        self.wait_agent_status_update(_supervisor_agent_id)
 
         # Associate the KB with the supervisor agent
         if kb_arn is not None:
@@ -1408,6 +1526,7 @@ class AgentsForAmazonBedrock:
         self,
         request_params: Dict = {},
         trace_level: str = "core",
+        sinks: List[EventSink] = None,
     ):
         if "enableTrace" in request_params:
             enable_trace = request_params["enableTrace"]
@@ -1419,7 +1538,7 @@ class AgentsForAmazonBedrock:
         else:
             request_params["sessionId"] = session_id = str(uuid.uuid4())
 
-        _time_before_call = datetime.datetime.now()
+        _console = ConsoleSink(trace_level=trace_level)
 
         _agent_resp = self._bedrock_agent_runtime_client.invoke_inline_agent(
             **request_params
@@ -1449,540 +1568,19 @@ class AgentsForAmazonBedrock:
                 print(_error_message)
             return _error_message
 
-        _total_in_tokens = 0
-        _total_out_tokens = 0
-        _total_llm_calls = 0
-        _orch_step = 0
-        _sub_step = 0
-        _num_response_chunks = 0
-        _time_before_orchestration = _overall_start_time = datetime.datetime.now()
-        _citations = []
-        _citations_event = None
-
-        _agent_answer = ""
-        _event_stream = _agent_resp["completion"]
+        _processor = AgentEventProcessor(
+            sinks=([_console] if enable_trace else []) + list(sinks or [])
+        )
 
         try:
-            _sub_agent_name = "<collab-name-not-yet-provided>"
-            for _event in _event_stream:
-                _sub_agent_alias_id = None
-
-                if "chunk" in _event:
-                    _data = _event["chunk"]["bytes"]
-                    _tmp_agent_answer = _data.decode("utf8")
-                    if enable_trace and trace_level == "all":
-                        # print(f"tmp answer: '{_tmp_agent_answer}', streaming: {stream_final_response}, trace: {enable_trace}")
-                        print(
-                            f"tmp answer: '{_tmp_agent_answer}', trace: {enable_trace}"
-                        )
-
-                    # continue to build up the full answer
-                    _agent_answer += _tmp_agent_answer
-
-                    # stream the chunks
-
-                    # if _num_response_chunks == 0:
-                    #     _time_to_first_token = datetime.datetime.now() - _overall_start_time
-                    #     if enable_trace and stream_final_response:
-                    #         print(colored(f"Time to first token: {_time_to_first_token.total_seconds():,.1f}s\n", "yellow"))
-                    # _num_response_chunks += 1
-
-                    # if enable_trace and stream_final_response and _num_response_chunks < 3:
-                    #     print(colored(f"Answer chunk [{_num_response_chunks}]: {_tmp_agent_answer}", "blue"))
-
-                    # print all keys in _event["chunk"] dictionary if more than just 'bytes' provided
-                    if enable_trace and trace_level == "all":
-                        if len(_event["chunk"].keys()) > 1:
-                            print(
-                                f"chunk keys beyond just 'bytes': {list(_event['chunk'].keys())}"
-                            )
-
-                    # remember the citations, if any are provided
-                    if "attribution" in _event["chunk"]:
-                        if "citations" in _event["chunk"]["attribution"]:
-                            _citations_event = copy.deepcopy(_event)
-                            _citations = _event["chunk"]["attribution"]["citations"]
-                            if enable_trace and trace_level == "all":
-                                print(colored(f"Citations: {_citations}", "blue"))
-
-                elif "returnControl" in _event:
-                    _agent_answer = _event["returnControl"]
-
-                if "trace" in _event and enable_trace:
-                    if trace_level == "all":
-                        print("---")
-                    else:
-                        if "callerChain" in _event["trace"]:
-                            if len(_event["trace"]["callerChain"]) > 1:
-                                _sub_agent_alias_arn = _event["trace"]["callerChain"][
-                                    1
-                                ]["agentAliasArn"]
-                                # get sub agent id by grabbing all text following the first '/' character
-                                _sub_agent_alias_id = _sub_agent_alias_arn.split(
-                                    "/", 1
-                                )[1]
-                                _sub_agent_name = "<not yet supported with inline>"  # multi_agent_names[_sub_agent_alias_id]
-
-                    if "routingClassifierTrace" in _event["trace"]["trace"]:
-                        _route = _event["trace"]["trace"]["routingClassifierTrace"]
-
-                        if "modelInvocationInput" in _route:
-                            _orch_step += 1
-                            print(colored(f"---- Step {_orch_step} ----", "green"))
-                            _time_before_routing = datetime.datetime.now()
-                            print(
-                                colored(
-                                    "Classifying request to immediately route to one collaborator if possible.",
-                                    "blue",
-                                )
-                            )
-
-                        if "modelInvocationOutput" in _route:
-                            _llm_usage = _route["modelInvocationOutput"]["metadata"][
-                                "usage"
-                            ]
-                            _in_tokens = _llm_usage["inputTokens"]
-                            _total_in_tokens += _in_tokens
-
-                            _out_tokens = _llm_usage["outputTokens"]
-                            _total_out_tokens += _out_tokens
-
-                            _total_llm_calls += 1
-                            _route_duration = (
-                                datetime.datetime.now() - _time_before_routing
-                            )
-
-                            # _raw_resp_str = _route["modelInvocationOutput"][
-                            #     "rawResponse"
-                            # ]["content"]
-                            # _raw_resp = json.loads(_raw_resp_str)
-                            # _classification = (
-                            #     _raw_resp["content"][0]["text"]
-                            #     .replace("<a>", "")
-                            #     .replace("</a>", "")
-                            # )
-                            
-                            _content = json.loads(_route["modelInvocationOutput"]["rawResponse"]["content"])
-                            if 'content' in _content.keys():
-                                _classification = _content["content"][0]["text"]
-                            else:
-                                _classification = _content["output"]["message"]["content"][0]["text"]
-                            _classification = _classification.replace("<a>", "").replace("</a>", "")
-
-                            if _classification == UNDECIDABLE_CLASSIFICATION:
-                                print(
-                                    colored(
-                                        f"Routing classifier did not find a matching collaborator. Reverting to 'SUPERVISOR' mode.",
-                                        "magenta",
-                                    )
-                                )
-                            elif _classification == "keep_previous_agent":
-                                print(
-                                    colored(
-                                        f"Continuing conversation with previous collaborator.",
-                                        "magenta",
-                                    )
-                                )
-                            else:
-                                _sub_agent_name = _classification
-                                print(
-                                    colored(
-                                        f"Routing classifier chose collaborator: '{_classification}'",
-                                        "magenta",
-                                    )
-                                )
-                            print(
-                                colored(
-                                    f"Routing classifier took {_route_duration.total_seconds():,.1f}s, using {_in_tokens+_out_tokens} tokens (in: {_in_tokens}, out: {_out_tokens}).\n",
-                                    "yellow",
-                                )
-                            )
-
-                    if "failureTrace" in _event["trace"]["trace"]:
-                        print(
-                            colored(
-                                f"Agent error: {_event['trace']['trace']['failureTrace']['failureReason']}",
-                                "red",
-                            )
-                        )
-
-                    if "orchestrationTrace" in _event["trace"]["trace"]:
-                        _orch = _event["trace"]["trace"]["orchestrationTrace"]
-
-                        if trace_level in ["core", "outline"]:
-                            if "rationale" in _orch:
-                                _rationale = _orch["rationale"]
-                                print(colored(f"{_rationale['text']}", "blue"))
-
-                            if "invocationInput" in _orch:
-                                # NOTE: when agent determines invocations should happen in parallel
-                                # the trace objects for invocation input still come back one at a time.
-                                _input = _orch["invocationInput"]
-
-                                if "actionGroupInvocationInput" in _input:
-                                    if trace_level == "outline":
-                                        print(
-                                            colored(
-                                                f"Using tool: {_input['actionGroupInvocationInput']['function']}",
-                                                "magenta",
-                                            )
-                                        )
-                                    else:
-                                        if (
-                                            "function"
-                                            not in _input["actionGroupInvocationInput"]
-                                        ):
-                                            print(
-                                                colored(
-                                                    f"EXPECTING to capture 'Using tool', but 'function' not found\n{_input['actionGroupInvocationInput']}",
-                                                    "red",
-                                                )
-                                            )
-                                        else:
-                                            print(
-                                                colored(
-                                                    f"Using tool: {_input['actionGroupInvocationInput']['function']} with these inputs:",
-                                                    "magenta",
-                                                )
-                                            )
-                                            if (
-                                                "parameters"
-                                                in _input["actionGroupInvocationInput"]
-                                            ):
-                                                if (
-                                                    len(
-                                                        _input[
-                                                            "actionGroupInvocationInput"
-                                                        ]["parameters"]
-                                                    )
-                                                    == 1
-                                                ) and (
-                                                    _input[
-                                                        "actionGroupInvocationInput"
-                                                    ]["parameters"][0]["name"]
-                                                    == "input_text"
-                                                ):
-                                                    print(
-                                                        colored(
-                                                            f"{_input['actionGroupInvocationInput']['parameters'][0]['value']}",
-                                                            "magenta",
-                                                        )
-                                                    )
-                                                else:
-                                                    print(
-                                                        colored(
-                                                            f"{_input['actionGroupInvocationInput']['parameters']}\n",
-                                                            "magenta",
-                                                        )
-                                                    )
-                                            else:
-                                                print(
-                                                    colored(
-                                                        f"    no input parameters being sent\n",
-                                                        "magenta",
-                                                    )
-                                                )
-
-                                elif "agentCollaboratorInvocationInput" in _input:
-                                    _collab_name = _input[
-                                        "agentCollaboratorInvocationInput"
-                                    ]["agentCollaboratorName"]
-                                    _sub_agent_name = _collab_name
-                                    _collab_input_text = _input[
-                                        "agentCollaboratorInvocationInput"
-                                    ]["input"]["text"]
-                                    _collab_arn = _input[
-                                        "agentCollaboratorInvocationInput"
-                                    ]["agentCollaboratorAliasArn"]
-                                    _collab_ids = _collab_arn.split("/", 1)[1]
-
-                                    if trace_level == "outline":
-                                        print(
-                                            colored(
-                                                f"Using sub-agent collaborator: '{_collab_name} [{_collab_ids}]'",
-                                                "magenta",
-                                            )
-                                        )
-                                    else:
-                                        print(
-                                            colored(
-                                                f"Using sub-agent collaborator: '{_collab_name} [{_collab_ids}]' passing input text:",
-                                                "magenta",
-                                            )
-                                        )
-                                        print(
-                                            colored(
-                                                f"{_collab_input_text[0:TRACE_TRUNCATION_LENGTH]}\n",
-                                                "magenta",
-                                            )
-                                        )
-
-                                elif "codeInterpreterInvocationInput" in _input:
-                                    if trace_level == "outline":
-                                        print(
-                                            colored(
-                                                f"Using code interpreter", "magenta"
-                                            )
-                                        )
-                                    else:
-                                        console = Console()
-                                        _gen_code = _input[
-                                            "codeInterpreterInvocationInput"
-                                        ]["code"]
-                                        _code = f"```python\n{_gen_code}\n```"
-
-                                        console.print(
-                                            Markdown(f"**Generated code**\n{_code}")
-                                        )
-
-                                elif "knowledgeBaseLookupInput" in _input:
-                                    if trace_level == "outline":
-                                        print(
-                                            colored(f"Using knowledge base", "magenta")
-                                        )
-                                    else:
-                                        _kb_id = _input["knowledgeBaseLookupInput"][
-                                            "knowledgeBaseId"
-                                        ]
-                                        _kb_query = _input["knowledgeBaseLookupInput"][
-                                            "text"
-                                        ]
-                                        print(
-                                            colored(
-                                                f"Using knowledge base id: {_kb_id} to search for:",
-                                                "magenta",
-                                            )
-                                        )
-                                        print(colored(f"  {_kb_query}\n", "magenta"))
-
-                            if "observation" in _orch:
-                                if trace_level == "core":
-                                    _output = _orch["observation"]
-                                    if "actionGroupInvocationOutput" in _output:
-                                        print(
-                                            colored(
-                                                f"--tool outputs:\n{_output['actionGroupInvocationOutput']['text'][0:TRACE_TRUNCATION_LENGTH]}...\n",
-                                                "magenta",
-                                            )
-                                        )
-
-                                    if "agentCollaboratorInvocationOutput" in _output:
-                                        _collab_name = _output[
-                                            "agentCollaboratorInvocationOutput"
-                                        ]["agentCollaboratorName"]
-                                        _collab_output_text = _output[
-                                            "agentCollaboratorInvocationOutput"
-                                        ]["output"]["text"][0:TRACE_TRUNCATION_LENGTH]
-                                        print(
-                                            colored(
-                                                f"\n----sub-agent {_collab_name} output text:\n{_collab_output_text}...\n",
-                                                "magenta",
-                                            )
-                                        )
-
-                                    if "codeInterpreterInvocationOutput" in _output:
-                                        if (
-                                            "executionError"
-                                            in _output[
-                                                "codeInterpreterInvocationOutput"
-                                            ]
-                                        ):
-                                            _err = _output[
-                                                "codeInterpreterInvocationOutput"
-                                            ]["executionError"]
-                                            print(
-                                                colored(
-                                                    f"--- Code interpreter execution ERROR:\n{_err}\n---\n",
-                                                    "red",
-                                                )
-                                            )
-                                        elif (
-                                            "executionOutput"
-                                            in _output[
-                                                "codeInterpreterInvocationOutput"
-                                            ]
-                                        ):
-                                            _output = _output[
-                                                "codeInterpreterInvocationOutput"
-                                            ]["executionOutput"]
-                                            print(
-                                                colored(
-                                                    f"--- Code interpreter execution OUTPUT:\n{_output}\n---\n",
-                                                    "magenta",
-                                                )
-                                            )
-
-                                    if "knowledgeBaseLookupOutput" in _output:
-                                        _refs = _output["knowledgeBaseLookupOutput"][
-                                            "retrievedReferences"
-                                        ]
-                                        _ref_count = len(_refs)
-                                        print(
-                                            colored(
-                                                f"Knowledge base lookup output, {_ref_count} references:\n",
-                                                "magenta",
-                                            )
-                                        )
-                                        _curr = 1
-                                        for _ref in _refs:
-                                            print(
-                                                colored(
-                                                    f"  ({_curr}) {_ref['content']['text'][0:TRACE_TRUNCATION_LENGTH]}...\n",
-                                                    "magenta",
-                                                )
-                                            )
-                                            _curr += 1
-
-                                    if "finalResponse" in _output:
-                                        print(
-                                            colored(
-                                                f"Final response:\n{_output['finalResponse']['text'][0:TRACE_TRUNCATION_LENGTH]}...",
-                                                "cyan",
-                                            )
-                                        )
-
-                        if "modelInvocationOutput" in _orch:
-                            if _sub_agent_alias_id is not None:
-                                _sub_step += 1
-                                print(
-                                    colored(
-                                        f"---- Step {_orch_step}.{_sub_step} [using sub-agent name:{_sub_agent_name}, id:{_sub_agent_alias_id}] ----",
-                                        "green",
-                                    )
-                                )
-                            else:
-                                _orch_step += 1
-                                _sub_step = 0
-                                print(colored(f"---- Step {_orch_step} ----", "green"))
-
-                            _total_llm_calls += 1
-                            _orch_duration = (
-                                datetime.datetime.now() - _time_before_orchestration
-                            )
-
-                            if "metadata" in _orch["modelInvocationOutput"]:
-                                _llm_usage = _orch["modelInvocationOutput"]["metadata"][
-                                    "usage"
-                                ]
-                                _in_tokens = _llm_usage["inputTokens"]
-                                _total_in_tokens += _in_tokens
-
-                                _out_tokens = _llm_usage["outputTokens"]
-                                _total_out_tokens += _out_tokens
-
-                                print(
-                                    colored(
-                                        f"Took {_orch_duration.total_seconds():,.1f}s, using {_in_tokens+_out_tokens} tokens (in: {_in_tokens}, out: {_out_tokens}) to complete prior action, observe, orchestrate.",
-                                        "yellow",
-                                    )
-                                )
-                            else:
-                                print(
-                                    colored(
-                                        f"Took {_orch_duration.total_seconds():,.1f}s [token count metadata was not returned] to complete prior action, observe, orchestrate.",
-                                        "yellow",
-                                    )
-                                )
-
-                            # restart the clock for next step/sub-step
-                            _time_before_orchestration = datetime.datetime.now()
-
-                    elif "preProcessingTrace" in _event["trace"]["trace"]:
-                        _pre = _event["trace"]["trace"]["preProcessingTrace"]
-                        if "modelInvocationOutput" in _pre:
-                            _llm_usage = _pre["modelInvocationOutput"]["metadata"][
-                                "usage"
-                            ]
-                            _in_tokens = _llm_usage["inputTokens"]
-                            _total_in_tokens += _in_tokens
-
-                            _out_tokens = _llm_usage["outputTokens"]
-                            _total_out_tokens += _out_tokens
-
-                            _total_llm_calls += 1
-
-                            print(
-                                colored(
-                                    "Pre-processing trace, agent came up with an initial plan.",
-                                    "yellow",
-                                )
-                            )
-                            print(
-                                colored(
-                                    f"Used LLM tokens, in: {_in_tokens}, out: {_out_tokens}",
-                                    "yellow",
-                                )
-                            )
-
-                    elif "postProcessingTrace" in _event["trace"]["trace"]:
-                        _post = _event["trace"]["trace"]["postProcessingTrace"]
-                        if "modelInvocationOutput" in _post:
-                            _llm_usage = _post["modelInvocationOutput"]["metadata"][
-                                "usage"
-                            ]
-                            _in_tokens = _llm_usage["inputTokens"]
-                            _total_in_tokens += _in_tokens
-
-                            _out_tokens = _llm_usage["outputTokens"]
-                            _total_out_tokens += _out_tokens
-
-                            _total_llm_calls += 1
-                            print(colored("Agent post-processing complete.", "yellow"))
-                            print(
-                                colored(
-                                    f"Used LLM tokens, in: {_in_tokens}, out: {_out_tokens}",
-                                    "yellow",
-                                )
-                            )
-
-                    if trace_level == "all":
-                        print(json.dumps(_event["trace"], indent=2))
-
-                if "files" in _event.keys() and enable_trace:
-                    console = Console()
-                    files_event = _event["files"]
-                    console.print(Markdown("**Files**"))
-
-                    files_list = files_event["files"]
-                    for this_file in files_list:
-                        print(f"{this_file['name']} ({this_file['type']})")
-                        file_bytes = this_file["bytes"]
-
-                        # save bytes to file, given the name of file and the bytes
-                        file_name = os.path.join("output", this_file["name"])
-                        with open(file_name, "wb") as f:
-                            f.write(file_bytes)
-                        # if this_file['type'] == 'image/png' or this_file['type'] == 'image/jpeg':
-                        #     img = mpimg.imread(file_name)
-                        #     # plt.imshow(img)
-                        #     # plt.show()
-
-            if enable_trace:
-                duration = datetime.datetime.now() - _time_before_call
-
-                if trace_level in ["core", "outline"]:
-                    print(
-                        colored(
-                            f"Agent made a total of {_total_llm_calls} LLM calls, "
-                            + f"using {_total_in_tokens+_total_out_tokens} tokens "
-                            + f"(in: {_total_in_tokens}, out: {_total_out_tokens})"
-                            + f", and took {duration.total_seconds():,.1f} total seconds",
-                            "yellow",
-                        )
-                    )
-
-                if trace_level == "all":
-                    print(f"Returning agent answer as: {_agent_answer}")
-
-            # if stream_final_response and enable_trace and trace_level == "all":
-            #     print(f"\nagent answer: ^^^{_agent_answer}^^^\n")
+            _state = _processor.run(_agent_resp["completion"])
+            if _state.return_control is not None:
+                return _state.return_control
 
-            _agent_answer = self._make_fully_cited_answer(
-                _agent_answer, _citations_event, enable_trace, trace_level
+            return self._make_fully_cited_answer(
+                _state.answer, _state.citations_event, enable_trace, trace_level
             )
 
-            return _agent_answer
-
         except Exception as e:
             print(f"Caught exception while processing input to invokeAgent:\n")
             print(f"  for input text:\n{request_params['inputText']}\n")
@@ -2004,6 +1602,7 @@ class AgentsForAmazonBedrock:
         trace_level: str = "core",
         multi_agent_names: dict = {},
         stream_final_response: bool = False,
+        sinks: List[EventSink] = None,
     ):
         """Invokes an agent with a given input text, while optional parameters
         also let you leverage an agent session, or target a specific agent alias.
@@ -2017,12 +1616,18 @@ class AgentsForAmazonBedrock:
             enable_trace (bool, optional): Whether to enable trace. Defaults to False.
             end_session (bool, optional): Whether to end the session. Defaults to False.
             trace_level (str, optional): The level of trace. Defaults to "none". Possible values are "none", "all", "core".
+            multi_agent_names (dict, optional): Names of collaborators by "<agentId>/<agentAliasId>", shown in their trace.
+            stream_final_response (bool, optional): Whether to stream the final response. Defaults to False.
+            sinks (List[EventSink], optional): Sinks also receiving the chunks and trace records, e.g. a ResultSink
+            or a CallbackSink. Defaults to None.
 
         Returns:
             str: The answer from the agent.
         """
 
-        _time_before_call = datetime.datetime.now()
+        _console = ConsoleSink(
+            trace_level=trace_level, stream_final_response=stream_final_response
+        )
 
         _agent_resp = self._bedrock_agent_runtime_client.invoke_agent(
             inputText=input_text,
@@ -2052,531 +1657,18 @@ class AgentsForAmazonBedrock:
                 print(_error_message)
             return _error_message
 
-        _total_in_tokens = 0
-        _total_out_tokens = 0
-        _total_llm_calls = 0
-        _orch_step = 0
-        _sub_step = 0
-        _num_response_chunks = 0
-        _time_before_orchestration = _overall_start_time = datetime.datetime.now()
-        _citations = []
-        _citations_event = None
-
-        _agent_answer = ""
-        _event_stream = _agent_resp["completion"]
+        _processor = AgentEventProcessor(
+            sinks=([_console] if enable_trace else []) + list(sinks or []),
+            agent_names=multi_agent_names,
+        )
 
         try:
-            _sub_agent_name = "<collab-name-not-yet-provided>"
-            for _event in _event_stream:
-                _sub_agent_alias_id = None
+            _state = _processor.run(_agent_resp["completion"])
 
-                if "chunk" in _event:
-                    _data = _event["chunk"]["bytes"]
-                    _tmp_agent_answer = _data.decode("utf8")
-                    if enable_trace and trace_level == "all":
-                        print(
-                            f"tmp answer: '{_tmp_agent_answer}', streaming: {stream_final_response}, trace: {enable_trace}"
-                        )
-
-                    # continue to build up the full answer
-                    _agent_answer += _tmp_agent_answer
-
-                    if _num_response_chunks == 0:
-                        _time_to_first_token = (
-                            datetime.datetime.now() - _overall_start_time
-                        )
-                        if enable_trace and stream_final_response:
-                            print(
-                                colored(
-                                    f"Time to first token: {_time_to_first_token.total_seconds():,.1f}s\n",
-                                    "yellow",
-                                )
-                            )
-                    _num_response_chunks += 1
-
-                    if (
-                        enable_trace
-                        and stream_final_response
-                        and _num_response_chunks < 3
-                    ):
-                        print(
-                            colored(
-                                f"Answer chunk [{_num_response_chunks}]: {_tmp_agent_answer}",
-                                "blue",
-                            )
-                        )
-
-                    # print all keys in _event["chunk"] dictionary if more than just 'bytes' provided
-                    if enable_trace and trace_level == "all":
-                        if len(_event["chunk"].keys()) > 1:
-                            print(
-                                f"chunk keys beyond just 'bytes': {list(_event['chunk'].keys())}"
-                            )
-
-                    # remember the citations, if any are provided
-                    if "attribution" in _event["chunk"]:
-                        if "citations" in _event["chunk"]["attribution"]:
-                            _citations_event = copy.deepcopy(_event)
-                            _citations = _event["chunk"]["attribution"]["citations"]
-                            if enable_trace and trace_level == "all":
-                                print(colored(f"Citations: {_citations}", "blue"))
-
-                if "trace" in _event and enable_trace:
-                    if trace_level == "all":
-                        print("---")
-                    else:
-                        if "callerChain" in _event["trace"]:
-                            if len(_event["trace"]["callerChain"]) > 1:
-                                _sub_agent_alias_arn = _event["trace"]["callerChain"][
-                                    1
-                                ]["agentAliasArn"]
-                                # get sub agent id by grabbing all text following the first '/' character
-                                _sub_agent_alias_id = _sub_agent_alias_arn.split(
-                                    "/", 1
-                                )[1]
-                                _sub_agent_name = multi_agent_names[_sub_agent_alias_id]
-                                # _sub_agent_name = "<not-yet-provided>"
-
-                        # if 'collaboratorName' in _event['trace']:
-                        #     _sub_agent_name = _event['trace']['collaboratorName']
-                        # else:
-                        #     _sub_agent_name = "<collab-name-not-yet-provided>"
-
-                    if "routingClassifierTrace" in _event["trace"]["trace"]:
-                        _route = _event["trace"]["trace"]["routingClassifierTrace"]
-
-                        if "modelInvocationInput" in _route:
-                            _orch_step += 1
-                            print(colored(f"---- Step {_orch_step} ----", "green"))
-                            _time_before_routing = datetime.datetime.now()
-                            print(
-                                colored(
-                                    "Classifying request to immediately route to one collaborator if possible.",
-                                    "blue",
-                                )
-                            )
-
-                        if "modelInvocationOutput" in _route:
-                            _llm_usage = _route["modelInvocationOutput"]["metadata"][
-                                "usage"
-                            ]
-                            _in_tokens = _llm_usage["inputTokens"]
-                            _total_in_tokens += _in_tokens
-
-                            _out_tokens = _llm_usage["outputTokens"]
-                            _total_out_tokens += _out_tokens
-
-                            _total_llm_calls += 1
-                            _route_duration = (
-                                datetime.datetime.now() - _time_before_routing
-                            )
-
-                            # _raw_resp_str = _route["modelInvocationOutput"][
-                            #     "rawResponse"
-                            # ]["content"]
-                            # _raw_resp = json.loads(_raw_resp_str)
-                            # _classification = (
-                            #     _raw_resp["content"][0]["text"]
-                            #     .replace("<a>", "")
-                            #     .replace("</a>", "")
-                            # )
-                            
-                            _content = json.loads(_route["modelInvocationOutput"]["rawResponse"]["content"])
-                            if 'content' in _content.keys():
-                                _classification = _content["content"][0]["text"]
-                            else:
-                                _classification = _content["output"]["message"]["content"][0]["text"]
-                            _classification = _classification.replace("<a>", "").replace("</a>", "")
-
-
-                            if _classification == UNDECIDABLE_CLASSIFICATION:
-                                print(
-                                    colored(
-                                        f"Routing classifier did not find a matching collaborator. Reverting to 'SUPERVISOR' mode.",
-                                        "magenta",
-                                    )
-                                )
-                            elif _classification == "keep_previous_agent":
-                                print(
-                                    colored(
-                                        f"Continuing conversation with previous collaborator.",
-                                        "magenta",
-                                    )
-                                )
-                                # # since we replaced the typical orchestration step with a simple routing
-                                # # classification, bump the step count.
-                                # _orch_step += 1
-                            else:
-                                _sub_agent_name = _classification
-                                print(
-                                    colored(
-                                        f"Routing classifier chose collaborator: '{_classification}'",
-                                        "magenta",
-                                    )
-                                )
-                                # # since we replaced the typical orchestration step with a simple routing
-                                # # classification, bump the step count.
-                                # _orch_step += 1
-                            print(
-                                colored(
-                                    f"Routing classifier took {_route_duration.total_seconds():,.1f}s, using {_in_tokens+_out_tokens} tokens (in: {_in_tokens}, out: {_out_tokens}).\n",
-                                    "yellow",
-                                )
-                            )
-
-                    if "failureTrace" in _event["trace"]["trace"]:
-                        print(
-                            colored(
-                                f"Agent error: {_event['trace']['trace']['failureTrace']['failureReason']}",
-                                "red",
-                            )
-                        )
-
-                    if "orchestrationTrace" in _event["trace"]["trace"]:
-                        _orch = _event["trace"]["trace"]["orchestrationTrace"]
-
-                        if trace_level in ["core", "outline"]:
-                            if "rationale" in _orch:
-                                _rationale = _orch["rationale"]
-                                print(colored(f"{_rationale['text']}", "blue"))
-
-                            if "invocationInput" in _orch:
-                                # NOTE: when agent determines invocations should happen in parallel
-                                # the trace objects for invocation input still come back one at a time.
-                                _input = _orch["invocationInput"]
-
-                                if "actionGroupInvocationInput" in _input:
-                                    if trace_level == "outline":
-                                        print(
-                                            colored(
-                                                f"Using tool: {_input['actionGroupInvocationInput']['function']}",
-                                                "magenta",
-                                            )
-                                        )
-                                    else:
-                                        if (
-                                            "function"
-                                            not in _input["actionGroupInvocationInput"]
-                                        ):
-                                            print(
-                                                colored(
-                                                    f"EXPECTING to capture 'Using tool', but 'function' not found\n{_input['actionGroupInvocationInput']}",
-                                                    "red",
-                                                )
-                                            )
-                                        else:
-                                            print(
-                                                colored(
-                                                    f"Using tool: {_input['actionGroupInvocationInput']['function']} with these inputs:",
-                                                    "magenta",
-                                                )
-                                            )
-                                            if (
-                                                "parameters"
-                                                in _input["actionGroupInvocationInput"]
-                                            ):
-                                                if (
-                                                    len(
-                                                        _input[
-                                                            "actionGroupInvocationInput"
-                                                        ]["parameters"]
-                                                    )
-                                                    == 1
-                                                ) and (
-                                                    _input[
-                                                        "actionGroupInvocationInput"
-                                                    ]["parameters"][0]["name"]
-                                                    == "input_text"
-                                                ):
-                                                    print(
-                                                        colored(
-                                                            f"{_input['actionGroupInvocationInput']['parameters'][0]['value']}",
-                                                            "magenta",
-                                                        )
-                                                    )
-                                                else:
-                                                    print(
-                                                        colored(
-                                                            f"{_input['actionGroupInvocationInput']['parameters']}\n",
-                                                            "magenta",
-                                                        )
-                                                    )
-                                            else:
-                                                print(
-                                                    colored(
-                                                        f"    no input parameters being sent\n",
-                                                        "magenta",
-                                                    )
-                                                )
-
-                                elif "agentCollaboratorInvocationInput" in _input:
-                                    _collab_name = _input[
-                                        "agentCollaboratorInvocationInput"
-                                    ]["agentCollaboratorName"]
-                                    _sub_agent_name = _collab_name
-                                    _collab_input_text = _input[
-                                        "agentCollaboratorInvocationInput"
-                                    ]["input"]["text"]
-                                    _collab_arn = _input[
-                                        "agentCollaboratorInvocationInput"
-                                    ]["agentCollaboratorAliasArn"]
-                                    _collab_ids = _collab_arn.split("/", 1)[1]
-
-                                    if trace_level == "outline":
-                                        print(
-                                            colored(
-                                                f"Using sub-agent collaborator: '{_collab_name} [{_collab_ids}]'",
-                                                "magenta",
-                                            )
-                                        )
-                                    else:
-                                        print(
-                                            colored(
-                                                f"Using sub-agent collaborator: '{_collab_name} [{_collab_ids}]' passing input text:",
-                                                "magenta",
-                                            )
-                                        )
-                                        print(
-                                            colored(
-                                                f"{_collab_input_text[0:TRACE_TRUNCATION_LENGTH]}\n",
-                                                "magenta",
-                                            )
-                                        )
-
-                                elif "codeInterpreterInvocationInput" in _input:
-                                    if trace_level == "outline":
-                                        print(
-                                            colored(
-                                                f"Using code interpreter", "magenta"
-                                            )
-                                        )
-                                    else:
-                                        console = Console()
-                                        _gen_code = _input[
-                                            "codeInterpreterInvocationInput"
-                                        ]["code"]
-                                        _code = f"```python\n{_gen_code}\n```"
-
-                                        console.print(
-                                            Markdown(f"**Generated code**\n{_code}")
-                                        )
-
-                                elif "knowledgeBaseLookupInput" in _input:
-                                    if trace_level == "outline":
-                                        print(
-                                            colored(f"Using knowledge base", "magenta")
-                                        )
-                                    else:
-                                        _kb_id = _input["knowledgeBaseLookupInput"][
-                                            "knowledgeBaseId"
-                                        ]
-                                        _kb_query = _input["knowledgeBaseLookupInput"][
-                                            "text"
-                                        ]
-                                        print(
-                                            colored(
-                                                f"Using knowledge base id: {_kb_id} to search for:",
-                                                "magenta",
-                                            )
-                                        )
-                                        print(colored(f"  {_kb_query}\n", "magenta"))
-
-                            if "observation" in _orch:
-                                if trace_level == "core":
-                                    _output = _orch["observation"]
-                                    if "actionGroupInvocationOutput" in _output:
-                                        print(
-                                            colored(
-                                                f"--tool outputs:\n{_output['actionGroupInvocationOutput']['text'][0:TRACE_TRUNCATION_LENGTH]}...\n",
-                                                "magenta",
-                                            )
-                                        )
-
-                                    if "agentCollaboratorInvocationOutput" in _output:
-                                        _collab_name = _output[
-                                            "agentCollaboratorInvocationOutput"
-                                        ]["agentCollaboratorName"]
-                                        _collab_output_text = _output[
-                                            "agentCollaboratorInvocationOutput"
-                                        ]["output"]["text"][0:TRACE_TRUNCATION_LENGTH]
-                                        print(
-                                            colored(
-                                                f"\n----sub-agent {_collab_name} output text:\n{_collab_output_text}...\n",
-                                                "magenta",
-                                            )
-                                        )
-
-                                    if "knowledgeBaseLookupOutput" in _output:
-                                        _refs = _output["knowledgeBaseLookupOutput"][
-                                            "retrievedReferences"
-                                        ]
-                                        _ref_count = len(_refs)
-                                        print(
-                                            colored(
-                                                f"Knowledge base lookup output, {_ref_count} references:\n",
-                                                "magenta",
-                                            )
-                                        )
-                                        _curr = 1
-                                        for _ref in _refs:
-                                            print(
-                                                colored(
-                                                    f"  ({_curr}) {_ref['content']['text'][0:TRACE_TRUNCATION_LENGTH]}...\n",
-                                                    "magenta",
-                                                )
-                                            )
-                                            _curr += 1
-
-                                    if "finalResponse" in _output:
-                                        print(
-                                            colored(
-                                                f"Final response:\n{_output['finalResponse']['text'][0:TRACE_TRUNCATION_LENGTH]}...",
-                                                "cyan",
-                                            )
-                                        )
-
-                        if "modelInvocationOutput" in _orch:
-                            if _sub_agent_alias_id is not None:
-                                _sub_step += 1
-                                print(
-                                    colored(
-                                        f"---- Step {_orch_step}.{_sub_step} [using sub-agent name:{_sub_agent_name}, id:{_sub_agent_alias_id}] ----",
-                                        "green",
-                                    )
-                                )
-                            else:
-                                _orch_step += 1
-                                _sub_step = 0
-                                print(colored(f"---- Step {_orch_step} ----", "green"))
-
-                            _total_llm_calls += 1
-                            _orch_duration = (
-                                datetime.datetime.now() - _time_before_orchestration
-                            )
-
-                            if "metadata" in _orch["modelInvocationOutput"]:
-                                _llm_usage = _orch["modelInvocationOutput"]["metadata"][
-                                    "usage"
-                                ]
-                                _in_tokens = _llm_usage["inputTokens"]
-                                _total_in_tokens += _in_tokens
-
-                                _out_tokens = _llm_usage["outputTokens"]
-                                _total_out_tokens += _out_tokens
-
-                                print(
-                                    colored(
-                                        f"Took {_orch_duration.total_seconds():,.1f}s, using {_in_tokens+_out_tokens} tokens (in: {_in_tokens}, out: {_out_tokens}) to complete prior action, observe, orchestrate.",
-                                        "yellow",
-                                    )
-                                )
-                            else:
-                                print(
-                                    colored(
-                                        f"Took {_orch_duration.total_seconds():,.1f}s [token count metadata was not returned] to complete prior action, observe, orchestrate.",
-                                        "yellow",
-                                    )
-                                )
-
-                            # restart the clock for next step/sub-step
-                            _time_before_orchestration = datetime.datetime.now()
-
-                    elif "preProcessingTrace" in _event["trace"]["trace"]:
-                        _pre = _event["trace"]["trace"]["preProcessingTrace"]
-                        if "modelInvocationOutput" in _pre:
-                            _llm_usage = _pre["modelInvocationOutput"]["metadata"][
-                                "usage"
-                            ]
-                            _in_tokens = _llm_usage["inputTokens"]
-                            _total_in_tokens += _in_tokens
-
-                            _out_tokens = _llm_usage["outputTokens"]
-                            _total_out_tokens += _out_tokens
-
-                            _total_llm_calls += 1
-
-                            print(
-                                colored(
-                                    "Pre-processing trace, agent came up with an initial plan.",
-                                    "yellow",
-                                )
-                            )
-                            print(
-                                colored(
-                                    f"Used LLM tokens, in: {_in_tokens}, out: {_out_tokens}",
-                                    "yellow",
-                                )
-                            )
-
-                    elif "postProcessingTrace" in _event["trace"]["trace"]:
-                        _post = _event["trace"]["trace"]["postProcessingTrace"]
-                        if "modelInvocationOutput" in _post:
-                            _llm_usage = _post["modelInvocationOutput"]["metadata"][
-                                "usage"
-                            ]
-                            _in_tokens = _llm_usage["inputTokens"]
-                            _total_in_tokens += _in_tokens
-
-                            _out_tokens = _llm_usage["outputTokens"]
-                            _total_out_tokens += _out_tokens
-
-                            _total_llm_calls += 1
-                            print(colored("Agent post-processing complete.", "yellow"))
-                            print(
-                                colored(
-                                    f"Used LLM tokens, in: {_in_tokens}, out: {_out_tokens}",
-                                    "yellow",
-                                )
-                            )
-
-                    if trace_level == "all":
-                        print(json.dumps(_event["trace"], indent=2))
-
-                if "files" in _event.keys() and enable_trace:
-                    console = Console()
-                    files_event = _event["files"]
-                    console.print(Markdown("**Files**"))
-
-                    files_list = files_event["files"]
-                    for this_file in files_list:
-                        print(f"{this_file['name']} ({this_file['type']})")
-                        file_bytes = this_file["bytes"]
-
-                        # save bytes to file, given the name of file and the bytes
-                        file_name = os.path.join("output", this_file["name"])
-                        with open(file_name, "wb") as f:
-                            f.write(file_bytes)
-                        # if this_file['type'] == 'image/png' or this_file['type'] == 'image/jpeg':
-                        #     img = mpimg.imread(file_name)
-                        #     # plt.imshow(img)
-                        #     # plt.show()
-
-            if enable_trace:
-                duration = datetime.datetime.now() - _time_before_call
-
-                if trace_level in ["core", "outline"]:
-                    print(
-                        colored(
-                            f"Agent made a total of {_total_llm_calls} LLM calls, "
-                            + f"using {_total_in_tokens+_total_out_tokens} tokens "
-                            + f"(in: {_total_in_tokens}, out: {_total_out_tokens})"
-                            + f", and took {duration.total_seconds():,.1f} total seconds",
-                            "yellow",
-                        )
-                    )
-
-                if trace_level == "all":
-                    print(f"Returning agent answer as: {_agent_answer}")
-
-            if stream_final_response and enable_trace and trace_level == "all":
-                print(f"\nagent answer: ^^^{_agent_answer}^^^\n")
-
-            _agent_answer = self._make_fully_cited_answer(
-                _agent_answer, _citations_event, enable_trace, trace_level
+            return self._make_fully_cited_answer(
+                _state.answer, _state.citations_event, enable_trace, trace_level
             )
 
-            return _agent_answer
-
         except Exception as e:
             print(f"Caught exception while processing input to invokeAgent:\n")
             print(f"  for input text:\n{input_text}\n")
@@ -2678,6 +1770,8 @@ class AgentsForAmazonBedrock:
         new_model_id: str = None,
         new_instructions: str = None,
         guardrail_id: str = None,
+        new_description: str = None,
+        prepare: bool = True,
     ):
         """Updates an agent with new details.
 
@@ -2686,6 +1780,9 @@ class AgentsForAmazonBedrock:
             new_model_id (str, optional): The new model ID to use. Defaults to None.
             new_instructions (str, optional): The new instructions to use. Defaults to None.
             guardrail_id (str, optional): ID of the new guardrail to use. Defaults to None.
+            new_description (str, optional): The new description to use. Defaults to None.
+            prepare (bool, optional): Whether to prepare the agent, e.g. not when it is prepared
+            once all its changes are made. Defaults to True.
 
         Returns:
             dict: UpdateAgent response.
@@ -2705,6 +1802,9 @@ class AgentsForAmazonBedrock:
         if new_instructions is not None:
             _agent_details["instruction"] = new_instructions
 
+        if new_description is not None:
+            _agent_details["description"] = new_description
+
         # Update guardrail or if there was none, this will add it.
         if guardrail_id is not None:
             _agent_details["guardrailConfiguration"] = {
@@ -2748,10 +1848,11 @@ class AgentsForAmazonBedrock:
             **_agent_details
         )
 
-        time.sleep(3)
+        self.wait_agent_status_update(_agent_id)
 
         # Prepare Agent
-        self._bedrock_agent_client.prepare_agent(agentId=_agent_id)
+        if prepare:
+            self._bedrock_agent_client.prepare_agent(agentId=_agent_id)
 
         return _update_agent_response
 
@@ -2777,14 +1878,123 @@ class AgentsForAmazonBedrock:
         except self._dynamodb_client.exceptions.ResourceInUseException:
             print(f"Table {table_name} already exists, skipping table creation step")
 
-    def load_dynamodb(self, table_name: str, items: List):
-        try:
+    @staticmethod
+    def _projection(projection: List[str] = None) -> Dict:
+        if not projection:
+            return {}
+        _names = {f"#p{idx}": name for idx, name in enumerate(projection)}
+        return {
+            "ProjectionExpression": ", ".join(_names),
+            "ExpressionAttributeNames": _names,
+        }
 
-            table = self._dynamodb_resource.Table(table_name)
-            for item in items:
-                table.put_item(Item=item)
-        except self._dynamodb_client.exceptions.ResourceInUseException:
+    def load_dynamodb(
+        self,
+        table_name: str,
+        items: List,
+        segments: int = DEFAULT_MAX_WORKERS,
+        overwrite_by_pkeys: List[str] = None,
+    ) -> int:
+        """Loads items into a DynamoDB table with batch writes, in parallel segments.
+
+        Each segment writes batches of up to 25 items through a `batch_writer` of its own,
+        which resends the items DynamoDB returns as unprocessed. Items with the same key are
+        de-duplicated beforehand, the last one winning as with sequential writes, since a
+        batch can't contain the same key twice and segments are written in no set order.
+
+        Args:
+            table_name (str): name of the table
+            items (List): items to write
+            segments (int, optional): number of segments written concurrently. Defaults to 4.
+            overwrite_by_pkeys (List[str], optional): key attributes to de-duplicate items by.
+            Defaults to the key schema of the table.
+
+        Returns:
+            int: number of items written
+        """
+        if items:
+            _pkeys = overwrite_by_pkeys or [
+                _key["AttributeName"]
+                for _key in self._dynamodb_resource.Table(table_name).key_schema
+            ]
+            items = list(
+                {tuple(item.get(_pkey) for _pkey in _pkeys): item for item in items}.values()
+            )
+        _segments = [
+            items[idx::segments] for idx in range(segments) if items[idx::segments]
+        ]
+
+        def _load(table, segment: List) -> int:
+            with table.batch_writer() as batch:
+                for item in segment:
+                    batch.put_item(Item=item)
+            return len(segment)
+
+        # a table object per thread, all sharing the thread-safe client
+        _tables = [self._dynamodb_resource.Table(table_name) for _ in _segments]
+        try:
+            with ThreadPoolExecutor(max_workers=max(len(_segments), 1)) as executor:
+                return sum(executor.map(_load, _tables, _segments))
+        except ClientError as e:
+            if e.response["Error"]["Code"] != "ResourceInUseException":
+                raise
             print(f"Error on loading process for table: {table_name}.")
+            return 0
+
+    def iter_query_dynamodb(
+        self,
+        table_name: str,
+        pk_field: str,
+        pk_value: str,
+        sk_field: str = None,
+        sk_value: str = None,
+        projection: List[str] = None,
+        limit: int = None,
+        page_size: int = None,
+    ) -> Iterator[Dict]:
+        """Yields the items of a partition, following `LastEvaluatedKey` across pages.
+
+        Args:
+            table_name (str): name of the table
+            pk_field (str): name of the partition key
+            pk_value (str): value of the partition key
+            sk_field (str, optional): name of the sort key. Defaults to None.
+            sk_value (str, optional): prefix of the sort key values to return. Defaults to None.
+            projection (List[str], optional): attributes to return, all if not set. Defaults to None.
+            limit (int, optional): number of items to return at most. Defaults to None.
+            page_size (int, optional): number of items to read per request. Defaults to None.
+        """
+        if limit == 0:
+            return
+        table = self._dynamodb_resource.Table(table_name)
+        # Create expression
+        if sk_field:
+            key_expression = Key(pk_field).eq(pk_value) & Key(sk_field).begins_with(
+                sk_value
+            )
+        else:
+            key_expression = Key(pk_field).eq(pk_value)
+
+        _kwargs = {
+            "KeyConditionExpression": key_expression,
+            **self._projection(projection),
+        }
+        _remaining = limit
+        while True:
+            _limits = [_limit for _limit in (page_size, _remaining) if _limit]
+            if _limits:
+                _kwargs["Limit"] = min(_limits)
+            query_data = table.query(**_kwargs)
+            for item in query_data["Items"]:
+                yield item
+
+            if _remaining is not None:
+                _remaining -= len(query_data["Items"])
+                if _remaining <= 0:
+                    return
+            if "LastEvaluatedKey" not in query_data:
+                return
+            _kwargs["ExclusiveStartKey"] = query_data["LastEvaluatedKey"]
 
     def query_dynamodb(
         self,
@@ -2793,23 +2003,64 @@ class AgentsForAmazonBedrock:
         pk_value: str,
         sk_field: str = None,
         sk_value: str = None,
+        projection: List[str] = None,
+        limit: int = None,
     ):
+        """Returns all items of a partition, see `iter_query_dynamodb`."""
         try:
-
-            table = self._dynamodb_resource.Table(table_name)
-            # Create expression
-            if sk_field:
-                key_expression = Key(pk_field).eq(pk_value) & Key(sk_field).begins_with(
-                    sk_value
+            return list(
+                self.iter_query_dynamodb(
+                    table_name,
+                    pk_field,
+                    pk_value,
+                    sk_field,
+                    sk_value,
+                    projection=projection,
+                    limit=limit,
                 )
-            else:
-                key_expression = Key(pk_field).eq(pk_value)
-
-            query_data = table.query(KeyConditionExpression=key_expression)
-            return query_data["Items"]
+            )
         except self._dynamodb_client.exceptions.ResourceInUseException:
             print(f"Error querying table: {table_name}.")
 
+    def scan_dynamodb(
+        self,
+        table_name: str,
+        segments: int = DEFAULT_MAX_WORKERS,
+        projection: List[str] = None,
+        filter_expression=None,
+    ) -> List[Dict]:
+        """Returns all items of a table, scanning its segments in parallel.
+
+        Args:
+            table_name (str): name of the table
+            segments (int, optional): number of segments scanned concurrently. Defaults to 4.
+            projection (List[str], optional): attributes to return, all if not set. Defaults to None.
+            filter_expression (optional): condition items must meet, e.g. `Attr("status").eq("open")`.
+            Defaults to None.
+        """
+        _kwargs = {"TotalSegments": segments, **self._projection(projection)}
+        if filter_expression is not None:
+            _kwargs["FilterExpression"] = filter_expression
+
+        def _scan(table, segment: int) -> List[Dict]:
+            _items = []
+            _segment_kwargs = dict(_kwargs, Segment=segment)
+            while True:
+                scan_data = table.scan(**_segment_kwargs)
+                _items.extend(scan_data["Items"])
+                if "LastEvaluatedKey" not in scan_data:
+                    return _items
+                _segment_kwargs["ExclusiveStartKey"] = scan_data["LastEvaluatedKey"]
+
+        # a table object per thread, all sharing the thread-safe client
+        _tables = [self._dynamodb_resource.Table(table_name) for _ in range(segments)]
+        with ThreadPoolExecutor(max_workers=segments) as executor:
+            return [
+                item
+                for items in executor.map(_scan, _tables, range(segments))
+                for item in items
+            ]
+
     def create_lambda_file(self, func: Callable, output_dir: str = ".") -> str:
         """
         Creates a Lambda function file that wraps the given function with the necessary handler code.
@@ -2821,6 +2072,12 @@ class AgentsForAmazonBedrock:
         Returns:
             str: Path to the created Lambda file
         """
+        # The code object of a function changes when it is redefined, a wrapper written for
+        # it before is still current
+        _cache_key = (func.__code__, os.path.abspath(output_dir))
+        if os.path.exists(self._lambda_files.get(_cache_key, "")):
+            return self._lambda_files[_cache_key]
+
         # Get the function's source code
         func_source = inspect.getsource(func)
 
@@ -2894,9 +2151,16 @@ class AgentsForAmazonBedrock:
         # Create output directory if it doesn't exist
         os.makedirs(output_dir, exist_ok=True)
 
-        # Create the Lambda file
+        # Create the Lambda file, leaving an unchanged one untouched
         file_path = os.path.join(output_dir, f"lambda_{func_name}.py")
-        with open(file_path, "w") as f:
-            f.write("\n".join(lambda_code))
-
+        lambda_source = "\n".join(lambda_code)
+        _current = None
+        if os.path.exists(file_path):
+            with open(file_path) as f:
+                _current = f.read()
+        if _current != lambda_source:
+            with open(file_path, "w") as f:
+                f.write(lambda_source)
+
+        self._lambda_files[_cache_key] = file_path
         return file_path
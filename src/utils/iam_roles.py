@@ -0,0 +1,220 @@
+# Copyright 2024 Amazon.com and its affiliates; all rights reserved.
+# This file is AWS Content and may not be duplicated or distributed without permission
+
+"""
+Idempotent IAM roles for agents and their Lambda functions.
+
+An IamRoleManager makes sure a role exists with a given trust policy, inline policies and
+managed policies, and remembers the fingerprint of every role it ensured. A role that
+already matches is reused without any write. Only the policies that differ are written,
+concurrently, and agents sharing a role, like the default agent role, ensure it once:
+
+    roles = IamRoleManager(iam_client)
+    role_arn = roles.ensure_role(
+        "DEFAULT_AgentExecutionRole",
+        trust_policy=DEFAULT_AGENT_IAM_ASSUME_ROLE_POLICY,
+        inline_policies={"bedrock_allow_policy": DEFAULT_AGENT_IAM_POLICY},
+    )
+
+Reading a role back from IAM succeeds before Lambda or Bedrock can assume it, so the
+manager does not wait for changes to propagate. Callers creating a Lambda function or an
+agent with the role retry while the service reports that it can't assume it yet.
+"""
+
+import hashlib
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Tuple, Union
+
+PolicyDocument = Union[Dict, str]
+
+
+def _canonical(document: PolicyDocument) -> str:
+    if isinstance(document, str):
+        document = json.loads(document)
+    return json.dumps(document, sort_keys=True, separators=(",", ":"))
+
+
+@dataclass
+class RoleSpec:
+    name: str
+    trust_policy: PolicyDocument
+    inline_policies: Dict[str, PolicyDocument] = field(default_factory=dict)
+    managed_policy_arns: List[str] = field(default_factory=list)
+
+    def fingerprint(self) -> str:
+        """Hash of the policies of the role, independent of key order and whitespace."""
+        spec = {
+            "trust_policy": _canonical(self.trust_policy),
+            "inline_policies": {
+                name: _canonical(document)
+                for name, document in self.inline_policies.items()
+            },
+            "managed_policy_arns": sorted(self.managed_policy_arns),
+        }
+        return hashlib.sha256(
+            json.dumps(spec, sort_keys=True).encode("utf-8")
+        ).hexdigest()
+
+
+class IamRoleManager:
+    """Creates or reuses IAM roles matching a spec, writing only what differs.
+
+    Args:
+        iam_client: IAM client to make the calls with
+        max_workers (int, optional): policies written at the same time. Defaults to 4.
+    """
+
+    def __init__(self, iam_client, max_workers: int = 4):
+        self._iam_client = iam_client
+        self._max_workers = max_workers
+        self._fingerprints: Dict[str, str] = dict()
+        self._arns: Dict[str, str] = dict()
+        self._locks: Dict[str, threading.Lock] = dict()
+        self._locks_lock = threading.Lock()
+        self.writes = 0
+
+    def _lock(self, role_name: str) -> threading.Lock:
+        with self._locks_lock:
+            return self._locks.setdefault(role_name, threading.Lock())
+
+    def _current_role(self, spec: RoleSpec) -> Optional[Dict]:
+        """The role with the policies of `spec` it currently has, None if it does not exist."""
+        try:
+            role = self._iam_client.get_role(RoleName=spec.name)["Role"]
+        except self._iam_client.exceptions.NoSuchEntityException:
+            return None
+
+        inline_policies = dict()
+        for policy_name in spec.inline_policies:
+            try:
+                inline_policies[policy_name] = self._iam_client.get_role_policy(
+                    RoleName=spec.name, PolicyName=policy_name
+                )["PolicyDocument"]
+            except self._iam_client.exceptions.NoSuchEntityException:
+                pass
+
+        attached = set()
+        paginator = self._iam_client.get_paginator("list_attached_role_policies")
+        for page in paginator.paginate(RoleName=spec.name):
+            attached.update(policy["PolicyArn"] for policy in page["AttachedPolicies"])
+
+        return {
+            "Arn": role["Arn"],
+            "AssumeRolePolicyDocument": role["AssumeRolePolicyDocument"],
+            "InlinePolicies": inline_policies,
+            "AttachedPolicyArns": attached,
+        }
+
+    def _write(self, call: Callable, **kwargs):
+        with self._locks_lock:
+            self.writes += 1
+        return call(**kwargs)
+
+    def _apply(self, spec: RoleSpec, current: Optional[Dict]) -> Tuple[str, bool]:
+        """Writes the parts of `spec` that differ from the current role, concurrently.
+
+        Returns:
+            Tuple[str, bool]: ARN of the role, and whether anything was written
+        """
+        changed = current is None
+        if current is None:
+            arn = self._write(
+                self._iam_client.create_role,
+                RoleName=spec.name,
+                AssumeRolePolicyDocument=_canonical(spec.trust_policy),
+            )["Role"]["Arn"]
+            current = {
+                "Arn": arn,
+                "AssumeRolePolicyDocument": None,
+                "InlinePolicies": dict(),
+                "AttachedPolicyArns": set(),
+            }
+            self._iam_client.get_waiter("role_exists").wait(
+                RoleName=spec.name, WaiterConfig={"Delay": 1, "MaxAttempts": 30}
+            )
+        elif _canonical(current["AssumeRolePolicyDocument"]) != _canonical(
+            spec.trust_policy
+        ):
+            changed = True
+            self._write(
+                self._iam_client.update_assume_role_policy,
+                RoleName=spec.name,
+                PolicyDocument=_canonical(spec.trust_policy),
+            )
+
+        writes = [
+            (
+                self._iam_client.put_role_policy,
+                dict(
+                    RoleName=spec.name,
+                    PolicyName=policy_name,
+                    PolicyDocument=_canonical(document),
+                ),
+            )
+            for policy_name, document in spec.inline_policies.items()
+            if policy_name not in current["InlinePolicies"]
+            or _canonical(current["InlinePolicies"][policy_name]) != _canonical(document)
+        ] + [
+            (
+                self._iam_client.attach_role_policy,
+                dict(RoleName=spec.name, PolicyArn=policy_arn),
+            )
+            for policy_arn in spec.managed_policy_arns
+            if policy_arn not in current["AttachedPolicyArns"]
+        ]
+        if writes:
+            with ThreadPoolExecutor(max_workers=self._max_workers) as executor:
+                for future in [
+                    executor.submit(self._write, call, **kwargs)
+                    for call, kwargs in writes
+                ]:
+                    future.result()
+        return current["Arn"], changed or bool(writes)
+
+    def ensure_role(
+        self,
+        role_name: str,
+        trust_policy: PolicyDocument,
+        inline_policies: Dict[str, PolicyDocument] = None,
+        managed_policy_arns: List[str] = None,
+    ) -> str:
+        """Makes sure a role exists with at least the given policies.
+
+        Inline policies and managed policies the role has on top of these are left as is.
+
+        Args:
+            role_name (str): name of the role
+            trust_policy (PolicyDocument): policy of who can assume the role
+            inline_policies (Dict[str, PolicyDocument], optional): inline policies by name
+            managed_policy_arns (List[str], optional): managed policies to attach
+
+        Returns:
+            str: ARN of the role
+        """
+        spec = RoleSpec(
+            name=role_name,
+            trust_policy=trust_policy,
+            inline_policies=inline_policies or dict(),
+            managed_policy_arns=managed_policy_arns or [],
+        )
+        fingerprint = spec.fingerprint()
+
+        # Callers ensuring the same role wait for the first one, then find it in the cache
+        with self._lock(role_name):
+            if self._fingerprints.get(role_name) == fingerprint:
+                return self._arns[role_name]
+
+            arn, _ = self._apply(spec, self._current_role(spec))
+
+            self._fingerprints[role_name] = fingerprint
+            self._arns[role_name] = arn
+            return arn
+
+    def forget(self, role_name: str):
+        """Drops a role from the cache, e.g. after deleting it."""
+        with self._lock(role_name):
+            self._fingerprints.pop(role_name, None)
+            self._arns.pop(role_name, None)
@@ -0,0 +1,506 @@
+# Copyright 2024 Amazon.com and its affiliates; all rights reserved.
+# This file is AWS Content and may not be duplicated or distributed without permission
+
+"""
+Incremental, concurrent ingestion into Knowledge Bases for Amazon Bedrock.
+
+An IngestionOrchestrator keeps a manifest with the content hash of every file it uploaded
+to the data bucket of a Knowledge Base, so re-syncing a corpus after small edits only
+uploads, or deletes, the files that changed since the last sync. Ingestion jobs for several
+Knowledge Base and data source pairs run concurrently and are polled with backoff, and every
+job started is recorded in the manifest so that tracking resumes after a restart:
+
+    with IngestionOrchestrator(kb_helper, manifest_path="ingestion.json") as orchestrator:
+        futures = orchestrator.submit(
+            [
+                IngestionTarget(kb_id, ds_id, bucket_name, source_dir="dataset/faq"),
+                IngestionTarget(other_kb_id, other_ds_id, other_bucket_name, source_dir="dataset/docs"),
+            ]
+        )
+        for target, future in futures.items():
+            print(target.key, future.result().status)
+
+The futures can be awaited from asyncio code with asyncio.wrap_future.
+"""
+
+import hashlib
+import json
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from botocore.exceptions import ClientError
+
+from src.utils.waiters import (
+    INGESTION_JOB_DONE,
+    Waiter,
+    WaiterProgress,
+    is_settled,
+    knowledge_base_status,
+    print_progress,
+)
+
+DEFAULT_MAX_WORKERS = 4
+DEFAULT_UPLOAD_WORKERS = 8
+DEFAULT_MULTIPART_CHUNKSIZE = 8 * 1024 * 1024
+MANIFEST_VERSION = 1
+# Uploads between two saves of the manifest, so an interrupted upload is not repeated
+MANIFEST_SAVE_EVERY = 100
+_HASH_CHUNK_SIZE = 1024 * 1024
+# Limits of S3 multipart uploads, as applied by boto3 when splitting files into parts
+_MIN_PART_SIZE = 5 * 1024 * 1024
+_MAX_PARTS = 10000
+
+
+@dataclass(frozen=True)
+class IngestionTarget:
+    """A Knowledge Base data source, and optionally the local directory mirrored into its bucket.
+
+    Args:
+        knowledge_base_id (str): id of the Knowledge Base
+        data_source_id (str): id of its S3 data source
+        bucket_name (str, optional): data bucket of the data source, required with `source_dir`
+        source_dir (str, optional): local directory to upload the changed files of before
+        ingesting. Without it only an ingestion job is run.
+        prefix (str, optional): key prefix of the files in the bucket. Defaults to "".
+    """
+
+    knowledge_base_id: str
+    data_source_id: str
+    bucket_name: Optional[str] = None
+    source_dir: Optional[str] = None
+    prefix: str = ""
+
+    @property
+    def key(self) -> str:
+        return f"{self.knowledge_base_id}/{self.data_source_id}"
+
+
+@dataclass
+class SyncDelta:
+    """Files to upload as (path, key) pairs and keys to delete to mirror a target's directory."""
+
+    upload: List[Tuple[str, str]] = field(default_factory=list)
+    delete: List[str] = field(default_factory=list)
+    unchanged: int = 0
+    digests: Dict[str, Dict] = field(default_factory=dict)
+
+    @property
+    def changed(self) -> bool:
+        return bool(self.upload or self.delete)
+
+
+@dataclass
+class IngestionResult:
+    target: IngestionTarget
+    uploaded: int = 0
+    deleted: int = 0
+    unchanged: int = 0
+    job: Optional[Dict] = None
+
+    @property
+    def status(self) -> str:
+        """Status of the ingestion job, UP_TO_DATE if nothing had to be ingested."""
+        return self.job["status"] if self.job else "UP_TO_DATE"
+
+
+@dataclass
+class UploadReport:
+    """Files and bytes uploaded by an upload, and how fast."""
+
+    uploaded: int = 0
+    skipped: int = 0
+    bytes: int = 0
+    seconds: float = 0.0
+
+    @property
+    def files_per_second(self) -> float:
+        return self.uploaded / self.seconds if self.seconds else 0.0
+
+    @property
+    def megabytes_per_second(self) -> float:
+        return self.bytes / 1024 / 1024 / self.seconds if self.seconds else 0.0
+
+    def __str__(self):
+        return (
+            f"Uploaded {self.uploaded} files ({self.bytes / 1024 / 1024:.1f} MB) in "
+            f"{self.seconds:.1f}s: {self.files_per_second:.1f} files/s, "
+            f"{self.megabytes_per_second:.1f} MB/s. Skipped {self.skipped} unchanged files"
+        )
+
+
+def file_etag(
+    path: str,
+    multipart_threshold: int = DEFAULT_MULTIPART_CHUNKSIZE,
+    multipart_chunksize: int = DEFAULT_MULTIPART_CHUNKSIZE,
+) -> str:
+    """ETag S3 gives a file uploaded with boto3 using the given transfer configuration.
+
+    That is the MD5 of files uploaded in one part, and the MD5 of the MD5s of the parts
+    followed by the number of parts for multipart uploads. Objects encrypted with SSE-KMS
+    have other ETags, and are always considered changed.
+    """
+    size = os.path.getsize(path)
+    if size < multipart_threshold:
+        md5 = hashlib.md5(usedforsecurity=False)
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(_HASH_CHUNK_SIZE), b""):
+                md5.update(chunk)
+        return md5.hexdigest()
+
+    part_size = max(multipart_chunksize, _MIN_PART_SIZE)
+    while -(-size // part_size) > _MAX_PARTS:
+        part_size *= 2
+    part_digests = []
+    with open(path, "rb") as f:
+        for part in iter(lambda: f.read(part_size), b""):
+            part_digests.append(hashlib.md5(part, usedforsecurity=False).digest())
+    md5 = hashlib.md5(b"".join(part_digests), usedforsecurity=False)
+    return f"{md5.hexdigest()}-{len(part_digests)}"
+
+
+def walk_files(source_dir: str, prefix: str = "") -> List[Tuple[str, str]]:
+    """Files under a directory as (path, key) pairs, keys being `prefix` and the relative path."""
+    files = []
+    for root, _, filenames in os.walk(source_dir):
+        for filename in sorted(filenames):
+            path = os.path.join(root, filename)
+            relative_path = os.path.relpath(path, source_dir)
+            files.append((path, prefix + relative_path.replace(os.sep, "/")))
+    return files
+
+
+def file_digest(path: str, previous: Optional[Dict] = None) -> Dict:
+    """SHA-256 of a file with its size and modification time.
+
+    The hash of `previous` is reused without reading the file when neither its size nor
+    its modification time changed.
+    """
+    stat = os.stat(path)
+    if (
+        previous
+        and previous.get("size") == stat.st_size
+        and previous.get("mtime_ns") == stat.st_mtime_ns
+    ):
+        return previous
+
+    sha256 = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(_HASH_CHUNK_SIZE), b""):
+            sha256.update(chunk)
+    return {
+        "sha256": sha256.hexdigest(),
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+    }
+
+
+class IngestionManifest:
+    """Content hashes of uploaded objects and the last ingestion job of every data source.
+
+    Objects are keyed by their S3 URI and jobs by Knowledge Base and data source id. The
+    manifest is saved as JSON at `path`, if given, replacing the previous file atomically.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self.objects: Dict[str, Dict] = dict()
+        self.jobs: Dict[str, Dict] = dict()
+        self._lock = threading.RLock()
+        if path is not None and os.path.exists(path):
+            self.load()
+
+    @staticmethod
+    def object_uri(bucket_name: str, key: str) -> str:
+        return f"s3://{bucket_name}/{key}"
+
+    def load(self):
+        with open(self.path) as f:
+            manifest = json.load(f)
+        if manifest.get("version") != MANIFEST_VERSION:
+            raise ValueError(
+                f"Unsupported ingestion manifest version {manifest.get('version')} in {self.path}"
+            )
+        with self._lock:
+            self.objects = manifest["objects"]
+            self.jobs = manifest["jobs"]
+
+    def save(self):
+        if self.path is None:
+            return
+        with self._lock:
+            manifest = {
+                "version": MANIFEST_VERSION,
+                "objects": self.objects,
+                "jobs": self.jobs,
+            }
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(manifest, f, indent=1, sort_keys=True)
+            os.replace(tmp_path, self.path)
+
+    def objects_under(self, bucket_name: str, prefix: str) -> Dict[str, Dict]:
+        """Recorded objects of a bucket under a key prefix, by key."""
+        uri_prefix = self.object_uri(bucket_name, prefix)
+        start = len(self.object_uri(bucket_name, ""))
+        with self._lock:
+            return {
+                uri[start:]: entry
+                for uri, entry in self.objects.items()
+                if uri.startswith(uri_prefix)
+            }
+
+    def record_object(self, bucket_name: str, key: str, digest: Dict):
+        with self._lock:
+            self.objects[self.object_uri(bucket_name, key)] = digest
+
+    def forget_object(self, bucket_name: str, key: str):
+        with self._lock:
+            self.objects.pop(self.object_uri(bucket_name, key), None)
+
+    def record_job(self, target: IngestionTarget, job: Dict):
+        with self._lock:
+            self.jobs[target.key] = {
+                "knowledgeBaseId": target.knowledge_base_id,
+                "dataSourceId": target.data_source_id,
+                "ingestionJobId": job["ingestionJobId"],
+                "status": job["status"],
+            }
+        self.save()
+
+    def pending_jobs(self) -> Dict[str, Dict]:
+        """Jobs recorded as started but not yet seen done, by data source."""
+        with self._lock:
+            return {
+                key: dict(job)
+                for key, job in self.jobs.items()
+                if job["status"] not in INGESTION_JOB_DONE
+            }
+
+
+class IngestionOrchestrator:
+    """Uploads changed files and runs ingestion jobs for several data sources concurrently.
+
+    Args:
+        kb_helper (KnowledgeBasesForAmazonBedrock): helper to upload and start ingestion jobs with
+        manifest_path (str, optional): JSON file to keep the manifest in, to only upload the
+        changes since the last sync and resume tracking jobs after a restart. Without it the
+        manifest is kept in memory.
+        max_workers (int, optional): data sources synchronized at the same time at most.
+        Defaults to 4.
+        timeout (float, optional): seconds to wait for an ingestion job. Defaults to 3600.
+        on_progress (Callable[[WaiterProgress], None], optional): called while waiting for a
+        Knowledge Base or an ingestion job. Defaults to printing the current status.
+    """
+
+    def __init__(
+        self,
+        kb_helper,
+        manifest_path: Optional[str] = None,
+        max_workers: int = DEFAULT_MAX_WORKERS,
+        timeout: float = 3600,
+        on_progress: Optional[Callable[[WaiterProgress], None]] = print_progress,
+    ):
+        self.kb_helper = kb_helper
+        self.s3_client = kb_helper.s3_client
+        self.bedrock_agent_client = kb_helper.bedrock_agent_client
+        self.manifest = IngestionManifest(manifest_path)
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self.on_progress = on_progress
+        self._executor = None
+        self._executor_lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self, wait: bool = True):
+        """Shuts the workers down, by default once all submitted synchronizations are done."""
+        with self._executor_lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=wait)
+                self._executor = None
+
+    def _submit(self, fn, *args) -> Future:
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers, thread_name_prefix="ingestion"
+                )
+            return self._executor.submit(fn, *args)
+
+    def plan(self, target: IngestionTarget) -> SyncDelta:
+        """Files of the target's directory that changed since they were last uploaded."""
+        delta = SyncDelta()
+        if target.source_dir is None:
+            return delta
+        if target.bucket_name is None:
+            raise ValueError(f"bucket_name is required to upload {target.source_dir}")
+
+        recorded = self.manifest.objects_under(target.bucket_name, target.prefix)
+        local_keys = set()
+        for path, key in walk_files(target.source_dir, target.prefix):
+            local_keys.add(key)
+            digest = file_digest(path, previous=recorded.get(key))
+            if key in recorded and recorded[key]["sha256"] == digest["sha256"]:
+                delta.unchanged += 1
+                if digest is not recorded[key]:
+                    # Touched but not changed, remember the new modification time
+                    self.manifest.record_object(target.bucket_name, key, digest)
+                continue
+            delta.upload.append((path, key))
+            delta.digests[key] = digest
+
+        delta.delete = sorted(set(recorded) - local_keys)
+        return delta
+
+    def upload(self, target: IngestionTarget, delta: SyncDelta):
+        """Uploads and deletes the objects of a delta, recording them in the manifest."""
+        uploaded = [0]
+        lock = threading.Lock()
+
+        def _on_uploaded(path: str, key: str):
+            self.manifest.record_object(target.bucket_name, key, delta.digests[key])
+            with lock:
+                uploaded[0] += 1
+                if uploaded[0] % MANIFEST_SAVE_EVERY == 0:
+                    self.manifest.save()
+
+        if delta.upload:
+            report = self.kb_helper.upload_files(
+                delta.upload, target.bucket_name, on_uploaded=_on_uploaded
+            )
+            print(f"{target.key}: {report}")
+
+        for key in delta.delete:
+            self.s3_client.delete_object(Bucket=target.bucket_name, Key=key)
+            self.manifest.forget_object(target.bucket_name, key)
+        self.manifest.save()
+
+    def _waiter(self, description: str, **kwargs) -> Waiter:
+        return Waiter(
+            description, on_progress=self.on_progress, max_delay=30, **kwargs
+        )
+
+    def start_job(self, target: IngestionTarget) -> Dict:
+        """Starts an ingestion job once the Knowledge Base is available, and records it."""
+        self._waiter(
+            f"knowledge base {target.knowledge_base_id} to be available"
+        ).wait(
+            knowledge_base_status(self.bedrock_agent_client, target.knowledge_base_id),
+            until=is_settled,
+        )
+
+        def _is_conflict(error: Exception) -> bool:
+            # Another ingestion job is still running on the data source
+            return (
+                isinstance(error, ClientError)
+                and error.response["Error"]["Code"] == "ConflictException"
+            )
+
+        job = self._waiter(
+            f"running ingestion job of {target.key} to finish", timeout=self.timeout
+        ).retry(
+            lambda: self.bedrock_agent_client.start_ingestion_job(
+                knowledgeBaseId=target.knowledge_base_id,
+                dataSourceId=target.data_source_id,
+            )["ingestionJob"],
+            retryable=_is_conflict,
+        )
+        self.manifest.record_job(target, job)
+        return job
+
+    def wait_job(self, target: IngestionTarget, ingestion_job_id: str) -> Dict:
+        """Waits for an ingestion job to be done, and records its final status."""
+
+        def poll():
+            return self.bedrock_agent_client.get_ingestion_job(
+                knowledgeBaseId=target.knowledge_base_id,
+                dataSourceId=target.data_source_id,
+                ingestionJobId=ingestion_job_id,
+            )["ingestionJob"]
+
+        job = self._waiter(
+            f"ingestion job {ingestion_job_id} of {target.key}",
+            timeout=self.timeout,
+            initial_delay=2,
+        ).wait(poll, until=lambda job: job["status"] in INGESTION_JOB_DONE)
+        self.manifest.record_job(target, job)
+        return job
+
+    def synchronize(self, target: IngestionTarget) -> IngestionResult:
+        """Uploads the changes of a target's directory and ingests them, blocking until done.
+
+        A job of the target still running according to the manifest is waited for first. No
+        new job is started when nothing changed since the last job completed.
+        """
+        delta = self.plan(target)
+        result = IngestionResult(
+            target=target,
+            uploaded=len(delta.upload),
+            deleted=len(delta.delete),
+            unchanged=delta.unchanged,
+        )
+
+        last_job = self.manifest.jobs.get(target.key)
+        if last_job is not None and last_job["status"] not in INGESTION_JOB_DONE:
+            result.job = self.wait_job(target, last_job["ingestionJobId"])
+            last_job = self.manifest.jobs[target.key]
+
+        up_to_date = (
+            target.source_dir is not None
+            and not delta.changed
+            and last_job is not None
+            and last_job["status"] == "COMPLETE"
+        )
+        if up_to_date:
+            self.manifest.save()
+            return result
+
+        self.upload(target, delta)
+        job = self.start_job(target)
+        result.job = self.wait_job(target, job["ingestionJobId"])
+        return result
+
+    def submit(
+        self, targets: Iterable[IngestionTarget]
+    ) -> Dict[IngestionTarget, "Future[IngestionResult]"]:
+        """Synchronizes targets concurrently in the background.
+
+        Returns:
+            Dict[IngestionTarget, Future[IngestionResult]]: future result of every target
+        """
+        targets = list(targets)
+        keys = [target.key for target in targets]
+        duplicates = sorted({key for key in keys if keys.count(key) > 1})
+        if duplicates:
+            raise ValueError(
+                f"Data sources can only be synchronized once at a time: {', '.join(duplicates)}"
+            )
+        return {target: self._submit(self.synchronize, target) for target in targets}
+
+    def synchronize_all(
+        self, targets: Iterable[IngestionTarget]
+    ) -> Dict[IngestionTarget, IngestionResult]:
+        """Synchronizes targets concurrently, blocking until all are done."""
+        futures = self.submit(targets)
+        return {target: future.result() for target, future in futures.items()}
+
+    def resume(self) -> Dict[IngestionTarget, "Future[Dict]"]:
+        """Resumes tracking the ingestion jobs that were running when the manifest was saved.
+
+        Returns:
+            Dict[IngestionTarget, Future[Dict]]: future final ingestion job of every data source
+        """
+        futures = dict()
+        for job in self.manifest.pending_jobs().values():
+            target = IngestionTarget(job["knowledgeBaseId"], job["dataSourceId"])
+            futures[target] = self._submit(
+                self.wait_job, target, job["ingestionJobId"]
+            )
+        return futures
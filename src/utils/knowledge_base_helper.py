@@ -9,8 +9,12 @@ IAM roles and OpenSearch Serverless.
 """
 
 import json
+import os
 import boto3
 import time
+from concurrent.futures import ThreadPoolExecutor
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
 from botocore.exceptions import ClientError
 from opensearchpy import (
     OpenSearch,
@@ -22,6 +26,21 @@ import pprint
 from retrying import retry
 import random
 
+from src.utils.ingestion import (
+    DEFAULT_MAX_WORKERS,
+    DEFAULT_MULTIPART_CHUNKSIZE,
+    DEFAULT_UPLOAD_WORKERS,
+    IngestionOrchestrator,
+    IngestionTarget,
+    UploadReport,
+    file_etag,
+    walk_files,
+)
+from src.utils.teardown import delete_bucket, delete_role
+
+# Parts of a multipart upload of one file uploaded at the same time
+MULTIPART_CONCURRENCY = 4
+
 valid_embedding_models = [
     "cohere.embed-multilingual-v3",
     "cohere.embed-english-v3",
@@ -257,6 +276,133 @@ class KnowledgeBasesForAmazonBedrock:
     def get_data_bucket_name(self):
         return self.data_bucket_name
 
+    def list_s3_objects(self, bucket_name: str, prefix: str = ""):
+        """
+        List the objects of a bucket under a key prefix
+        Args:
+            bucket_name: bucket name
+            prefix: key prefix
+        Returns:
+            dictionary of the ETag and size of every object by key
+        """
+        objects = dict()
+        paginator = self.s3_client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=bucket_name, Prefix=prefix):
+            for obj in page.get("Contents", []):
+                objects[obj["Key"]] = {
+                    "ETag": obj["ETag"].strip('"'),
+                    "Size": obj["Size"],
+                }
+        return objects
+
+    def upload_files(
+        self,
+        files,
+        bucket_name: str,
+        max_workers: int = DEFAULT_UPLOAD_WORKERS,
+        multipart_threshold: int = DEFAULT_MULTIPART_CHUNKSIZE,
+        multipart_chunksize: int = DEFAULT_MULTIPART_CHUNKSIZE,
+        on_uploaded=None,
+    ):
+        """
+        Upload files to a bucket concurrently, splitting large files in parts uploaded in parallel
+        Args:
+            files: list of (path, key) pairs
+            bucket_name: bucket name
+            max_workers: files uploaded at the same time
+            multipart_threshold: size from which files are uploaded in parts
+            multipart_chunksize: size of the parts
+            on_uploaded: called with the path and key of every uploaded file
+        Returns:
+            UploadReport with the number of files and bytes uploaded and the time it took
+        """
+        transfer_config = TransferConfig(
+            multipart_threshold=multipart_threshold,
+            multipart_chunksize=multipart_chunksize,
+            max_concurrency=MULTIPART_CONCURRENCY,
+        )
+        # Enough connections for all parts of all files in flight
+        s3_client = boto3.client(
+            "s3",
+            region_name=self.region_name,
+            endpoint_url=self.s3_client.meta.endpoint_url,
+            config=Config(max_pool_connections=max_workers * MULTIPART_CONCURRENCY),
+        )
+
+        def _upload(path, key):
+            s3_client.upload_file(path, bucket_name, key, Config=transfer_config)
+            if on_uploaded is not None:
+                on_uploaded(path, key)
+            return os.path.getsize(path)
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = [executor.submit(_upload, path, key) for path, key in files]
+            uploaded_bytes = sum(future.result() for future in futures)
+        return UploadReport(
+            uploaded=len(files),
+            bytes=uploaded_bytes,
+            seconds=time.perf_counter() - start,
+        )
+
+    def upload_directory(
+        self,
+        source_dir: str,
+        bucket_name: str = None,
+        prefix: str = "",
+        compare: str = "etag",
+        max_workers: int = DEFAULT_UPLOAD_WORKERS,
+        multipart_threshold: int = DEFAULT_MULTIPART_CHUNKSIZE,
+        multipart_chunksize: int = DEFAULT_MULTIPART_CHUNKSIZE,
+    ):
+        """
+        Upload a directory tree to the Knowledge Base data bucket, skipping unchanged objects
+        Args:
+            source_dir: local directory to upload
+            bucket_name: bucket name, defaults to the data bucket of this instance
+            prefix: key prefix of the uploaded files
+            compare: "etag" to skip objects with the same content, "size" to skip objects with
+                the same size, None to upload all files
+            max_workers: files uploaded at the same time
+            multipart_threshold: size from which files are uploaded in parts
+            multipart_chunksize: size of the parts
+        Returns:
+            UploadReport with the number of files and bytes uploaded and skipped, and throughput
+        """
+        if compare not in ("etag", "size", None):
+            raise ValueError(f"compare must be 'etag', 'size' or None, got {compare!r}")
+        bucket_name = bucket_name or self.data_bucket_name
+        if bucket_name is None:
+            raise ValueError("No bucket_name given and no data bucket created")
+
+        files = walk_files(source_dir, prefix)
+        remote = self.list_s3_objects(bucket_name, prefix) if compare else dict()
+
+        def _unchanged(path, key):
+            if key not in remote or remote[key]["Size"] != os.path.getsize(path):
+                return False
+            if compare == "size":
+                return True
+            return remote[key]["ETag"] == file_etag(
+                path, multipart_threshold, multipart_chunksize
+            )
+
+        # Hashing is I/O bound as well, compare on the upload workers
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            unchanged = list(executor.map(lambda file: _unchanged(*file), files))
+        changed_files = [file for file, same in zip(files, unchanged) if not same]
+
+        report = self.upload_files(
+            changed_files,
+            bucket_name,
+            max_workers=max_workers,
+            multipart_threshold=multipart_threshold,
+            multipart_chunksize=multipart_chunksize,
+        )
+        report.skipped = len(files) - len(changed_files)
+        print(report)
+        return report
+
     def _get_knowledge_base_s3_bucket(self, knowledge_base_id, data_source_id):
         """Get the s3 bucket associated with a knowledge base, if there is one"""
         try:
@@ -789,40 +935,56 @@ class KnowledgeBasesForAmazonBedrock:
             pp.pprint(ds)
         return kb, ds
 
-    def synchronize_data(self, kb_id, ds_id):
+    def synchronize_data(self, kb_id, ds_id, source_dir=None, manifest_path=None):
         """
         Start an ingestion job to synchronize data from an S3 bucket to the Knowledge Base
         and waits for the job to be completed
         Args:
             kb_id: knowledge base id
             ds_id: data source id
+            source_dir: local directory whose changed files to upload to the data bucket first
+            manifest_path: JSON file with the hashes of the files uploaded by previous syncs, so
+                that only the files changed since then are uploaded
+        Returns:
+            the ingestion job, None if no file changed since the last completed job
         """
-        # ensure that the kb is available
-        i_status = ["CREATING", "DELETING", "UPDATING"]
-        while (
-            self.bedrock_agent_client.get_knowledge_base(knowledgeBaseId=kb_id)[
-                "knowledgeBase"
-            ]["status"]
-            in i_status
-        ):
-            time.sleep(10)
-        # Start an ingestion job
-        start_job_response = self.bedrock_agent_client.start_ingestion_job(
-            knowledgeBaseId=kb_id, dataSourceId=ds_id
+        target = IngestionTarget(
+            knowledge_base_id=kb_id,
+            data_source_id=ds_id,
+            bucket_name=(
+                self._get_knowledge_base_s3_bucket(kb_id, ds_id) if source_dir else None
+            ),
+            source_dir=source_dir,
         )
-        job = start_job_response["ingestionJob"]
-        pp.pprint(job)
-        # Get job
-        while job["status"] != "COMPLETE" and job["status"] != "FAILED":
-            get_job_response = self.bedrock_agent_client.get_ingestion_job(
-                knowledgeBaseId=kb_id,
-                dataSourceId=ds_id,
-                ingestionJobId=job["ingestionJobId"],
+        with IngestionOrchestrator(self, manifest_path=manifest_path) as orchestrator:
+            result = orchestrator.synchronize(target)
+        pp.pprint(result.job)
+        return result.job
+
+    def synchronize_data_sources(
+        self, targets, manifest_path=None, max_workers=DEFAULT_MAX_WORKERS
+    ):
+        """
+        Synchronize several Knowledge Base data sources concurrently, uploading only the files
+        changed since the last sync of each
+        Args:
+            targets: list of IngestionTarget
+            manifest_path: JSON file with the hashes of uploaded files and the running jobs,
+                pass the same file to resume tracking the jobs after a restart
+            max_workers: data sources synchronized at the same time at most
+        Returns:
+            dictionary of IngestionResult by IngestionTarget
+        """
+        with IngestionOrchestrator(
+            self, manifest_path=manifest_path, max_workers=max_workers
+        ) as orchestrator:
+            results = orchestrator.synchronize_all(targets)
+        for result in results.values():
+            print(
+                f"{result.target.key}: {result.status}, {result.uploaded} uploaded, "
+                f"{result.deleted} deleted, {result.unchanged} unchanged"
             )
-            job = get_job_response["ingestionJob"]
-            interactive_sleep(5)
-        pp.pprint(job)
-        # interactive_sleep(40)
+        return results
 
     def get_kb(self, kb_id):
         """
@@ -969,30 +1131,15 @@ class KnowledgeBasesForAmazonBedrock:
         Args:
             kb_execution_role_name: knowledge base execution role
         """
-        attached_policies = self.iam_client.list_attached_role_policies(
-            RoleName=kb_execution_role_name, MaxItems=100
-        )
-        policies_arns = []
-        for policy in attached_policies["AttachedPolicies"]:
-            policies_arns.append(policy["PolicyArn"])
-        for policy in policies_arns:
-            self.iam_client.detach_role_policy(
-                RoleName=kb_execution_role_name, PolicyArn=policy
-            )
-            self.iam_client.delete_policy(PolicyArn=policy)
-        self.iam_client.delete_role(RoleName=kb_execution_role_name)
+        delete_role(self.iam_client, kb_execution_role_name)
         return 0
 
     def delete_s3(self, bucket_name: str):
         """
-        Delete the objects contained in the Knowledge Base S3 bucket.
+        Delete the objects contained in the Knowledge Base S3 bucket, 1000 per call.
         Once the bucket is empty, delete the bucket
         Args:
             bucket_name: bucket name
 
         """
-        objects = self.s3_client.list_objects(Bucket=bucket_name)
-        if "Contents" in objects:
-            for obj in objects["Contents"]:
-                self.s3_client.delete_object(Bucket=bucket_name, Key=obj["Key"])
-        self.s3_client.delete_bucket(Bucket=bucket_name)
+        delete_bucket(self.s3_client, bucket_name)
@@ -0,0 +1,137 @@
+# Copyright 2024 Amazon.com and its affiliates; all rights reserved.
+# This file is AWS Content and may not be duplicated or distributed without permission
+
+"""
+Content-addressed build cache for the Lambda functions of agent action groups.
+
+Packages are zipped reproducibly, with fixed timestamps and permissions, so the same
+source always gives the same zip, and the same CodeSha256 once deployed. Zips are cached
+on disk by the hash of their source, so redeploying an unchanged tool neither re-zips it
+nor, by comparing with the CodeSha256 of the deployed function, re-uploads it:
+
+    cache = LambdaBuildCache()
+    packages = cache.build_many(["lambda_news.py", "lambda_stocks.py"])
+    if packages["lambda_news.py"].code_sha256 != deployed["CodeSha256"]:
+        lambda_client.update_function_code(FunctionName=name, ZipFile=packages["lambda_news.py"].zip_content)
+"""
+
+import base64
+import hashlib
+import os
+import tempfile
+import threading
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from io import BytesIO
+from typing import Dict, Iterable, Optional
+
+DEFAULT_CACHE_DIR = os.path.join(tempfile.gettempdir(), "bedrock_agent_lambda_cache")
+DEFAULT_MAX_WORKERS = 8
+# Zip entries get a fixed timestamp and permissions, so that zips are reproducible
+_ZIP_DATE_TIME = (1980, 1, 1, 0, 0, 0)
+_ZIP_FILE_MODE = 0o644 << 16
+
+
+@dataclass(frozen=True)
+class LambdaPackage:
+    source_code_file: str
+    source_hash: str
+    zip_content: bytes
+
+    @property
+    def code_sha256(self) -> str:
+        """Hash of the package as reported by Lambda in the CodeSha256 of a function."""
+        return code_sha256(self.zip_content)
+
+
+def code_sha256(zip_content: bytes) -> str:
+    return base64.b64encode(hashlib.sha256(zip_content).digest()).decode("utf-8")
+
+
+def _archive_name(source_code_file: str) -> str:
+    # The name ZipFile.write gives the file, which the handler of the function refers to
+    return os.path.normpath(os.path.splitdrive(source_code_file)[1]).lstrip(os.sep)
+
+
+def zip_source(source_code_file: str, source: bytes) -> bytes:
+    """Zips a source file reproducibly, the same source always giving the same bytes."""
+    info = zipfile.ZipInfo(_archive_name(source_code_file), date_time=_ZIP_DATE_TIME)
+    info.external_attr = _ZIP_FILE_MODE
+    info.compress_type = zipfile.ZIP_DEFLATED
+    s = BytesIO()
+    with zipfile.ZipFile(s, "w") as z:
+        z.writestr(info, source)
+    return s.getvalue()
+
+
+class LambdaBuildCache:
+    """Zips of Lambda source files, kept in memory and on disk by the hash of their source.
+
+    Args:
+        cache_dir (str, optional): directory to keep the zips in across runs, None to only
+        keep them in memory. Defaults to a directory in the system temporary directory.
+        max_workers (int, optional): packages built at the same time by `build_many`.
+        Defaults to 8.
+    """
+
+    def __init__(
+        self,
+        cache_dir: Optional[str] = DEFAULT_CACHE_DIR,
+        max_workers: int = DEFAULT_MAX_WORKERS,
+    ):
+        self.cache_dir = cache_dir
+        self.max_workers = max_workers
+        self.hits = 0
+        self.misses = 0
+        self._packages: Dict[str, LambdaPackage] = dict()
+        self._lock = threading.Lock()
+
+    def _cache_path(self, source_hash: str) -> str:
+        return os.path.join(self.cache_dir, f"{source_hash}.zip")
+
+    def build(self, source_code_file: str) -> LambdaPackage:
+        """Zips a source file, or returns the zip of a previous build of the same source."""
+        with open(source_code_file, "rb") as f:
+            source = f.read()
+        source_hash = hashlib.sha256(
+            _archive_name(source_code_file).encode("utf-8") + b"\0" + source
+        ).hexdigest()
+
+        with self._lock:
+            package = self._packages.get(source_hash)
+        if package is None and self.cache_dir is not None:
+            try:
+                with open(self._cache_path(source_hash), "rb") as f:
+                    package = LambdaPackage(source_code_file, source_hash, f.read())
+            except FileNotFoundError:
+                pass
+
+        if package is not None:
+            self.hits += 1
+        else:
+            self.misses += 1
+            package = LambdaPackage(
+                source_code_file, source_hash, zip_source(source_code_file, source)
+            )
+            if self.cache_dir is not None:
+                os.makedirs(self.cache_dir, exist_ok=True)
+                tmp_path = f"{self._cache_path(source_hash)}.{threading.get_ident()}.tmp"
+                with open(tmp_path, "wb") as f:
+                    f.write(package.zip_content)
+                os.replace(tmp_path, self._cache_path(source_hash))
+
+        with self._lock:
+            self._packages[source_hash] = package
+        return package
+
+    def build_many(self, source_code_files: Iterable[str]) -> Dict[str, LambdaPackage]:
+        """Builds several packages in parallel.
+
+        Returns:
+            Dict[str, LambdaPackage]: package of every source file
+        """
+        source_code_files = list(dict.fromkeys(source_code_files))
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            packages = executor.map(self.build, source_code_files)
+            return dict(zip(source_code_files, packages))
@@ -0,0 +1,172 @@
+# Copyright 2024 Amazon.com and its affiliates; all rights reserved.
+# This file is AWS Content and may not be duplicated or distributed without permission
+
+"""
+Provisioning plans for multi-agent teams.
+
+A ProvisioningPlan is a dependency graph of provisioning steps, such as creating an agent,
+adding its action groups or associating it with a supervisor. Steps run as soon as the
+steps they depend on are done, with independent steps running concurrently on a bounded
+pool of workers, so a team takes about as long as its slowest branch:
+
+    plan = ProvisioningPlan(max_workers=4)
+    plan.add("agent:news", create_news_agent)
+    plan.add("agent:stocks", create_stocks_agent)
+    plan.add("supervisor", create_supervisor)
+    plan.add("prepare", prepare_supervisor, depends_on=["agent:news", "agent:stocks", "supervisor"])
+    plan.run()
+"""
+
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterable, List, Tuple
+
+DEFAULT_MAX_WORKERS = 4
+
+
+class ProvisioningError(RuntimeError):
+    """Raised when a step of a provisioning plan fails, after the running steps are done."""
+
+    def __init__(self, step: str, skipped: List[str]):
+        self.step = step
+        self.skipped = skipped
+        message = f"Provisioning step {step} failed"
+        if skipped:
+            message += f", skipped: {', '.join(skipped)}"
+        super().__init__(message)
+
+
+@dataclass
+class ProvisioningStep:
+    name: str
+    action: Callable[[], Any]
+    depends_on: Tuple[str, ...] = ()
+
+
+class ProvisioningPlan:
+    """Dependency graph of provisioning steps, run concurrently where independent.
+
+    Args:
+        max_workers (int, optional): steps running at the same time at most. Defaults to 4.
+        verbose (bool, optional): whether to print when steps start and finish. Defaults to False.
+    """
+
+    def __init__(self, max_workers: int = DEFAULT_MAX_WORKERS, verbose: bool = False):
+        self.max_workers = max_workers
+        self.verbose = verbose
+        self.steps: Dict[str, ProvisioningStep] = dict()
+        self.results: Dict[str, Any] = dict()
+        self.durations: Dict[str, float] = dict()
+
+    def add(
+        self, name: str, action: Callable[[], Any], depends_on: Iterable[str] = ()
+    ) -> str:
+        """Adds a step running `action` once all steps in `depends_on` are done.
+
+        Returns:
+            str: name of the step, to depend on it in later steps
+        """
+        if name in self.steps:
+            raise ValueError(f"Duplicate provisioning step: {name}")
+        self.steps[name] = ProvisioningStep(
+            name=name, action=action, depends_on=tuple(depends_on)
+        )
+        return name
+
+    def levels(self) -> List[List[str]]:
+        """Steps grouped by the order they can run in, each group only depending on earlier ones.
+
+        Raises:
+            ValueError: if a step depends on an unknown step, or steps depend on each other
+        """
+        for step in self.steps.values():
+            for dependency in step.depends_on:
+                if dependency not in self.steps:
+                    raise ValueError(
+                        f"Provisioning step {step.name} depends on unknown step {dependency}"
+                    )
+
+        levels = []
+        done = set()
+        remaining = dict(self.steps)
+        while remaining:
+            level = [
+                name
+                for name, step in remaining.items()
+                if all(dependency in done for dependency in step.depends_on)
+            ]
+            if not level:
+                raise ValueError(
+                    f"Provisioning steps depend on each other: {', '.join(remaining)}"
+                )
+            levels.append(level)
+            done.update(level)
+            for name in level:
+                del remaining[name]
+        return levels
+
+    def __str__(self):
+        lines = []
+        for idx, level in enumerate(self.levels(), start=1):
+            for name in level:
+                depends_on = self.steps[name].depends_on
+                after = f" (after {', '.join(depends_on)})" if depends_on else ""
+                lines.append(f"{idx}. {name}{after}")
+        return "\n".join(lines)
+
+    def _run_step(self, step: ProvisioningStep):
+        if self.verbose:
+            print(f"Provisioning {step.name}...")
+        start = time.perf_counter()
+        try:
+            return step.action()
+        finally:
+            self.durations[step.name] = time.perf_counter() - start
+            if self.verbose:
+                print(
+                    f"Provisioned {step.name} in {self.durations[step.name]:.1f}s"
+                )
+
+    def run(self) -> Dict[str, Any]:
+        """Runs all steps, each as soon as its dependencies are done.
+
+        Once a step fails no further steps are started, and ProvisioningError is raised
+        after the running ones are done.
+
+        Returns:
+            Dict[str, Any]: result of every step by name
+        """
+        self.levels()
+
+        pending = {name: set(step.depends_on) for name, step in self.steps.items()}
+        running = dict()
+        failed = None
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+
+            def _submit_ready():
+                for name in [name for name, deps in pending.items() if not deps]:
+                    del pending[name]
+                    running[executor.submit(self._run_step, self.steps[name])] = name
+
+            _submit_ready()
+            while running:
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    error = future.exception()
+                    if error is not None:
+                        if failed is None:
+                            failed = (name, error)
+                        continue
+                    self.results[name] = future.result()
+                    for deps in pending.values():
+                        deps.discard(name)
+                if failed is None:
+                    _submit_ready()
+
+        if failed is not None:
+            name, error = failed
+            raise ProvisioningError(step=name, skipped=list(pending)) from error
+        return self.results
@@ -0,0 +1,488 @@
+# Copyright 2024 Amazon.com and its affiliates; all rights reserved.
+# This file is AWS Content and may not be duplicated or distributed without permission
+
+"""
+Diff-based reconciliation of Agents for Amazon Bedrock.
+
+Instead of deleting and recreating an agent to apply a change to its definition, the
+current state of the agent is compared field by field with the desired one, and only the
+update calls for the fields that differ are made, before preparing the agent once:
+
+    changes = reconcile_agent(agents_helper, "news_agent", desired_spec, dry_run=True)
+    print(format_plan("news_agent", changes))
+"""
+
+from dataclasses import dataclass, field, replace
+from typing import Any, Dict, List, Optional
+
+from src.utils.bedrock_agent_helper import (
+    DEFAULT_ALIAS,
+    DEFAULT_CI_ACTION_GROUP_NAME,
+    AgentsForAmazonBedrock,
+)
+
+AGENT_FIELDS = ("instruction", "description", "foundation_model", "guardrail_id")
+
+
+@dataclass
+class ActionGroupSpec:
+    functions: List[Dict]
+    description: str = ""
+    # "lambda", with the Lambda created from source_code_file, or "RETURN_CONTROL"
+    executor: str = "lambda"
+    source_code_file: Optional[str] = None
+    lambda_function_name: Optional[str] = None
+    additional_function_iam_policy: Optional[str] = None
+    # CodeSha256 of the deployed Lambda function, or of the package of source_code_file
+    code_sha256: Optional[str] = None
+    state: str = "ENABLED"
+
+
+@dataclass
+class AgentSpec:
+    instruction: str
+    description: str
+    foundation_model: str
+    guardrail_id: Optional[str] = None
+    code_interpreter: bool = False
+    # State of the code interpreter action group of an existing agent, None without one
+    code_interpreter_state: Optional[str] = None
+    action_groups: Dict[str, ActionGroupSpec] = field(default_factory=dict)
+    # Knowledge Base ID to the description the agent uses it by
+    knowledge_bases: Dict[str, str] = field(default_factory=dict)
+    # Knowledge Base ID to the state of its association with an existing agent, ENABLED
+    # when missing
+    knowledge_base_states: Dict[str, str] = field(default_factory=dict)
+
+
+@dataclass
+class Change:
+    action: str  # "create", "update" or "delete"
+    target: str
+    current: Any = None
+    desired: Any = None
+
+    def __str__(self):
+        symbol = {"create": "+", "update": "~", "delete": "-"}[self.action]
+        if self.action == "update":
+            return f"{symbol} {self.target}: {_short(self.current)} -> {_short(self.desired)}"
+        return f"{symbol} {self.target}"
+
+
+def _short(value: Any, limit: int = 60) -> str:
+    text = repr(value)
+    return text if len(text) <= limit else text[: limit - 3] + "..."
+
+
+def _normalize_functions(functions: List[Dict]) -> List[Dict]:
+    """Functions of an action group, with the defaults the service fills in made explicit."""
+    return sorted(
+        (
+            {
+                "name": function["name"],
+                "description": function.get("description", ""),
+                "parameters": {
+                    name: {
+                        "description": parameter.get("description", ""),
+                        "type": parameter["type"],
+                        "required": parameter.get("required", False),
+                    }
+                    for name, parameter in function.get("parameters", {}).items()
+                },
+                "requireConfirmation": function.get("requireConfirmation", "DISABLED"),
+            }
+            for function in functions
+        ),
+        key=lambda function: function["name"],
+    )
+
+
+def _guardrail_id(identifier: Optional[str]) -> Optional[str]:
+    # the identifier may be a guardrail ID or ARN
+    return identifier.split("/")[-1] if identifier else None
+
+
+def _deployed_code_sha256(lambda_client, function_arn: str) -> Optional[str]:
+    try:
+        return lambda_client.get_function_configuration(FunctionName=function_arn)[
+            "CodeSha256"
+        ]
+    except lambda_client.exceptions.ResourceNotFoundException:
+        return None
+
+
+def fetch_agent_spec(
+    bedrock_agent_client, agent_id: str, lambda_client=None
+) -> AgentSpec:
+    """Current DRAFT definition of an agent, with the CodeSha256 of the Lambda functions
+    of its action groups if a Lambda client is given."""
+    _agent = bedrock_agent_client.get_agent(agentId=agent_id)["agent"]
+    _spec = AgentSpec(
+        instruction=_agent.get("instruction", ""),
+        description=_agent.get("description", ""),
+        foundation_model=_agent.get("foundationModel"),
+        guardrail_id=_guardrail_id(
+            _agent.get("guardrailConfiguration", {}).get("guardrailIdentifier")
+        ),
+    )
+
+    for _page in bedrock_agent_client.get_paginator("list_agent_action_groups").paginate(
+        agentId=agent_id, agentVersion="DRAFT"
+    ):
+        for _summary in _page["actionGroupSummaries"]:
+            if _summary["actionGroupName"] == DEFAULT_CI_ACTION_GROUP_NAME:
+                _spec.code_interpreter_state = _summary["actionGroupState"]
+                _spec.code_interpreter = _summary["actionGroupState"] == "ENABLED"
+                continue
+            _action_group = bedrock_agent_client.get_agent_action_group(
+                agentId=agent_id,
+                agentVersion="DRAFT",
+                actionGroupId=_summary["actionGroupId"],
+            )["agentActionGroup"]
+            _executor = _action_group.get("actionGroupExecutor", {})
+            _spec.action_groups[_summary["actionGroupName"]] = ActionGroupSpec(
+                functions=_action_group.get("functionSchema", {}).get("functions", []),
+                description=_action_group.get("description", ""),
+                executor=_executor.get("customControl", "lambda"),
+                code_sha256=(
+                    _deployed_code_sha256(lambda_client, _executor["lambda"])
+                    if lambda_client is not None and "lambda" in _executor
+                    else None
+                ),
+                state=_summary["actionGroupState"],
+            )
+
+    for _page in bedrock_agent_client.get_paginator(
+        "list_agent_knowledge_bases"
+    ).paginate(agentId=agent_id, agentVersion="DRAFT"):
+        for _summary in _page["agentKnowledgeBaseSummaries"]:
+            _kb_id = _summary["knowledgeBaseId"]
+            _spec.knowledge_bases[_kb_id] = _summary.get("description", "")
+            _spec.knowledge_base_states[_kb_id] = _summary["knowledgeBaseState"]
+
+    return _spec
+
+
+def diff_agent_specs(current: AgentSpec, desired: AgentSpec) -> List[Change]:
+    """Field-level changes turning the current definition of an agent into the desired one."""
+    changes = []
+
+    for _field in AGENT_FIELDS:
+        _current, _desired = getattr(current, _field), getattr(desired, _field)
+        if _field == "guardrail_id":
+            _current, _desired = _guardrail_id(_current), _guardrail_id(_desired)
+        if _current != _desired:
+            changes.append(Change("update", _field, _current, _desired))
+
+    _ci_target = f"action_group:{DEFAULT_CI_ACTION_GROUP_NAME}"
+    if desired.code_interpreter and not current.code_interpreter:
+        if current.code_interpreter_state is not None:
+            # a disabled code interpreter is enabled again, it can't be created twice
+            changes.append(
+                Change("update", _ci_target, current.code_interpreter_state, "ENABLED")
+            )
+        else:
+            changes.append(Change("create", _ci_target))
+    elif current.code_interpreter and not desired.code_interpreter:
+        changes.append(Change("delete", _ci_target))
+
+    for _name, _desired in desired.action_groups.items():
+        _current = current.action_groups.get(_name)
+        if _current is None:
+            changes.append(Change("create", f"action_group:{_name}", desired=_desired))
+        elif _current.executor != _desired.executor:
+            # the executor of an action group can't be changed in place
+            changes.append(Change("delete", f"action_group:{_name}", current=_current))
+            changes.append(Change("create", f"action_group:{_name}", desired=_desired))
+        elif (
+            _normalize_functions(_current.functions)
+            != _normalize_functions(_desired.functions)
+            or _current.description != _desired.description[0:199]
+            or _current.state != _desired.state
+            # an edited source file of the Lambda function
+            or (
+                _desired.code_sha256 is not None
+                and _current.code_sha256 != _desired.code_sha256
+            )
+        ):
+            changes.append(
+                Change("update", f"action_group:{_name}", _current, _desired)
+            )
+    for _name, _current in current.action_groups.items():
+        if _name not in desired.action_groups:
+            changes.append(Change("delete", f"action_group:{_name}", current=_current))
+
+    for _kb_id, _description in desired.knowledge_bases.items():
+        if _kb_id not in current.knowledge_bases:
+            changes.append(
+                Change("create", f"knowledge_base:{_kb_id}", desired=_description)
+            )
+            continue
+        _current_kb = {
+            "description": current.knowledge_bases[_kb_id],
+            "state": current.knowledge_base_states.get(_kb_id, "ENABLED"),
+        }
+        _desired_kb = {"description": _description, "state": "ENABLED"}
+        if _current_kb != _desired_kb:
+            # a disabled association is enabled again, it can't be associated twice
+            changes.append(
+                Change("update", f"knowledge_base:{_kb_id}", _current_kb, _desired_kb)
+            )
+    for _kb_id in current.knowledge_bases:
+        if _kb_id not in desired.knowledge_bases:
+            changes.append(Change("delete", f"knowledge_base:{_kb_id}"))
+
+    return changes
+
+
+def format_plan(agent_name: str, changes: List[Change]) -> str:
+    if not changes:
+        return f"Agent {agent_name} is up to date"
+    return "\n".join([f"Agent {agent_name}:"] + [f"  {change}" for change in changes])
+
+
+def _is_lambda_source(spec: ActionGroupSpec) -> bool:
+    """Whether the Lambda function of an action group is built from a local source file,
+    rather than given by its ARN."""
+    return (
+        spec.executor == "lambda"
+        and spec.source_code_file is not None
+        and "arn:" not in spec.source_code_file
+    )
+
+
+def _with_code_sha256(
+    agents_helper: AgentsForAmazonBedrock, spec: AgentSpec
+) -> AgentSpec:
+    """`spec` with the CodeSha256 of the packages of its Lambda source files."""
+    _packages = agents_helper._lambda_build_cache.build_many(
+        _action_group.source_code_file
+        for _action_group in spec.action_groups.values()
+        if _is_lambda_source(_action_group)
+    )
+    return replace(
+        spec,
+        action_groups={
+            _name: (
+                replace(
+                    _action_group,
+                    code_sha256=_packages[_action_group.source_code_file].code_sha256,
+                )
+                if _is_lambda_source(_action_group)
+                else _action_group
+            )
+            for _name, _action_group in spec.action_groups.items()
+        },
+    )
+
+
+def _lambda_executor(
+    agents_helper: AgentsForAmazonBedrock, agent_name: str, spec: ActionGroupSpec
+) -> Dict:
+    """Executor of a Lambda action group, creating its function or updating its code."""
+    if not _is_lambda_source(spec):
+        return {"lambda": spec.source_code_file}
+    return {
+        "lambda": agents_helper.create_lambda(
+            agent_name,
+            spec.lambda_function_name,
+            spec.source_code_file,
+            additional_function_iam_policy=spec.additional_function_iam_policy,
+        )
+    }
+
+
+def _action_group_id(bedrock_agent_client, agent_id: str, name: str) -> str:
+    for _page in bedrock_agent_client.get_paginator("list_agent_action_groups").paginate(
+        agentId=agent_id, agentVersion="DRAFT"
+    ):
+        for _summary in _page["actionGroupSummaries"]:
+            if _summary["actionGroupName"] == name:
+                return _summary["actionGroupId"]
+    raise KeyError(f"Action group {name} not found on agent {agent_id}")
+
+
+def _apply_change(
+    agents_helper: AgentsForAmazonBedrock,
+    agent_name: str,
+    agent_id: str,
+    change: Change,
+):
+    _client = agents_helper._bedrock_agent_client
+    _kind, _, _name = change.target.partition(":")
+
+    if _kind == "action_group" and _name == DEFAULT_CI_ACTION_GROUP_NAME:
+        if change.action == "create":
+            _client.create_agent_action_group(
+                agentId=agent_id,
+                agentVersion="DRAFT",
+                actionGroupName=DEFAULT_CI_ACTION_GROUP_NAME,
+                parentActionGroupSignature="AMAZON.CodeInterpreter",
+                actionGroupState="ENABLED",
+            )
+        elif change.action == "update":
+            _client.update_agent_action_group(
+                agentId=agent_id,
+                agentVersion="DRAFT",
+                actionGroupId=_action_group_id(_client, agent_id, _name),
+                actionGroupName=DEFAULT_CI_ACTION_GROUP_NAME,
+                parentActionGroupSignature="AMAZON.CodeInterpreter",
+                actionGroupState=change.desired,
+            )
+        else:
+            _client.delete_agent_action_group(
+                agentId=agent_id,
+                agentVersion="DRAFT",
+                actionGroupId=_action_group_id(_client, agent_id, _name),
+                skipResourceInUseCheck=True,
+            )
+
+    elif _kind == "action_group" and change.action == "create":
+        _spec: ActionGroupSpec = change.desired
+        if _spec.executor == "RETURN_CONTROL":
+            _executor = {"customControl": "RETURN_CONTROL"}
+        else:
+            _executor = _lambda_executor(agents_helper, agent_name, _spec)
+        _client.create_agent_action_group(
+            agentId=agent_id,
+            agentVersion="DRAFT",
+            actionGroupExecutor=_executor,
+            actionGroupName=_name,
+            functionSchema={"functions": _spec.functions},
+            description=_spec.description[0:199],
+        )
+
+    elif _kind == "action_group" and change.action == "update":
+        _group_id = _action_group_id(_client, agent_id, _name)
+        _current = _client.get_agent_action_group(
+            agentId=agent_id, agentVersion="DRAFT", actionGroupId=_group_id
+        )["agentActionGroup"]
+        _executor = _current["actionGroupExecutor"]
+        if change.desired.code_sha256 is not None:
+            # create_lambda updates the code of the existing function in place
+            _executor = _lambda_executor(agents_helper, agent_name, change.desired)
+        _client.update_agent_action_group(
+            agentId=agent_id,
+            agentVersion="DRAFT",
+            actionGroupId=_group_id,
+            actionGroupName=_name,
+            actionGroupExecutor=_executor,
+            actionGroupState=change.desired.state,
+            functionSchema={"functions": change.desired.functions},
+            description=change.desired.description[0:199],
+        )
+
+    elif _kind == "action_group" and change.action == "delete":
+        _client.delete_agent_action_group(
+            agentId=agent_id,
+            agentVersion="DRAFT",
+            actionGroupId=_action_group_id(_client, agent_id, _name),
+            skipResourceInUseCheck=True,
+        )
+
+    elif _kind == "knowledge_base" and change.action == "create":
+        agents_helper.associate_kb_with_agent(
+            agent_id, change.desired, _name, prepare=False
+        )
+
+    elif _kind == "knowledge_base" and change.action == "update":
+        _client.update_agent_knowledge_base(
+            agentId=agent_id,
+            agentVersion="DRAFT",
+            knowledgeBaseId=_name,
+            description=change.desired["description"],
+            knowledgeBaseState=change.desired["state"],
+        )
+
+    elif _kind == "knowledge_base" and change.action == "delete":
+        _client.disassociate_agent_knowledge_base(
+            agentId=agent_id, agentVersion="DRAFT", knowledgeBaseId=_name
+        )
+
+    else:
+        raise ValueError(f"Unsupported change: {change}")
+
+
+def _update_alias(agents_helper: AgentsForAmazonBedrock, agent_id: str):
+    """Points the latest alias of an agent at a new version of the prepared DRAFT."""
+    _client = agents_helper._bedrock_agent_client
+    _aliases = [
+        _summary
+        for _page in _client.get_paginator("list_agent_aliases").paginate(
+            agentId=agent_id
+        )
+        for _summary in _page["agentAliasSummaries"]
+        if _summary["agentAliasId"] != DEFAULT_ALIAS
+    ]
+    if _aliases:
+        _alias = max(_aliases, key=lambda _summary: _summary["updatedAt"])
+        _client.update_agent_alias(
+            agentId=agent_id,
+            agentAliasId=_alias["agentAliasId"],
+            agentAliasName=_alias["agentAliasName"],
+        )
+        _alias_id = _alias["agentAliasId"]
+    else:
+        _alias_id = _client.create_agent_alias(
+            agentAliasName="with-code-ag", agentId=agent_id
+        )["agentAlias"]["agentAliasId"]
+    agents_helper.wait_agent_alias_status_update(agent_id, _alias_id)
+
+
+def reconcile_agent(
+    agents_helper: AgentsForAmazonBedrock,
+    agent_name: str,
+    desired: AgentSpec,
+    dry_run: bool = False,
+    verbose: bool = False,
+) -> List[Change]:
+    """Brings an existing agent in line with its desired definition.
+
+    Only the fields that differ are updated, including the code of Lambda functions whose
+    source file changed, after which the agent is prepared once and
+    its latest alias is pointed at the new version.
+
+    Args:
+        agents_helper (AgentsForAmazonBedrock): helper to make the calls with
+        agent_name (str): name of the existing agent
+        desired (AgentSpec): desired definition of the agent
+        dry_run (bool, optional): only print the changes, without applying them. Defaults to False.
+        verbose (bool, optional): whether to print the changes as they are applied. Defaults to False.
+
+    Returns:
+        List[Change]: the changes, applied unless `dry_run`
+    """
+    _agent_id = agents_helper.get_agent_id_by_name(agent_name)
+    if _agent_id is None:
+        raise ValueError(f"Agent {agent_name} not found")
+
+    _current = fetch_agent_spec(
+        agents_helper._bedrock_agent_client, _agent_id, agents_helper._lambda_client
+    )
+    changes = diff_agent_specs(_current, _with_code_sha256(agents_helper, desired))
+
+    if dry_run or verbose:
+        print(format_plan(agent_name, changes))
+    if dry_run or not changes:
+        return changes
+
+    agents_helper.wait_agent_status_update(_agent_id)
+    if any(change.target in AGENT_FIELDS for change in changes):
+        agents_helper.update_agent(
+            agent_name,
+            new_model_id=desired.foundation_model,
+            new_instructions=desired.instruction,
+            guardrail_id=desired.guardrail_id,
+            new_description=desired.description,
+            prepare=False,
+        )
+
+    for change in changes:
+        if change.target not in AGENT_FIELDS:
+            if verbose:
+                print(f"Applying {change}")
+            _apply_change(agents_helper, agent_name, _agent_id, change)
+
+    agents_helper.prepare_agent_by_id(_agent_id)
+    _update_alias(agents_helper, _agent_id)
+    return changes
@@ -0,0 +1,527 @@
+# Copyright 2024 Amazon.com and its affiliates; all rights reserved.
+# This file is AWS Content and may not be duplicated or distributed without permission
+
+"""
+Bulk teardown of the resources of an environment.
+
+A TeardownPlanner finds the agents and Knowledge Bases of an environment, by name prefix
+and/or by tags, and everything they reference: agent aliases, action group Lambda
+functions, IAM roles, OpenSearch Serverless collections and their policies, and S3 data
+buckets. It then deletes them on a ProvisioningPlan, concurrently where independent and in
+dependency order otherwise, e.g. a role only after the agents and functions using it:
+
+    planner = TeardownPlanner()
+    resources = planner.discover(name_prefix="test-", tags={"environment": "test"})
+    report = planner.run(resources)
+    print(report)
+
+A failed deletion does not stop the others; only the resources depending on it are
+skipped, and both are listed in the report.
+"""
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+import boto3
+from botocore.exceptions import ClientError
+
+from src.utils.provisioning import ProvisioningPlan
+from src.utils.waiters import Waiter, agent_status, is_settled
+
+DEFAULT_MAX_WORKERS = 8
+# Keys per DeleteObjects call, the most S3 accepts
+DELETE_OBJECTS_BATCH_SIZE = 1000
+# Roles shared by agents in and outside of any environment, never deleted
+SHARED_ROLE_NAMES = ("DEFAULT_AgentExecutionRole",)
+
+
+@dataclass
+class TeardownResource:
+    kind: str  # "agent", "knowledge_base", "lambda", "role", "collection" or "bucket"
+    name: str
+    id: Optional[str] = None
+    depends_on: List[str] = field(default_factory=list)
+
+    @property
+    def step(self) -> str:
+        return f"{self.kind}:{self.name}"
+
+
+@dataclass
+class TeardownReport:
+    removed: Dict[str, List[str]] = field(default_factory=dict)
+    failed: Dict[str, str] = field(default_factory=dict)
+    skipped: List[str] = field(default_factory=list)
+    seconds: float = 0.0
+
+    def __str__(self):
+        lines = [f"Teardown finished in {self.seconds:.1f}s"]
+        for kind, names in sorted(self.removed.items()):
+            lines.append(f"  removed {len(names)} {kind}: {', '.join(sorted(names))}")
+        for step, error in sorted(self.failed.items()):
+            lines.append(f"  failed {step}: {error}")
+        if self.skipped:
+            lines.append(f"  skipped: {', '.join(sorted(self.skipped))}")
+        return "\n".join(lines)
+
+
+def _error_code(error: Exception) -> str:
+    return error.response["Error"]["Code"] if isinstance(error, ClientError) else ""
+
+
+def delete_bucket(s3_client, bucket_name: str) -> int:
+    """Empties and deletes a bucket, deleting up to 1000 objects per call.
+
+    Returns:
+        int: number of objects deleted
+    """
+    deleted = 0
+    paginator = s3_client.get_paginator("list_objects_v2")
+    for page in paginator.paginate(
+        Bucket=bucket_name, PaginationConfig={"PageSize": DELETE_OBJECTS_BATCH_SIZE}
+    ):
+        keys = [{"Key": obj["Key"]} for obj in page.get("Contents", [])]
+        if not keys:
+            continue
+        response = s3_client.delete_objects(
+            Bucket=bucket_name, Delete={"Objects": keys, "Quiet": True}
+        )
+        if response.get("Errors"):
+            error = response["Errors"][0]
+            raise RuntimeError(
+                f"Failed to delete {len(response['Errors'])} objects of {bucket_name}, "
+                f"e.g. {error['Key']}: {error['Message']}"
+            )
+        deleted += len(keys)
+    s3_client.delete_bucket(Bucket=bucket_name)
+    return deleted
+
+
+def delete_role(iam_client, role_name: str) -> None:
+    """Deletes a role with its inline policies and the customer managed policies attached to it.
+
+    Customer managed policies still attached to other roles are only detached.
+    """
+    paginator = iam_client.get_paginator("list_role_policies")
+    for page in paginator.paginate(RoleName=role_name):
+        for policy_name in page["PolicyNames"]:
+            iam_client.delete_role_policy(RoleName=role_name, PolicyName=policy_name)
+
+    paginator = iam_client.get_paginator("list_attached_role_policies")
+    for page in paginator.paginate(RoleName=role_name):
+        for policy in page["AttachedPolicies"]:
+            iam_client.detach_role_policy(
+                RoleName=role_name, PolicyArn=policy["PolicyArn"]
+            )
+            if policy["PolicyArn"].startswith("arn:aws:iam::aws:policy/"):
+                continue
+            try:
+                iam_client.delete_policy(PolicyArn=policy["PolicyArn"])
+            except iam_client.exceptions.DeleteConflictException:
+                pass
+    iam_client.delete_role(RoleName=role_name)
+
+
+class TeardownPlanner:
+    """Finds the resources of an environment and deletes them concurrently in dependency order.
+
+    Args:
+        max_workers (int, optional): resources deleted at the same time at most. Defaults to 8.
+        verbose (bool, optional): whether to print every deletion. Defaults to True.
+        on_wait_progress (Callable[[WaiterProgress], None], optional): called while waiting
+        for a deletion to finish. Defaults to None.
+    """
+
+    def __init__(
+        self,
+        max_workers: int = DEFAULT_MAX_WORKERS,
+        verbose: bool = True,
+        on_wait_progress=None,
+    ):
+        self.max_workers = max_workers
+        self.verbose = verbose
+        self.on_wait_progress = on_wait_progress
+        self.bedrock_agent_client = boto3.client("bedrock-agent")
+        self.lambda_client = boto3.client("lambda")
+        self.iam_client = boto3.client("iam")
+        self.s3_client = boto3.client("s3")
+        self.aoss_client = boto3.client("opensearchserverless")
+
+    def _waiter(self, description: str, **kwargs) -> Waiter:
+        return Waiter(description, on_progress=self.on_wait_progress, **kwargs)
+
+    # Discovery
+
+    def _matches(self, name: str, arn: str, name_prefix: str, tags: Dict) -> bool:
+        if name_prefix and not name.startswith(name_prefix):
+            return False
+        if tags:
+            resource_tags = self.bedrock_agent_client.list_tags_for_resource(
+                resourceArn=arn
+            ).get("tags", {})
+            return all(resource_tags.get(key) == value for key, value in tags.items())
+        return True
+
+    def _discover_agent(self, summary: Dict, name_prefix: str, tags: Dict) -> List:
+        agent = self.bedrock_agent_client.get_agent(agentId=summary["agentId"])["agent"]
+        if not self._matches(agent["agentName"], agent["agentArn"], name_prefix, tags):
+            return []
+
+        resources = [TeardownResource("agent", agent["agentName"], agent["agentId"])]
+        role_name = agent["agentResourceRoleArn"].split("/")[-1]
+        if role_name not in SHARED_ROLE_NAMES:
+            resources.append(
+                TeardownResource("role", role_name, depends_on=[resources[0].step])
+            )
+
+        paginator = self.bedrock_agent_client.get_paginator("list_agent_action_groups")
+        for page in paginator.paginate(agentId=agent["agentId"], agentVersion="DRAFT"):
+            for action_group in page["actionGroupSummaries"]:
+                action_group = self.bedrock_agent_client.get_agent_action_group(
+                    agentId=agent["agentId"],
+                    agentVersion="DRAFT",
+                    actionGroupId=action_group["actionGroupId"],
+                )["agentActionGroup"]
+                function_arn = action_group.get("actionGroupExecutor", {}).get("lambda")
+                if function_arn is None:
+                    continue
+                function_name = function_arn.split(":")[6]
+                resources.append(
+                    TeardownResource(
+                        "lambda", function_name, depends_on=[resources[0].step]
+                    )
+                )
+                try:
+                    function_role = self.lambda_client.get_function(
+                        FunctionName=function_name
+                    )["Configuration"]["Role"]
+                except self.lambda_client.exceptions.ResourceNotFoundException:
+                    continue
+                resources.append(
+                    TeardownResource(
+                        "role",
+                        function_role.split("/")[-1],
+                        depends_on=[f"lambda:{function_name}"],
+                    )
+                )
+
+        # Supervisors are deleted before their collaborators
+        try:
+            paginator = self.bedrock_agent_client.get_paginator(
+                "list_agent_collaborators"
+            )
+            for page in paginator.paginate(
+                agentId=agent["agentId"], agentVersion="DRAFT"
+            ):
+                for collaborator in page["agentCollaboratorSummaries"]:
+                    alias_arn = collaborator["agentDescriptor"]["aliasArn"]
+                    resources.append(
+                        TeardownResource(
+                            "collaborator",
+                            alias_arn.split("/")[-2],
+                            depends_on=[resources[0].step],
+                        )
+                    )
+        except ClientError as e:
+            if _error_code(e) not in ("ValidationException", "ResourceNotFoundException"):
+                raise
+        return resources
+
+    def _discover_knowledge_base(
+        self, summary: Dict, name_prefix: str, tags: Dict
+    ) -> List:
+        kb = self.bedrock_agent_client.get_knowledge_base(
+            knowledgeBaseId=summary["knowledgeBaseId"]
+        )["knowledgeBase"]
+        if not self._matches(kb["name"], kb["knowledgeBaseArn"], name_prefix, tags):
+            return []
+
+        resource = TeardownResource("knowledge_base", kb["name"], kb["knowledgeBaseId"])
+        resources = [
+            resource,
+            TeardownResource(
+                "role", kb["roleArn"].split("/")[-1], depends_on=[resource.step]
+            ),
+        ]
+        oss_config = kb["storageConfiguration"].get(
+            "opensearchServerlessConfiguration"
+        )
+        if oss_config is not None:
+            collection_id = oss_config["collectionArn"].split("/")[-1]
+            resources.append(
+                TeardownResource(
+                    "collection",
+                    kb["name"],
+                    collection_id,
+                    depends_on=[resource.step],
+                )
+            )
+
+        paginator = self.bedrock_agent_client.get_paginator("list_data_sources")
+        for page in paginator.paginate(knowledgeBaseId=kb["knowledgeBaseId"]):
+            for data_source in page["dataSourceSummaries"]:
+                configuration = self.bedrock_agent_client.get_data_source(
+                    knowledgeBaseId=kb["knowledgeBaseId"],
+                    dataSourceId=data_source["dataSourceId"],
+                )["dataSource"]["dataSourceConfiguration"]
+                if configuration["type"] == "S3":
+                    bucket_name = configuration["s3Configuration"]["bucketArn"].split(
+                        ":"
+                    )[-1]
+                    resources.append(
+                        TeardownResource(
+                            "bucket", bucket_name, depends_on=[resource.step]
+                        )
+                    )
+        return resources
+
+    def discover(
+        self, name_prefix: str = None, tags: Dict[str, str] = None
+    ) -> List[TeardownResource]:
+        """Finds the agents and Knowledge Bases of an environment and the resources they use.
+
+        Args:
+            name_prefix (str, optional): prefix of the names of the agents and Knowledge Bases
+            tags (Dict[str, str], optional): tags the agents and Knowledge Bases must have
+
+        Returns:
+            List[TeardownResource]: resources to delete, with the steps they depend on
+        """
+        if not name_prefix and not tags:
+            raise ValueError("A name_prefix or tags are required to select an environment")
+
+        agents = [
+            summary
+            for page in self.bedrock_agent_client.get_paginator("list_agents").paginate()
+            for summary in page["agentSummaries"]
+            if summary["agentName"].startswith(name_prefix or "")
+        ]
+        kbs = [
+            summary
+            for page in self.bedrock_agent_client.get_paginator(
+                "list_knowledge_bases"
+            ).paginate()
+            for summary in page["knowledgeBaseSummaries"]
+            if summary["name"].startswith(name_prefix or "")
+        ]
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = [
+                executor.submit(self._discover_agent, summary, name_prefix, tags)
+                for summary in agents
+            ] + [
+                executor.submit(self._discover_knowledge_base, summary, name_prefix, tags)
+                for summary in kbs
+            ]
+            found = [resource for future in futures for resource in future.result()]
+
+        return self._merge(found)
+
+    @staticmethod
+    def _merge(found: List[TeardownResource]) -> List[TeardownResource]:
+        """Merges resources found more than once, e.g. a role shared by several functions."""
+        resources: Dict[str, TeardownResource] = dict()
+        for resource in found:
+            if resource.kind == "collaborator":
+                continue
+            if resource.step in resources:
+                resources[resource.step].depends_on.extend(resource.depends_on)
+            else:
+                resources[resource.step] = resource
+
+        # Collaborators found on a supervisor are deleted after it, if in the environment
+        agent_steps = {
+            resource.id: resource.step
+            for resource in resources.values()
+            if resource.kind == "agent"
+        }
+        for resource in found:
+            if resource.kind == "collaborator" and resource.name in agent_steps:
+                resources[agent_steps[resource.name]].depends_on.extend(
+                    resource.depends_on
+                )
+
+        for resource in resources.values():
+            resource.depends_on = sorted(
+                {dependency for dependency in resource.depends_on if dependency in resources}
+            )
+        return list(resources.values())
+
+    # Deletion
+
+    def _delete_agent(self, resource: TeardownResource):
+        _client = self.bedrock_agent_client
+        _aliases = _client.list_agent_aliases(agentId=resource.id, maxResults=100)[
+            "agentAliasSummaries"
+        ]
+        for alias in _aliases:
+            _client.delete_agent_alias(
+                agentId=resource.id, agentAliasId=alias["agentAliasId"]
+            )
+        self._waiter(f"agent {resource.name} to settle").wait(
+            agent_status(_client, resource.id), until=is_settled
+        )
+        _client.delete_agent(agentId=resource.id, skipResourceInUseCheck=True)
+        self._waiter(f"agent {resource.name} to be deleted").wait(
+            agent_status(_client, resource.id), until=lambda status: status == "DELETED"
+        )
+
+    def _delete_knowledge_base(self, resource: TeardownResource):
+        _client = self.bedrock_agent_client
+        paginator = _client.get_paginator("list_data_sources")
+        for page in paginator.paginate(knowledgeBaseId=resource.id):
+            for data_source in page["dataSourceSummaries"]:
+                _client.delete_data_source(
+                    knowledgeBaseId=resource.id,
+                    dataSourceId=data_source["dataSourceId"],
+                )
+        _client.delete_knowledge_base(knowledgeBaseId=resource.id)
+
+        def poll():
+            try:
+                return _client.get_knowledge_base(knowledgeBaseId=resource.id)[
+                    "knowledgeBase"
+                ]["status"]
+            except _client.exceptions.ResourceNotFoundException:
+                return "DELETED"
+
+        self._waiter(f"knowledge base {resource.name} to be deleted").wait(
+            poll, until=lambda status: status == "DELETED"
+        )
+
+    def _collection_policy_names(self, resource: TeardownResource) -> Dict[str, str]:
+        """Names of the policies of a Knowledge Base's collection by policy type.
+
+        create_or_retrieve_knowledge_base names the collection "<kb>-<suffix>" and its
+        policies "<kb>-sp-<suffix>", "<kb>-np-<suffix>" and "<kb>-ap-<suffix>". Policies are
+        only matched by these exact names, never by prefix, which other Knowledge Bases may
+        share.
+        """
+        details = self.aoss_client.batch_get_collection(ids=[resource.id])[
+            "collectionDetails"
+        ]
+        prefix = f"{resource.name}-"
+        if not details or not details[0]["name"].startswith(prefix):
+            return {}
+        suffix = details[0]["name"][len(prefix) :]
+        if not suffix.isdigit():
+            return {}
+        return {
+            "encryption": f"{resource.name}-sp-{suffix}",
+            "network": f"{resource.name}-np-{suffix}",
+            "data": f"{resource.name}-ap-{suffix}",
+        }
+
+    def _delete_collection(self, resource: TeardownResource):
+        policy_names = self._collection_policy_names(resource)
+        self.aoss_client.delete_collection(id=resource.id)
+
+        def poll():
+            details = self.aoss_client.batch_get_collection(ids=[resource.id])[
+                "collectionDetails"
+            ]
+            return details[0]["status"] if details else "DELETED"
+
+        self._waiter(f"collection {resource.name} to be deleted").wait(
+            poll, until=lambda status: status == "DELETED"
+        )
+
+        for policy_type, policy_name in policy_names.items():
+            try:
+                if policy_type == "data":
+                    self.aoss_client.delete_access_policy(
+                        type=policy_type, name=policy_name
+                    )
+                else:
+                    self.aoss_client.delete_security_policy(
+                        type=policy_type, name=policy_name
+                    )
+            except self.aoss_client.exceptions.ResourceNotFoundException:
+                pass
+
+    def _delete(self, resource: TeardownResource):
+        if resource.kind == "agent":
+            self._delete_agent(resource)
+        elif resource.kind == "knowledge_base":
+            self._delete_knowledge_base(resource)
+        elif resource.kind == "lambda":
+            self.lambda_client.delete_function(FunctionName=resource.name)
+        elif resource.kind == "role":
+            delete_role(self.iam_client, resource.name)
+        elif resource.kind == "collection":
+            self._delete_collection(resource)
+        elif resource.kind == "bucket":
+            deleted = delete_bucket(self.s3_client, resource.name)
+            if self.verbose:
+                print(f"Deleted {deleted} objects from bucket {resource.name}")
+        else:
+            raise ValueError(f"Unsupported resource kind: {resource.kind}")
+
+    def plan(self, resources: List[TeardownResource], report: TeardownReport = None):
+        """Plan deleting the resources, filling `report` as the steps run."""
+        report = report if report is not None else TeardownReport()
+        plan = ProvisioningPlan(max_workers=self.max_workers)
+
+        def _step(resource: TeardownResource):
+            def action():
+                failed = [
+                    dependency
+                    for dependency in resource.depends_on
+                    if dependency in report.failed or dependency in report.skipped
+                ]
+                if failed:
+                    report.skipped.append(resource.step)
+                    return
+                start = time.perf_counter()
+                try:
+                    self._delete(resource)
+                except ClientError as e:
+                    if _error_code(e) not in (
+                        "ResourceNotFoundException",
+                        "NoSuchEntity",
+                        "NoSuchBucket",
+                    ):
+                        report.failed[resource.step] = str(e)
+                        return
+                except Exception as e:
+                    report.failed[resource.step] = str(e)
+                    return
+                report.removed.setdefault(resource.kind, []).append(resource.name)
+                if self.verbose:
+                    print(
+                        f"Deleted {resource.step} in {time.perf_counter() - start:.1f}s"
+                    )
+
+            return action
+
+        for resource in resources:
+            plan.add(resource.step, _step(resource), depends_on=resource.depends_on)
+        return plan
+
+    def run(
+        self, resources: List[TeardownResource], dry_run: bool = False
+    ) -> TeardownReport:
+        """Deletes the resources, concurrently where independent.
+
+        Args:
+            resources (List[TeardownResource]): resources found by `discover`
+            dry_run (bool, optional): only print the plan. Defaults to False.
+
+        Returns:
+            TeardownReport: the resources removed, failed and skipped
+        """
+        report = TeardownReport()
+        plan = self.plan(resources, report)
+        if dry_run or self.verbose:
+            print(plan)
+        if dry_run:
+            return report
+
+        start = time.perf_counter()
+        plan.run()
+        report.seconds = time.perf_counter() - start
+        if self.verbose:
+            print(report)
+        return report
@@ -0,0 +1,229 @@
+# Copyright 2024 Amazon.com and its affiliates; all rights reserved.
+# This file is AWS Content and may not be duplicated or distributed without permission
+
+"""
+Waiters for Agents for Amazon Bedrock resources to settle.
+
+A Waiter polls a condition with exponential backoff and jitter until it holds or a deadline
+passes, reporting progress through an optional callback. Instead of sleeping for a fixed
+time after creating or updating a resource, callers wait for exactly as long as it takes:
+
+    Waiter("agent to be prepared").wait(agent_status(client, agent_id), until=is_settled)
+
+Conditions are provided for agent, agent alias and Knowledge Base status, ingestion jobs
+and IAM role propagation.
+"""
+
+import random
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Optional, TypeVar
+
+from botocore.exceptions import ClientError
+
+T = TypeVar("T")
+
+INGESTION_JOB_DONE = ("COMPLETE", "FAILED", "STOPPED")
+
+
+class WaiterTimeoutError(TimeoutError):
+    """Raised when the condition of a waiter does not hold before its deadline."""
+
+
+@dataclass
+class WaiterProgress:
+    description: str
+    attempt: int
+    elapsed: float
+    value: Any
+    next_delay: float
+
+
+@dataclass
+class Waiter:
+    """Poll a condition with exponential backoff and jitter until it holds.
+
+    Args:
+        description (str): what is being waited for, used in progress reports and errors
+        timeout (float, optional): seconds before giving up. Defaults to 300.
+        initial_delay (float, optional): seconds before the second poll. Defaults to 0.5.
+        max_delay (float, optional): upper bound of the delay between polls. Defaults to 10.
+        multiplier (float, optional): growth of the delay after every poll. Defaults to 2.
+        jitter (float, optional): fraction by which delays are randomly shortened or
+        lengthened, so that concurrent waiters do not poll in lockstep. Defaults to 0.2.
+        on_progress (Callable[[WaiterProgress], None], optional): called before every delay.
+    """
+
+    description: str
+    timeout: float = 300.0
+    initial_delay: float = 0.5
+    max_delay: float = 10.0
+    multiplier: float = 2.0
+    jitter: float = 0.2
+    on_progress: Optional[Callable[[WaiterProgress], None]] = None
+
+    def _delay(self, attempt: int) -> float:
+        delay = min(self.max_delay, self.initial_delay * self.multiplier**attempt)
+        return delay * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+    def _pause(self, start: float, attempt: int, value: Any, error: Exception = None):
+        elapsed = time.monotonic() - start
+        remaining = self.timeout - elapsed
+        if remaining <= 0:
+            raise WaiterTimeoutError(
+                f"Timed out after {self.timeout:g}s waiting for {self.description}, last: {value!r}"
+            ) from error
+
+        delay = min(self._delay(attempt), remaining)
+        if self.on_progress is not None:
+            self.on_progress(
+                WaiterProgress(
+                    description=self.description,
+                    attempt=attempt,
+                    elapsed=elapsed,
+                    value=value,
+                    next_delay=delay,
+                )
+            )
+        time.sleep(delay)
+
+    def wait(self, poll: Callable[[], T], until: Callable[[T], bool] = bool) -> T:
+        """Poll until `until` holds for the polled value, and return that value.
+
+        Raises:
+            WaiterTimeoutError: if the condition does not hold before the deadline
+        """
+        start = time.monotonic()
+        attempt = 0
+        while True:
+            value = poll()
+            if until(value):
+                return value
+            self._pause(start, attempt, value)
+            attempt += 1
+
+    def retry(self, call: Callable[[], T], retryable: Callable[[Exception], bool]) -> T:
+        """Call until it no longer raises a retryable error, and return its result.
+
+        Raises:
+            WaiterTimeoutError: if the call still fails with a retryable error at the deadline
+        """
+        start = time.monotonic()
+        attempt = 0
+        while True:
+            try:
+                return call()
+            except Exception as e:
+                if not retryable(e):
+                    raise
+                self._pause(start, attempt, str(e), error=e)
+            attempt += 1
+
+
+def print_progress(progress: WaiterProgress) -> None:
+    """Progress callback printing the state of the resource being waited for."""
+    print(
+        f"Waiting for {progress.description}. Current status {progress.value} "
+        f"({progress.elapsed:.0f}s elapsed)"
+    )
+
+
+def is_settled(status: str) -> bool:
+    """Whether a status has left a transitional state such as CREATING or PREPARING."""
+    return not status.endswith("ING")
+
+
+def agent_status(bedrock_agent_client, agent_id: str) -> Callable[[], str]:
+    """Condition reporting the status of an agent, DELETED once it no longer exists."""
+
+    def poll():
+        try:
+            return bedrock_agent_client.get_agent(agentId=agent_id)["agent"][
+                "agentStatus"
+            ]
+        except bedrock_agent_client.exceptions.ResourceNotFoundException:
+            return "DELETED"
+
+    return poll
+
+
+def agent_alias_status(
+    bedrock_agent_client, agent_id: str, agent_alias_id: str
+) -> Callable[[], str]:
+    """Condition reporting the status of an agent alias, DELETED once it no longer exists."""
+
+    def poll():
+        try:
+            return bedrock_agent_client.get_agent_alias(
+                agentId=agent_id, agentAliasId=agent_alias_id
+            )["agentAlias"]["agentAliasStatus"]
+        except bedrock_agent_client.exceptions.ResourceNotFoundException:
+            return "DELETED"
+
+    return poll
+
+
+def knowledge_base_status(
+    bedrock_agent_client, knowledge_base_id: str
+) -> Callable[[], str]:
+    """Condition reporting the status of a Knowledge Base."""
+
+    def poll():
+        return bedrock_agent_client.get_knowledge_base(
+            knowledgeBaseId=knowledge_base_id
+        )["knowledgeBase"]["status"]
+
+    return poll
+
+
+def ingestion_job_status(
+    bedrock_agent_client,
+    knowledge_base_id: str,
+    data_source_id: str,
+    ingestion_job_id: str,
+) -> Callable[[], str]:
+    """Condition reporting the status of a Knowledge Base ingestion job."""
+
+    def poll():
+        return bedrock_agent_client.get_ingestion_job(
+            knowledgeBaseId=knowledge_base_id,
+            dataSourceId=data_source_id,
+            ingestionJobId=ingestion_job_id,
+        )["ingestionJob"]["status"]
+
+    return poll
+
+
+def role_policy_exists(iam_client, role_name: str, policy_name: str) -> Callable[[], bool]:
+    """Condition holding once an inline policy is visible on an IAM role."""
+
+    def poll():
+        try:
+            iam_client.get_role_policy(RoleName=role_name, PolicyName=policy_name)
+            return True
+        except iam_client.exceptions.NoSuchEntityException:
+            return False
+
+    return poll
+
+
+def is_role_propagation_error(error: Exception) -> bool:
+    """Whether a call failed because a newly created IAM role has not propagated yet.
+
+    Lambda and Bedrock reject roles they cannot assume yet with a client error
+    mentioning the role, e.g. "The role defined for the function cannot be assumed by
+    Lambda."
+    """
+    if not isinstance(error, ClientError):
+        return False
+    code = error.response.get("Error", {}).get("Code", "")
+    message = error.response.get("Error", {}).get("Message", "").lower()
+    return (
+        code
+        in (
+            "InvalidParameterValueException",
+            "ValidationException",
+            "AccessDeniedException",
+        )
+        and "role" in message
+    )
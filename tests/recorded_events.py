@@ -0,0 +1,224 @@
+"""Completion events of a supervisor delegating to a collaborator, recorded with fixed event
+times, and what the invoke loops of AgentsForAmazonBedrock printed for them."""
+
+import datetime
+import json
+
+T0 = datetime.datetime(2025, 1, 1, 12, 0, 0, tzinfo=datetime.timezone.utc)
+SUPERVISOR_ARN = "arn:aws:bedrock:us-east-1:123456789012:agent-alias/SUPERVISOR/ALIAS"
+COLLABORATOR_ARN = "arn:aws:bedrock:us-east-1:123456789012:agent-alias/WEATHER/WALIAS"
+AGENT_NAMES = {"WEATHER/WALIAS": "weather"}
+
+
+def trace_event(seconds: float, payload: dict, collaborator: bool = False) -> dict:
+    caller_chain = [{"agentAliasArn": SUPERVISOR_ARN}]
+    if collaborator:
+        caller_chain.append({"agentAliasArn": COLLABORATOR_ARN})
+    return {
+        "trace": {
+            "agentId": "WEATHER" if collaborator else "SUPERVISOR",
+            "callerChain": caller_chain,
+            "eventTime": T0 + datetime.timedelta(seconds=seconds),
+            "trace": payload,
+        }
+    }
+
+
+def model_invocation_output(input_tokens: int, output_tokens: int) -> dict:
+    return {
+        "modelInvocationOutput": {
+            "traceId": "trace",
+            "rawResponse": {"content": "{}"},
+            "metadata": {
+                "usage": {"inputTokens": input_tokens, "outputTokens": output_tokens}
+            },
+        }
+    }
+
+
+def orchestration(**payload) -> dict:
+    return {"orchestrationTrace": payload}
+
+
+ROUTING_OUTPUT = {
+    "modelInvocationOutput": {
+        "traceId": "routing",
+        "rawResponse": {
+            "content": json.dumps({"content": [{"text": "<a>undecidable</a>"}]})
+        },
+        "metadata": {
+            "usage": {"inputTokens": 50, "outputTokens": 5},
+            "totalTimeMs": 1500,
+        },
+    }
+}
+
+TOOL_RESULT = (
+    "#tool_result format=csv rows=2/2 columns=2/5 tokens=12 raw_tokens=40\n"
+    "city,temp\nSeattle,70"
+)
+
+EVENTS = [
+    trace_event(0, {"routingClassifierTrace": {"modelInvocationInput": {}}}),
+    trace_event(1.5, {"routingClassifierTrace": ROUTING_OUTPUT}),
+    trace_event(2, {"preProcessingTrace": model_invocation_output(30, 10)}),
+    trace_event(4, orchestration(**model_invocation_output(100, 20))),
+    trace_event(4, orchestration(rationale={"text": "Ask the weather agent"})),
+    trace_event(
+        4,
+        orchestration(
+            invocationInput={
+                "agentCollaboratorInvocationInput": {
+                    "agentCollaboratorName": "weather",
+                    "agentCollaboratorAliasArn": COLLABORATOR_ARN,
+                    "input": {"text": "What is the weather in Seattle?", "type": "TEXT"},
+                }
+            }
+        ),
+    ),
+    trace_event(6, orchestration(**model_invocation_output(200, 30)), collaborator=True),
+    trace_event(
+        6,
+        orchestration(
+            invocationInput={
+                "actionGroupInvocationInput": {
+                    "actionGroupName": "weather",
+                    "function": "get_weather",
+                    "executionType": "LAMBDA",
+                    "parameters": [{"name": "city", "type": "string", "value": "Seattle"}],
+                }
+            }
+        ),
+        collaborator=True,
+    ),
+    trace_event(
+        7,
+        orchestration(observation={"actionGroupInvocationOutput": {"text": TOOL_RESULT}}),
+        collaborator=True,
+    ),
+    trace_event(
+        7,
+        orchestration(
+            invocationInput={
+                "knowledgeBaseLookupInput": {
+                    "knowledgeBaseId": "KB",
+                    "text": "Seattle climate",
+                }
+            }
+        ),
+        collaborator=True,
+    ),
+    trace_event(
+        8,
+        orchestration(
+            observation={
+                "knowledgeBaseLookupOutput": {
+                    "retrievedReferences": [{"content": {"text": "Seattle is rainy."}}]
+                }
+            }
+        ),
+        collaborator=True,
+    ),
+    trace_event(9, orchestration(**model_invocation_output(250, 40)), collaborator=True),
+    trace_event(
+        9,
+        orchestration(observation={"finalResponse": {"text": "It is 70F."}}),
+        collaborator=True,
+    ),
+    trace_event(
+        10,
+        orchestration(
+            observation={
+                "agentCollaboratorInvocationOutput": {
+                    "agentCollaboratorName": "weather",
+                    "output": {"text": "It is 70F.", "type": "TEXT"},
+                }
+            }
+        ),
+    ),
+    trace_event(12, orchestration(**model_invocation_output(300, 25))),
+    trace_event(
+        12, orchestration(observation={"finalResponse": {"text": "It is 70 fahrenheit."}})
+    ),
+    trace_event(13, {"postProcessingTrace": model_invocation_output(20, 8)}),
+    {"chunk": {"bytes": b"It is 70 "}},
+    {"chunk": {"bytes": b"fahrenheit."}},
+]
+
+ANSWER = "It is 70 fahrenheit."
+
+# Printed by AgentsForAmazonBedrock.invoke before the event processor, after its request
+# and session lines. Durations were then measured as the events were processed, so they
+# are "0.0s" for recorded events; they now come from the event times.
+OUTLINE_OUTPUT = """\
+---- Step 1 ----
+Classifying request to immediately route to one collaborator if possible.
+Routing classifier did not find a matching collaborator. Reverting to 'SUPERVISOR' mode.
+Routing classifier took 0.0s, using 55 tokens (in: 50, out: 5).
+
+Pre-processing trace, agent came up with an initial plan.
+Used LLM tokens, in: 30, out: 10
+---- Step 2 ----
+Took 0.0s, using 120 tokens (in: 100, out: 20) to complete prior action, observe, orchestrate.
+Ask the weather agent
+Using sub-agent collaborator: 'weather [WEATHER/WALIAS]'
+---- Step 2.1 [using sub-agent name:weather, id:WEATHER/WALIAS] ----
+Took 0.0s, using 230 tokens (in: 200, out: 30) to complete prior action, observe, orchestrate.
+Using tool: get_weather
+Using knowledge base
+---- Step 2.2 [using sub-agent name:weather, id:WEATHER/WALIAS] ----
+Took 0.0s, using 290 tokens (in: 250, out: 40) to complete prior action, observe, orchestrate.
+---- Step 3 ----
+Took 0.0s, using 325 tokens (in: 300, out: 25) to complete prior action, observe, orchestrate.
+Agent post-processing complete.
+Used LLM tokens, in: 20, out: 8
+Agent made a total of 7 LLM calls, using 1088 tokens (in: 950, out: 138), and took 0.0 total seconds
+"""
+
+CORE_OUTPUT = """\
+---- Step 1 ----
+Classifying request to immediately route to one collaborator if possible.
+Routing classifier did not find a matching collaborator. Reverting to 'SUPERVISOR' mode.
+Routing classifier took 0.0s, using 55 tokens (in: 50, out: 5).
+
+Pre-processing trace, agent came up with an initial plan.
+Used LLM tokens, in: 30, out: 10
+---- Step 2 ----
+Took 0.0s, using 120 tokens (in: 100, out: 20) to complete prior action, observe, orchestrate.
+Ask the weather agent
+Using sub-agent collaborator: 'weather [WEATHER/WALIAS]' passing input text:
+What is the weather in Seattle?
+
+---- Step 2.1 [using sub-agent name:weather, id:WEATHER/WALIAS] ----
+Took 0.0s, using 230 tokens (in: 200, out: 30) to complete prior action, observe, orchestrate.
+Using tool: get_weather with these inputs:
+[{'name': 'city', 'type': 'string', 'value': 'Seattle'}]
+
+--tool outputs:
+#tool_result format=csv rows=2/2 columns=2/5 tokens=12 raw_tokens=40
+city,temp
+Seattle,70...
+
+Using knowledge base id: KB to search for:
+  Seattle climate
+
+Knowledge base lookup output, 1 references:
+
+  (1) Seattle is rainy....
+
+---- Step 2.2 [using sub-agent name:weather, id:WEATHER/WALIAS] ----
+Took 0.0s, using 290 tokens (in: 250, out: 40) to complete prior action, observe, orchestrate.
+Final response:
+It is 70F....
+
+----sub-agent weather output text:
+It is 70F....
+
+---- Step 3 ----
+Took 0.0s, using 325 tokens (in: 300, out: 25) to complete prior action, observe, orchestrate.
+Final response:
+It is 70 fahrenheit....
+Agent post-processing complete.
+Used LLM tokens, in: 20, out: 8
+Agent made a total of 7 LLM calls, using 1088 tokens (in: 950, out: 138), and took 0.0 total seconds
+"""
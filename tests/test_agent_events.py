@@ -0,0 +1,190 @@
+import copy
+import io
+import os
+import re
+import unittest
+from contextlib import redirect_stdout
+from unittest import mock
+
+from src.utils.agent_events import (
+    AgentEventProcessor,
+    ConsoleSink,
+    InvocationState,
+    ResultSink,
+    TraceRecord,
+    Usage,
+    tool_result_tokens,
+    trace_records,
+)
+
+from .recorded_events import (
+    AGENT_NAMES,
+    ANSWER,
+    CORE_OUTPUT,
+    EVENTS,
+    OUTLINE_OUTPUT,
+    T0,
+    trace_event,
+)
+
+_DURATION = re.compile(r"(?<=[Tt]ook )\d[\d,]*\.\d(?=s| total seconds)")
+_TOOL_RESULT_TOKENS = "--tool result tokens: ~12, ~40 before encoding\n\n"
+
+
+def run(sinks):
+    return AgentEventProcessor(sinks, agent_names=AGENT_NAMES).run(
+        copy.deepcopy(EVENTS)
+    )
+
+
+def console_output(**kwargs) -> str:
+    output = io.StringIO()
+    with mock.patch.dict(os.environ, {"ANSI_COLORS_DISABLED": "1"}):
+        with redirect_stdout(output):
+            run([ConsoleSink(**kwargs)])
+    return output.getvalue()
+
+
+class TestTraceRecords(unittest.TestCase):
+
+    def records(self, idx):
+        return trace_records(EVENTS[idx]["trace"])
+
+    def test_trace_records_1(self):
+        (record,) = self.records(1)
+        self.assertEqual(record.kind, "routing_output")
+        self.assertEqual(record.data["classification"], "undecidable")
+        self.assertEqual(record.data["total_time_ms"], 1500)
+        self.assertEqual(record.usage, Usage(50, 5))
+
+    def test_trace_records_2(self):
+        (record,) = self.records(7)
+        self.assertEqual(record.kind, "tool_input")
+        self.assertEqual(record.data["function"], "get_weather")
+        self.assertEqual(record.data["execution_type"], "LAMBDA")
+
+    def test_trace_records_3(self):
+        (record,) = self.records(8)
+        self.assertEqual(record.kind, "tool_output")
+        self.assertEqual(record.data["tokens"], {"tokens": 12, "raw_tokens": 40})
+
+    def test_trace_records_4(self):
+        # Guardrail traces have no handler
+        event = trace_event(0, {"guardrailTrace": {"action": "NONE"}})
+        self.assertEqual(trace_records(event["trace"]), [])
+
+    def test_trace_records_5(self):
+        self.assertEqual(
+            [record.kind for idx in range(4) for record in self.records(idx)],
+            ["routing_input", "routing_output", "pre_processing", "model_output"],
+        )
+
+    def test_tool_result_tokens_1(self):
+        self.assertIsNone(tool_result_tokens("70 fahrenheit"))
+        self.assertIsNone(tool_result_tokens(None))
+
+
+class TestInvocationState(unittest.TestCase):
+
+    def test_account_1(self):
+        state = InvocationState()
+        state._first_event_time = T0
+        record = TraceRecord(
+            "model_output", {}, trace_event(2, {})["trace"], Usage(10, 5)
+        )
+        state.account(record)
+        self.assertEqual((state.step, state.sub_step), (1, 0))
+        self.assertEqual((state.input_tokens, state.output_tokens), (10, 5))
+        self.assertEqual(state.llm_calls, 1)
+        self.assertEqual(state.duration, 2.0)
+
+    def test_account_2(self):
+        # Model invocations of a collaborator are sub-steps of the supervisor's step
+        state = InvocationState(step=2, sub_agent_alias_id="WEATHER/WALIAS")
+        state._first_event_time = T0
+        state.account(
+            TraceRecord("model_output", {}, trace_event(1, {})["trace"], None)
+        )
+        self.assertEqual((state.step, state.sub_step), (2, 1))
+        self.assertEqual(state.total_tokens, 0)
+        self.assertEqual(state.llm_calls, 1)
+
+    def test_account_3(self):
+        state = InvocationState()
+        state.account(
+            TraceRecord(
+                "routing_output",
+                {"classification": "weather", "total_time_ms": None},
+                trace_event(0, {})["trace"],
+                Usage(0, 0),
+            )
+        )
+        self.assertEqual(state.sub_agent_name, "weather")
+        self.assertIsNone(state.duration)
+
+
+class TestAgentEventProcessor(unittest.TestCase):
+
+    def test_run_1(self):
+        result = ResultSink()
+        state = run([result])
+        self.assertEqual(state.answer, ANSWER)
+        self.assertEqual(state.step, 3)
+        self.assertEqual(state.llm_calls, 7)
+        self.assertEqual((state.input_tokens, state.output_tokens), (950, 138))
+        self.assertEqual(state.chunks, 2)
+        self.assertEqual(result.result.answer, ANSWER)
+        self.assertEqual(result.result.llm_calls, 7)
+
+    def test_run_2(self):
+        steps = []
+
+        class StepSink(ResultSink):
+            def on_record(self, record, state):
+                if record.kind in ("routing_output", "model_output"):
+                    steps.append((state.step, state.sub_step, state.duration))
+
+        run([StepSink()])
+        self.assertEqual(
+            steps,
+            [(1, 0, 1.5), (2, 0, 4.0), (2, 1, 2.0), (2, 2, 3.0), (3, 0, 3.0)],
+        )
+
+    def test_stream_1(self):
+        processor = AgentEventProcessor(agent_names=AGENT_NAMES)
+        self.assertEqual(
+            list(processor.stream(copy.deepcopy(EVENTS))), ["It is 70 ", "fahrenheit."]
+        )
+
+
+class TestConsoleSink(unittest.TestCase):
+    """The console output of the invoke loops before the event processor, but for step
+    durations, which come from the event times, and the tokens of encoded tool results."""
+
+    def test_console_sink_1(self):
+        output = console_output(trace_level="outline")
+        self.assertEqual(_DURATION.sub("0.0", output), OUTLINE_OUTPUT)
+
+    def test_console_sink_2(self):
+        output = console_output(trace_level="core")
+        self.assertIn(_TOOL_RESULT_TOKENS, output)
+        output = output.replace(_TOOL_RESULT_TOKENS, "")
+        self.assertEqual(_DURATION.sub("0.0", output), CORE_OUTPUT)
+
+    def test_console_sink_3(self):
+        output = console_output(trace_level="core")
+        self.assertIn("Routing classifier took 1.5s", output)
+        self.assertIn(
+            "---- Step 2.2 [using sub-agent name:weather, id:WEATHER/WALIAS] ----\n"
+            "Took 3.0s",
+            output,
+        )
+
+    def test_console_sink_4(self):
+        output = console_output(trace_level="all", stream_final_response=True)
+        self.assertIn(f"Returning agent answer as: {ANSWER}", output)
+        self.assertNotIn("^^^", output)
+
+
+if __name__ == "__main__":
+    unittest.main()
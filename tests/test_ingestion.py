@@ -0,0 +1,173 @@
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from src.utils.ingestion import (
+    IngestionManifest,
+    IngestionOrchestrator,
+    IngestionTarget,
+)
+
+
+class StubKnowledgeBaseHelper:
+    """The calls of a KnowledgeBasesForAmazonBedrock the orchestrator makes, recorded."""
+
+    def __init__(self):
+        self.uploaded = []
+        self.s3_client = mock.Mock()
+        self.bedrock_agent_client = mock.Mock()
+        self.bedrock_agent_client.get_knowledge_base.return_value = {
+            "knowledgeBase": {"status": "ACTIVE"}
+        }
+        self.bedrock_agent_client.start_ingestion_job.side_effect = lambda **kwargs: {
+            "ingestionJob": {"ingestionJobId": f"JOB{len(self.started) + 1}", "status": "STARTING"}
+        }
+        self.bedrock_agent_client.get_ingestion_job.side_effect = lambda **kwargs: {
+            "ingestionJob": {"ingestionJobId": kwargs["ingestionJobId"], "status": "COMPLETE"}
+        }
+
+    @property
+    def started(self):
+        return self.bedrock_agent_client.start_ingestion_job.call_args_list
+
+    def upload_files(self, files, bucket_name, on_uploaded=None):
+        for path, key in files:
+            self.uploaded.append(key)
+            on_uploaded(path, key)
+        return f"Uploaded {len(files)} files"
+
+
+class TestIngestionOrchestrator(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.source_dir = os.path.join(directory.name, "dataset")
+        self.manifest_path = os.path.join(directory.name, "ingestion.json")
+        os.makedirs(os.path.join(self.source_dir, "faq"))
+        for name, content in [("a.txt", "alpha"), ("b.txt", "beta"), ("faq/c.txt", "gamma")]:
+            self.write(name, content)
+        self.target = IngestionTarget("KB", "DS", "bucket", source_dir=self.source_dir, prefix="docs/")
+        self.kb_helper = StubKnowledgeBaseHelper()
+
+    def write(self, name, content):
+        with open(os.path.join(self.source_dir, name), "w") as f:
+            f.write(content)
+
+    def orchestrator(self):
+        return IngestionOrchestrator(
+            self.kb_helper, manifest_path=self.manifest_path, on_progress=None
+        )
+
+    def synchronize(self):
+        with mock.patch("builtins.print"):
+            return self.orchestrator().synchronize(self.target)
+
+    def test_plan_1(self):
+        delta = self.orchestrator().plan(self.target)
+        self.assertEqual(
+            [key for _, key in delta.upload], ["docs/a.txt", "docs/b.txt", "docs/faq/c.txt"]
+        )
+        self.assertEqual((delta.delete, delta.unchanged), ([], 0))
+
+    def test_plan_2(self):
+        self.synchronize()
+        path = os.path.join(self.source_dir, "a.txt")
+        os.utime(path, ns=(0, os.stat(path).st_mtime_ns + 10**9))
+        self.write("b.txt", "beta, edited")
+        os.remove(os.path.join(self.source_dir, "faq", "c.txt"))
+
+        orchestrator = self.orchestrator()
+        delta = orchestrator.plan(self.target)
+        # Touched but unchanged files are not uploaded again, only their times recorded
+        self.assertEqual(delta.unchanged, 1)
+        self.assertEqual(delta.upload, [(os.path.join(self.source_dir, "b.txt"), "docs/b.txt")])
+        self.assertEqual(delta.delete, ["docs/faq/c.txt"])
+        self.assertEqual(
+            orchestrator.manifest.objects["s3://bucket/docs/a.txt"]["mtime_ns"],
+            os.stat(path).st_mtime_ns,
+        )
+
+    def test_synchronize_1(self):
+        result = self.synchronize()
+        self.assertEqual((result.uploaded, result.deleted, result.unchanged), (3, 0, 0))
+        self.assertEqual(result.status, "COMPLETE")
+        self.assertEqual(len(self.kb_helper.started), 1)
+
+        with open(self.manifest_path) as f:
+            manifest = json.load(f)
+        self.assertEqual(len(manifest["objects"]), 3)
+        self.assertEqual(manifest["jobs"]["KB/DS"]["status"], "COMPLETE")
+
+    def test_synchronize_2(self):
+        # Nothing changed since the last job completed
+        self.synchronize()
+        result = self.synchronize()
+        self.assertEqual(result.status, "UP_TO_DATE")
+        self.assertEqual(result.unchanged, 3)
+        self.assertEqual(len(self.kb_helper.started), 1)
+        self.assertEqual(len(self.kb_helper.uploaded), 3)
+
+    def test_synchronize_3(self):
+        self.synchronize()
+        self.write("b.txt", "beta, edited")
+        os.remove(os.path.join(self.source_dir, "a.txt"))
+
+        result = self.synchronize()
+        self.assertEqual((result.uploaded, result.deleted, result.unchanged), (1, 1, 1))
+        self.assertEqual(self.kb_helper.uploaded[3:], ["docs/b.txt"])
+        self.kb_helper.s3_client.delete_object.assert_called_once_with(
+            Bucket="bucket", Key="docs/a.txt"
+        )
+        self.assertEqual(len(self.kb_helper.started), 2)
+        self.assertNotIn("s3://bucket/docs/a.txt", IngestionManifest(self.manifest_path).objects)
+
+    def test_synchronize_4(self):
+        # A job still running when the manifest was saved is waited for after a restart
+        self.synchronize()
+        manifest = IngestionManifest(self.manifest_path)
+        manifest.record_job(self.target, {"ingestionJobId": "RUNNING", "status": "IN_PROGRESS"})
+
+        result = self.synchronize()
+        self.kb_helper.bedrock_agent_client.get_ingestion_job.assert_called_with(
+            knowledgeBaseId="KB", dataSourceId="DS", ingestionJobId="RUNNING"
+        )
+        self.assertEqual(result.job["ingestionJobId"], "RUNNING")
+        self.assertEqual(result.status, "COMPLETE")
+        self.assertEqual(len(self.kb_helper.started), 1)
+
+    def test_resume_1(self):
+        manifest = IngestionManifest(self.manifest_path)
+        manifest.record_job(self.target, {"ingestionJobId": "RUNNING", "status": "STARTING"})
+        self.assertEqual(list(manifest.pending_jobs()), ["KB/DS"])
+
+        with self.orchestrator() as orchestrator:
+            futures = orchestrator.resume()
+        (target,) = futures
+        self.assertEqual(target.key, "KB/DS")
+        self.assertEqual(futures[target].result()["status"], "COMPLETE")
+        self.assertEqual(IngestionManifest(self.manifest_path).pending_jobs(), {})
+
+
+class TestIngestionManifest(unittest.TestCase):
+
+    def test_load_1(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "ingestion.json")
+            with open(path, "w") as f:
+                json.dump({"version": 0, "objects": {}, "jobs": {}}, f)
+            with self.assertRaisesRegex(ValueError, "Unsupported ingestion manifest version 0"):
+                IngestionManifest(path)
+
+    def test_objects_under_1(self):
+        manifest = IngestionManifest()
+        manifest.record_object("bucket", "docs/a.txt", {"sha256": "A"})
+        manifest.record_object("bucket", "other/b.txt", {"sha256": "B"})
+        manifest.record_object("other-bucket", "docs/c.txt", {"sha256": "C"})
+        self.assertEqual(manifest.objects_under("bucket", "docs/"), {"docs/a.txt": {"sha256": "A"}})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,117 @@
+import threading
+import unittest
+
+from src.utils.provisioning import ProvisioningError, ProvisioningPlan
+
+
+def team_plan(calls, **kwargs):
+    """Plan of a supervisor with two collaborators, appending step names to `calls`."""
+    plan = ProvisioningPlan(**kwargs)
+    for name in ("agent:news", "agent:stocks", "supervisor"):
+        plan.add(name, lambda name=name: calls.append(name) or name)
+    plan.add(
+        "prepare",
+        lambda: calls.append("prepare") or "prepared",
+        depends_on=["agent:news", "agent:stocks", "supervisor"],
+    )
+    plan.add("alias", lambda: calls.append("alias"), depends_on=["prepare"])
+    return plan
+
+
+class TestProvisioningPlan(unittest.TestCase):
+
+    def test_levels_1(self):
+        plan = team_plan([])
+        self.assertEqual(
+            plan.levels(),
+            [["agent:news", "agent:stocks", "supervisor"], ["prepare"], ["alias"]],
+        )
+        self.assertEqual(
+            str(plan).splitlines()[-2:],
+            ["2. prepare (after agent:news, agent:stocks, supervisor)", "3. alias (after prepare)"],
+        )
+
+    def test_levels_2(self):
+        plan = ProvisioningPlan()
+        plan.add("prepare", lambda: None, depends_on=["missing"])
+        with self.assertRaisesRegex(ValueError, "unknown step missing"):
+            plan.levels()
+
+    def test_levels_3(self):
+        plan = ProvisioningPlan()
+        plan.add("a", lambda: None, depends_on=["b"])
+        plan.add("b", lambda: None, depends_on=["a"])
+        with self.assertRaisesRegex(ValueError, "depend on each other"):
+            plan.run()
+
+    def test_add_1(self):
+        plan = ProvisioningPlan()
+        self.assertEqual(plan.add("a", lambda: None), "a")
+        with self.assertRaisesRegex(ValueError, "Duplicate provisioning step: a"):
+            plan.add("a", lambda: None)
+
+    def test_run_1(self):
+        calls = []
+        results = team_plan(calls).run()
+        self.assertEqual(
+            sorted(calls[:3]), ["agent:news", "agent:stocks", "supervisor"]
+        )
+        self.assertEqual(calls[3:], ["prepare", "alias"])
+        self.assertEqual(results["prepare"], "prepared")
+        self.assertEqual(results["agent:news"], "agent:news")
+
+    def test_run_2(self):
+        # Independent steps run at the same time, up to max_workers
+        barrier = threading.Barrier(3, timeout=5)
+        plan = ProvisioningPlan(max_workers=3)
+        for name in ("a", "b", "c"):
+            plan.add(name, barrier.wait)
+        plan.run()
+        self.assertEqual(set(plan.durations), {"a", "b", "c"})
+
+    def test_run_3(self):
+        calls = []
+        plan = ProvisioningPlan(max_workers=1)
+        plan.add("agent", lambda: calls.append("agent"))
+        plan.add("supervisor", lambda: 1 / 0)
+        plan.add("prepare", lambda: calls.append("prepare"), depends_on=["agent", "supervisor"])
+        plan.add("alias", lambda: calls.append("alias"), depends_on=["prepare"])
+
+        with self.assertRaises(ProvisioningError) as context:
+            plan.run()
+        self.assertEqual(context.exception.step, "supervisor")
+        self.assertEqual(context.exception.skipped, ["prepare", "alias"])
+        self.assertIsInstance(context.exception.__cause__, ZeroDivisionError)
+        self.assertEqual(str(context.exception), "Provisioning step supervisor failed, skipped: prepare, alias")
+        self.assertEqual(calls, ["agent"])
+
+    def test_run_4(self):
+        # Once a step fails, steps that became ready are not started
+        started = threading.Event()
+        release = threading.Event()
+        calls = []
+
+        def slow():
+            started.set()
+            release.wait(5)
+            calls.append("slow")
+
+        def fail():
+            started.wait(5)
+            # Let the slow step finish once the failure is seen
+            threading.Timer(0.2, release.set).start()
+            raise RuntimeError("failed")
+
+        plan = ProvisioningPlan(max_workers=2)
+        plan.add("slow", slow)
+        plan.add("fail", fail)
+        plan.add("after_slow", lambda: calls.append("after_slow"), depends_on=["slow"])
+
+        with self.assertRaises(ProvisioningError) as context:
+            plan.run()
+        self.assertEqual(context.exception.skipped, ["after_slow"])
+        self.assertEqual(calls, ["slow"])
+
+
+if __name__ == "__main__":
+    unittest.main()
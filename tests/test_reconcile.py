@@ -0,0 +1,275 @@
+import datetime
+import unittest
+from dataclasses import replace
+from unittest import mock
+
+from src.utils.bedrock_agent_helper import DEFAULT_ALIAS, DEFAULT_CI_ACTION_GROUP_NAME
+from src.utils.reconcile import (
+    ActionGroupSpec,
+    AgentSpec,
+    Change,
+    _apply_change,
+    _update_alias,
+    diff_agent_specs,
+    fetch_agent_spec,
+)
+
+CI_TARGET = f"action_group:{DEFAULT_CI_ACTION_GROUP_NAME}"
+FUNCTIONS = [
+    {
+        "name": "get_news",
+        "description": "Gets the news",
+        "parameters": {"topic": {"description": "Topic", "type": "string", "required": True}},
+    }
+]
+
+
+def agent_spec(**kwargs) -> AgentSpec:
+    spec = AgentSpec(
+        instruction="Find the news",
+        description="News agent",
+        foundation_model="anthropic.claude-3-5-haiku",
+        action_groups={
+            "actions_news": ActionGroupSpec(
+                functions=FUNCTIONS,
+                description="Set of functions for news",
+                source_code_file="news.py",
+                code_sha256="SHA",
+            )
+        },
+        knowledge_bases={"KB1": "News archive"},
+    )
+    return replace(spec, **kwargs)
+
+
+def paginator(key, pages):
+    """A paginator returning `pages`, each a list of summaries under `key`."""
+    return mock.Mock(paginate=mock.Mock(return_value=[{key: page} for page in pages]))
+
+
+def bedrock_agent_client(action_groups, knowledge_bases, aliases=()):
+    paginators = {
+        "list_agent_action_groups": paginator("actionGroupSummaries", [action_groups]),
+        "list_agent_knowledge_bases": paginator(
+            "agentKnowledgeBaseSummaries", [knowledge_bases]
+        ),
+        "list_agent_aliases": paginator("agentAliasSummaries", aliases),
+    }
+    client = mock.Mock()
+    client.get_paginator.side_effect = lambda operation: paginators[operation]
+    client.get_agent.return_value = {
+        "agent": {
+            "instruction": "Find the news",
+            "description": "News agent",
+            "foundationModel": "anthropic.claude-3-5-haiku",
+        }
+    }
+    client.get_agent_action_group.return_value = {
+        "agentActionGroup": {
+            "actionGroupExecutor": {"lambda": "arn:aws:lambda:us-east-1:123:function:news"},
+            "functionSchema": {"functions": FUNCTIONS},
+            "description": "Set of functions for news",
+        }
+    }
+    return client
+
+
+class TestDiffAgentSpecs(unittest.TestCase):
+
+    def test_diff_1(self):
+        self.assertEqual(diff_agent_specs(agent_spec(), agent_spec()), [])
+
+    def test_diff_2(self):
+        changes = diff_agent_specs(
+            agent_spec(), agent_spec(instruction="Find the latest news", guardrail_id="arn:guardrail/G1")
+        )
+        self.assertEqual(
+            [(change.action, change.target) for change in changes],
+            [("update", "instruction"), ("update", "guardrail_id")],
+        )
+        self.assertEqual(changes[1].desired, "G1")
+
+    def test_diff_3(self):
+        desired = agent_spec(
+            action_groups={"actions_stocks": agent_spec().action_groups["actions_news"]},
+            knowledge_bases={"KB2": "Stock reports"},
+        )
+        changes = diff_agent_specs(agent_spec(), desired)
+        self.assertEqual(
+            [str(change) for change in changes],
+            [
+                "+ action_group:actions_stocks",
+                "- action_group:actions_news",
+                "+ knowledge_base:KB2",
+                "- knowledge_base:KB1",
+            ],
+        )
+
+    def test_diff_4(self):
+        # The executor of an action group can't be changed in place
+        current = agent_spec()
+        desired = agent_spec(
+            action_groups={
+                "actions_news": ActionGroupSpec(functions=FUNCTIONS, executor="RETURN_CONTROL")
+            }
+        )
+        changes = diff_agent_specs(current, desired)
+        self.assertEqual(
+            [(change.action, change.target) for change in changes],
+            [("delete", "action_group:actions_news"), ("create", "action_group:actions_news")],
+        )
+
+    def test_diff_5(self):
+        # An edited source file of the Lambda function
+        desired = agent_spec()
+        desired.action_groups["actions_news"].code_sha256 = "EDITED"
+        (change,) = diff_agent_specs(agent_spec(), desired)
+        self.assertEqual((change.action, change.target), ("update", "action_group:actions_news"))
+
+        # Unknown when the function is given by its ARN
+        desired.action_groups["actions_news"].code_sha256 = None
+        self.assertEqual(diff_agent_specs(agent_spec(), desired), [])
+
+    def test_diff_6(self):
+        current = agent_spec(code_interpreter=False, code_interpreter_state="DISABLED")
+        (change,) = diff_agent_specs(current, agent_spec(code_interpreter=True))
+        self.assertEqual((change.action, change.target), ("update", CI_TARGET))
+        self.assertEqual(change.desired, "ENABLED")
+
+        (change,) = diff_agent_specs(agent_spec(), agent_spec(code_interpreter=True))
+        self.assertEqual((change.action, change.target), ("create", CI_TARGET))
+
+        current = agent_spec(code_interpreter=True, code_interpreter_state="ENABLED")
+        (change,) = diff_agent_specs(current, agent_spec())
+        self.assertEqual((change.action, change.target), ("delete", CI_TARGET))
+
+    def test_diff_7(self):
+        current = agent_spec(knowledge_base_states={"KB1": "DISABLED"})
+        (change,) = diff_agent_specs(current, agent_spec())
+        self.assertEqual((change.action, change.target), ("update", "knowledge_base:KB1"))
+        self.assertEqual(change.desired, {"description": "News archive", "state": "ENABLED"})
+
+    def test_diff_8(self):
+        current = agent_spec()
+        current.action_groups["actions_news"].state = "DISABLED"
+        (change,) = diff_agent_specs(current, agent_spec())
+        self.assertEqual((change.action, change.target), ("update", "action_group:actions_news"))
+        self.assertEqual(change.desired.state, "ENABLED")
+
+
+class TestFetchAgentSpec(unittest.TestCase):
+
+    def test_fetch_1(self):
+        client = bedrock_agent_client(
+            action_groups=[
+                {
+                    "actionGroupName": DEFAULT_CI_ACTION_GROUP_NAME,
+                    "actionGroupId": "CI",
+                    "actionGroupState": "DISABLED",
+                },
+                {
+                    "actionGroupName": "actions_news",
+                    "actionGroupId": "AG1",
+                    "actionGroupState": "ENABLED",
+                },
+            ],
+            knowledge_bases=[
+                {"knowledgeBaseId": "KB1", "description": "News archive", "knowledgeBaseState": "DISABLED"}
+            ],
+        )
+        lambda_client = mock.Mock()
+        lambda_client.get_function_configuration.return_value = {"CodeSha256": "SHA"}
+
+        spec = fetch_agent_spec(client, "AGENT", lambda_client)
+        self.assertFalse(spec.code_interpreter)
+        self.assertEqual(spec.code_interpreter_state, "DISABLED")
+        self.assertEqual(spec.action_groups["actions_news"].code_sha256, "SHA")
+        self.assertEqual(spec.knowledge_bases, {"KB1": "News archive"})
+        self.assertEqual(spec.knowledge_base_states, {"KB1": "DISABLED"})
+
+        # Disabled ones are enabled again rather than created twice
+        changes = diff_agent_specs(spec, agent_spec(code_interpreter=True))
+        self.assertEqual([change.action for change in changes], ["update", "update"])
+
+
+class TestApplyChange(unittest.TestCase):
+
+    def setUp(self):
+        self.agents_helper = mock.Mock()
+        self.client = bedrock_agent_client(
+            action_groups=[
+                {
+                    "actionGroupName": DEFAULT_CI_ACTION_GROUP_NAME,
+                    "actionGroupId": "CI",
+                    "actionGroupState": "DISABLED",
+                }
+            ],
+            knowledge_bases=[],
+        )
+        self.agents_helper._bedrock_agent_client = self.client
+
+    def test_apply_1(self):
+        _apply_change(
+            self.agents_helper, "news", "AGENT", Change("update", CI_TARGET, "DISABLED", "ENABLED")
+        )
+        self.client.create_agent_action_group.assert_not_called()
+        kwargs = self.client.update_agent_action_group.call_args.kwargs
+        self.assertEqual(kwargs["actionGroupId"], "CI")
+        self.assertEqual(kwargs["actionGroupState"], "ENABLED")
+        self.assertEqual(kwargs["parentActionGroupSignature"], "AMAZON.CodeInterpreter")
+
+    def test_apply_2(self):
+        change = Change(
+            "update",
+            "knowledge_base:KB1",
+            {"description": "News archive", "state": "DISABLED"},
+            {"description": "News archive", "state": "ENABLED"},
+        )
+        _apply_change(self.agents_helper, "news", "AGENT", change)
+        self.agents_helper.associate_kb_with_agent.assert_not_called()
+        self.client.update_agent_knowledge_base.assert_called_once_with(
+            agentId="AGENT",
+            agentVersion="DRAFT",
+            knowledgeBaseId="KB1",
+            description="News archive",
+            knowledgeBaseState="ENABLED",
+        )
+
+
+class TestUpdateAlias(unittest.TestCase):
+
+    def alias(self, alias_id, day):
+        return {
+            "agentAliasId": alias_id,
+            "agentAliasName": alias_id.lower(),
+            "updatedAt": datetime.datetime(2025, 1, day),
+        }
+
+    def test_update_alias_1(self):
+        # The latest alias is on the second page
+        agents_helper = mock.Mock()
+        agents_helper._bedrock_agent_client = bedrock_agent_client(
+            [], [], aliases=[[self.alias(DEFAULT_ALIAS, 9), self.alias("OLD", 1)], [self.alias("NEW", 2)]]
+        )
+        _update_alias(agents_helper, "AGENT")
+        client = agents_helper._bedrock_agent_client
+        client.update_agent_alias.assert_called_once_with(
+            agentId="AGENT", agentAliasId="NEW", agentAliasName="new"
+        )
+        client.create_agent_alias.assert_not_called()
+
+    def test_update_alias_2(self):
+        agents_helper = mock.Mock()
+        client = agents_helper._bedrock_agent_client = bedrock_agent_client(
+            [], [], aliases=[[self.alias(DEFAULT_ALIAS, 1)]]
+        )
+        client.create_agent_alias.return_value = {"agentAlias": {"agentAliasId": "ALIAS"}}
+        _update_alias(agents_helper, "AGENT")
+        client.create_agent_alias.assert_called_once_with(
+            agentAliasName="with-code-ag", agentId="AGENT"
+        )
+        agents_helper.wait_agent_alias_status_update.assert_called_once_with("AGENT", "ALIAS")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,38 @@
+import unittest
+
+from ui_cache import ResponseCache
+
+KEY = ResponseCache.key("AGENT", "ALIAS")
+
+
+class TestResponseCache(unittest.TestCase):
+
+    def setUp(self):
+        self.cache = ResponseCache()
+        self.cache.put(KEY, "Book a table for 2 people at 7pm", "Booked.", 1200.0)
+
+    def test_get_1(self):
+        hit = self.cache.get(KEY, "book a table for 2 people at 7pm!")
+        self.assertEqual(hit.answer, "Booked.")
+        self.assertEqual(hit.similarity, 1.0)
+
+    def test_get_2(self):
+        # Words with digits must match exactly, however similar the prompts
+        self.assertIsNone(self.cache.get(KEY, "Book a table for 2 people at 7am"))
+        self.assertIsNone(self.cache.get(KEY, "Book a table for 3 people at 7pm"))
+
+    def test_get_3(self):
+        self.assertIsNone(self.cache.get(KEY, "Book a table for 2 people at 7pm tomorrow"))
+        self.assertIsNone(
+            self.cache.get(ResponseCache.key("AGENT", "OTHER"), "Book a table for 2 people at 7pm")
+        )
+
+    def test_report_1(self):
+        self.cache.get(KEY, "Book a table for 2 people at 7pm")
+        self.cache.get(KEY, "Book a table for 2 people at 8pm")
+        report = self.cache.report()
+        self.assertEqual((report["lookups"], report["hits"]), (2, 1))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,68 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from ui_history import HistoryStore, MessageHistory, get_history_store
+
+
+class TestMessageHistory(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "history.sqlite3")
+
+    def test_append_1(self):
+        history = MessageHistory("session", window=4, store_path=self.path)
+        for idx in range(10):
+            history.append("user", f"message {idx}")
+        self.assertEqual(len(history), 10)
+        self.assertEqual(len(history.recent), 4)
+        self.assertEqual(
+            [message["content"] for message in history.last(7)],
+            [f"message {idx}" for idx in range(3, 10)],
+        )
+
+    def test_last_1(self):
+        # Stored messages of a chat inactive for longer than the TTL
+        history = MessageHistory("session", window=4, store_path=self.path, ttl_seconds=60)
+        with mock.patch("time.time", return_value=1000.0):
+            for idx in range(6):
+                history.append("user", f"message {idx}")
+        self.assertEqual((len(history), len(history.recent)), (6, 3))
+        with mock.patch("time.time", return_value=2000.0):
+            HistoryStore(self.path, ttl_seconds=60).put("other", [(0, {"role": "user", "content": "other"})])
+
+        self.assertEqual(
+            [message["content"] for message in history.last(6)],
+            ["message 3", "message 4", "message 5"],
+        )
+        self.assertEqual(len(history), 3)
+        history.append("user", "message 6")
+        self.assertEqual(len(history.last(4)), 4)
+
+    def test_put_1(self):
+        store = HistoryStore(self.path, ttl_seconds=60)
+        with mock.patch("time.time", return_value=1000.0):
+            store.put("abandoned", [(0, {"role": "user", "content": "old"})])
+            store.put("active", [(0, {"role": "user", "content": "old"})])
+        with mock.patch("time.time", return_value=1050.0):
+            store.page("active", 1, 10)
+        with mock.patch("time.time", return_value=1100.0):
+            store.put("new", [(0, {"role": "user", "content": "new"})])
+        # Sessions inactive for longer than the TTL are deleted on put
+        self.assertEqual(store.page("abandoned", 1, 10), [])
+        self.assertEqual(store.page("active", 1, 10), [{"role": "user", "content": "old"}])
+        self.assertEqual(store.page("new", 1, 10), [{"role": "user", "content": "new"}])
+
+    def test_put_2(self):
+        store = get_history_store(self.path, ttl_seconds=None)
+        with mock.patch("time.time", return_value=0.0):
+            store.put("session", [(0, {"role": "user", "content": "kept"})])
+        store.put("other", [(0, {"role": "user", "content": "other"})])
+        self.assertEqual(store.page("session", 1, 10), [{"role": "user", "content": "kept"}])
+
+
+if __name__ == "__main__":
+    unittest.main()
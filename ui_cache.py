@@ -0,0 +1,181 @@
+import json
+import re
+import threading
+import time
+import unicodedata
+import zlib
+from collections import OrderedDict
+from dataclasses import dataclass, field
+
+# Prompts closer than this to a cached one get its answer
+DEFAULT_SIMILARITY_THRESHOLD = 0.95
+DEFAULT_TTL_SECONDS = 3600
+DEFAULT_MAX_ENTRIES = 500
+EMBEDDING_DIMENSIONS = 4096
+
+_WORD = re.compile(r"\w+")
+# Words with digits, such as "2", "7pm" or "b12", must match exactly
+_NUMBER = re.compile(r"\w*\d\w*")
+
+
+def normalize_prompt(text):
+    """Lower case words of a prompt, without punctuation or extra whitespace."""
+    text = unicodedata.normalize("NFKC", text).lower()
+    return " ".join(_WORD.findall(text))
+
+
+def embed(text):
+    """Local hashed bag of words and character trigrams of a normalized prompt, as a sparse
+    unit vector. Close wordings of a prompt get close vectors, without calling a model."""
+    features = {}
+    for word in text.split():
+        features[word] = features.get(word, 0.0) + 1.0
+    padded = f" {text} "
+    for idx in range(len(padded) - 2):
+        trigram = "#" + padded[idx:idx + 3]
+        features[trigram] = features.get(trigram, 0.0) + 0.5
+
+    vector = {}
+    for feature, weight in features.items():
+        bucket = zlib.crc32(feature.encode("utf-8")) % EMBEDDING_DIMENSIONS
+        vector[bucket] = vector.get(bucket, 0.0) + weight
+    norm = sum(value * value for value in vector.values()) ** 0.5 or 1.0
+    return {bucket: value / norm for bucket, value in vector.items()}
+
+
+def cosine_similarity(a, b):
+    if len(a) > len(b):
+        a, b = b, a
+    return sum(value * b.get(bucket, 0.0) for bucket, value in a.items())
+
+
+@dataclass
+class CachedAnswer:
+    prompt: str
+    vector: dict
+    answer: str
+    latency_ms: float
+    created_at: float = field(default_factory=time.monotonic)
+    hits: int = 0
+
+
+@dataclass(frozen=True)
+class CacheHit:
+    answer: str
+    similarity: float
+    age_seconds: float
+    latency_ms: float
+
+
+class ResponseCache:
+    """Answers of an agent to the first prompts of sessions, returned for near-identical prompts.
+
+    Answers are keyed on the agent, its alias and the session attributes. Within a key, a
+    prompt matches the closest cached prompt whose embedding is at least
+    `similarity_threshold` similar, and that has the same words with digits, "2 people at
+    7pm" never getting the answer to "3 people at 7pm" or "2 people at 7am". Answers expire
+    after `ttl_seconds`, and the least recently used go beyond `max_entries`.
+
+    Configured with `response_cache` in config.py, e.g. {"similarity_threshold": 0.95}.
+    """
+
+    def __init__(self, similarity_threshold=DEFAULT_SIMILARITY_THRESHOLD,
+                 ttl_seconds=DEFAULT_TTL_SECONDS, max_entries=DEFAULT_MAX_ENTRIES):
+        self.similarity_threshold = similarity_threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self.lookups = 0
+        self.hits = 0
+        self.saved_ms = 0.0
+
+    @staticmethod
+    def key(agent_id, agent_alias_id, session_attributes=None):
+        return (
+            agent_id,
+            agent_alias_id,
+            json.dumps(session_attributes or {}, sort_keys=True, default=str),
+        )
+
+    def _expire(self, now):
+        expired = [
+            entry_key for entry_key, entry in self._entries.items()
+            if now - entry.created_at > self.ttl_seconds
+        ]
+        for entry_key in expired:
+            del self._entries[entry_key]
+
+    def get(self, key, prompt):
+        """Cached answer to the closest prompt to `prompt` under `key`, or None."""
+        normalized = normalize_prompt(prompt)
+        vector = embed(normalized)
+        numbers = _NUMBER.findall(normalized)
+        now = time.monotonic()
+        with self._lock:
+            self.lookups += 1
+            self._expire(now)
+            best, best_similarity = None, 0.0
+            for (entry_key, entry_prompt), entry in self._entries.items():
+                if entry_key != key or _NUMBER.findall(entry_prompt) != numbers:
+                    continue
+                similarity = 1.0 if entry_prompt == normalized else cosine_similarity(vector, entry.vector)
+                if similarity >= self.similarity_threshold and similarity > best_similarity:
+                    best, best_similarity = entry, similarity
+            if best is None:
+                return None
+            self._entries.move_to_end((key, best.prompt))
+            best.hits += 1
+            self.hits += 1
+            return CacheHit(best.answer, best_similarity, now - best.created_at, best.latency_ms)
+
+    def put(self, key, prompt, answer, latency_ms):
+        normalized = normalize_prompt(prompt)
+        with self._lock:
+            self._entries[(key, normalized)] = CachedAnswer(
+                normalized, embed(normalized), answer, latency_ms
+            )
+            self._entries.move_to_end((key, normalized))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def record_savings(self, hit, latency_ms):
+        """Count the latency of the original answer, less that of serving it again."""
+        with self._lock:
+            self.saved_ms += max(hit.latency_ms - latency_ms, 0.0)
+
+    def report(self):
+        """Hit rate and latency saved since the cache was created."""
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "lookups": self.lookups,
+                "hits": self.hits,
+                "hit_rate": round(self.hits / self.lookups, 3) if self.lookups else 0.0,
+                "saved_ms": round(self.saved_ms, 1),
+                "saved_ms_per_hit": round(self.saved_ms / self.hits, 1) if self.hits else 0.0,
+            }
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_response_cache(settings):
+    """Response cache for the `response_cache` setting, None when answers are not cached.
+
+    Shared by the sessions of the Streamlit server, and kept across reruns and reloads of
+    config.py as long as the settings do not change.
+    """
+    if not settings:
+        return None
+    settings = {} if settings is True else dict(settings)
+    cache_key = json.dumps(settings, sort_keys=True)
+    with _caches_lock:
+        if cache_key not in _caches:
+            _caches[cache_key] = ResponseCache(**settings)
+        return _caches[cache_key]
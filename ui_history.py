@@ -0,0 +1,147 @@
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+# Messages kept in the session state, older ones are moved to the local store
+DEFAULT_WINDOW = 50
+# Messages rendered on a rerun, and loaded by each click on "older messages"
+DEFAULT_PAGE_SIZE = 20
+DEFAULT_STORE_PATH = os.path.join(tempfile.gettempdir(), "demo_ui_history.sqlite3")
+# Messages of chats without activity for longer are deleted from the store
+DEFAULT_TTL_SECONDS = 24 * 3600
+
+
+class HistoryStore:
+    """Messages moved out of the session state of the chats, in a local SQLite file.
+
+    Chats are abandoned rather than closed, so every `put` deletes the messages of the
+    sessions whose messages were neither stored nor read for `ttl_seconds`.
+    """
+
+    def __init__(self, path, ttl_seconds=DEFAULT_TTL_SECONDS):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        # Shared by the threads Streamlit runs sessions in, behind the lock
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._connection:
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS messages ("
+                "session_id TEXT, seq INTEGER, role TEXT, content TEXT, updated_at REAL, "
+                "PRIMARY KEY (session_id, seq))"
+            )
+            columns = [row[1] for row in self._connection.execute("PRAGMA table_info(messages)")]
+            if "updated_at" not in columns:
+                # Stores of earlier versions, whose messages expire on the first put
+                self._connection.execute("ALTER TABLE messages ADD COLUMN updated_at REAL DEFAULT 0")
+
+    def put(self, session_id, messages):
+        """Store `(seq, message)` pairs of a session, and delete expired sessions."""
+        now = time.time()
+        with self._lock, self._connection:
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO messages VALUES (?, ?, ?, ?, ?)",
+                [(session_id, seq, message["role"], message["content"], now) for seq, message in messages],
+            )
+            self._connection.execute(
+                "UPDATE messages SET updated_at = ? WHERE session_id = ?", (now, session_id)
+            )
+            if self.ttl_seconds is not None:
+                self._connection.execute(
+                    "DELETE FROM messages WHERE session_id IN ("
+                    "SELECT session_id FROM messages GROUP BY session_id HAVING MAX(updated_at) < ?)",
+                    (now - self.ttl_seconds,),
+                )
+
+    def page(self, session_id, before_seq, limit):
+        """Up to `limit` messages of a session before `before_seq`, oldest first."""
+        with self._lock, self._connection:
+            self._connection.execute(
+                "UPDATE messages SET updated_at = ? WHERE session_id = ?", (time.time(), session_id)
+            )
+            rows = self._connection.execute(
+                "SELECT role, content FROM messages WHERE session_id = ? AND seq < ? "
+                "ORDER BY seq DESC LIMIT ?",
+                (session_id, before_seq, limit),
+            ).fetchall()
+        return [{"role": role, "content": content} for role, content in reversed(rows)]
+
+    def delete(self, session_id):
+        with self._lock, self._connection:
+            self._connection.execute("DELETE FROM messages WHERE session_id = ?", (session_id,))
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_history_store(path=None, ttl_seconds=DEFAULT_TTL_SECONDS):
+    """Store of the Streamlit server for `path`, the `history_store` setting, expiring
+    sessions after `ttl_seconds`, the `history_ttl_seconds` setting."""
+    path = path or DEFAULT_STORE_PATH
+    with _stores_lock:
+        if path not in _stores:
+            _stores[path] = HistoryStore(path, ttl_seconds)
+        _stores[path].ttl_seconds = ttl_seconds
+        return _stores[path]
+
+
+class MessageHistory:
+    """Messages of a chat, only the last `window` of them held in the session state.
+
+    Appending to a full window moves its oldest half to the local store, so the session
+    state, and the work of a rerun, stay the same size however long the chat gets.
+    """
+
+    def __init__(self, session_id, window=DEFAULT_WINDOW, store_path=None,
+                 ttl_seconds=DEFAULT_TTL_SECONDS):
+        self.session_id = session_id
+        self.window = max(window, 2)
+        self.store_path = store_path
+        self.ttl_seconds = ttl_seconds
+        # Messages in the session state, and the sequence number of the first one
+        self.recent = []
+        self.first_seq = 0
+
+    def __len__(self):
+        return self.first_seq + len(self.recent)
+
+    @property
+    def store(self):
+        return get_history_store(self.store_path, self.ttl_seconds)
+
+    def append(self, role, content):
+        self.recent.append({"role": role, "content": content})
+        if len(self.recent) > self.window:
+            moved = len(self.recent) - self.window // 2
+            self.store.put(
+                self.session_id,
+                [(self.first_seq + idx, message) for idx, message in enumerate(self.recent[:moved])],
+            )
+            self.recent = self.recent[moved:]
+            self.first_seq += moved
+
+    def last(self, count):
+        """The last `count` messages, oldest first, read from the store past the window.
+
+        Fewer when the messages in the store expired, which are then forgotten.
+        """
+        if count <= len(self.recent):
+            return self.recent[len(self.recent) - count:]
+        wanted = min(count - len(self.recent), self.first_seq)
+        older = self.store.page(self.session_id, self.first_seq, wanted)
+        if len(older) < wanted:
+            # Deleted by the TTL of the store while the chat was inactive
+            self.store.delete(self.session_id)
+            self.first_seq = 0
+            return list(self.recent)
+        return older + self.recent
+
+    def clear(self):
+        """Forget the messages of the chat, including those in the store."""
+        if self.first_seq:
+            self.store.delete(self.session_id)
+        self.recent = []
+        self.first_seq = 0
@@ -0,0 +1,185 @@
+import datetime
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import boto3
+
+# Invocation inputs and the observations answering them share a traceId
+INVOCATION_KINDS = {
+    'actionGroupInvocationInput': 'tool',
+    'agentCollaboratorInvocationInput': 'collaborator',
+    'knowledgeBaseLookupInput': 'knowledge_base',
+    'codeInterpreterInvocationInput': 'code_interpreter',
+}
+
+MODEL_TRACE_TYPES = ('preProcessingTrace', 'orchestrationTrace', 'postProcessingTrace', 'routingClassifierTrace')
+
+
+def model_latency_ms(model_output, started_at, ended_at):
+    """Model latency from the trace metadata, or from the event times of the trace."""
+    metadata = model_output.get('metadata', {})
+    if 'totalTimeMs' in metadata:
+        return metadata['totalTimeMs']
+    if started_at and ended_at:
+        return (ended_at - started_at).total_seconds() * 1000
+    return None
+
+
+class TurnTimings:
+    """Latency breakdown of one agent turn, from the client's and the traces' point of view."""
+
+    def __init__(self, session_id, agent_id):
+        self.session_id = session_id
+        self.agent_id = agent_id
+        self.timestamp = datetime.datetime.now(datetime.timezone.utc)
+        self._start = time.perf_counter()
+        self.marks = {}
+        self.durations = {}
+        self.steps = []
+        self._pending = {}
+
+    def mark(self, name):
+        """Time since the start of the turn, recorded the first time only."""
+        self.marks.setdefault(name, (time.perf_counter() - self._start) * 1000)
+
+    @contextmanager
+    def measure(self, name):
+        """Accumulate the time spent in the block under `name`."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.durations[name] = self.durations.get(name, 0.0) + (time.perf_counter() - start) * 1000
+
+    def observe_trace(self, event):
+        """Record model, tool and collaborator latency of a trace event."""
+        trace_part = event['trace']
+        event_time = trace_part.get('eventTime')
+        agent = trace_part.get('collaboratorName') or trace_part.get('agentId') or self.agent_id
+
+        for trace_type in MODEL_TRACE_TYPES:
+            if trace_type not in trace_part.get('trace', {}):
+                continue
+            _trace = trace_part['trace'][trace_type]
+
+            if 'modelInvocationInput' in _trace:
+                self._pending[('model', _trace['modelInvocationInput'].get('traceId'))] = event_time
+
+            if 'modelInvocationOutput' in _trace:
+                _output = _trace['modelInvocationOutput']
+                started_at = self._pending.pop(('model', _output.get('traceId')), None)
+                self._add_step('model', agent, trace_type, model_latency_ms(_output, started_at, event_time))
+
+            if 'invocationInput' in _trace:
+                _input = _trace['invocationInput']
+                for key, kind in INVOCATION_KINDS.items():
+                    if key in _input:
+                        name = (
+                            _input[key].get('function')
+                            or _input[key].get('agentCollaboratorName')
+                            or _input[key].get('knowledgeBaseId')
+                            or kind
+                        )
+                        self._pending[('invocation', _input.get('traceId'))] = (kind, name, event_time)
+
+            if 'observation' in _trace:
+                _pending = self._pending.pop(('invocation', _trace['observation'].get('traceId')), None)
+                if _pending:
+                    kind, name, started_at = _pending
+                    latency = None
+                    if started_at and event_time:
+                        latency = (event_time - started_at).total_seconds() * 1000
+                    self._add_step(kind, agent, name, latency)
+
+    def _add_step(self, kind, agent, name, latency_ms):
+        if latency_ms is not None:
+            self.steps.append({'kind': kind, 'agent': agent, 'name': name, 'latency_ms': round(latency_ms, 1)})
+
+    def _step_total(self, *kinds):
+        return sum(step['latency_ms'] for step in self.steps if step['kind'] in kinds)
+
+    def summary(self):
+        """Phases of the turn in milliseconds, with the latency of each traced step."""
+        phases = {
+            'client_creation_ms': self.durations.get('client_creation'),
+            'request_send_ms': self.durations.get('request'),
+            'time_to_first_event_ms': self.marks.get('first_event'),
+            'time_to_first_chunk_ms': self.marks.get('first_chunk'),
+            'model_ms': self._step_total('model'),
+            'tool_ms': self._step_total('tool', 'knowledge_base', 'code_interpreter'),
+            # Includes the model and tool time of the collaborators themselves
+            'collaborator_ms': self._step_total('collaborator'),
+            # Agent lookups happen while rendering, but are a network call of their own
+            'agent_lookup_ms': self.durations.get('agent_lookup'),
+            'render_ms': self.durations.get('render', 0.0) - self.durations.get('agent_lookup', 0.0),
+            'total_ms': self.marks.get('end'),
+        }
+        return {
+            'timestamp': self.timestamp.isoformat(),
+            'session_id': self.session_id,
+            'agent_id': self.agent_id,
+            'phases': {name: round(value, 1) for name, value in phases.items() if value is not None},
+            'steps': self.steps,
+        }
+
+
+class MetricsSink:
+    """Export turn timings to stdout, a JSON lines file or CloudWatch.
+
+    Configured with `metrics_sink` in config.py: "stdout", "file:<path>" or
+    "cloudwatch:<namespace>".
+    """
+
+    def __init__(self, target):
+        self.kind, _, self.destination = target.partition(':')
+        if self.kind not in ('stdout', 'file', 'cloudwatch'):
+            raise ValueError(f"Unknown metrics sink: {target}")
+        self._lock = threading.Lock()
+        self._cloudwatch = None
+
+    def emit(self, summary):
+        if self.kind == 'stdout':
+            print(json.dumps(summary))
+        elif self.kind == 'file':
+            with self._lock:
+                os.makedirs(os.path.dirname(self.destination) or '.', exist_ok=True)
+                with open(self.destination, 'a') as f:
+                    f.write(json.dumps(summary) + '\n')
+        else:
+            # Do not hold up the UI on the metrics call
+            threading.Thread(target=self._put_metric_data, args=(summary,), daemon=True).start()
+
+    def _put_metric_data(self, summary):
+        try:
+            if self._cloudwatch is None:
+                self._cloudwatch = boto3.client('cloudwatch')
+            self._cloudwatch.put_metric_data(
+                Namespace=self.destination or 'BedrockAgentsDemoUI',
+                MetricData=[
+                    {
+                        'MetricName': name,
+                        'Dimensions': [{'Name': 'AgentId', 'Value': summary['agent_id']}],
+                        'Timestamp': datetime.datetime.fromisoformat(summary['timestamp']),
+                        'Value': value,
+                        'Unit': 'Milliseconds',
+                    }
+                    for name, value in summary['phases'].items()
+                ],
+            )
+        except Exception as e:
+            print(f"Error exporting turn metrics: {e}")
+
+
+_sinks = {}
+
+
+def get_metrics_sink(target):
+    """Metrics sink for the `metrics_sink` setting, None when metrics are not exported."""
+    if not target:
+        return None
+    if target not in _sinks:
+        _sinks[target] = MetricsSink(target)
+    return _sinks[target]
@@ -1,9 +1,16 @@
 import boto3
 import streamlit as st
-import datetime
-import json
 import math
+import config
+from src.utils.agent_events import (
+    KEEP_PREVIOUS_AGENT_CLASSIFICATION,
+    UNDECIDABLE_CLASSIFICATION,
+    AgentEventProcessor,
+    EventSink,
+)
 from src.utils.bedrock_agent import Task
+from ui_cache import get_response_cache
+from ui_metrics import TurnTimings, get_metrics_sink
 
 def make_full_prompt(tasks, additional_instructions, processing_type="sequential"):
     """Build a full prompt from tasks and instructions."""
@@ -53,6 +60,7 @@ def get_trace_text(key):
             "kb_response": "知识库响应",
             "references": "引用",
             "tool_response": "工具响应",
+            "tool_result_tokens": "约 {} 个令牌，编码前约 {} 个（节省 {}%）",
             "code_output": "代码解释器输出",
             "code_error": "代码解释错误: ",
             "files_generated": "生成的文件:\n",
@@ -66,7 +74,17 @@ def get_trace_text(key):
             "collaborator_invoke": "调用协作者 - {}",
             "collaborator_name": "协作者名称: ",
             "collaborator_input": "输入内容: ",
-            "collaborator_response": "协作者响应 - {}"
+            "collaborator_response": "协作者响应 - {}",
+            "latency_breakdown": "延迟分解",
+            "phase": "阶段",
+            "latency_ms": "延迟 (毫秒)",
+            "step_kind": "类型",
+            "agent": "Agent",
+            "name": "名称",
+            "cached_answer": ":material/bolt: *缓存的回答（相似度 {:.0%}，{:.0f} 秒前）*",
+            "response_cache": "响应缓存",
+            "metric": "指标",
+            "value": "值"
         },
         "English": {
             "choosing_collaborator": "Choosing a collaborator for this request...",
@@ -88,6 +106,7 @@ def get_trace_text(key):
             "kb_response": "Knowledge Base Response",
             "references": "references",
             "tool_response": "Tool Response",
+            "tool_result_tokens": "~{} tokens, ~{} before encoding ({}% saved)",
             "code_output": "Code interpreter output",
             "code_error": "Code interpretation error: ",
             "files_generated": "Code interpretation files generated:\n",
@@ -101,177 +120,179 @@ def get_trace_text(key):
             "collaborator_invoke": "Invoking Collaborator - {}",
             "collaborator_name": "Collaborator Name: ",
             "collaborator_input": "Input Content: ",
-            "collaborator_response": "Collaborator Response - {}"
+            "collaborator_response": "Collaborator Response - {}",
+            "latency_breakdown": "Latency breakdown",
+            "phase": "Phase",
+            "latency_ms": "Latency (ms)",
+            "step_kind": "Kind",
+            "agent": "Agent",
+            "name": "Name",
+            "cached_answer": ":material/bolt: *Cached answer ({:.0%} similar, {:.0f}s old)*",
+            "response_cache": "Response cache",
+            "metric": "Metric",
+            "value": "Value"
         }
     }
     
     language = st.session_state.get('language', "English")
     return texts[language][key]
 
-def process_routing_trace(event, step, _sub_agent_name, _time_before_routing=None):
-    """Process routing classifier trace events."""
-   
-    _route = event['trace']['trace']['routingClassifierTrace']
-    
-    if 'modelInvocationInput' in _route:
-        #print("Processing modelInvocationInput")
-        container = st.container(border=True)                            
-        container.markdown(f"""**{get_trace_text("choosing_collaborator")}**""")
-        return datetime.datetime.now(), step, _sub_agent_name, None, None
-        
-    if 'modelInvocationOutput' in _route and _time_before_routing:
-        #print("Processing modelInvocationOutput")
-        try:
-            _llm_usage = _route['modelInvocationOutput'].get('metadata', {}).get('usage', {})
-            inputTokens = _llm_usage.get('inputTokens', 0)
-            outputTokens = _llm_usage.get('outputTokens', 0)
-        except Exception as e:
-            print(f"Error getting token usage from routing trace: {e}")
-            inputTokens = 0
-            outputTokens = 0
-        
-        _route_duration = datetime.datetime.now() - _time_before_routing
+class StreamlitTraceSink(EventSink):
+    """Render the trace records of an agent invocation as Streamlit containers and expanders."""
 
-        _raw_resp_str = _route['modelInvocationOutput']['rawResponse']['content']
-        _raw_resp = json.loads(_raw_resp_str)
-        _classification = _raw_resp['content'][0]['text'].replace('<a>', '').replace('</a>', '')
+    def __init__(self, agentClient, timings=None):
+        self.agentClient = agentClient
+        self.timings = timings
+        self.step = 0.0
+        self._sub_agent_name = " "
+        self.collaborator_output = None
+        # Whether the agent called tools or collaborators, whose side effects a cached answer would skip
+        self.called_tools = False
+        self._renderers = {
+            'routing_input': self._routing_input,
+            'routing_output': self._routing_output,
+            'rationale': self._rationale,
+            'kb_input': self._kb_input,
+            'collaborator_input': self._collaborator_input,
+            'tool_input': self._tool_input,
+            'code_input': self._code_input,
+            'kb_output': self._kb_output,
+            'collaborator_output': self._collaborator_output,
+            'tool_output': self._tool_output,
+            'code_output': self._code_output,
+            'final_response': self._final_response,
+        }
 
-        if _classification == "undecidable":
+    def on_event(self, event, state):
+        if self.timings:
+            self.timings.mark("first_event")
+            if "trace" in event:
+                self.timings.observe_trace(event)
+
+    def on_record(self, record, state):
+        if record.kind in ('tool_input', 'collaborator_input'):
+            self.called_tools = True
+        renderer = self._renderers.get(record.kind)
+        if renderer is None:
+            return
+        if self.timings:
+            with self.timings.measure("render"):
+                renderer(record, state)
+        else:
+            renderer(record, state)
+
+    def _routing_input(self, record, state):
+        container = st.container(border=True)
+        container.markdown(f"""**{get_trace_text("choosing_collaborator")}**""")
+
+    def _routing_output(self, record, state):
+        _classification = record.data['classification']
+        if _classification == UNDECIDABLE_CLASSIFICATION:
             text = get_trace_text("no_matching")
-        elif _classification in (_sub_agent_name, 'keep_previous_agent'):
-            step = math.floor(step + 1)
+        elif _classification in (self._sub_agent_name, KEEP_PREVIOUS_AGENT_CLASSIFICATION):
+            self.step = math.floor(self.step + 1)
             text = get_trace_text("continue_conversation")
         else:
-            _sub_agent_name = _classification
-            step = math.floor(step + 1)
-            text = get_trace_text("use_collaborator").format(_sub_agent_name)
+            self._sub_agent_name = _classification
+            self.step = math.floor(self.step + 1)
+            text = get_trace_text("use_collaborator").format(self._sub_agent_name)
 
-        time_text = get_trace_text("intent_classifier").format(_route_duration.total_seconds())
-        container = st.container(border=True)                            
+        container = st.container(border=True)
         container.write(text)
-        container.write(time_text)
-        
-        return step, _sub_agent_name, inputTokens, outputTokens
-
-def process_orchestration_trace(event, agentClient, step):
-    """Process orchestration trace events."""
-    _orch = event['trace']['trace']['orchestrationTrace']
-    inputTokens = 0
-    outputTokens = 0
-    collaborator_output = None
-    
-    if "invocationInput" in _orch:
-        _input = _orch['invocationInput']
-        
-        if 'knowledgeBaseLookupInput' in _input:
-            with st.expander(get_trace_text("using_kb"), False, icon=":material/plumbing:"):
-                st.write(get_trace_text("kb_id") + _input["knowledgeBaseLookupInput"]["knowledgeBaseId"])
-                st.write(get_trace_text("query") + _input["knowledgeBaseLookupInput"]["text"].replace('$', r'\$'))
-        
-        if 'agentCollaboratorInvocationInput' in _input:
-            # 处理collaborator agent的调用
-            collab_name = _input['agentCollaboratorInvocationInput']['agentCollaboratorName']
-            collab_input = _input['agentCollaboratorInvocationInput']['input']['text']
-            with st.expander(get_trace_text("collaborator_invoke").format(collab_name), False, icon=":material/account-group:"):
-                st.write(f"{get_trace_text('collaborator_name')}{collab_name}")
-                st.write(f"{get_trace_text('collaborator_input')}{collab_input[:200]}...")
-                
-        if "actionGroupInvocationInput" in _input:
-            try:
-                function = _input["actionGroupInvocationInput"].get("function", get_trace_text("unknown_function"))
-                with st.expander(f"{get_trace_text('invoking_tool')}{function}", False, icon=":material/plumbing:"):
-                    st.write(get_trace_text("function") + function)
-                    if "executionType" in _input["actionGroupInvocationInput"]:
-                        st.write(get_trace_text("type") + _input["actionGroupInvocationInput"]["executionType"])
-                    if 'parameters' in _input["actionGroupInvocationInput"]:
-                        st.write(f"*{get_trace_text('parameters')}*")
-                        params = _input["actionGroupInvocationInput"]["parameters"]
-                        st.table({
-                            get_trace_text('param_name'): [p["name"] for p in params],
-                            get_trace_text('param_value'): [p["value"] for p in params]
-                        })
-            except Exception as e:
-                print(f"Error processing actionGroupInvocationInput: {e}")
-                print(f"actionGroupInvocationInput content: {_input['actionGroupInvocationInput']}")
-
-        if 'codeInterpreterInvocationInput' in _input:
-            with st.expander(get_trace_text("code_interpreter"), False, icon=":material/psychology:"):
-                gen_code = _input['codeInterpreterInvocationInput']['code']
-                st.code(gen_code, language="python")
-                    
-    if "modelInvocationOutput" in _orch:
-        try:
-            metadata = _orch["modelInvocationOutput"].get("metadata", {})
-            usage = metadata.get("usage", {})
-            inputTokens = usage.get("inputTokens", 0)
-            outputTokens = usage.get("outputTokens", 0)
-        except Exception as e:
-            print(f"Error getting token usage from orchestration trace: {e}")
-            inputTokens = 0
-            outputTokens = 0
-                    
-    if "rationale" in _orch:
-        if "agentId" in event["trace"]:
-            agentData = agentClient.get_agent(agentId=event["trace"]["agentId"])
-            agentName = agentData["agent"]["agentName"]
-            chain = event["trace"]["callerChain"]
-            
-            container = st.container(border=True)
-            
-            if len(chain) <= 1:
-                step = math.floor(step + 1)
-                container.markdown(f"""#### {get_trace_text("step")}  :blue[{round(step,2)}]""")
-            else:
-                step = step + 0.1
-                container.markdown(f"""###### {get_trace_text("step")} {round(step,2)} {get_trace_text("sub_agent")}  :red[{agentName}]""")
-            
-            container.write(_orch["rationale"]["text"].replace('$', r'\$'))
+        if state.duration is not None:
+            container.write(get_trace_text("intent_classifier").format(state.duration))
 
-    if "observation" in _orch:
-        _obs = _orch['observation']
-        
-        if 'knowledgeBaseLookupOutput' in _obs:
-            with st.expander(get_trace_text("kb_response"), False, icon=":material/psychology:"):
-                _refs = _obs['knowledgeBaseLookupOutput']['retrievedReferences']
-                _ref_count = len(_refs)
-                st.write(f"{_ref_count} {get_trace_text('references')}")
-                for i, _ref in enumerate(_refs, 1):
-                    st.write(f"  ({i}) {_ref['content']['text'][0:200]}...")
-        
-        if 'agentCollaboratorInvocationOutput' in _obs:
-            # 处理collaborator agent的响应
-            collab_name = _obs['agentCollaboratorInvocationOutput']['agentCollaboratorName']
-            collab_output = _obs['agentCollaboratorInvocationOutput']['output']['text']
-            with st.expander(get_trace_text("collaborator_response").format(collab_name), False, icon=":material/account-group:"):
-                st.write(f"{get_trace_text('collaborator_name')}{collab_name}")
-                st.markdown(collab_output.replace('$', r'\$'))
-            
-            # 保存collaborator的输出，以便在主UI中显示
-            collaborator_output = collab_output
-
-        if 'actionGroupInvocationOutput' in _obs:
-            with st.expander(get_trace_text("tool_response"), False, icon=":material/psychology:"):
-                st.write(_obs['actionGroupInvocationOutput']['text'].replace('$', r'\$'))
-
-        if 'codeInterpreterInvocationOutput' in _obs:
-            with st.expander(get_trace_text("code_interpreter"), False, icon=":material/psychology:"):
-                if 'executionOutput' in _obs['codeInterpreterInvocationOutput']:
-                    raw_output = _obs['codeInterpreterInvocationOutput']['executionOutput']
-                    st.code(raw_output)
-
-                if 'executionError' in _obs['codeInterpreterInvocationOutput']:
-                    error_text = _obs['codeInterpreterInvocationOutput']['executionError']
-                    st.write(f"{get_trace_text('code_error')}{error_text}")
-
-                if 'files' in _obs['codeInterpreterInvocationOutput']:
-                    files_generated = _obs['codeInterpreterInvocationOutput']['files']
-                    st.write(f"{get_trace_text('files_generated')}{files_generated}")
-
-        if 'finalResponse' in _obs:
-            with st.expander(get_trace_text("agent_response"), False, icon=":material/psychology:"):
-                st.write(_obs['finalResponse']['text'].replace('$', r'\$'))
-            
-    return step, inputTokens, outputTokens, collaborator_output
+    def _rationale(self, record, state):
+        if "agentId" not in record.trace:
+            return
+        if self.timings:
+            with self.timings.measure("agent_lookup"):
+                agentData = self.agentClient.get_agent(agentId=record.trace["agentId"])
+        else:
+            agentData = self.agentClient.get_agent(agentId=record.trace["agentId"])
+        agentName = agentData["agent"]["agentName"]
+        chain = record.trace["callerChain"]
+
+        container = st.container(border=True)
+
+        if len(chain) <= 1:
+            self.step = math.floor(self.step + 1)
+            container.markdown(f"""#### {get_trace_text("step")}  :blue[{round(self.step,2)}]""")
+        else:
+            self.step = self.step + 0.1
+            container.markdown(f"""###### {get_trace_text("step")} {round(self.step,2)} {get_trace_text("sub_agent")}  :red[{agentName}]""")
+
+        container.write(record.data["text"].replace('$', r'\$'))
+
+    def _kb_input(self, record, state):
+        with st.expander(get_trace_text("using_kb"), False, icon=":material/plumbing:"):
+            st.write(get_trace_text("kb_id") + record.data["knowledge_base_id"])
+            st.write(get_trace_text("query") + record.data["text"].replace('$', r'\$'))
+
+    def _collaborator_input(self, record, state):
+        collab_name = record.data['name']
+        with st.expander(get_trace_text("collaborator_invoke").format(collab_name), False, icon=":material/account-group:"):
+            st.write(f"{get_trace_text('collaborator_name')}{collab_name}")
+            st.write(f"{get_trace_text('collaborator_input')}{record.data['text'][:200]}...")
+
+    def _tool_input(self, record, state):
+        function = record.data["function"] or get_trace_text("unknown_function")
+        with st.expander(f"{get_trace_text('invoking_tool')}{function}", False, icon=":material/plumbing:"):
+            st.write(get_trace_text("function") + function)
+            if record.data["execution_type"]:
+                st.write(get_trace_text("type") + record.data["execution_type"])
+            if record.data["parameters"] is not None:
+                st.write(f"*{get_trace_text('parameters')}*")
+                params = record.data["parameters"]
+                st.table({
+                    get_trace_text('param_name'): [p["name"] for p in params],
+                    get_trace_text('param_value'): [p["value"] for p in params]
+                })
+
+    def _code_input(self, record, state):
+        with st.expander(get_trace_text("code_interpreter"), False, icon=":material/psychology:"):
+            st.code(record.data['code'], language="python")
+
+    def _kb_output(self, record, state):
+        with st.expander(get_trace_text("kb_response"), False, icon=":material/psychology:"):
+            _refs = record.data['references']
+            st.write(f"{len(_refs)} {get_trace_text('references')}")
+            for i, _ref in enumerate(_refs, 1):
+                st.write(f"  ({i}) {_ref['content']['text'][0:200]}...")
+
+    def _collaborator_output(self, record, state):
+        collab_name = record.data['name']
+        collab_output = record.data['text']
+        with st.expander(get_trace_text("collaborator_response").format(collab_name), False, icon=":material/account-group:"):
+            st.write(f"{get_trace_text('collaborator_name')}{collab_name}")
+            st.markdown(collab_output.replace('$', r'\$'))
+
+        # 保存collaborator的输出，以便在主UI中显示
+        self.collaborator_output = collab_output
+
+    def _tool_output(self, record, state):
+        with st.expander(get_trace_text("tool_response"), False, icon=":material/psychology:"):
+            _tokens = record.data.get('tokens')
+            if _tokens:
+                _saved = 100 * (1 - _tokens['tokens'] / max(_tokens['raw_tokens'], 1))
+                st.caption(get_trace_text("tool_result_tokens").format(
+                    _tokens['tokens'], _tokens['raw_tokens'], max(round(_saved), 0)))
+            st.write(record.data['text'].replace('$', r'\$'))
+
+    def _code_output(self, record, state):
+        with st.expander(get_trace_text("code_interpreter"), False, icon=":material/psychology:"):
+            if record.data['output'] is not None:
+                st.code(record.data['output'])
+
+            if record.data['error'] is not None:
+                st.write(f"{get_trace_text('code_error')}{record.data['error']}")
+
+            if record.data['files'] is not None:
+                st.write(f"{get_trace_text('files_generated')}{record.data['files']}")
+
+    def _final_response(self, record, state):
+        with st.expander(get_trace_text("agent_response"), False, icon=":material/psychology:"):
+            st.write(record.data['text'].replace('$', r'\$'))
 
 def get_error_text(key):
     """根据当前语言获取错误文本"""
@@ -291,19 +312,59 @@ def get_error_text(key):
     language = st.session_state.get('language', "English")
     return texts[language][key]
 
+def render_turn_timings(summary):
+    """Show the latency breakdown of a turn in an expandable panel."""
+    with st.expander(get_trace_text("latency_breakdown"), False, icon=":material/timer:"):
+        st.table({
+            get_trace_text("phase"): list(summary['phases']),
+            get_trace_text("latency_ms"): list(summary['phases'].values()),
+        })
+        if summary['steps']:
+            st.table({
+                get_trace_text("step_kind"): [_step['kind'] for _step in summary['steps']],
+                get_trace_text("agent"): [_step['agent'] for _step in summary['steps']],
+                get_trace_text("name"): [_step['name'] for _step in summary['steps']],
+                get_trace_text("latency_ms"): [_step['latency_ms'] for _step in summary['steps']],
+            })
+
+def render_cache_report():
+    """Show the hit rate and latency saved by the response cache, when it is enabled."""
+    cache = get_response_cache(getattr(config, 'response_cache', None))
+    if cache is None:
+        return
+    with st.expander(get_trace_text("response_cache"), False, icon=":material/bolt:"):
+        report = cache.report()
+        st.table({
+            get_trace_text("metric"): list(report),
+            get_trace_text("value"): [str(value) for value in report.values()],
+        })
+
+def emit_turn_timings(timings, cache_status=None):
+    """End the turn, show its latency breakdown and export it to the metrics sink."""
+    timings.mark("end")
+    summary = timings.summary()
+    if cache_status:
+        summary['cache'] = cache_status
+    render_turn_timings(summary)
+    sink = get_metrics_sink(getattr(config, 'metrics_sink', None))
+    if sink:
+        sink.emit(summary)
+
 def invoke_agent(input_text, session_id, task_yaml_content):
     """Main agent invocation and response processing."""
     # 检查配置中是否指定了区域
     _bot_config = st.session_state['bot_config']
     region = _bot_config.get('region', None)
+    timings = TurnTimings(session_id, _bot_config.get('agent_id'))
     
     # 使用指定的区域创建 boto3 客户端（如果有的话）
-    if region:
-        client = boto3.client('bedrock-agent-runtime', region_name=region)
-        agentClient = boto3.client('bedrock-agent', region_name=region)
-    else:
-        client = boto3.client('bedrock-agent-runtime')
-        agentClient = boto3.client('bedrock-agent')
+    with timings.measure("client_creation"):
+        if region:
+            client = boto3.client('bedrock-agent-runtime', region_name=region)
+            agentClient = boto3.client('bedrock-agent', region_name=region)
+        else:
+            client = boto3.client('bedrock-agent-runtime')
+            agentClient = boto3.client('bedrock-agent')
         
     # 检查是否有必要的配置信息
     if 'agent_id' not in _bot_config or 'agent_alias_id' not in _bot_config:
@@ -323,94 +384,98 @@ def invoke_agent(input_text, session_id, task_yaml_content):
     else:
         messagesStr = input_text
 
+    # Answer near-identical prompts from the response cache, when it is enabled. Only the first
+    # turn of a session is, follow-ups depending on the turns before them
+    cache = get_response_cache(getattr(config, 'response_cache', None))
+    _started_sessions = st.session_state.setdefault('started_sessions', set())
+    # Cached turns the agent's session has not seen yet, passed to it on the next invocation
+    _cached_turns = st.session_state.setdefault('cached_turns', {})
+    first_turn = session_id not in _started_sessions
+    if cache and first_turn:
+        cache_key = cache.key(
+            _bot_config['agent_id'],
+            _bot_config['agent_alias_id'],
+            _bot_config.get('session_attributes'),
+        )
+        hit = cache.get(cache_key, messagesStr)
+        if hit:
+            timings.mark("first_chunk")
+            yield get_trace_text("cached_answer").format(hit.similarity, hit.age_seconds) + "\n\n"
+            with timings.measure("render"):
+                yield hit.answer
+            emit_turn_timings(timings, "hit")
+            cache.record_savings(hit, timings.marks["end"])
+            _started_sessions.add(session_id)
+            _cached_turns[session_id] = [
+                {"role": "user", "content": [{"text": messagesStr}]},
+                {"role": "assistant", "content": [{"text": hit.answer}]},
+            ]
+            return
+
     # Invoke agent
-    try:
-        if 'session_attributes' in _bot_config:
-            session_state = {
-                "sessionAttributes": _bot_config['session_attributes']['sessionAttributes']
-            }
-            if 'promptSessionAttributes' in _bot_config['session_attributes']:
-                session_state['promptSessionAttributes'] = _bot_config['session_attributes']['promptSessionAttributes']
-
-            response = client.invoke_agent(
-                agentId=_bot_config['agent_id'],
-                agentAliasId=_bot_config['agent_alias_id'],
-                sessionId=session_id,
-                sessionState=session_state,
-                inputText=messagesStr,
-                enableTrace=True
-            )
-        else:
-            response = client.invoke_agent(
-                agentId=_bot_config['agent_id'],
-                agentAliasId=_bot_config['agent_alias_id'],
-                sessionId=session_id,
-                inputText=messagesStr,
-                enableTrace=True
-            )
-    except Exception as e:
-        print(f"Error invoking agent: {e}")
-        raise e
+    with timings.measure("request"):
+        try:
+            session_state = {}
+            if 'session_attributes' in _bot_config:
+                session_state["sessionAttributes"] = _bot_config['session_attributes']['sessionAttributes']
+                if 'promptSessionAttributes' in _bot_config['session_attributes']:
+                    session_state['promptSessionAttributes'] = _bot_config['session_attributes']['promptSessionAttributes']
+            if session_id in _cached_turns:
+                session_state["conversationHistory"] = {"messages": _cached_turns[session_id]}
+
+            if session_state:
+                response = client.invoke_agent(
+                    agentId=_bot_config['agent_id'],
+                    agentAliasId=_bot_config['agent_alias_id'],
+                    sessionId=session_id,
+                    sessionState=session_state,
+                    inputText=messagesStr,
+                    enableTrace=True
+                )
+            else:
+                response = client.invoke_agent(
+                    agentId=_bot_config['agent_id'],
+                    agentAliasId=_bot_config['agent_alias_id'],
+                    sessionId=session_id,
+                    inputText=messagesStr,
+                    enableTrace=True
+                )
+        except Exception as e:
+            print(f"Error invoking agent: {e}")
+            raise e
+    _started_sessions.add(session_id)
+    _cached_turns.pop(session_id, None)
 
     # Process response
-    step = 0.0
-    _sub_agent_name = " "
-    _time_before_routing = None
-    inputTokens = 0
-    outputTokens = 0
-    _total_llm_calls = 0
-    collaborator_response = None
-    has_collaborator_output = False
-    
+    trace_sink = StreamlitTraceSink(agentClient, timings)
+    processor = AgentEventProcessor([trace_sink])
+
+    answer_parts = []
     with st.spinner(get_trace_text("processing")):
-        for event in response.get("completion"):
-            if "chunk" in event:
-                chunk_text = event["chunk"]["bytes"].decode("utf-8").replace('$', r'\$')
-                # 如果不是空字符串，并且没有collaborator输出，则输出chunk
-                if chunk_text.strip() and not has_collaborator_output:
+        for chunk_text in processor.stream(response.get("completion")):
+            timings.mark("first_chunk")
+            chunk_text = chunk_text.replace('$', r'\$')
+            # 如果不是空字符串，并且没有collaborator输出，则输出chunk
+            if chunk_text.strip() and not trace_sink.collaborator_output:
+                answer_parts.append(chunk_text)
+                # Streamlit renders the chunk while the generator is suspended
+                with timings.measure("render"):
                     yield chunk_text
-                
-            if "trace" in event:
-                if 'routingClassifierTrace' in event['trace']['trace']:
-                    #print("Processing routing trace...")
-                    result = process_routing_trace(event, step, _sub_agent_name, _time_before_routing)
-                    if result:
-                        if len(result) == 5:  # Initial invocation
-                            #print("Initial routing invocation")
-                            _time_before_routing, step, _sub_agent_name, in_tokens, out_tokens = result
-                            if in_tokens is not None or out_tokens is not None:
-                                inputTokens += (in_tokens or 0)
-                                outputTokens += (out_tokens or 0)
-                                _total_llm_calls += 1
-                        else:  # Subsequent invocation
-                            #print("Subsequent routing invocation")
-                            step, _sub_agent_name, in_tokens, out_tokens = result
-                            if in_tokens is not None or out_tokens is not None:
-                                inputTokens += (in_tokens or 0)
-                                outputTokens += (out_tokens or 0)
-                                _total_llm_calls += 1
-
-                        
-                if "orchestrationTrace" in event["trace"]["trace"]:
-                    result = process_orchestration_trace(event, agentClient, step)
-                    if result:
-                        step, in_tokens, out_tokens, collab_output = result
-                        if in_tokens is not None or out_tokens is not None:
-                            inputTokens += (in_tokens or 0)
-                            outputTokens += (out_tokens or 0)
-                            _total_llm_calls += 1
-                        
-                        # 如果有collaborator输出，保存它
-                        if collab_output:
-                            collaborator_response = collab_output
-                            has_collaborator_output = True
 
         # 如果有collaborator输出，直接返回它而不是supervisor的输出
-        if has_collaborator_output and collaborator_response:
-            yield "\n\n" + collaborator_response
+        if trace_sink.collaborator_output:
+            answer_parts.append("\n\n" + trace_sink.collaborator_output)
+            yield "\n\n" + trace_sink.collaborator_output
 
         # Display token usage at the end
         container = st.container(border=True)
-        container.markdown(f"{get_trace_text('total_input_tokens')}**{str(inputTokens)}**")
-        container.markdown(f"{get_trace_text('total_output_tokens')}**{str(outputTokens)}**")
-        container.markdown(f"{get_trace_text('total_llm_calls')}**{str(_total_llm_calls)}**")
+        container.markdown(f"{get_trace_text('total_input_tokens')}**{str(processor.state.input_tokens)}**")
+        container.markdown(f"{get_trace_text('total_output_tokens')}**{str(processor.state.output_tokens)}**")
+        container.markdown(f"{get_trace_text('total_llm_calls')}**{str(processor.state.llm_calls)}**")
+
+        emit_turn_timings(timings, "miss" if cache and first_turn else None)
+        # Answers that called tools or collaborators, or handed control back to the caller, are
+        # not answers to reuse
+        if (cache and first_turn and answer_parts and not trace_sink.called_tools
+                and processor.state.return_control is None):
+            cache.put(cache_key, messagesStr, "".join(answer_parts), timings.marks["end"])